@@ -12,4 +12,7 @@ from instant_ngp_3dml.utils import DIR_PATH
 sys.path += [os.path.dirname(pyd) for pyd in glob.iglob(os.path.join(DIR_PATH, "build*", "**/*.pyd"), recursive=True)]
 sys.path += [os.path.dirname(pyd) for pyd in glob.iglob(os.path.join(DIR_PATH, "build*", "**/*.so"), recursive=True)]
 
+# Add shared scripts (image metrics, dataset tools) to PYTHONPATH
+sys.path.append(os.path.join(DIR_PATH, "scripts"))
+
 logger = Logger("3dml-instant-ngp")
@@ -5,10 +5,12 @@ from typing import Dict
 
 from utils_3dml.software import Cli
 
+from instant_ngp_3dml.software.evaluation import main as evaluate
 from instant_ngp_3dml.software.rendering import main as render
 from instant_ngp_3dml.software.training import main as train
 
 modules: Dict[str, Callable] = {
+    "evaluation": evaluate,
     "rendering": render,
     "training": train
 }
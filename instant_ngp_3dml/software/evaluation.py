@@ -0,0 +1,156 @@
+#!/usr/bin/python3
+"""Evaluation Script."""
+import os
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from typing import Deque
+from typing import Dict
+from typing import Final
+from typing import List
+from typing import Tuple
+
+import imageio
+import numpy as np
+from image_metrics import aggregate_metrics
+from image_metrics import check_metrics
+from image_metrics import frame_metrics
+from tqdm import tqdm
+from utils_3dml.file.extensions import FileExt
+from utils_3dml.file.json_utils import write_json
+from utils_3dml.monitoring.profiler import LogScopeTime
+from utils_3dml.monitoring.profiler import profile
+from utils_3dml.structure.nerf.nerf_predicted_images import NerfPredictionPath
+from utils_3dml.utils.asserts import assert_eq
+from utils_3dml.utils.asserts import assert_gt
+from utils_3dml.utils.asserts import assert_isfile
+
+from instant_ngp_3dml import logger
+from instant_ngp_3dml.software.rendering import get_testbed_and_spp
+from instant_ngp_3dml.utils.tonemapper import srgb_to_linear
+
+IMAGE_EXTENSIONS: Final[Tuple[str, ...]] = (".png", ".jpg", ".jpeg", ".bmp", ".exr")
+
+
+def __resolve_image_path(base_folder: str, file_path: str) -> str:
+    """Resolve a dataset image path like the NeRF loader does (relative to the JSON, optional extension)."""
+    path = file_path if os.path.isabs(file_path) else os.path.join(base_folder, file_path)
+    if os.path.splitext(path)[1] == "" and not os.path.exists(path):
+        for ext in IMAGE_EXTENSIONS:
+            if os.path.exists(path + ext):
+                return path + ext
+    return path
+
+
+def __load_reference(path: str) -> np.ndarray:
+    """Load a ground truth image as linear RGB composited on black, like a render with a black background."""
+    raw = np.asarray(imageio.imread(path))
+    image = raw.astype(np.float32)
+    if image.ndim == 2:
+        image = image[..., np.newaxis]
+    if np.issubdtype(raw.dtype, np.integer):
+        # 8 or 16 bits sRGB colors, linear alpha
+        image /= np.iinfo(raw.dtype).max
+        image[..., 0:3] = srgb_to_linear(image[..., 0:3])
+    if image.shape[2] == 4:
+        # Premultiply alpha
+        return image[..., 0:3] * image[..., 3:4]
+    return image[..., 0:3]
+
+
+def __evaluate_snapshot(snapshot_msgpack: str,
+                        nerf_transform_json: str,
+                        metrics: List[str],
+                        spp: int,
+                        loader_pool: ThreadPoolExecutor,
+                        metric_pool: ProcessPoolExecutor,
+                        n_prefetch: int,
+                        max_pending: int) -> Dict[str, Any]:
+    testbed, spp = get_testbed_and_spp(snapshot_msgpack, NerfPredictionPath.IMAGE, spp)
+
+    # Same evaluation settings as scripts/run.py --test_transforms
+    testbed.background_color = [0.0, 0.0, 0.0, 1.0]
+    testbed.snap_to_pixel_centers = True
+    testbed.nerf.render_min_transmittance = 1e-4
+    testbed.load_training_data(nerf_transform_json)
+
+    base_folder = os.path.dirname(nerf_transform_json)
+    paths: List[str] = testbed.nerf.training.dataset.paths
+    n_images = testbed.nerf.training.dataset.n_images
+
+    references: Deque[Future] = deque(loader_pool.submit(__load_reference, __resolve_image_path(base_folder, path))
+                                      for path in paths[:n_prefetch])
+    results: List[Future] = []
+    pending: Deque[Future] = deque()
+    for trainview in tqdm(range(n_images), desc="Evaluating", unit="frame"):
+        if trainview + n_prefetch < n_images:
+            next_path = __resolve_image_path(base_folder, paths[trainview + n_prefetch])
+            references.append(loader_pool.submit(__load_reference, next_path))
+
+        testbed.set_camera_to_training_view(trainview)
+        w, h = tuple(testbed.nerf.training.dataset.metadata[trainview].resolution)
+        image = testbed.render(w, h, spp, True)
+
+        reference = references.popleft().result()
+        assert_eq(reference.shape[:2], (h, w))
+
+        # Metrics run in the background, rendering only waits if all workers are busy and the queue is full
+        while len(pending) >= max_pending:
+            pending.popleft().result()
+        future = metric_pool.submit(frame_metrics, image, reference, metrics)
+        pending.append(future)
+        results.append(future)
+
+    frames = [dict(file_path=path, **future.result()) for path, future in zip(paths, results)]
+    return {"frames": frames, "aggregate": aggregate_metrics(frames, metrics)}
+
+
+@profile
+def main(snapshot_msgpack: str,
+         nerf_transform_json: str,
+         out_metrics_json: str,
+         metrics: str = "PSNR,SSIM,FLIP",
+         spp: int = 8,
+         n_workers: int = 0,
+         n_prefetch: int = 8):
+    """Evaluate NeRF Snapshots against the Ground Truth Images of a Dataset.
+
+    Args:
+        snapshot_msgpack: Input NeRF Weights, or comma-separated list of NeRF Weights to evaluate one after the other
+        nerf_transform_json: Input NeRF Transform Json with the ground truth images
+        out_metrics_json: Output Json with per-frame and aggregated metrics, for each snapshot
+        metrics: Comma-separated metrics to compute. See scripts/image_metrics.py
+        spp: Input number of samples per pixel
+        n_workers: Nb processes computing the metrics (0: one per CPU)
+        n_prefetch: Nb ground truth images read ahead of the rendering
+
+    Resources:
+        cpu: intensive
+        ram: normal
+        gpu: intensive
+        network: none
+    """
+    assert_isfile(nerf_transform_json, ext=FileExt.JSON)
+    assert_gt(n_prefetch, 0)
+    snapshots = [snapshot.strip() for snapshot in snapshot_msgpack.split(",") if snapshot.strip() != ""]
+    for snapshot in snapshots:
+        assert_isfile(snapshot)
+    metric_names = [metric.strip().upper() for metric in metrics.split(",")]
+    check_metrics(metric_names)
+
+    n_workers = n_workers if n_workers > 0 else (os.cpu_count() or 1)
+    evaluation: Dict[str, Any] = {}
+    with ThreadPoolExecutor(max_workers=n_prefetch) as loader_pool, \
+            ProcessPoolExecutor(max_workers=n_workers) as metric_pool:
+        for snapshot in snapshots:
+            with LogScopeTime(f"NeRF Evaluation of {snapshot}"):
+                evaluation[snapshot] = __evaluate_snapshot(snapshot, nerf_transform_json, metric_names, spp,
+                                                           loader_pool, metric_pool, n_prefetch,
+                                                           max_pending=2 * n_workers)
+            for metric, values in evaluation[snapshot]["aggregate"].items():
+                logger.info(f"{snapshot}: {metric}={values['mean']:.4f} [min={values['min']:.4f} max={values['max']:.4f}]")
+
+    logger.info(f"Save metrics {out_metrics_json}")
+    write_json(out_metrics_json, evaluation, pretty=True)
@@ -0,0 +1,60 @@
+"""Test the ground truth images loading of the evaluation."""
+import os
+
+import cv2
+import numpy as np
+import pytest
+from utils_3dml.utils.asserts import assert_eq
+from utils_3dml.utils.asserts import assert_np_close
+
+from instant_ngp_3dml.software.evaluation import __load_reference as load_reference
+from instant_ngp_3dml.software.evaluation import __resolve_image_path as resolve_image_path
+from instant_ngp_3dml.utils.tonemapper import srgb_to_linear
+
+
+def test_resolve_image_path(tmp_path):
+    """Test that dataset image paths are resolved relative to the JSON, with an optional extension."""
+    # GIVEN
+    base_folder = str(tmp_path)
+    os.makedirs(os.path.join(base_folder, "train"))
+    cv2.imwrite(os.path.join(base_folder, "train", "r_0.png"), np.zeros((2, 2, 3), dtype=np.uint8))
+    absolute_path = os.path.join(base_folder, "train", "r_0.png")
+
+    # WHEN / THEN
+    assert_eq(resolve_image_path(base_folder, "train/r_0.png"), absolute_path)
+    assert_eq(resolve_image_path(base_folder, "./train/r_0"), os.path.join(base_folder, "./train/r_0.png"))
+    assert_eq(resolve_image_path("/elsewhere", absolute_path), absolute_path)
+    # Missing images are left as they are, to fail when they are loaded
+    assert_eq(resolve_image_path(base_folder, "train/r_1"), os.path.join(base_folder, "train/r_1"))
+
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.uint16])
+def test_load_reference(tmp_path, dtype):
+    """Test that 8 and 16 bits references are normalized to the same linear colors."""
+    # GIVEN
+    max_value = np.iinfo(dtype).max
+    bgr = np.array([[[0, max_value // 2, max_value]]], dtype=dtype)
+    path = os.path.join(str(tmp_path), "reference.png")
+    cv2.imwrite(path, bgr)
+
+    # WHEN
+    image = load_reference(path)
+
+    # THEN
+    assert_eq(image.shape, (1, 1, 3))
+    assert_np_close(image[0, 0], srgb_to_linear(np.array([1.0, 0.5, 0.0])), eps=1e-2)
+
+
+def test_load_reference_alpha(tmp_path):
+    """Test that RGBA references are premultiplied, like renders on a black background."""
+    # GIVEN
+    bgra = np.array([[[255, 255, 255, 255], [255, 255, 255, 0]]], dtype=np.uint8)
+    path = os.path.join(str(tmp_path), "reference.png")
+    cv2.imwrite(path, bgra)
+
+    # WHEN
+    image = load_reference(path)
+
+    # THEN
+    assert_np_close(image[0, 0], np.ones(3), eps=1e-6)
+    assert_np_close(image[0, 1], np.zeros(3), eps=1e-6)
@@ -9,6 +9,8 @@ from utils_3dml.monitoring.profiler import LogScopeTime
 from utils_3dml.monitoring.profiler import profile
 from utils_3dml.utils.asserts import assert_gt
 from utils_3dml.utils.dataclass import _asdict_inner
+from validate_dataset import format_report
+from validate_dataset import validate_dataset
 
 from instant_ngp_3dml import logger
 from instant_ngp_3dml.utils.network_config import get_nerf_config_json
@@ -69,7 +71,8 @@ def main(nerf_transform_json: str,  # noqa: PLR0913
          out_training_info_json: str = "",
          snapshot_msgpack: str = "",
          n_steps: int = 100000,
-         enable_depth_supervision: bool = False):
+         enable_depth_supervision: bool = False,
+         skip_dataset_check: bool = False):
     """Train NeRF Scene.
 
     Args:
@@ -80,6 +83,7 @@ def main(nerf_transform_json: str,  # noqa: PLR0913
         snapshot_msgpack: Optional Input NeRF Weight
         n_steps: Nb training iterations
         enable_depth_supervision: If specified, NeRF is train with Depth Supervision
+        skip_dataset_check: If specified, the images of the dataset are not checked before loading it
 
     Resources:
         cpu: normal
@@ -89,6 +93,13 @@ def main(nerf_transform_json: str,  # noqa: PLR0913
     """
     assert_gt(n_steps, 0)
 
+    if not skip_dataset_check:
+        # Header-only check of the dataset, before the GPU is initialized
+        report = validate_dataset(nerf_transform_json)
+        if report["errors"]:
+            raise ValueError(f"Invalid NeRF dataset {nerf_transform_json}:\n{format_report(report)}")
+        logger.info(format_report(report))
+
     testbed = ngp.Testbed(ngp.TestbedMode.Nerf)
 
     testbed.load_training_data(nerf_transform_json)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# Camera path evaluation, mirroring `CameraPath::eval_camera_path` and the camera smoothing of `Testbed::render_to_cpu`.
+#
+# When rendering a camera path frame by frame, the only state carried from one `testbed.render` call to the next is
+# the smoothed camera at which the next frame's shutter opens (`testbed.smoothed_camera`). It is computed here without
+# rendering, so that a video can start at any frame (e.g. to split a long path between workers):
+# - without smoothing, it is the path's camera at the start time of the frame,
+# - with smoothing, it is an exponential moving average in log space whose weights decay by a factor 0.02 per second,
+#   so only the last few seconds before the frame matter and the cost does not depend on the frame index.
+
+import json
+
+import numpy as np
+from scipy.spatial.transform import Rotation
+
+# Per-second decay of the camera smoothing, see `Testbed::apply_camera_smoothing`
+SMOOTHING_DECAY_PER_SECOND = 0.02
+# Weight of the camera history below which it is ignored when warming up the smoothing
+SMOOTHING_TOLERANCE = 1e-7
+
+# Interpolated keyframe attributes besides the rotation: T (3 values), slice, scale, fov, aperture_size, glow_y_cutoff
+N_KEYFRAME_ATTRIBUTES = 8
+
+class CameraPath:
+	def __init__(self, rotations, attributes, glow_modes, loop=False):
+		self.rotations = np.asarray(rotations, dtype=np.float64).reshape(-1, 4) # quaternions, [x, y, z, w]
+		self.attributes = np.asarray(attributes, dtype=np.float64).reshape(len(self.rotations), N_KEYFRAME_ATTRIBUTES)
+		self.glow_modes = list(glow_modes)
+		self.loop = loop
+
+	@staticmethod
+	def load(path):
+		with open(path) as f:
+			data = json.load(f)
+		keyframes = data.get("path", [])
+		rotations = [keyframe["R"] for keyframe in keyframes]
+		attributes = [[*keyframe["T"], keyframe["slice"], keyframe["scale"], keyframe["fov"], keyframe.get("dof", keyframe.get("aperture_size")), keyframe.get("glow_y_cutoff", 0.0)] for keyframe in keyframes]
+		glow_modes = [keyframe.get("glow_mode", 0) for keyframe in keyframes]
+		return CameraPath(rotations, attributes, glow_modes, loop=data.get("loop", False))
+
+	def __len__(self):
+		return len(self.rotations)
+
+	def _index(self, i):
+		n = len(self)
+		return (i + n) % n if self.loop else min(max(i, 0), n - 1)
+
+	def keyframe(self, t):
+		# Returns (quaternion, attributes, glow_mode) of the path at time t in [0, 1], see `CameraPath::eval_camera_path`
+		if len(self) == 0:
+			raise ValueError("The camera path has no keyframes")
+		t *= len(self) if self.loop else len(self) - 1
+		t1 = int(np.floor(t))
+		t -= np.floor(t)
+
+		# Cubic B-spline, summed in the same order as `spline` so that quaternion signs are aligned the same way
+		weights = [(1-t)**3 / 6, (3*t**3 - 6*t**2 + 4) / 6, (-3*t**3 + 3*t**2 + 3*t + 1) / 6, t**3 / 6]
+		indices = [self._index(t1 + k) for k in range(-1, 3)]
+		R = self.rotations[indices[0]] * weights[0]
+		attributes = self.attributes[indices[0]] * weights[0]
+		for index, weight in zip(indices[1:], weights[1:]):
+			rhs = self.rotations[index] * weight
+			R = R + (-rhs if np.dot(rhs, R) < 0 else rhs)
+			attributes = attributes + self.attributes[index] * weight
+		return R, attributes, self.glow_modes[indices[0]]
+
+	def camera_matrix(self, t):
+		# 3x4 camera matrix at time t, as `testbed.camera_matrix` after `set_camera_from_time`
+		R, attributes, _ = self.keyframe(t)
+		return np.concatenate((Rotation.from_quat(R).as_matrix(), attributes[0:3, np.newaxis]), axis=1)
+
+def _se3_coefficients(theta):
+	# (1 - cos)/theta^2 and (theta - sin)/theta^3, with their Taylor expansion near 0
+	if theta < 1e-4:
+		return 0.5 - theta**2 / 24, 1 / 6 - theta**2 / 120
+	return (1 - np.cos(theta)) / theta**2, (theta - np.sin(theta)) / theta**3
+
+def _hat(w):
+	return np.array([[0, -w[2], w[1]], [w[2], 0, -w[0]], [-w[1], w[0], 0]])
+
+def _se3_log(m):
+	w = Rotation.from_matrix(m[:, 0:3]).as_rotvec()
+	a, b = _se3_coefficients(np.linalg.norm(w))
+	W = _hat(w)
+	V = np.eye(3) + a * W + b * W @ W
+	return w, np.linalg.solve(V, m[:, 3])
+
+def _se3_exp(w, u):
+	a, b = _se3_coefficients(np.linalg.norm(w))
+	W = _hat(w)
+	V = np.eye(3) + a * W + b * W @ W
+	return np.concatenate((Rotation.from_rotvec(w).as_matrix(), (V @ u)[:, np.newaxis]), axis=1)
+
+def _compose(a, b):
+	# a * b of 3x4 rigid transforms
+	return np.concatenate((a[:, 0:3] @ b[:, 0:3], (a[:, 0:3] @ b[:, 3] + a[:, 3])[:, np.newaxis]), axis=1)
+
+def _inverse(m):
+	rot = m[:, 0:3].T
+	return np.concatenate((rot, (-rot @ m[:, 3])[:, np.newaxis]), axis=1)
+
+def camera_log_lerp(a, b, t):
+	# exp(t * log(b * a^-1)) * a, see `camera_log_lerp` in common_device.cuh
+	w, u = _se3_log(_compose(b, _inverse(a)))
+	return _compose(_se3_exp(w * t, u * t), a)
+
+def smoothing_decay(fps):
+	return SMOOTHING_DECAY_PER_SECOND ** (1.0 / fps)
+
+def smoothing_warmup_frames(fps):
+	# Number of frames after which the smoothed camera has forgotten its initial value up to SMOOTHING_TOLERANCE
+	return int(np.ceil(np.log(SMOOTHING_TOLERANCE) / np.log(smoothing_decay(fps))))
+
+def smoothed_camera(camera_path, frame, n_frames, fps, smoothing=False):
+	# Value of `testbed.smoothed_camera` when `testbed.render` is called for `frame` after frames 0..frame-1,
+	# with start_time=frame/n_frames and end_time=(frame+1)/n_frames like run.py does
+	if not smoothing or frame == 0:
+		return camera_path.camera_matrix(frame / n_frames)
+
+	# Older frames contribute less than SMOOTHING_TOLERANCE: start from the path itself a few seconds earlier
+	first = max(frame - smoothing_warmup_frames(fps), 0)
+	camera = camera_path.camera_matrix(first / n_frames)
+	alpha = 1.0 - smoothing_decay(fps)
+	for i in range(first + 1, frame + 1):
+		camera = camera_log_lerp(camera, camera_path.camera_matrix(i / n_frames), alpha)
+	return camera
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# Non-blocking writer of captured frames (NeRFCapture samples) into a dataset folder.
+#
+# Frames are converted and written by a bounded thread pool, so that the thread receiving them never waits for
+# the disk: when max_pending frames are already waiting to be written, new frames are dropped and counted.
+# Each written frame is appended to `transforms.jsonl` (first line: the dataset intrinsics, then one frame per
+# line), and `transforms.json` is atomically rewritten every flush_every frames and when closing, so an
+# interrupted capture still leaves a usable dataset.
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+MANIFEST_JSONL = "transforms.jsonl"
+MANIFEST_JSON = "transforms.json"
+
+def _from_bytes(buffer, dtype):
+	# Array of dtype from a uint8 sequence, without copy if it is a bytes-like object
+	try:
+		return np.frombuffer(buffer, dtype=dtype)
+	except TypeError:
+		return np.asarray(buffer, dtype=np.uint8).view(dtype)
+
+def load_jsonl_manifest(path):
+	# transforms dict of a (possibly interrupted) transforms.jsonl
+	with open(path) as f:
+		lines = [json.loads(line) for line in f if line.strip()]
+	if not lines:
+		return {"frames": []}
+	manifest = dict(lines[0], frames=sorted(lines[1:], key=lambda frame: frame.get("capture_index", 0)))
+	return manifest
+
+class CaptureWriter:
+	def __init__(self, save_path, depth_scale=10.0, n_workers=4, max_pending=32, flush_every=10):
+		self.save_path = str(save_path)
+		self.images_dir = os.path.join(self.save_path, "images")
+		self.depth_scale = float(depth_scale)
+		self.flush_every = flush_every
+		self.manifest = None
+		self.frames = []
+		self.received = 0
+		self.written = 0
+		self.dropped = 0
+		self.failed = 0
+		self._queued = 0
+		self._pending = threading.BoundedSemaphore(max_pending)
+		self._lock = threading.Lock()
+		self._pool = ThreadPoolExecutor(max_workers=n_workers)
+		self._jsonl = None
+
+	def stats(self):
+		with self._lock:
+			return {"received": self.received, "written": self.written, "dropped": self.dropped, "failed": self.failed}
+
+	def _start(self, sample):
+		os.makedirs(self.images_dir)
+		self.manifest = {
+			"fl_x": sample.fl_x,
+			"fl_y": sample.fl_y,
+			"cx": sample.cx,
+			"cy": sample.cy,
+			"w": sample.width,
+			"h": sample.height,
+			"integer_depth_scale": self.depth_scale / 65535.0,
+		}
+		self._jsonl = open(os.path.join(self.save_path, MANIFEST_JSONL), "w")
+		self._jsonl.write(json.dumps(self.manifest) + "\n")
+		self._jsonl.flush()
+
+	def submit(self, sample):
+		# Queues a sample to be written, returns False if it was dropped because too many frames are pending
+		with self._lock:
+			if self.manifest is None:
+				self._start(sample)
+			self.received += 1
+			if not self._pending.acquire(blocking=False):
+				self.dropped += 1
+				return False
+			index = self._queued
+			self._queued += 1
+		self._pool.submit(self._write, index, sample)
+		return True
+
+	def _write(self, index, sample):
+		try:
+			frame = self._write_files(index, sample)
+		except Exception as e:
+			print(f"Could not write frame {index}: {e}")
+			with self._lock:
+				self.failed += 1
+			return
+		finally:
+			self._pending.release()
+
+		with self._lock:
+			self.frames.append(frame)
+			self.written += 1
+			self._jsonl.write(json.dumps(frame) + "\n")
+			self._jsonl.flush()
+			if self.flush_every > 0 and self.written % self.flush_every == 0:
+				self._flush_json()
+
+	def _write_files(self, index, sample):
+		# RGB
+		image = _from_bytes(sample.image, np.uint8).reshape((sample.height, sample.width, 3))
+		if not cv2.imwrite(os.path.join(self.images_dir, f"{index}.png"), cv2.cvtColor(image, cv2.COLOR_RGB2BGR)):
+			raise IOError("image not written")
+
+		frame = {
+			"transform_matrix": np.asarray(sample.transform_matrix, dtype=np.float32).reshape((4, 4)).T.tolist(),
+			"file_path": f"images/{index}",
+			"fl_x": sample.fl_x,
+			"fl_y": sample.fl_y,
+			"cx": sample.cx,
+			"cy": sample.cy,
+			"w": sample.width,
+			"h": sample.height,
+			"capture_index": index,
+		}
+
+		# Depth if available
+		if sample.has_depth:
+			depth = _from_bytes(sample.depth_image, np.float32).reshape((sample.depth_height, sample.depth_width))
+			depth = (depth * 65535 / self.depth_scale).astype(np.uint16)
+			depth = cv2.resize(depth, dsize=(sample.width, sample.height), interpolation=cv2.INTER_NEAREST)
+			if not cv2.imwrite(os.path.join(self.images_dir, f"{index}.depth.png"), depth):
+				raise IOError("depth not written")
+			frame["depth_path"] = f"images/{index}.depth.png"
+		return frame
+
+	def _flush_json(self):
+		# Called with the lock held. Frames are written out of order by the pool, the manifest is in capture order.
+		manifest = dict(self.manifest, frames=sorted(self.frames, key=lambda frame: frame["capture_index"]))
+		path = os.path.join(self.save_path, MANIFEST_JSON)
+		with open(path + ".tmp", "w") as f:
+			json.dump(manifest, f, indent=4)
+		os.replace(path + ".tmp", path)
+
+	def close(self):
+		# Waits for the pending frames, and writes the final manifest
+		self._pool.shutdown(wait=True)
+		with self._lock:
+			if self.manifest is not None:
+				self._flush_json()
+				self._jsonl.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+def capture_dataset(reader, writer, n_frames, idle_sleep=0.001, on_frame=None):
+	# Reads samples until n_frames have been queued for writing. on_frame, if given, is called after each sample.
+	queued = 0
+	while queued < n_frames:
+		sample = reader.read_next() # Get frame from NeRFCapture
+		if not sample:
+			time.sleep(idle_sleep)
+			continue
+		if writer.submit(sample):
+			queued += 1
+		if on_frame is not None:
+			on_frame(writer.stats())
+	return queued
@@ -17,29 +17,53 @@ import numpy as np
 import json
 import sys
 import math
-import cv2
 import os
 import shutil
 
+from pose_normalization import average_distance, center_of_attention, nerf_scale, translate_and_scale, up_rotation, up_vector
+from sharpness import compute_sharpness
+from colmap_model import read_model
+from depth_priors import compute_depth_maps, integer_depth_scale, reliable_points, write_depth_maps
+from image_pairs import frame_intrinsics, transforms_pairs, write_pair_list
+from retrieval_pairs import folder_pairs
+from dedupe_frames import dedupe_folder, write_image_list
+from scene_bounds import fit_bounds, print_gain, report_gain
+from video_frames import extract_frames
+from mask_pipeline import Detectron2Predictor, category_ids, generate_masks
+
 ROOT_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
 SCRIPTS_FOLDER = os.path.join(ROOT_DIR, "scripts")
 
 def parse_args():
 	parser = argparse.ArgumentParser(description="Convert a text colmap export to nerf format transforms.json; optionally convert video to images, and optionally run colmap in the first place.")
 
-	parser.add_argument("--video_in", default="", help="Run ffmpeg first to convert a provided video file into a set of images. Uses the video_fps parameter also.")
-	parser.add_argument("--video_fps", default=2)
+	parser.add_argument("--video_in", default="", help="Extract the frames of a provided video file into a set of images first. Uses the video_fps parameter also.")
+	parser.add_argument("--video_fps", default=2, help="Number of frames to extract per second of video: the sharpest frame of each 1/video_fps seconds is kept.")
+	parser.add_argument("--video_extractor", default="opencv", choices=["opencv", "ffmpeg"], help="Decode the video in-process and only write the selected frames (opencv), or write every frame at video_fps with ffmpeg.")
+	parser.add_argument("--video_min_motion", default=0.0, type=float, help="Also skip the extracted frames whose mean absolute difference (in 8-bit levels) to the previous extracted frame is below this (opencv extractor only).")
 	parser.add_argument("--time_slice", default="", help="Time (in seconds) in the format t1,t2 within which the images should be generated from the video. E.g.: \"--time_slice '10,300'\" will generate images only from 10th second to 300th second of the video.")
 	parser.add_argument("--run_colmap", action="store_true", help="run colmap first on the image folder")
-	parser.add_argument("--colmap_matcher", default="sequential", choices=["exhaustive","sequential","spatial","transitive","vocab_tree"], help="Select which matcher colmap should use. Sequential for videos, exhaustive for ad-hoc images.")
+	parser.add_argument("--colmap_matcher", default="sequential", choices=["exhaustive","sequential","spatial","transitive","vocab_tree","pairs"], help="Select which matcher colmap should use. Sequential for videos, exhaustive for ad-hoc images, pairs to only match the pairs of images of --colmap_pairs.")
+	parser.add_argument("--colmap_pairs", default="", help="Pair list (one \"image1 image2\" per line) for the pairs matcher. If not given, generated from --colmap_pose_priors, or else by image retrieval: each image is paired with its most similar images.")
+	parser.add_argument("--colmap_retrieval_neighbors", default=20, type=int, help="Number of most similar images each image is matched with, when pairs are generated by image retrieval.")
+	parser.add_argument("--colmap_pose_priors", default="", help="Transforms file with approximate poses of the images (e.g. from record3d2nerf.py or nerfcapture2nerf.py): only match the images with nearby, overlapping views.")
 	parser.add_argument("--colmap_db", default="colmap.db", help="colmap database filename")
+	parser.add_argument("--dedupe", action="store_true", help="Only run colmap on the sharpest of near-duplicate images (e.g. from a stationary phone), detected by perceptual hashing.")
+	parser.add_argument("--dedupe_max_distance", default=4, type=int, help="Images whose perceptual hashes differ by at most this many bits (out of 64) are near-duplicates.")
 	parser.add_argument("--colmap_camera_model", default="OPENCV", choices=["SIMPLE_PINHOLE", "PINHOLE", "SIMPLE_RADIAL", "RADIAL", "OPENCV", "SIMPLE_RADIAL_FISHEYE", "RADIAL_FISHEYE", "OPENCV_FISHEYE"], help="Camera model")
 	parser.add_argument("--colmap_camera_params", default="", help="Intrinsic parameters, depending on the chosen model. Format: fx,fy,cx,cy,dist")
 	parser.add_argument("--images", default="images", help="Input path to the images.")
-	parser.add_argument("--text", default="colmap_text", help="Input path to the colmap text files (set automatically if --run_colmap is used).")
+	parser.add_argument("--text", default="colmap_text", help="Input path to the colmap model, binary (.bin) or text (.txt) files (set automatically if --run_colmap is used).")
 	parser.add_argument("--aabb_scale", default=32, choices=["1", "2", "4", "8", "16", "32", "64", "128"], help="Large scene scale factor. 1=scene fits in unit cube; power of 2 up to 128")
+	parser.add_argument("--auto_aabb", action="store_true", help="Replace --aabb_scale by the smallest one containing the cameras and the reliable COLMAP points (see --depth_min_track_length and --depth_max_reprojection_error), and write their bounding box as render_aabb.")
 	parser.add_argument("--skip_early", default=0, help="Skip this many images from the start.")
+	parser.add_argument("--sharpness_reduction", default=2, type=int, choices=[1, 2, 4, 8], help="Downscaling factor of the images when computing their sharpness. Scores are cached next to the images.")
 	parser.add_argument("--keep_colmap_coords", action="store_true", help="Keep transforms.json in COLMAP's original frame of reference (this will avoid reorienting and repositioning the scene for preview and rendering).")
+	parser.add_argument("--depth_priors", action="store_true", help="Write sparse depth maps of the COLMAP points seen by each image, for depth-supervised training.")
+	parser.add_argument("--depth_folder", default="depth", help="Output path to the depth maps.")
+	parser.add_argument("--depth_min_track_length", default=2, type=int, help="Only use the points seen by at least this many images as depth priors.")
+	parser.add_argument("--depth_max_reprojection_error", default=2.0, type=float, help="Only use the points with at most this mean reprojection error (in pixels) as depth priors.")
+	parser.add_argument("--depth_splat_radius", default=1.0, type=float, help="Radius (in pixels) of the disc each point covers in the depth maps.")
 	parser.add_argument("--out", default="transforms.json", help="Output path.")
 	parser.add_argument("--vocab_path", default="", help="Vocabulary tree path.")
 	parser.add_argument("--overwrite", action="store_true", help="Do not ask for confirmation for overwriting existing images and COLMAP data.")
@@ -54,6 +78,26 @@ def do_system(arg):
 		print("FATAL: command failed")
 		sys.exit(err)
 
+def prepare_video_image_folder(args):
+	if not os.path.isabs(args.images):
+		args.images = os.path.join(os.path.dirname(args.video_in), args.images)
+
+	if not args.overwrite and (input(f"warning! folder '{args.images}' will be deleted/replaced. continue? (Y/n)").lower().strip()+"y")[:1] != "y":
+		sys.exit(1)
+	try:
+		shutil.rmtree(args.images)
+	except:
+		pass
+	os.makedirs(args.images)
+
+def extract_video_frames(args):
+	prepare_video_image_folder(args)
+	fps = float(args.video_fps) or 1.0
+	time_slice = [float(t) for t in args.time_slice.split(",")] if args.time_slice else None
+	print(f"extracting frames with input video file={args.video_in}, output image folder={args.images}, fps={fps}.")
+	paths = extract_frames(args.video_in, args.images, fps, time_slice, reduction=4, min_motion=args.video_min_motion)
+	print(f"{len(paths)} frames written")
+
 def run_ffmpeg(args):
 	ffmpeg_binary = "ffmpeg"
 
@@ -69,21 +113,11 @@ def run_ffmpeg(args):
 		if candidates:
 			ffmpeg_binary = candidates[0]
 
-	if not os.path.isabs(args.images):
-		args.images = os.path.join(os.path.dirname(args.video_in), args.images)
-
+	prepare_video_image_folder(args)
 	images = "\"" + args.images + "\""
 	video =  "\"" + args.video_in + "\""
 	fps = float(args.video_fps) or 1.0
 	print(f"running ffmpeg with input video file={video}, output image folder={images}, fps={fps}.")
-	if not args.overwrite and (input(f"warning! folder '{images}' will be deleted/replaced. continue? (Y/n)").lower().strip()+"y")[:1] != "y":
-		sys.exit(1)
-	try:
-		# Passing Images' Path Without Double Quotes
-		shutil.rmtree(args.images)
-	except:
-		pass
-	do_system(f"mkdir {images}")
 
 	time_slice_value = ""
 	time_slice = args.time_slice
@@ -111,17 +145,38 @@ def run_colmap(args):
 	images = "\"" + args.images + "\""
 	db_noext=str(Path(db).with_suffix(""))
 
-	if args.text=="text":
-		args.text=db_noext+"_text"
-	text=args.text
 	sparse=db_noext+"_sparse"
-	print(f"running colmap with:\n\tdb={db}\n\timages={images}\n\tsparse={sparse}\n\ttext={text}")
-	if not args.overwrite and (input(f"warning! folders '{sparse}' and '{text}' will be deleted/replaced. continue? (Y/n)").lower().strip()+"y")[:1] != "y":
+	print(f"running colmap with:\n\tdb={db}\n\timages={images}\n\tsparse={sparse}")
+	if not args.overwrite and (input(f"warning! folder '{sparse}' will be deleted/replaced. continue? (Y/n)").lower().strip()+"y")[:1] != "y":
 		sys.exit(1)
 	if os.path.exists(db):
 		os.remove(db)
-	do_system(f"{colmap_binary} feature_extractor --ImageReader.camera_model {args.colmap_camera_model} --ImageReader.camera_params \"{args.colmap_camera_params}\" --SiftExtraction.estimate_affine_shape=true --SiftExtraction.domain_size_pooling=true --ImageReader.single_camera 1 --database_path {db} --image_path {images}")
-	match_cmd = f"{colmap_binary} {args.colmap_matcher}_matcher --SiftMatching.guided_matching=true --database_path {db}"
+	image_list = ""
+	names = None
+	if args.dedupe:
+		names = dedupe_folder(args.images, args.dedupe_max_distance, args.sharpness_reduction)
+		image_list = f" --ImageReader.image_list_path \"{db_noext}_images.txt\""
+		write_image_list(db_noext + "_images.txt", names)
+		print(f"{len(names)} images left after removing near-duplicates")
+	do_system(f"{colmap_binary} feature_extractor --ImageReader.camera_model {args.colmap_camera_model} --ImageReader.camera_params \"{args.colmap_camera_params}\" --SiftExtraction.estimate_affine_shape=true --SiftExtraction.domain_size_pooling=true --ImageReader.single_camera 1 --database_path {db} --image_path {images}{image_list}")
+	if args.colmap_matcher == "pairs":
+		pairs = args.colmap_pairs or db_noext + "_pairs.txt"
+		if args.colmap_pose_priors:
+			prior_names, pose_prior_pairs = transforms_pairs(args.colmap_pose_priors, args.images)
+			if names is not None:
+				# Pairs of images left out of the database are not importable
+				kept = set(names)
+				pose_prior_pairs = np.array([pair for pair in pose_prior_pairs if prior_names[pair[0]] in kept and prior_names[pair[1]] in kept], dtype=np.int64).reshape(-1, 2)
+			names = prior_names
+			print(f"{len(pose_prior_pairs)} image pairs from the pose priors {args.colmap_pose_priors}")
+			write_pair_list(pairs, names, pose_prior_pairs)
+		elif not args.colmap_pairs:
+			names, similar_pairs = folder_pairs(args.images, args.colmap_retrieval_neighbors, names=names)
+			print(f"{len(similar_pairs)} image pairs from image retrieval")
+			write_pair_list(pairs, names, similar_pairs)
+		match_cmd = f"{colmap_binary} matches_importer --match_list_path \"{pairs}\" --match_type pairs --SiftMatching.guided_matching=true --database_path {db}"
+	else:
+		match_cmd = f"{colmap_binary} {args.colmap_matcher}_matcher --SiftMatching.guided_matching=true --database_path {db}"
 	if args.vocab_path:
 		match_cmd += f" --VocabTreeMatching.vocab_tree_path {args.vocab_path}"
 	do_system(match_cmd)
@@ -132,21 +187,8 @@ def run_colmap(args):
 	do_system(f"mkdir {sparse}")
 	do_system(f"{colmap_binary} mapper --database_path {db} --image_path {images} --output_path {sparse}")
 	do_system(f"{colmap_binary} bundle_adjuster --input_path {sparse}/0 --output_path {sparse}/0 --BundleAdjustment.refine_principal_point 1")
-	try:
-		shutil.rmtree(text)
-	except:
-		pass
-	do_system(f"mkdir {text}")
-	do_system(f"{colmap_binary} model_converter --input_path {sparse}/0 --output_path {text} --output_type TXT")
-
-def variance_of_laplacian(image):
-	return cv2.Laplacian(image, cv2.CV_64F).var()
-
-def sharpness(imagePath):
-	image = cv2.imread(imagePath)
-	gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-	fm = variance_of_laplacian(gray)
-	return fm
+	# The binary model is read directly, no need to convert it to text
+	args.text=os.path.join(sparse, "0")
 
 def qvec2rotmat(qvec):
 	return np.array([
@@ -165,35 +207,13 @@ def qvec2rotmat(qvec):
 		]
 	])
 
-def rotmat(a, b):
-	a, b = a / np.linalg.norm(a), b / np.linalg.norm(b)
-	v = np.cross(a, b)
-	c = np.dot(a, b)
-	# handle exception for the opposite direction input
-	if c < -1 + 1e-10:
-		return rotmat(a + np.random.uniform(-1e-2, 1e-2, 3), b)
-	s = np.linalg.norm(v)
-	kmat = np.array([[0, -v[2], v[1]], [v[2], 0, -v[0]], [-v[1], v[0], 0]])
-	return np.eye(3) + kmat + kmat.dot(kmat) * ((1 - c) / (s ** 2 + 1e-10))
-
-def closest_point_2_lines(oa, da, ob, db): # returns point closest to both rays of form o+t*d, and a weight factor that goes to 0 if the lines are parallel
-	da = da / np.linalg.norm(da)
-	db = db / np.linalg.norm(db)
-	c = np.cross(da, db)
-	denom = np.linalg.norm(c)**2
-	t = ob - oa
-	ta = np.linalg.det([t, db, c]) / (denom + 1e-10)
-	tb = np.linalg.det([t, da, c]) / (denom + 1e-10)
-	if ta > 0:
-		ta = 0
-	if tb > 0:
-		tb = 0
-	return (oa+ta*da+ob+tb*db) * 0.5, denom
-
 if __name__ == "__main__":
 	args = parse_args()
 	if args.video_in != "":
-		run_ffmpeg(args)
+		if args.video_extractor == "ffmpeg":
+			run_ffmpeg(args)
+		else:
+			extract_video_frames(args)
 	if args.run_colmap:
 		run_colmap(args)
 	AABB_SCALE = int(args.aabb_scale)
@@ -202,157 +222,151 @@ if __name__ == "__main__":
 	TEXT_FOLDER = args.text
 	OUT_PATH = args.out
 	print(f"outputting to {OUT_PATH}...")
+	colmap_cameras, colmap_images, colmap_points3D = read_model(TEXT_FOLDER, load_points3D=args.depth_priors or args.auto_aabb)
 	cameras = {}
-	with open(os.path.join(TEXT_FOLDER,"cameras.txt"), "r") as f:
-		camera_angle_x = math.pi / 2
-		for line in f:
-			# 1 SIMPLE_RADIAL 2048 1536 1580.46 1024 768 0.0045691
-			# 1 OPENCV 3840 2160 3178.27 3182.09 1920 1080 0.159668 -0.231286 -0.00123982 0.00272224
-			# 1 RADIAL 1920 1080 1665.1 960 540 0.0672856 -0.0761443
-			if line[0] == "#":
-				continue
-			els = line.split(" ")
-			camera = {}
-			camera_id = int(els[0])
-			camera["w"] = float(els[2])
-			camera["h"] = float(els[3])
-			camera["fl_x"] = float(els[4])
-			camera["fl_y"] = float(els[4])
-			camera["k1"] = 0
-			camera["k2"] = 0
-			camera["k3"] = 0
-			camera["k4"] = 0
-			camera["p1"] = 0
-			camera["p2"] = 0
-			camera["cx"] = camera["w"] / 2
-			camera["cy"] = camera["h"] / 2
-			camera["is_fisheye"] = False
-			if els[1] == "SIMPLE_PINHOLE":
-				camera["cx"] = float(els[5])
-				camera["cy"] = float(els[6])
-			elif els[1] == "PINHOLE":
-				camera["fl_y"] = float(els[5])
-				camera["cx"] = float(els[6])
-				camera["cy"] = float(els[7])
-			elif els[1] == "SIMPLE_RADIAL":
-				camera["cx"] = float(els[5])
-				camera["cy"] = float(els[6])
-				camera["k1"] = float(els[7])
-			elif els[1] == "RADIAL":
-				camera["cx"] = float(els[5])
-				camera["cy"] = float(els[6])
-				camera["k1"] = float(els[7])
-				camera["k2"] = float(els[8])
-			elif els[1] == "OPENCV":
-				camera["fl_y"] = float(els[5])
-				camera["cx"] = float(els[6])
-				camera["cy"] = float(els[7])
-				camera["k1"] = float(els[8])
-				camera["k2"] = float(els[9])
-				camera["p1"] = float(els[10])
-				camera["p2"] = float(els[11])
-			elif els[1] == "SIMPLE_RADIAL_FISHEYE":
-				camera["is_fisheye"] = True
-				camera["cx"] = float(els[5])
-				camera["cy"] = float(els[6])
-				camera["k1"] = float(els[7])
-			elif els[1] == "RADIAL_FISHEYE":
-				camera["is_fisheye"] = True
-				camera["cx"] = float(els[5])
-				camera["cy"] = float(els[6])
-				camera["k1"] = float(els[7])
-				camera["k2"] = float(els[8])
-			elif els[1] == "OPENCV_FISHEYE":
-				camera["is_fisheye"] = True
-				camera["fl_y"] = float(els[5])
-				camera["cx"] = float(els[6])
-				camera["cy"] = float(els[7])
-				camera["k1"] = float(els[8])
-				camera["k2"] = float(els[9])
-				camera["k3"] = float(els[10])
-				camera["k4"] = float(els[11])
-			else:
-				print("Unknown camera model ", els[1])
-			# fl = 0.5 * w / tan(0.5 * angle_x);
-			camera["camera_angle_x"] = math.atan(camera["w"] / (camera["fl_x"] * 2)) * 2
-			camera["camera_angle_y"] = math.atan(camera["h"] / (camera["fl_y"] * 2)) * 2
-			camera["fovx"] = camera["camera_angle_x"] * 180 / math.pi
-			camera["fovy"] = camera["camera_angle_y"] * 180 / math.pi
-
-			print(f"camera {camera_id}:\n\tres={camera['w'],camera['h']}\n\tcenter={camera['cx'],camera['cy']}\n\tfocal={camera['fl_x'],camera['fl_y']}\n\tfov={camera['fovx'],camera['fovy']}\n\tk={camera['k1'],camera['k2']} p={camera['p1'],camera['p2']} ")
-			cameras[camera_id] = camera
+	camera_angle_x = math.pi / 2
+	for camera_id, colmap_camera in colmap_cameras.items():
+		# 1 SIMPLE_RADIAL 2048 1536 1580.46 1024 768 0.0045691
+		# 1 OPENCV 3840 2160 3178.27 3182.09 1920 1080 0.159668 -0.231286 -0.00123982 0.00272224
+		# 1 RADIAL 1920 1080 1665.1 960 540 0.0672856 -0.0761443
+		model = colmap_camera.model
+		params = colmap_camera.params
+		camera = {}
+		camera["w"] = float(colmap_camera.width)
+		camera["h"] = float(colmap_camera.height)
+		camera["fl_x"] = float(params[0])
+		camera["fl_y"] = float(params[0])
+		camera["k1"] = 0
+		camera["k2"] = 0
+		camera["k3"] = 0
+		camera["k4"] = 0
+		camera["p1"] = 0
+		camera["p2"] = 0
+		camera["cx"] = camera["w"] / 2
+		camera["cy"] = camera["h"] / 2
+		camera["is_fisheye"] = False
+		if model == "SIMPLE_PINHOLE":
+			camera["cx"] = float(params[1])
+			camera["cy"] = float(params[2])
+		elif model == "PINHOLE":
+			camera["fl_y"] = float(params[1])
+			camera["cx"] = float(params[2])
+			camera["cy"] = float(params[3])
+		elif model == "SIMPLE_RADIAL":
+			camera["cx"] = float(params[1])
+			camera["cy"] = float(params[2])
+			camera["k1"] = float(params[3])
+		elif model == "RADIAL":
+			camera["cx"] = float(params[1])
+			camera["cy"] = float(params[2])
+			camera["k1"] = float(params[3])
+			camera["k2"] = float(params[4])
+		elif model == "OPENCV":
+			camera["fl_y"] = float(params[1])
+			camera["cx"] = float(params[2])
+			camera["cy"] = float(params[3])
+			camera["k1"] = float(params[4])
+			camera["k2"] = float(params[5])
+			camera["p1"] = float(params[6])
+			camera["p2"] = float(params[7])
+		elif model == "SIMPLE_RADIAL_FISHEYE":
+			camera["is_fisheye"] = True
+			camera["cx"] = float(params[1])
+			camera["cy"] = float(params[2])
+			camera["k1"] = float(params[3])
+		elif model == "RADIAL_FISHEYE":
+			camera["is_fisheye"] = True
+			camera["cx"] = float(params[1])
+			camera["cy"] = float(params[2])
+			camera["k1"] = float(params[3])
+			camera["k2"] = float(params[4])
+		elif model == "OPENCV_FISHEYE":
+			camera["is_fisheye"] = True
+			camera["fl_y"] = float(params[1])
+			camera["cx"] = float(params[2])
+			camera["cy"] = float(params[3])
+			camera["k1"] = float(params[4])
+			camera["k2"] = float(params[5])
+			camera["k3"] = float(params[6])
+			camera["k4"] = float(params[7])
+		else:
+			print("Unknown camera model ", model)
+		# fl = 0.5 * w / tan(0.5 * angle_x);
+		camera["camera_angle_x"] = math.atan(camera["w"] / (camera["fl_x"] * 2)) * 2
+		camera["camera_angle_y"] = math.atan(camera["h"] / (camera["fl_y"] * 2)) * 2
+		camera["fovx"] = camera["camera_angle_x"] * 180 / math.pi
+		camera["fovy"] = camera["camera_angle_y"] * 180 / math.pi
+
+		print(f"camera {camera_id}:\n\tres={camera['w'],camera['h']}\n\tcenter={camera['cx'],camera['cy']}\n\tfocal={camera['fl_x'],camera['fl_y']}\n\tfov={camera['fovx'],camera['fovy']}\n\tk={camera['k1'],camera['k2']} p={camera['p1'],camera['p2']} ")
+		cameras[camera_id] = camera
 
 	if len(cameras) == 0:
 		print("No cameras found!")
 		sys.exit(1)
 
-	with open(os.path.join(TEXT_FOLDER,"images.txt"), "r") as f:
-		i = 0
-		bottom = np.array([0.0, 0.0, 0.0, 1.0]).reshape([1, 4])
-		if len(cameras) == 1:
-			camera = cameras[camera_id]
-			out = {
-				"camera_angle_x": camera["camera_angle_x"],
-				"camera_angle_y": camera["camera_angle_y"],
-				"fl_x": camera["fl_x"],
-				"fl_y": camera["fl_y"],
-				"k1": camera["k1"],
-				"k2": camera["k2"],
-				"k3": camera["k3"],
-				"k4": camera["k4"],
-				"p1": camera["p1"],
-				"p2": camera["p2"],
-				"is_fisheye": camera["is_fisheye"],
-				"cx": camera["cx"],
-				"cy": camera["cy"],
-				"w": camera["w"],
-				"h": camera["h"],
-				"aabb_scale": AABB_SCALE,
-				"frames": [],
-			}
-		else:
-			out = {
-				"frames": [],
-				"aabb_scale": AABB_SCALE
-			}
-
-		up = np.zeros(3)
-		for line in f:
-			line = line.strip()
-			if line[0] == "#":
-				continue
-			i = i + 1
-			if i < SKIP_EARLY*2:
-				continue
-			if  i % 2 == 1:
-				elems=line.split(" ") # 1-4 is quat, 5-7 is trans, 9ff is filename (9, if filename contains no spaces)
-				#name = str(PurePosixPath(Path(IMAGE_FOLDER, elems[9])))
-				# why is this requireing a relitive path while using ^
-				image_rel = os.path.relpath(IMAGE_FOLDER)
-				name = str(f"./{image_rel}/{'_'.join(elems[9:])}")
-				b = sharpness(name)
-				print(name, "sharpness=",b)
-				image_id = int(elems[0])
-				qvec = np.array(tuple(map(float, elems[1:5])))
-				tvec = np.array(tuple(map(float, elems[5:8])))
-				R = qvec2rotmat(-qvec)
-				t = tvec.reshape([3,1])
-				m = np.concatenate([np.concatenate([R, t], 1), bottom], 0)
-				c2w = np.linalg.inv(m)
-				if not args.keep_colmap_coords:
-					c2w[0:3,2] *= -1 # flip the y and z axis
-					c2w[0:3,1] *= -1
-					c2w = c2w[[1,0,2,3],:]
-					c2w[2,:] *= -1 # flip whole world upside down
-
-					up += c2w[0:3,1]
-
-				frame = {"file_path":name,"sharpness":b,"transform_matrix": c2w}
-				if len(cameras) != 1:
-					frame.update(cameras[int(elems[8])])
-				out["frames"].append(frame)
+	bottom = np.array([0.0, 0.0, 0.0, 1.0]).reshape([1, 4])
+	if len(cameras) == 1:
+		camera = cameras[camera_id]
+		out = {
+			"camera_angle_x": camera["camera_angle_x"],
+			"camera_angle_y": camera["camera_angle_y"],
+			"fl_x": camera["fl_x"],
+			"fl_y": camera["fl_y"],
+			"k1": camera["k1"],
+			"k2": camera["k2"],
+			"k3": camera["k3"],
+			"k4": camera["k4"],
+			"p1": camera["p1"],
+			"p2": camera["p2"],
+			"is_fisheye": camera["is_fisheye"],
+			"cx": camera["cx"],
+			"cy": camera["cy"],
+			"w": camera["w"],
+			"h": camera["h"],
+			"aabb_scale": AABB_SCALE,
+			"frames": [],
+		}
+	else:
+		out = {
+			"frames": [],
+			"aabb_scale": AABB_SCALE
+		}
+
+	for qvec, tvec, camera_id, image_name in list(zip(colmap_images.qvecs, colmap_images.tvecs, colmap_images.camera_ids, colmap_images.names))[SKIP_EARLY:]:
+		#name = str(PurePosixPath(Path(IMAGE_FOLDER, image_name)))
+		# why is this requireing a relitive path while using ^
+		image_rel = os.path.relpath(IMAGE_FOLDER)
+		name = str(f"./{image_rel}/{'_'.join(image_name.split(' '))}")
+		R = qvec2rotmat(-qvec)
+		t = tvec.reshape([3,1])
+		m = np.concatenate([np.concatenate([R, t], 1), bottom], 0)
+		c2w = np.linalg.inv(m)
+		if not args.keep_colmap_coords:
+			c2w[0:3,2] *= -1 # flip the y and z axis
+			c2w[0:3,1] *= -1
+			c2w = c2w[[1,0,2,3],:]
+			c2w[2,:] *= -1 # flip whole world upside down
+
+		frame = {"file_path":name,"sharpness":None,"transform_matrix": c2w}
+		if len(cameras) != 1:
+			frame.update(cameras[int(camera_id)])
+		out["frames"].append(frame)
 	nframes = len(out["frames"])
 
+	print("computing sharpness...")
+	for f, b in zip(out["frames"], compute_sharpness([f["file_path"] for f in out["frames"]], reduction=args.sharpness_reduction)):
+		print(f["file_path"], "sharpness=",b)
+		f["sharpness"] = b
+
+	if args.depth_priors:
+		print("computing depth priors...")
+		depth_maps = compute_depth_maps(colmap_cameras, colmap_images, colmap_points3D, range(SKIP_EARLY, len(colmap_images.ids)), args.depth_min_track_length, args.depth_max_reprojection_error, args.depth_splat_radius)
+
+	if args.auto_aabb:
+		# Reliable COLMAP points, in COLMAP's coordinates
+		points = colmap_points3D.xyz[reliable_points(colmap_points3D, args.depth_min_track_length, args.depth_max_reprojection_error)]
+
+	scale = 1.0
 	if args.keep_colmap_coords:
 		flip_mat = np.array([
 			[1, 0, 0, 0],
@@ -365,93 +379,62 @@ if __name__ == "__main__":
 			f["transform_matrix"] = np.matmul(f["transform_matrix"], flip_mat) # flip cameras (it just works)
 	else:
 		# don't keep colmap coords - reorient the scene to be easier to work with
+		c2ws = np.stack([f["transform_matrix"] for f in out["frames"]])
 
-		up = up / np.linalg.norm(up)
+		up = up_vector(c2ws)
 		print("up vector was", up)
-		R = rotmat(up,[0,0,1]) # rotate up vector to [0,0,1]
-		R = np.pad(R,[0,1])
-		R[-1, -1] = 1
-
-		for f in out["frames"]:
-			f["transform_matrix"] = np.matmul(R, f["transform_matrix"]) # rotate up to be the z axis
+		R_up = up_rotation(up)
+		c2ws = R_up @ c2ws # rotate up to be the z axis
 
 		# find a central point they are all looking at
 		print("computing center of attention...")
-		totw = 0.0
-		totp = np.array([0.0, 0.0, 0.0])
-		for f in out["frames"]:
-			mf = f["transform_matrix"][0:3,:]
-			for g in out["frames"]:
-				mg = g["transform_matrix"][0:3,:]
-				p, w = closest_point_2_lines(mf[:,3], mf[:,2], mg[:,3], mg[:,2])
-				if w > 0.00001:
-					totp += p*w
-					totw += w
-		if totw > 0.0:
-			totp /= totw
+		totp = center_of_attention(c2ws)
 		print(totp) # the cameras are looking at totp
-		for f in out["frames"]:
-			f["transform_matrix"][0:3,3] -= totp
 
-		avglen = 0.
-		for f in out["frames"]:
-			avglen += np.linalg.norm(f["transform_matrix"][0:3,3])
-		avglen /= nframes
-		print("avg camera distance from origin", avglen)
-		for f in out["frames"]:
-			f["transform_matrix"][0:3,3] *= 4.0 / avglen # scale to "nerf sized"
+		print("avg camera distance from origin", average_distance(c2ws, totp))
+		scale = nerf_scale(c2ws, totp)
+		c2ws = translate_and_scale(c2ws, totp, scale) # scale to "nerf sized"
+
+		if args.auto_aabb:
+			# same transform as the cameras: swap x and y, flip z, align up, translate and scale
+			points = points[:, [1, 0, 2]] * [1, 1, -1]
+			points = (points @ R_up[0:3, 0:3].T - totp) * scale
+
+		for f, c2w in zip(out["frames"], c2ws):
+			f["transform_matrix"] = c2w
 
 	for f in out["frames"]:
 		f["transform_matrix"] = f["transform_matrix"].tolist()
+
+	if args.depth_priors:
+		depth_unit = integer_depth_scale(depth_maps, scale)
+		if depth_unit is None:
+			print("No reliable COLMAP points, no depth priors written")
+		else:
+			depth_rel = os.path.relpath(args.depth_folder)
+			depth_paths = []
+			resolutions = []
+			for f, image_name, camera_id in zip(out["frames"], colmap_images.names[SKIP_EARLY:], colmap_images.camera_ids[SKIP_EARLY:]):
+				depth_paths.append(f"./{depth_rel}/{os.path.splitext('_'.join(image_name.split(' ')))[0]}.png")
+				resolutions.append((int(colmap_cameras[int(camera_id)].width), int(colmap_cameras[int(camera_id)].height)))
+				f["depth_path"] = depth_paths[-1]
+			print(f"writing {len(depth_paths)} depth maps to {args.depth_folder}, {sum(len(d) for _, d in depth_maps)} depth samples")
+			write_depth_maps(depth_paths, resolutions, depth_maps, depth_unit, scale)
+			out["integer_depth_scale"] = depth_unit
+
+	if args.auto_aabb:
+		c2ws = np.array([f["transform_matrix"] for f in out["frames"]])
+		intrinsics = np.array([frame_intrinsics(out, f) for f in out["frames"]])
+		aabb_scale, render_aabb = fit_bounds(c2ws, intrinsics, out, points)
+		print_gain(report_gain(c2ws, intrinsics, out, aabb_scale, render_aabb))
+		out["aabb_scale"] = aabb_scale
+		out["render_aabb"] = render_aabb
 	print(nframes,"frames")
 	print(f"writing {OUT_PATH}")
 	with open(OUT_PATH, "w") as outfile:
 		json.dump(out, outfile, indent=2)
 
 	if len(args.mask_categories) > 0:
-		# Check if detectron2 is installed. If not, install it.
-		try:
-			import detectron2
-		except ModuleNotFoundError:
-			try:
-				import torch
-			except ModuleNotFoundError:
-				print("PyTorch is not installed. For automatic masking, install PyTorch from https://pytorch.org/")
-				sys.exit(1)
-
-			input("Detectron2 is not installed. Press enter to install it.")
-			import subprocess
-			package = 'git+https://github.com/facebookresearch/detectron2.git'
-			subprocess.check_call([sys.executable, "-m", "pip", "install", package])
-			import detectron2
-
-		import torch
-		from pathlib import Path
-		from detectron2.config import get_cfg
-		from detectron2 import model_zoo
-		from detectron2.engine import DefaultPredictor
-
-		category2id = json.load(open(SCRIPTS_FOLDER / "category2id.json", "r"))
-		mask_ids = [category2id[c] for c in args.mask_categories]
-
-		cfg = get_cfg()
-		# Add project-specific config (e.g., TensorMask) here if you're not running a model in detectron2's core library
-		cfg.merge_from_file(model_zoo.get_config_file("COCO-InstanceSegmentation/mask_rcnn_R_50_FPN_3x.yaml"))
-		cfg.MODEL.ROI_HEADS.SCORE_THRESH_TEST = 0.5  # set threshold for this model
-		# Find a model from detectron2's model zoo.
-		cfg.MODEL.WEIGHTS = model_zoo.get_checkpoint_url("COCO-InstanceSegmentation/mask_rcnn_R_50_FPN_3x.yaml")
-		predictor = DefaultPredictor(cfg)
-
-		for frame in out["frames"]:
-			img = cv2.imread(frame["file_path"])
-			outputs = predictor(img)
-
-			output_mask = np.zeros((img.shape[0], img.shape[1]))
-			for i in range(len(outputs["instances"])):
-				if outputs["instances"][i].pred_classes.cpu().numpy()[0] in mask_ids:
-					pred_mask = outputs["instances"][i].pred_masks.cpu().numpy()[0]
-					output_mask = np.logical_or(output_mask, pred_mask)
-
-			rgb_path = Path(frame["file_path"])
-			mask_name = str(rgb_path.parents[0] / Path("dynamic_mask_" + rgb_path.name.replace(".jpg", ".png")))
-			cv2.imwrite(mask_name, (output_mask*255).astype(np.uint8))
+		mask_ids = category_ids(args.mask_categories)
+		predictor = Detectron2Predictor(mask_ids)
+		generate_masks([f["file_path"] for f in out["frames"]], predictor, mask_ids)
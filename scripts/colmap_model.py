@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# Reader for COLMAP sparse models, in the binary (cameras.bin, images.bin, points3D.bin) or text format.
+#
+# Binary files are read at once with np.fromfile and decoded with structured dtypes. Only the offsets of the
+# variable-length records (image names, 2D points, tracks) are walked in Python, all the fields are gathered
+# as arrays, so that models with hundreds of thousands of images or millions of points load in seconds.
+# See https://colmap.github.io/format.html for the file formats.
+
+import os
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+# model_id: (model_name, num_params)
+CAMERA_MODELS = {
+	0: ("SIMPLE_PINHOLE", 3),
+	1: ("PINHOLE", 4),
+	2: ("SIMPLE_RADIAL", 4),
+	3: ("RADIAL", 5),
+	4: ("OPENCV", 8),
+	5: ("OPENCV_FISHEYE", 8),
+	6: ("FULL_OPENCV", 12),
+	7: ("FOV", 5),
+	8: ("SIMPLE_RADIAL_FISHEYE", 4),
+	9: ("RADIAL_FISHEYE", 5),
+	10: ("THIN_PRISM_FISHEYE", 12),
+}
+CAMERA_MODEL_IDS = {name: model_id for model_id, (name, _) in CAMERA_MODELS.items()}
+
+Camera = namedtuple("Camera", ["id", "model", "width", "height", "params"])
+
+# One entry per registered image, in file order. qvecs are [w, x, y, z] world-to-camera rotations.
+# If loaded, the 2D points of image i are points2D_xy[points2D_offsets[i]:points2D_offsets[i+1]] (and same for points2D_point3D_ids).
+Images = namedtuple("Images", ["ids", "qvecs", "tvecs", "camera_ids", "names", "points2D_offsets", "points2D_xy", "points2D_point3D_ids"])
+
+# The track of point i is track_image_ids[track_offsets[i]:track_offsets[i+1]] (and same for track_point2D_idxs)
+Points3D = namedtuple("Points3D", ["ids", "xyz", "rgb", "errors", "track_offsets", "track_image_ids", "track_point2D_idxs"])
+
+CAMERA_HEADER_DTYPE = np.dtype([("id", "<i4"), ("model_id", "<i4"), ("width", "<u8"), ("height", "<u8")])
+IMAGE_HEADER_DTYPE = np.dtype([("id", "<i4"), ("qvec", "<f8", 4), ("tvec", "<f8", 3), ("camera_id", "<i4")])
+POINT2D_DTYPE = np.dtype([("xy", "<f8", 2), ("point3D_id", "<i8")])
+POINT3D_HEADER_DTYPE = np.dtype([("id", "<u8"), ("xyz", "<f8", 3), ("rgb", "u1", 3), ("error", "<f8"), ("track_length", "<u8")])
+TRACK_ELEMENT_DTYPE = np.dtype([("image_id", "<i4"), ("point2D_idx", "<i4")])
+
+# Records decoded at once by `_gather`, bounds the size of its byte index arrays
+GATHER_CHUNK_SIZE = 1 << 16
+
+def _gather(data, offsets, dtype):
+	# Decodes records of `dtype` starting at the byte `offsets` of `data`
+	offsets = np.asarray(offsets, dtype=np.int64)
+	result = np.empty(len(offsets), dtype=dtype)
+	result_bytes = result.view(np.uint8).reshape(len(offsets), dtype.itemsize)
+	byte_range = np.arange(dtype.itemsize)
+	for start in range(0, len(offsets), GATHER_CHUNK_SIZE):
+		chunk = offsets[start:start + GATHER_CHUNK_SIZE]
+		result_bytes[start:start + len(chunk)] = data[chunk[:, np.newaxis] + byte_range]
+	return result
+
+def _gather_ranges(data, starts, counts, dtype):
+	# Decodes the concatenation of `counts[i]` consecutive records of `dtype` starting at `starts[i]`
+	counts = np.asarray(counts, dtype=np.int64)
+	total = int(counts.sum())
+	first = np.cumsum(counts) - counts
+	offsets = np.repeat(np.asarray(starts, dtype=np.int64), counts) + (np.arange(total) - np.repeat(first, counts)) * dtype.itemsize
+	return _gather(data, offsets, dtype)
+
+def _offsets(counts):
+	return np.concatenate(([0], np.cumsum(counts, dtype=np.int64)))
+
+def read_cameras_binary(path):
+	data = np.fromfile(path, dtype=np.uint8)
+	n = struct.unpack_from("<Q", data, 0)[0]
+	cameras = {}
+	offset = 8
+	for _ in range(n):
+		header = _gather(data, [offset], CAMERA_HEADER_DTYPE)[0]
+		model_name, num_params = CAMERA_MODELS[int(header["model_id"])]
+		offset += CAMERA_HEADER_DTYPE.itemsize
+		params = data[offset:offset + 8 * num_params].view("<f8").copy()
+		offset += 8 * num_params
+		cameras[int(header["id"])] = Camera(int(header["id"]), model_name, int(header["width"]), int(header["height"]), params)
+	return cameras
+
+def read_images_binary(path, load_points2D=False):
+	data = np.fromfile(path, dtype=np.uint8)
+	buffer = data.tobytes()
+	n = struct.unpack_from("<Q", buffer, 0)[0]
+
+	header_offsets = np.empty(n, dtype=np.int64)
+	points_offsets = np.empty(n, dtype=np.int64)
+	num_points = np.empty(n, dtype=np.int64)
+	names = []
+	offset = 8
+	for i in range(n):
+		header_offsets[i] = offset
+		name_start = offset + IMAGE_HEADER_DTYPE.itemsize
+		name_end = buffer.index(b"\0", name_start)
+		names.append(buffer[name_start:name_end].decode("utf-8"))
+		num_points[i] = struct.unpack_from("<Q", buffer, name_end + 1)[0]
+		points_offsets[i] = name_end + 9
+		offset = points_offsets[i] + num_points[i] * POINT2D_DTYPE.itemsize
+
+	headers = _gather(data, header_offsets, IMAGE_HEADER_DTYPE)
+	points2D_offsets, points2D_xy, points2D_point3D_ids = None, None, None
+	if load_points2D:
+		points = _gather_ranges(data, points_offsets, num_points, POINT2D_DTYPE)
+		points2D_offsets = _offsets(num_points)
+		points2D_xy = points["xy"]
+		points2D_point3D_ids = points["point3D_id"]
+	return Images(headers["id"].astype(np.int64), headers["qvec"], headers["tvec"], headers["camera_id"].astype(np.int64), names, points2D_offsets, points2D_xy, points2D_point3D_ids)
+
+def read_points3D_binary(path):
+	data = np.fromfile(path, dtype=np.uint8)
+	buffer = data.tobytes()
+	n = struct.unpack_from("<Q", buffer, 0)[0]
+
+	# Only the track lengths are needed to walk the records
+	header_offsets = np.empty(n, dtype=np.int64)
+	track_lengths = np.empty(n, dtype=np.int64)
+	length_offset = POINT3D_HEADER_DTYPE.fields["track_length"][1]
+	unpack_length = struct.Struct("<Q").unpack_from
+	offset = 8
+	for i in range(n):
+		header_offsets[i] = offset
+		track_length = unpack_length(buffer, offset + length_offset)[0]
+		track_lengths[i] = track_length
+		offset += POINT3D_HEADER_DTYPE.itemsize + track_length * TRACK_ELEMENT_DTYPE.itemsize
+
+	headers = _gather(data, header_offsets, POINT3D_HEADER_DTYPE)
+	tracks = _gather_ranges(data, header_offsets + POINT3D_HEADER_DTYPE.itemsize, track_lengths, TRACK_ELEMENT_DTYPE)
+	return Points3D(headers["id"].astype(np.int64), headers["xyz"], headers["rgb"], headers["error"], _offsets(track_lengths), tracks["image_id"].astype(np.int64), tracks["point2D_idx"].astype(np.int64))
+
+def read_cameras_text(path):
+	cameras = {}
+	with open(path, "r") as f:
+		for line in f:
+			# 1 OPENCV 3840 2160 3178.27 3182.09 1920 1080 0.159668 -0.231286 -0.00123982 0.00272224
+			line = line.strip()
+			if len(line) == 0 or line[0] == "#":
+				continue
+			els = line.split()
+			cameras[int(els[0])] = Camera(int(els[0]), els[1], int(els[2]), int(els[3]), np.array(tuple(map(float, els[4:]))))
+	return cameras
+
+def read_images_text(path, load_points2D=False):
+	ids, qvecs, tvecs, camera_ids, names = [], [], [], [], []
+	points = []
+	with open(path, "r") as f:
+		lines = [line.strip() for line in f if not line.startswith("#")]
+	# Two lines per image, the second one (2D points) may be empty
+	for i in range(0, len(lines), 2):
+		elems = lines[i].split(" ") # 1-4 is quat, 5-7 is trans, 9ff is filename (9, if filename contains no spaces)
+		if len(elems) < 10:
+			continue
+		ids.append(int(elems[0]))
+		qvecs.append(tuple(map(float, elems[1:5])))
+		tvecs.append(tuple(map(float, elems[5:8])))
+		camera_ids.append(int(elems[8]))
+		names.append(" ".join(elems[9:]))
+		if load_points2D:
+			points.append(np.array(tuple(map(float, lines[i + 1].split())) if i + 1 < len(lines) else (), dtype=np.float64).reshape(-1, 3))
+
+	points2D_offsets, points2D_xy, points2D_point3D_ids = None, None, None
+	if load_points2D:
+		points2D_offsets = _offsets([len(p) for p in points])
+		points = np.concatenate(points) if points else np.zeros((0, 3))
+		points2D_xy = points[:, 0:2]
+		points2D_point3D_ids = points[:, 2].astype(np.int64)
+	return Images(np.array(ids, dtype=np.int64), np.array(qvecs, dtype=np.float64).reshape(-1, 4), np.array(tvecs, dtype=np.float64).reshape(-1, 3), np.array(camera_ids, dtype=np.int64), names, points2D_offsets, points2D_xy, points2D_point3D_ids)
+
+def read_points3D_text(path):
+	ids, xyz, rgb, errors, tracks = [], [], [], [], []
+	with open(path, "r") as f:
+		for line in f:
+			line = line.strip()
+			if len(line) == 0 or line[0] == "#":
+				continue
+			els = line.split()
+			ids.append(int(els[0]))
+			xyz.append(tuple(map(float, els[1:4])))
+			rgb.append(tuple(map(int, els[4:7])))
+			errors.append(float(els[7]))
+			tracks.append(np.array(tuple(map(int, els[8:])), dtype=np.int64).reshape(-1, 2))
+	track = np.concatenate(tracks) if tracks else np.zeros((0, 2), dtype=np.int64)
+	return Points3D(np.array(ids, dtype=np.int64), np.array(xyz, dtype=np.float64).reshape(-1, 3), np.array(rgb, dtype=np.uint8).reshape(-1, 3), np.array(errors, dtype=np.float64), _offsets([len(t) for t in tracks]), track[:, 0], track[:, 1])
+
+def qvecs_to_rotmats(qvecs):
+	# [w, x, y, z] quaternions (N, 4) to rotation matrices (N, 3, 3)
+	w, x, y, z = np.moveaxis(np.asarray(qvecs, dtype=np.float64), -1, 0)
+	return np.stack([
+		1 - 2 * y**2 - 2 * z**2, 2 * x * y - 2 * w * z, 2 * z * x + 2 * w * y,
+		2 * x * y + 2 * w * z, 1 - 2 * x**2 - 2 * z**2, 2 * y * z - 2 * w * x,
+		2 * z * x - 2 * w * y, 2 * y * z + 2 * w * x, 1 - 2 * x**2 - 2 * y**2,
+	], axis=-1).reshape(w.shape + (3, 3))
+
+def detect_model_format(folder):
+	if all(os.path.isfile(os.path.join(folder, f"{name}.bin")) for name in ("cameras", "images")):
+		return ".bin"
+	if all(os.path.isfile(os.path.join(folder, f"{name}.txt")) for name in ("cameras", "images")):
+		return ".txt"
+	raise FileNotFoundError(f"No COLMAP model (cameras and images, .bin or .txt) in {folder}")
+
+def read_model(folder, load_points2D=False, load_points3D=False):
+	# Returns (cameras, images, points3D) of the model in `folder`, points3D is None unless requested
+	ext = detect_model_format(folder)
+	if ext == ".bin":
+		cameras = read_cameras_binary(os.path.join(folder, "cameras.bin"))
+		images = read_images_binary(os.path.join(folder, "images.bin"), load_points2D)
+		points3D = read_points3D_binary(os.path.join(folder, "points3D.bin")) if load_points3D else None
+	else:
+		cameras = read_cameras_text(os.path.join(folder, "cameras.txt"))
+		images = read_images_text(os.path.join(folder, "images.txt"), load_points2D)
+		points3D = read_points3D_text(os.path.join(folder, "points3D.txt")) if load_points3D else None
+	return cameras, images, points3D
+
+def write_cameras_binary(path, cameras):
+	with open(path, "wb") as f:
+		f.write(struct.pack("<Q", len(cameras)))
+		for camera in cameras.values():
+			f.write(struct.pack("<iiQQ", camera.id, CAMERA_MODEL_IDS[camera.model], camera.width, camera.height))
+			f.write(np.asarray(camera.params, dtype="<f8").tobytes())
+
+def write_images_binary(path, images):
+	with open(path, "wb") as f:
+		f.write(struct.pack("<Q", len(images.ids)))
+		for i in range(len(images.ids)):
+			f.write(struct.pack("<i4d3di", images.ids[i], *images.qvecs[i], *images.tvecs[i], images.camera_ids[i]))
+			f.write(images.names[i].encode("utf-8") + b"\0")
+			points = np.zeros(0, dtype=POINT2D_DTYPE)
+			if images.points2D_offsets is not None:
+				start, end = images.points2D_offsets[i], images.points2D_offsets[i + 1]
+				points = np.zeros(end - start, dtype=POINT2D_DTYPE)
+				points["xy"] = images.points2D_xy[start:end]
+				points["point3D_id"] = images.points2D_point3D_ids[start:end]
+			f.write(struct.pack("<Q", len(points)))
+			f.write(points.tobytes())
+
+def write_points3D_binary(path, points3D):
+	with open(path, "wb") as f:
+		f.write(struct.pack("<Q", len(points3D.ids)))
+		for i in range(len(points3D.ids)):
+			start, end = points3D.track_offsets[i], points3D.track_offsets[i + 1]
+			f.write(struct.pack("<Q3d3BdQ", points3D.ids[i], *points3D.xyz[i], *points3D.rgb[i], points3D.errors[i], end - start))
+			track = np.zeros(end - start, dtype=TRACK_ELEMENT_DTYPE)
+			track["image_id"] = points3D.track_image_ids[start:end]
+			track["point2D_idx"] = points3D.track_point2D_idxs[start:end]
+			f.write(track.tobytes())
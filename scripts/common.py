@@ -178,9 +178,12 @@ def write_image(file, img, quality=95):
 		write_image_imageio(file, img, quality)
 
 def trim(error, skip=0.000001):
-	error = np.sort(error.flatten())
+	error = error.flatten()
 	size = error.size
 	skip = int(skip * size)
+	if 0 < skip < size:
+		# Only the two cut points need to be in place, no need to sort the whole array
+		error = np.partition(error, (skip, size-skip-1))
 	return error[skip:size-skip].mean()
 
 def luminance(a):
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# Compaction of snapshots for storage and transfer, and expansion back to snapshots the testbed loads.
+#
+# The hash grid encoding holds most of the weights of a NeRF. Its parameters are located after the density and color
+# MLPs (NerfNetwork::set_params_impl), level by level as tiny-cuda-nn's GridEncoding lays them out, and quantized to
+# int8 with one scale per level and feature. Optionally, the hash entries whose features all stay within
+# sparsify_threshold of 0, e.g. entries no training sample touched since their initialization in [-1e-4, 1e-4], are
+# dropped and restored as 0. The MLPs and the density grid are kept as they are, and the optimizer state, which the
+# renderer does not need, is dropped. The result is msgpack compressed with zstd (by default if the zstandard module
+# is installed), zlib (the default otherwise) or lzma, after an 8 byte magic and a codec byte.
+#
+# The report gives the size ratio and the PSNR of the restored weights. With --reference_transforms (needs pyngp and a
+# GPU), both snapshots also render the views of a transforms file, and the PSNR of the compacted renders against the
+# original ones is reported.
+
+import argparse
+import importlib.util
+import json
+import lzma
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from snapshot import PARAMS_TYPES, packb, read_snapshot, unpackb, write_snapshot
+
+COMPACT_MAGIC = b"INGPCPT\x01"
+COMPACT_EXTENSION = ".ingpc"
+CODECS = {"zstd": 1, "zlib": 2, "lzma": 3}
+# Defaults of Testbed::reset_network and of tiny-cuda-nn's grid encodings
+NERF_DESIRED_RESOLUTION = 2048.0
+TESTBED_LOG2_HASHMAP_SIZE = 15
+TCNN_LOG2_HASHMAP_SIZE = 19
+N_POS_DIMS = 3
+
+def parse_args():
+	parser = argparse.ArgumentParser(description="Compact snapshots (.ingp/.msgpack) for storage, or expand compacted snapshots (.ingpc) back to .ingp.")
+	parser.add_argument("inputs", nargs="+", help="Snapshots to compact, or compacted snapshots to expand.")
+	parser.add_argument("--out_dir", default="", help="Output folder. Defaults to the folder of each input.")
+	parser.add_argument("--codec", default=None, choices=list(CODECS), help="Compression of the compacted snapshots. Defaults to zstd if the zstandard module is installed, zlib otherwise.")
+	parser.add_argument("--level", default=None, type=int, help="Compression level of the codec (default: its own).")
+	parser.add_argument("--no_quantize", action="store_true", help="Keep the hash grid in fp16, only drop the optimizer state and recompress.")
+	parser.add_argument("--sparsify_threshold", default=0.0, type=float, help="Drop the hash entries whose features are all within this value of 0 (e.g. 1e-4 for untouched entries). 0 keeps all entries.")
+	parser.add_argument("--keep_optimizer_state", action="store_true", help="Keep the optimizer state of the snapshots, to resume training.")
+	parser.add_argument("--reference_transforms", default="", help="Transforms file of views rendered by the original and the compacted snapshot to report the PSNR impact (needs pyngp).")
+	parser.add_argument("--spp", default=8, type=int, help="Samples per pixel of the reference renders.")
+	parser.add_argument("--n_workers", default=None, type=int, help="Number of processes handling snapshots (one per CPU by default).")
+	return parser.parse_args()
+
+def _float32(x):
+	return float(np.float32(x))
+
+def grid_layout(config):
+	# (offset of the hash grid in the params, [(first entry, number of entries) of each level], features per level),
+	# None if the model has no grid encoding whose parameters can be located
+	snapshot = config["snapshot"]
+	encoding = config.get("encoding", {})
+	otype = encoding.get("otype", "").lower()
+	if "grid" not in otype or snapshot.get("mode", "Nerf") != "Nerf":
+		return None
+	# Only grid encodings have parameters, the direction encoding must have none for the grid to end the params
+	if "grid" in json.dumps(config.get("dir_encoding", {}), default=dict).lower():
+		return None
+
+	n_features = int(encoding.get("n_features_per_level", 2))
+	n_levels = int(encoding["n_features"]) // n_features if encoding.get("n_features", 0) > 0 else int(encoding.get("n_levels", 16))
+	base_resolution = int(encoding.get("base_resolution", 0)) or 1 << (int(encoding.get("log2_hashmap_size", TESTBED_LOG2_HASHMAP_SIZE)) // N_POS_DIMS)
+	per_level_scale = float(encoding.get("per_level_scale", 0.0))
+	if per_level_scale <= 0 and n_levels > 1:
+		aabb_scale = snapshot.get("nerf", {}).get("aabb_scale", 1)
+		per_level_scale = _float32(np.exp(np.log(np.float32(NERF_DESIRED_RESOLUTION * aabb_scale / base_resolution)) / np.float32(n_levels - 1)))
+	elif per_level_scale <= 0:
+		per_level_scale = 2.0
+	log2_hashmap_size = int(encoding.get("log2_hashmap_size", TCNN_LOG2_HASHMAP_SIZE))
+	grid_type = {"hashgrid": "hash", "densegrid": "dense", "tiledgrid": "tiled"}.get(otype, encoding.get("type", "Hash").lower())
+
+	levels = []
+	start = 0
+	log2_per_level_scale = np.log2(np.float32(per_level_scale))
+	for level in range(n_levels):
+		# GridEncodingTemplated: grid_resolution(grid_scale(level, ...)) vertices per axis, aligned to 8 entries
+		scale = np.float32(np.exp2(np.float32(level * log2_per_level_scale)) * np.float32(base_resolution) - np.float32(1.0))
+		resolution = int(np.ceil(scale)) + 1
+		n_entries = min(resolution**N_POS_DIMS, (1 << 32) // 2 - 1)
+		n_entries = -(-n_entries // 8) * 8
+		if grid_type == "hash":
+			n_entries = min(n_entries, 1 << log2_hashmap_size)
+		elif grid_type == "tiled":
+			n_entries = min(n_entries, base_resolution**N_POS_DIMS)
+		levels.append((start, n_entries))
+		start += n_entries
+
+	offset = int(snapshot["n_params"]) - start * n_features
+	if offset < 0:
+		return None
+	return offset, levels, n_features
+
+def quantize_level(values, sparsify_threshold=0.0):
+	# int8 features of the (entries, features) values of a level, their scales, and the mask of the kept entries
+	values = values.astype(np.float32)
+	mask = None
+	if sparsify_threshold > 0:
+		kept = np.abs(values).max(axis=1) > sparsify_threshold
+		mask = np.packbits(kept)
+		values = values[kept]
+	scales = np.abs(values).max(axis=0) / 127 if len(values) > 0 else np.zeros(values.shape[1], dtype=np.float32)
+	scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+	quantized = np.clip(np.round(values / scales), -127, 127).astype(np.int8)
+	return {"scales": scales, "quantized": quantized, "mask": mask}
+
+def dequantize_level(level, n_entries, n_features):
+	quantized = np.frombuffer(level["quantized"], dtype=np.int8).reshape(-1, n_features)
+	values = quantized.astype(np.float32) * np.frombuffer(level["scales"], dtype=np.float32)
+	if level["mask"] is None:
+		return values
+	kept = np.unpackbits(np.frombuffer(level["mask"], dtype=np.uint8), count=n_entries).astype(bool)
+	restored = np.zeros((n_entries, n_features), dtype=np.float32)
+	restored[kept] = values
+	return restored
+
+def compact(config, quantize=True, sparsify_threshold=0.0, keep_optimizer_state=False):
+	# Compacted copy of a snapshot config: params_binary replaced by a dict of its parts
+	snapshot = dict(config["snapshot"])
+	params = np.frombuffer(snapshot["params_binary"], dtype=PARAMS_TYPES[snapshot.get("params_type", "__half")])
+	if not keep_optimizer_state:
+		snapshot.pop("optimizer", None)
+
+	layout = grid_layout(config) if quantize else None
+	if layout is None:
+		snapshot["params_binary"] = {"dense": params}
+	else:
+		offset, levels, n_features = layout
+		end = offset + sum(n for _, n in levels) * n_features
+		grid = params[offset:end].reshape(-1, n_features)
+		snapshot["params_binary"] = {
+			"dense": params[:offset],
+			"tail": params[end:],
+			"n_features": n_features,
+			"levels": [dict(quantize_level(grid[start:start + n], sparsify_threshold), n_entries=n) for start, n in levels],
+		}
+	return dict(config, snapshot=snapshot)
+
+def expand(compacted):
+	# Snapshot config of a compacted one
+	snapshot = dict(compacted["snapshot"])
+	parts = snapshot["params_binary"]
+	dtype = PARAMS_TYPES[snapshot.get("params_type", "__half")]
+	params = [np.frombuffer(parts["dense"], dtype=dtype)]
+	if "levels" in parts:
+		params += [dequantize_level(level, level["n_entries"], parts["n_features"]).astype(dtype).reshape(-1) for level in parts["levels"]]
+		params.append(np.frombuffer(parts["tail"], dtype=dtype))
+	snapshot["params_binary"] = np.concatenate(params)
+	return dict(compacted, snapshot=snapshot)
+
+def default_codec():
+	return "zstd" if importlib.util.find_spec("zstandard") is not None else "zlib"
+
+def _codec(codec, level=None):
+	# (compress, decompress) functions of a codec
+	if codec == "zstd":
+		try:
+			import zstandard
+		except ImportError:
+			raise ImportError("The zstd codec needs the zstandard module (pip install zstandard), or use --codec zlib")
+		return zstandard.ZstdCompressor(level=3 if level is None else level).compress, zstandard.ZstdDecompressor().decompress
+	if codec == "zlib":
+		return (lambda data: zlib.compress(data, 1 if level is None else level)), zlib.decompress
+	if codec == "lzma":
+		return (lambda data: lzma.compress(data, preset=6 if level is None else level)), lzma.decompress
+	raise ValueError(f"Unknown codec {codec}, supported codecs are {list(CODECS)}")
+
+def is_compact(path):
+	with open(path, "rb") as f:
+		return f.read(len(COMPACT_MAGIC)) == COMPACT_MAGIC
+
+def write_compact(path, compacted, codec=None, level=None):
+	codec = codec or default_codec()
+	compress, _ = _codec(codec, level)
+	data = compress(packb(compacted))
+	with open(path + ".tmp", "wb") as f:
+		f.write(COMPACT_MAGIC + bytes([CODECS[codec]]))
+		f.write(data)
+	os.replace(path + ".tmp", path)
+
+def read_compact(path):
+	with open(path, "rb") as f:
+		if f.read(len(COMPACT_MAGIC)) != COMPACT_MAGIC:
+			raise ValueError(f"{path} is not a compacted snapshot")
+		codec_id = f.read(1)[0]
+		data = f.read()
+	codec = {value: key for key, value in CODECS.items()}.get(codec_id)
+	if codec is None:
+		raise ValueError(f"{path} uses an unknown codec ({codec_id})")
+	_, decompress = _codec(codec)
+	return unpackb(decompress(data))
+
+def params_psnr(original, restored):
+	# PSNR (dB) of restored weights, the peak being the largest original weight
+	original, restored = original.astype(np.float64), restored.astype(np.float64)
+	mse = np.mean((original - restored)**2)
+	peak = np.abs(original).max()
+	return float("inf") if mse == 0 else float(10 * np.log10(peak**2 / mse))
+
+def output_path(path, out_dir, extension):
+	folder = out_dir or os.path.dirname(path)
+	return os.path.join(folder, os.path.splitext(os.path.basename(path))[0] + extension)
+
+def compact_snapshot(path, out_path, codec=None, level=None, quantize=True, sparsify_threshold=0.0, keep_optimizer_state=False):
+	# Writes the compacted snapshot, returns its report
+	original = read_snapshot(path)
+	compacted = compact(original.config, quantize, sparsify_threshold, keep_optimizer_state)
+	codec = codec or default_codec()
+	write_compact(out_path, compacted, codec, level)
+	parts = compacted["snapshot"]["params_binary"]
+	levels = parts.get("levels", [])
+	n_dropped = sum(level["n_entries"] - len(level["quantized"]) for level in levels)
+	n_entries = sum(level["n_entries"] for level in levels)
+	return {
+		"input": path,
+		"output": out_path,
+		"codec": codec,
+		"input_bytes": os.path.getsize(path),
+		"output_bytes": os.path.getsize(out_path),
+		"ratio": os.path.getsize(path) / os.path.getsize(out_path),
+		"quantized": bool(levels),
+		"dropped_entries": n_dropped / n_entries if n_entries else 0.0,
+		"params_psnr": params_psnr(original.params_binary, expand(compacted)["snapshot"]["params_binary"]),
+	}
+
+def expand_snapshot(path, out_path):
+	# Writes the standard snapshot of a compacted one
+	write_snapshot(out_path, expand(read_compact(path)))
+	return {"input": path, "output": out_path}
+
+def render_views(snapshot_path, transforms_path, spp=8):
+	# Linear renders of the views of a transforms file, as in run.py --test_transforms
+	import common # noqa, adds the build folder to the path
+	import pyngp as ngp
+	testbed = ngp.Testbed()
+	testbed.load_snapshot(snapshot_path)
+	testbed.background_color = [0.0, 0.0, 0.0, 1.0]
+	testbed.snap_to_pixel_centers = True
+	testbed.nerf.render_min_transmittance = 1e-4
+	testbed.shall_train = False
+	testbed.load_training_data(transforms_path)
+	images = []
+	for i in range(testbed.nerf.training.dataset.n_images):
+		resolution = testbed.nerf.training.dataset.metadata[i].resolution
+		testbed.set_camera_to_training_view(i)
+		images.append(testbed.render(resolution[0], resolution[1], spp, True))
+	return images
+
+def render_psnr(snapshot_path, compact_path, transforms_path, spp=8, out_dir=""):
+	# PSNR of the renders of a compacted snapshot against the renders of the original one
+	from image_metrics import compute_metrics
+	expanded_path = output_path(compact_path, out_dir, ".expanded.ingp")
+	expand_snapshot(compact_path, expanded_path)
+	try:
+		pairs = list(zip(render_views(expanded_path, transforms_path, spp), render_views(snapshot_path, transforms_path, spp)))
+	finally:
+		os.remove(expanded_path)
+	return compute_metrics(pairs, ("PSNR",))["aggregate"]["PSNR"]
+
+def _process(path, args):
+	if is_compact(path):
+		return expand_snapshot(path, output_path(path, args.out_dir, ".ingp"))
+	return compact_snapshot(path, output_path(path, args.out_dir, COMPACT_EXTENSION), args.codec, args.level, not args.no_quantize, args.sparsify_threshold, args.keep_optimizer_state)
+
+if __name__ == "__main__":
+	args = parse_args()
+	if args.out_dir:
+		os.makedirs(args.out_dir, exist_ok=True)
+	if args.n_workers is not None and args.n_workers <= 1:
+		reports = [_process(path, args) for path in args.inputs]
+	else:
+		with ProcessPoolExecutor(max_workers=args.n_workers) as pool:
+			reports = list(pool.map(_process, args.inputs, [args] * len(args.inputs)))
+
+	for report in reports:
+		if "ratio" not in report:
+			print(f"{report['input']} -> {report['output']}")
+			continue
+		print(f"{report['input']} -> {report['output']}: {report['input_bytes'] / 2**20:.1f} MiB -> {report['output_bytes'] / 2**20:.1f} MiB ({report['ratio']:.2f}x, {report['codec']}), weights PSNR {report['params_psnr']:.1f} dB, {100 * report['dropped_entries']:.1f}% hash entries dropped")
+		if args.reference_transforms:
+			psnr = render_psnr(report["input"], report["output"], args.reference_transforms, args.spp, args.out_dir)
+			print(f"  render PSNR against the original: {psnr['mean']:.2f} dB [min={psnr['min']:.2f} max={psnr['max']:.2f}]")
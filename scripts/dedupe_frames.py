@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# Removes the near-duplicate frames of a capture (e.g. long runs of frames from a stationary phone), keeping the
+# sharpest frame of each group.
+#
+# Each image gets a 64 bit perceptual hash (DCT of a 32x32 grayscale thumbnail, low frequencies compared to their
+# median), computed in a process pool. Hashes are put in a BK-tree (metric tree over the Hamming distance), and
+# frames are visited from the sharpest: each kept frame drops the frames within max_distance bits of it that are not
+# kept yet, found with a BK-tree query instead of a comparison with every other frame. Every dropped frame has a
+# kept frame within max_distance bits.
+#
+# The input is either a transforms file, written back with the kept frames only, or an image folder (before
+# COLMAP), for which the list of kept images is written, e.g. for COLMAP's --ImageReader.image_list_path.
+
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from retrieval_pairs import list_images
+from select_keyframes import rebase_paths, resolve_image_path
+from sharpness import compute_sharpness
+
+HASH_SIZE = 8
+THUMBNAIL_SIZE = 32
+
+def parse_args():
+	parser = argparse.ArgumentParser(description="Remove the near-duplicate frames of a transforms file or an image folder, keeping the sharpest ones.")
+	parser.add_argument("input", help="Transforms file, or image folder.")
+	parser.add_argument("--out", required=True, help="Output transforms file, or, for an image folder, output list of the kept images.")
+	parser.add_argument("--max_distance", default=4, type=int, help="Frames whose perceptual hashes differ by at most this many bits (out of 64) are duplicates.")
+	parser.add_argument("--sharpness_reduction", default=2, type=int, choices=[1, 2, 4, 8], help="Downscaling factor of the images when computing the sharpness of frames that have none.")
+	parser.add_argument("--n_workers", default=None, type=int, help="Number of processes hashing the images (one per CPU by default).")
+	return parser.parse_args()
+
+def perceptual_hash(path):
+	# 64 bit DCT hash of an image, as a Python int
+	image = cv2.imread(path, cv2.IMREAD_REDUCED_GRAYSCALE_4)
+	if image is None:
+		raise IOError(f"Could not read {path}")
+	thumbnail = cv2.resize(image, (THUMBNAIL_SIZE, THUMBNAIL_SIZE), interpolation=cv2.INTER_AREA).astype(np.float32)
+	low_frequencies = cv2.dct(thumbnail)[:HASH_SIZE, :HASH_SIZE]
+	# The DC term is left out of the median, it is much larger than the others
+	bits = low_frequencies.ravel() > np.median(low_frequencies.ravel()[1:])
+	return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+def compute_hashes(paths, n_workers=None):
+	if n_workers is not None and n_workers <= 1:
+		return [perceptual_hash(path) for path in paths]
+	with ProcessPoolExecutor(max_workers=n_workers) as pool:
+		chunksize = max(1, len(paths) // (4 * (n_workers or os.cpu_count() or 1)))
+		return list(pool.map(perceptual_hash, paths, chunksize=chunksize))
+
+def hamming_distance(a, b):
+	return bin(a ^ b).count("1")
+
+class BKTree:
+	# Hashes and the indices of the frames that have them. Nodes are [hash, indices, {distance: child}].
+	def __init__(self):
+		self.root = None
+
+	def add(self, value, index):
+		if self.root is None:
+			self.root = [value, [index], {}]
+			return
+		node = self.root
+		while True:
+			distance = hamming_distance(value, node[0])
+			if distance == 0:
+				node[1].append(index)
+				return
+			child = node[2].get(distance)
+			if child is None:
+				node[2][distance] = [value, [index], {}]
+				return
+			node = child
+
+	def query(self, value, max_distance):
+		# Indices of the frames whose hash is within max_distance of value
+		found = []
+		stack = [self.root] if self.root is not None else []
+		while stack:
+			node = stack.pop()
+			distance = hamming_distance(value, node[0])
+			if distance <= max_distance:
+				found += node[1]
+			# Triangle inequality: only children at distance in [distance - max_distance, distance + max_distance]
+			stack += [child for d, child in node[2].items() if abs(d - distance) <= max_distance]
+		return found
+
+def select_unique(hashes, scores, max_distance=4):
+	# Sorted indices of the frames kept: from the highest score, each kept frame drops its near-duplicates
+	tree = BKTree()
+	for i, value in enumerate(hashes):
+		tree.add(value, i)
+	dropped = np.zeros(len(hashes), dtype=bool)
+	kept = []
+	for i in np.argsort(-np.asarray(scores, dtype=np.float64), kind="stable"):
+		if dropped[i]:
+			continue
+		kept.append(int(i))
+		dropped[tree.query(hashes[i], max_distance)] = True
+	return sorted(kept)
+
+def dedupe_images(paths, max_distance=4, sharpness_reduction=2, n_workers=None, scores=None):
+	# Indices of the kept images. scores, if given, are used instead of the sharpness of the images.
+	if scores is None:
+		scores = compute_sharpness(paths, reduction=sharpness_reduction, n_workers=n_workers)
+	return select_unique(compute_hashes(paths, n_workers), scores, max_distance)
+
+def dedupe_folder(image_folder, max_distance=4, sharpness_reduction=2, n_workers=None):
+	# Names, relative to image_folder, of the kept images of a folder
+	paths = list_images(image_folder)
+	kept = dedupe_images(paths, max_distance, sharpness_reduction, n_workers)
+	return [os.path.relpath(paths[i], image_folder).replace("\\", "/") for i in kept]
+
+def dedupe_transforms(transforms_path, out_path, max_distance=4, sharpness_reduction=2, n_workers=None):
+	# Writes the transforms with the kept frames only, returns (number of kept frames, number of frames)
+	with open(transforms_path) as f:
+		transforms = json.load(f)
+	frames = transforms["frames"]
+	in_dir = os.path.dirname(os.path.abspath(transforms_path))
+	paths = [resolve_image_path(in_dir, frame["file_path"]) for frame in frames]
+	# The sharpness written by colmap2nerf is used when every frame has one
+	scores = None
+	if frames and all(frame.get("sharpness") is not None for frame in frames):
+		scores = [frame["sharpness"] for frame in frames]
+	kept = dedupe_images(paths, max_distance, sharpness_reduction, n_workers, scores)
+
+	out_dir = os.path.dirname(os.path.abspath(out_path))
+	transforms["frames"] = [rebase_paths(frames[i], in_dir, out_dir) for i in kept]
+	with open(out_path, "w") as f:
+		json.dump(transforms, f, indent=2)
+	return len(kept), len(frames)
+
+def write_image_list(path, names):
+	with open(path, "w") as f:
+		for name in names:
+			f.write(f"{name}\n")
+
+if __name__ == "__main__":
+	args = parse_args()
+	if os.path.isdir(args.input):
+		names = dedupe_folder(args.input, args.max_distance, args.sharpness_reduction, args.n_workers)
+		write_image_list(args.out, names)
+		print(f"kept {len(names)} of {len(list_images(args.input))} images, wrote {args.out}")
+	else:
+		n_kept, n_frames = dedupe_transforms(args.input, args.out, args.max_distance, args.sharpness_reduction, args.n_workers)
+		print(f"kept {n_kept} of {n_frames} frames, wrote {args.out}")
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# Sparse depth priors from a COLMAP reconstruction, for depth-supervised training.
+#
+# The 3D points observed by each registered image are projected into it with its pose and intrinsics, including
+# the lens distortion (the training images are not undistorted, the loader distorts the rays instead). The depth
+# maps hold the camera space z of the nearest point at each pixel, 0 elsewhere, which the loader ignores, and are
+# written as uint16 images whose unit is the transforms' `integer_depth_scale`.
+#
+# Projection is vectorised over the points of an image, and images are processed in a thread pool (numpy and the
+# PNG encoder release the GIL).
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from colmap_model import qvecs_to_rotmats
+
+# COLMAP camera model: names of its parameters
+CAMERA_PARAMS = {
+	"SIMPLE_PINHOLE": ("f", "cx", "cy"),
+	"PINHOLE": ("fx", "fy", "cx", "cy"),
+	"SIMPLE_RADIAL": ("f", "cx", "cy", "k1"),
+	"RADIAL": ("f", "cx", "cy", "k1", "k2"),
+	"OPENCV": ("fx", "fy", "cx", "cy", "k1", "k2", "p1", "p2"),
+	"FULL_OPENCV": ("fx", "fy", "cx", "cy", "k1", "k2", "p1", "p2", "k3", "k4", "k5", "k6"),
+	"SIMPLE_RADIAL_FISHEYE": ("f", "cx", "cy", "k1"),
+	"RADIAL_FISHEYE": ("f", "cx", "cy", "k1", "k2"),
+	"OPENCV_FISHEYE": ("fx", "fy", "cx", "cy", "k1", "k2", "k3", "k4"),
+}
+FISHEYE_MODELS = {"SIMPLE_RADIAL_FISHEYE", "RADIAL_FISHEYE", "OPENCV_FISHEYE"}
+
+UINT16_MAX = 65535
+
+def camera_intrinsics(model, params):
+	if model not in CAMERA_PARAMS:
+		raise ValueError(f"Unsupported camera model for depth priors: {model}. Should be one of {list(CAMERA_PARAMS)}.")
+	intrinsics = dict(zip(CAMERA_PARAMS[model], (float(p) for p in params)))
+	if "f" in intrinsics:
+		intrinsics["fx"] = intrinsics["fy"] = intrinsics.pop("f")
+	for name in ("k1", "k2", "k3", "k4", "k5", "k6", "p1", "p2"):
+		intrinsics.setdefault(name, 0.0)
+	return intrinsics
+
+def project_points(points_cam, model, params):
+	# Pixel coordinates (N, 2) of camera space points (N, 3) in front of the camera, COLMAP conventions
+	# (the center of the top left pixel is (0.5, 0.5))
+	c = camera_intrinsics(model, params)
+	x = points_cam[:, 0] / points_cam[:, 2]
+	y = points_cam[:, 1] / points_cam[:, 2]
+	if model in FISHEYE_MODELS:
+		r = np.hypot(x, y)
+		theta = np.arctan(r)
+		theta2 = theta * theta
+		theta_d = theta * (1 + theta2 * (c["k1"] + theta2 * (c["k2"] + theta2 * (c["k3"] + theta2 * c["k4"]))))
+		scale = np.divide(theta_d, r, out=np.ones_like(r), where=r > 1e-12)
+		xd = x * scale
+		yd = y * scale
+	else:
+		r2 = x * x + y * y
+		radial = (1 + r2 * (c["k1"] + r2 * (c["k2"] + r2 * c["k3"]))) / (1 + r2 * (c["k4"] + r2 * (c["k5"] + r2 * c["k6"])))
+		xd = x * radial + 2 * c["p1"] * x * y + c["p2"] * (r2 + 2 * x * x)
+		yd = y * radial + c["p1"] * (r2 + 2 * y * y) + 2 * c["p2"] * x * y
+	return np.stack([c["fx"] * xd + c["cx"], c["fy"] * yd + c["cy"]], axis=-1)
+
+def _splat_offsets(radius):
+	r = int(np.ceil(radius))
+	offsets = np.stack(np.meshgrid(np.arange(-r, r + 1), np.arange(-r, r + 1), indexing="xy"), axis=-1).reshape(-1, 2)
+	return offsets[(offsets ** 2).sum(axis=-1) <= radius ** 2]
+
+def sparse_depth_map(camera, qvec, tvec, xyz, splat_radius=0):
+	# Returns (flat pixel indices, depths) of the points xyz (N, 3) seen by the camera, the nearest point wins
+	# each pixel. splat_radius > 0 draws each point as a disc, so that it is hit by more training rays.
+	points_cam = xyz @ qvecs_to_rotmats(qvec).T + tvec
+	points_cam = points_cam[points_cam[:, 2] > 0]
+	uv = project_points(points_cam, camera.model, camera.params)
+	valid = np.isfinite(uv).all(axis=-1)
+	pixels = np.floor(uv[valid]).astype(np.int64)
+	depths = points_cam[valid, 2]
+
+	if splat_radius > 0:
+		offsets = _splat_offsets(splat_radius)
+		pixels = (pixels[:, np.newaxis, :] + offsets).reshape(-1, 2)
+		depths = np.repeat(depths, len(offsets))
+
+	width, height = int(camera.width), int(camera.height)
+	inside = (pixels[:, 0] >= 0) & (pixels[:, 0] < width) & (pixels[:, 1] >= 0) & (pixels[:, 1] < height)
+	indices = pixels[inside, 1] * width + pixels[inside, 0]
+	depths = depths[inside]
+
+	order = np.lexsort((depths, indices))
+	indices, depths = indices[order], depths[order]
+	first = np.ones(len(indices), dtype=bool)
+	first[1:] = indices[1:] != indices[:-1]
+	return indices[first], depths[first]
+
+def reliable_points(points3D, min_track_length=2, max_reprojection_error=np.inf):
+	# Mask of the points3D seen by at least min_track_length images and with a mean reprojection error of at most
+	# max_reprojection_error pixels
+	return (np.diff(points3D.track_offsets) >= min_track_length) & (points3D.errors <= max_reprojection_error)
+
+def points_per_image(points3D, image_ids, min_track_length=2, max_reprojection_error=np.inf):
+	# Indices of the points3D observed by each image of image_ids, among the reliable points
+	track_lengths = np.diff(points3D.track_offsets)
+	reliable = reliable_points(points3D, min_track_length, max_reprojection_error)
+	observed_points = np.repeat(np.arange(len(track_lengths)), track_lengths)
+	observing_images = points3D.track_image_ids
+	keep = reliable[observed_points]
+	observed_points, observing_images = observed_points[keep], observing_images[keep]
+
+	order = np.argsort(observing_images, kind="stable")
+	observed_points, observing_images = observed_points[order], observing_images[order]
+	starts = np.searchsorted(observing_images, image_ids, side="left")
+	ends = np.searchsorted(observing_images, image_ids, side="right")
+	# A point may be observed more than once by the same image
+	return [np.unique(observed_points[start:end]) for start, end in zip(starts, ends)]
+
+def compute_depth_maps(cameras, images, points3D, image_indices=None, min_track_length=2, max_reprojection_error=np.inf, splat_radius=0, n_workers=None):
+	# Sparse depth maps, in COLMAP units, of images[image_indices] (all images by default), see sparse_depth_map
+	if image_indices is None:
+		image_indices = range(len(images.ids))
+	image_indices = list(image_indices)
+	visible_points = points_per_image(points3D, images.ids[image_indices], min_track_length, max_reprojection_error)
+
+	def depth_map(i, points):
+		camera = cameras[int(images.camera_ids[i])]
+		return sparse_depth_map(camera, images.qvecs[i], images.tvecs[i], points3D.xyz[points], splat_radius)
+
+	with ThreadPoolExecutor(max_workers=n_workers) as pool:
+		return list(pool.map(depth_map, image_indices, visible_points))
+
+def integer_depth_scale(depth_maps, scale=1.0):
+	# Unit of the uint16 depth images such that the farthest point is stored as UINT16_MAX, once the depths
+	# are multiplied by `scale` (the scale applied to the poses of the transforms). None if there is no point.
+	max_depth = max((depths.max() for _, depths in depth_maps if len(depths) > 0), default=None)
+	if max_depth is None:
+		return None
+	return float(max_depth) * scale / UINT16_MAX
+
+def write_depth_map(path, resolution, indices, depths, depth_unit):
+	width, height = resolution
+	image = np.zeros(height * width, dtype=np.uint16)
+	# Valid depths are never stored as 0, the loader's "no depth"
+	image[indices] = np.clip(np.rint(depths / depth_unit), 1, UINT16_MAX).astype(np.uint16)
+	os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+	if not cv2.imwrite(path, image.reshape(height, width)):
+		raise IOError(f"Could not write {path}")
+
+def write_depth_maps(paths, resolutions, depth_maps, depth_unit, scale=1.0, n_workers=None):
+	# Writes each depth map, multiplied by `scale`, in units of depth_unit
+	def write(path, resolution, depth_map):
+		indices, depths = depth_map
+		write_depth_map(path, resolution, indices, depths * scale, depth_unit)
+
+	with ThreadPoolExecutor(max_workers=n_workers) as pool:
+		list(pool.map(write, paths, resolutions, depth_maps))
@@ -0,0 +1,163 @@
+# Fast FLIP
+#
+# Same metric as `flip.compute_flip`, restructured for throughput:
+# - the CSF filters, feature detectors and the Hunt-adjusted cmax are built once per `pixels_per_degree`,
+# - every filter is applied as 1D convolutions: the achromatic and red-green CSFs are single Gaussians,
+#   the blue-yellow CSF is a sum of two Gaussians, and the edge/point detectors are a Gaussian times a
+#   polynomial in x (the sign of their weights only depends on x, so the +1/-1 normalization factors too).
+#   This is exact, and for these kernel sizes cheaper than an FFT convolution,
+# - everything runs in float32, on a single image (C,H,W) or on a batch (N,C,H,W),
+#   with the reference and test images filtered together.
+#
+# Results match `flip.compute_flip` to within 5e-4 absolute error per pixel (typically 1e-5),
+# and 1e-5 on the mean FLIP of an image.
+
+import functools
+
+import numpy as np
+from scipy.ndimage import convolve1d
+
+from flip import color_space_transform, hunt_adjustment, hyab
+
+QC = 0.7
+QF = 0.5
+
+# a1, b1, a2, b2 of the contrast sensitivity functions, see `flip.generate_spatial_filter`
+CSF_PARAMETERS = {
+    "A": (1, 0.0047, 0, 1e-5),
+    "RG": (1, 0.0053, 0, 1e-5),
+    "BY": (34.1, 0.04, 13.5, 0.025),
+}
+
+RGB2XYZ = np.array([[10135552 / 24577794, 8788810 / 24577794, 4435075 / 24577794],
+                    [2613072 / 12288897, 8788810 / 12288897, 887015 / 12288897],
+                    [1425312 / 73733382, 8788810 / 73733382, 70074185 / 73733382]])
+XYZ2RGB = np.linalg.inv(RGB2XYZ)
+# Transform of a white (1, 1, 1) linear RGB pixel, as computed by `color_space_transform(np.ones(dim), 'linrgb2xyz')`
+REFERENCE_ILLUMINANT = RGB2XYZ.sum(axis=1).astype(np.float32).reshape(3, 1, 1)
+
+
+@functools.lru_cache(maxsize=None)
+def csf_filters(pixels_per_degree):
+    # Returns, for each opponent channel, the list of (weight, 1D kernel) such that the 2D CSF kernel
+    # of `flip.generate_spatial_filter` is sum(weight * outer(kernel, kernel))
+    max_scale_parameter = max(max(b1, b2) for _, b1, _, b2 in CSF_PARAMETERS.values())
+    r = int(np.ceil(3 * np.sqrt(max_scale_parameter / (2 * np.pi**2)) * pixels_per_degree))
+    x = np.arange(-r, r + 1) / pixels_per_degree
+
+    filters = []
+    for channel in ("A", "RG", "BY"):
+        a1, b1, a2, b2 = CSF_PARAMETERS[channel]
+        terms = [(a * np.sqrt(np.pi / b), np.exp(-np.pi**2 * x**2 / b)) for a, b in ((a1, b1), (a2, b2)) if a != 0]
+        total = sum(a * np.sum(g)**2 for a, g in terms)
+        filters.append([(float(a / total), g) for a, g in terms])
+    return filters
+
+
+@functools.lru_cache(maxsize=None)
+def feature_filters(pixels_per_degree):
+    # Returns the (smoothing, derivative) 1D kernels of the edge and point detectors of `flip.feature_detection`:
+    # the 2D x-detector is outer(smoothing, derivative), the y-detector its transpose
+    w = 0.082
+    sd = 0.5 * w * pixels_per_degree
+    radius = int(np.ceil(3 * sd))
+    x = np.arange(-radius, radius + 1)
+    g = np.exp(-x**2 / (2 * sd * sd))
+
+    def normalize(gx):
+        return np.where(gx < 0, gx / -np.sum(gx[gx < 0]), gx / np.sum(gx[gx > 0]))
+
+    smoothing = g / np.sum(g)
+    edge = normalize(-x * g)
+    point = normalize((x**2 / (sd * sd) - 1) * g)
+    return smoothing, edge, point
+
+
+@functools.lru_cache(maxsize=None)
+def color_cmax():
+    hunt_adjusted_green = hunt_adjustment(color_space_transform(np.array([[[0.0]], [[1.0]], [[0.0]]]), 'linrgb2lab'))
+    hunt_adjusted_blue = hunt_adjustment(color_space_transform(np.array([[[0.0]], [[0.0]], [[1.0]]]), 'linrgb2lab'))
+    return float(np.power(hyab(hunt_adjusted_green, hunt_adjusted_blue), QC).squeeze())
+
+
+def _matmul_channels(matrix, img):
+    return np.einsum("ij,...jhw->...ihw", matrix.astype(np.float32), img)
+
+
+def _convolve2d(img, vertical, horizontal):
+    # 'nearest' is the edge padding of the reference implementation
+    img = convolve1d(img, vertical, axis=-2, mode="nearest")
+    return convolve1d(img, horizontal, axis=-1, mode="nearest")
+
+
+# The YCxCz luminance is kept without its -16 offset: the filters are normalized so they commute with it,
+# and dark regions keep their float32 precision.
+def srgb_to_ycxcz(img):
+    img = np.where(img > 0.04045, np.power((img + 0.055) / 1.055, 2.4), img / 12.92)
+    xyz = _matmul_channels(RGB2XYZ, img) / REFERENCE_ILLUMINANT
+    y = xyz[..., 1:2, :, :]
+    return np.concatenate((116 * y, 500 * (xyz[..., 0:1, :, :] - y), 200 * (y - xyz[..., 2:3, :, :])), axis=-3)
+
+
+def ycxcz_to_linrgb(img):
+    y = img[..., 0:1, :, :] / 116
+    xyz = np.concatenate((y + img[..., 1:2, :, :] / 500, y, y - img[..., 2:3, :, :] / 200), axis=-3)
+    return _matmul_channels(XYZ2RGB, xyz * REFERENCE_ILLUMINANT)
+
+
+def linrgb_to_hunt_lab(img):
+    xyz = _matmul_channels(RGB2XYZ, img) / REFERENCE_ILLUMINANT
+    delta = 6 / 29
+    f = np.where(xyz > 0.00885, np.cbrt(xyz), xyz / (3 * delta * delta) + 4 / 29)
+    L = 116 * f[..., 1:2, :, :] - 16
+    a = 500 * (f[..., 0:1, :, :] - f[..., 1:2, :, :])
+    b = 200 * (f[..., 1:2, :, :] - f[..., 2:3, :, :])
+    return np.concatenate((L, 0.01 * L * a, 0.01 * L * b), axis=-3)
+
+
+def spatial_filter(img, pixels_per_degree):
+    filtered = np.empty_like(img)
+    for channel, terms in enumerate(csf_filters(pixels_per_degree)):
+        channel_img = img[..., channel, :, :]
+        filtered[..., channel, :, :] = sum(weight * _convolve2d(channel_img, g, g) for weight, g in terms)
+    return np.clip(ycxcz_to_linrgb(filtered), 0.0, 1.0)
+
+
+def feature_magnitudes(imgy, pixels_per_degree):
+    smoothing, edge, point = feature_filters(pixels_per_degree)
+    magnitudes = []
+    for detector in (edge, point):
+        features_x = _convolve2d(imgy, smoothing, detector)
+        features_y = _convolve2d(imgy, detector, smoothing)
+        magnitudes.append(np.sqrt(features_x**2 + features_y**2))
+    return magnitudes
+
+
+def compute_flip(reference, test, pixels_per_degree):
+    # Drop-in for `flip.compute_flip`: sRGB images in [0, 1] of shape (3,H,W) or (N,3,H,W),
+    # returns the FLIP error map of shape (1,H,W) or (N,1,H,W)
+    assert reference.shape == test.shape
+    pixels_per_degree = float(pixels_per_degree)
+
+    # Reference and test share all filters: process them as one batch
+    images = srgb_to_ycxcz(np.stack((reference, test)).astype(np.float32))
+
+    # --- Color pipeline ---
+    preprocessed = linrgb_to_hunt_lab(spatial_filter(images, pixels_per_degree))
+    delta = preprocessed[0] - preprocessed[1]
+    deltaE_hyab = np.abs(delta[..., 0:1, :, :]) + np.sqrt(np.sum(delta[..., 1:3, :, :]**2, axis=-3, keepdims=True))
+
+    pc = 0.4
+    pt = 0.95
+    cmax = np.float32(color_cmax())
+    pccmax = pc * cmax
+    power_deltaE_hyab = np.power(deltaE_hyab, np.float32(QC))
+    deltaE_c = np.where(power_deltaE_hyab < pccmax, (pt / pccmax) * power_deltaE_hyab, pt + ((power_deltaE_hyab - pccmax) / (cmax - pccmax)) * (1.0 - pt))
+
+    # --- Feature pipeline ---
+    edges, points = feature_magnitudes(images[..., 0:1, :, :] / 116, pixels_per_degree)
+    deltaE_f = np.maximum(np.abs(edges[0] - edges[1]), np.abs(points[1] - points[0]))
+    deltaE_f = np.power(np.float32(1 / np.sqrt(2)) * deltaE_f, np.float32(QF))
+
+    # --- Final error ---
+    return np.power(deltaE_c, 1 - deltaE_f)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# Batched image-quality metrics (MSE, PSNR, SSIM, FLIP) for evaluating renders against references.
+#
+# All requested metrics of a frame are computed in a single pass that shares the sRGB
+# conversion of both images, in float32. Frames are spread over a process pool.
+# Values match `common.compute_error` applied the way `run.py` does (up to float32 rounding,
+# see `flip.fast` for the FLIP tolerance).
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+from scipy.ndimage import convolve1d
+
+from common import linear_to_srgb, luminance, mse2psnr
+import flip.fast
+import flip.utils
+
+METRICS = ["MSE", "PSNR", "SSIM", "FLIP"]
+
+# Same viewing conditions as `common.compute_error_img`: 0.7m away from a 0.7m wide 4K monitor
+FLIP_PIXELS_PER_DEGREE = 0.7 * (3840 / 0.7) * (np.pi / 180)
+
+SSIM_KERNEL = np.array([0.120078, 0.233881, 0.292082, 0.233881, 0.120078], dtype=np.float32)
+
+def to_display(img):
+	# Linear RGB(A) render -> clipped float32 sRGB, with non-finite values zeroed like `compute_error_img`
+	img = np.asarray(img, dtype=np.float32)[...,:3]
+	img = np.clip(linear_to_srgb(np.maximum(img, 0.0)), 0.0, 1.0)
+	img[np.logical_not(np.isfinite(img))] = 0.0
+	return img
+
+def ssim_map(a, b):
+	# Same as `common.SSIM`, but the five blurs are run as one stacked separable convolution
+	a = luminance(a)
+	b = luminance(b)
+	blurred = np.stack((a, b, a*a, b*b, a*b))
+	blurred = convolve1d(blurred, SSIM_KERNEL, axis=1)
+	mA, mB, aa, bb, ab = convolve1d(blurred, SSIM_KERNEL, axis=2)
+	sA = aa - mA**2
+	sB = bb - mB**2
+	sAB = ab - mA*mB
+	c1 = 0.01**2
+	c2 = 0.03**2
+	p1 = (2.0*mA*mB + c1)/(mA*mA + mB*mB + c1)
+	p2 = (2.0*sAB + c2)/(sA + sB + c2)
+	return p1 * p2
+
+def flip_map(a, b):
+	# `a` and `b` are already clipped sRGB, i.e. what `compute_error_img` feeds to FLIP
+	return flip.fast.compute_flip(flip.utils.HWCtoCHW(b), flip.utils.HWCtoCHW(a), FLIP_PIXELS_PER_DEGREE)
+
+def masked_mean(metric_map):
+	metric_map = np.where(np.isfinite(metric_map), metric_map, 0.0)
+	return float(np.mean(metric_map, dtype=np.float64))
+
+def check_metrics(metrics):
+	for metric in metrics:
+		if metric not in METRICS:
+			raise ValueError(f"Unknown metric: {metric}. Supported metrics are {METRICS}.")
+
+def frame_metrics(img, ref, metrics=("MSE", "PSNR", "SSIM")):
+	# Computes the requested metrics of a linear render `img` against its linear reference `ref`
+	check_metrics(metrics)
+	a = to_display(img)
+	b = to_display(ref)
+
+	result = {}
+	if "MSE" in metrics or "PSNR" in metrics:
+		mse = masked_mean((a - b)**2)
+		if "MSE" in metrics:
+			result["MSE"] = mse
+		if "PSNR" in metrics:
+			with np.errstate(divide="ignore"):
+				result["PSNR"] = float(mse2psnr(mse))
+	if "SSIM" in metrics:
+		result["SSIM"] = masked_mean(ssim_map(a, b))
+	if "FLIP" in metrics:
+		result["FLIP"] = masked_mean(flip_map(a, b))
+	return result
+
+def aggregate_metrics(frames, metrics):
+	aggregate = {}
+	for metric in metrics:
+		values = np.array([frame[metric] for frame in frames], dtype=np.float64)
+		if values.size == 0:
+			continue
+		aggregate[metric] = {"mean": float(values.mean()), "min": float(values.min()), "max": float(values.max())}
+	return aggregate
+
+def _pair_metrics(pair, metrics):
+	return frame_metrics(pair[0], pair[1], metrics)
+
+def compute_metrics(pairs, metrics=("MSE", "PSNR", "SSIM"), n_workers=None):
+	# Evaluates a batch of (image, reference) pairs. Returns a per-frame table and its aggregates:
+	# {"frames": [{"MSE": ..., ...}, ...], "aggregate": {"MSE": {"mean": ..., "min": ..., "max": ...}, ...}}
+	# n_workers=None uses one process per CPU, n_workers<=1 computes everything in this process.
+	metrics = list(metrics)
+	check_metrics(metrics)
+	if n_workers is not None and n_workers <= 1:
+		frames = [_pair_metrics(pair, metrics) for pair in pairs]
+	else:
+		with ProcessPoolExecutor(max_workers=n_workers) as pool:
+			frames = list(pool.map(partial(_pair_metrics, metrics=metrics), pairs))
+	return {"frames": frames, "aggregate": aggregate_metrics(frames, metrics)}
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# Image pair lists for COLMAP's matches_importer, from prior camera poses (e.g. Record3D / NeRFCapture transforms).
+#
+# Instead of matching all the pairs of images (exhaustive matcher), each image is only matched with its
+# num_neighbors nearest cameras (KD-tree over the camera positions) whose view frustum overlaps its own.
+# The overlap of a pair is estimated by projecting a grid of points of each frustum, up to frustum_depth, into the
+# other camera (pinhole model, distortion is neglected), so the matching cost is linear in the number of images.
+
+import argparse
+import os
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from select_keyframes import resolve_image_path
+from transforms_columns import load_columns
+
+# Pairs whose frustum overlaps are estimated at once, bounds the memory used
+OVERLAP_CHUNK_SIZE = 1 << 14
+
+def parse_args():
+	parser = argparse.ArgumentParser(description="Write a COLMAP pair list (for matches_importer) from the prior camera poses of a transforms file.")
+	parser.add_argument("transforms", help="Input transforms file, with prior poses.")
+	parser.add_argument("--images", default="", help="COLMAP image folder: image names are relative to it. Defaults to the common folder of the images.")
+	parser.add_argument("--out", default="pairs.txt", help="Output pair list.")
+	parser.add_argument("--num_neighbors", default=20, type=int, help="Number of nearest cameras considered for each image.")
+	parser.add_argument("--min_overlap", default=0.1, type=float, help="Minimum estimated frustum overlap (0 to 1) of a pair.")
+	parser.add_argument("--frustum_depth", default=0.0, type=float, help="Depth up to which frustums are compared, in units of the poses. Defaults to the average distance of the cameras to their centroid.")
+	return parser.parse_args()
+
+def frame_intrinsics(transforms, frame):
+	# (fl_x, fl_y, w, h) of a frame, whose own values override the transforms' ones
+	def get(key):
+		return frame.get(key, transforms.get(key))
+	w, h = get("w"), get("h")
+	fl_x, fl_y = get("fl_x"), get("fl_y")
+	if fl_x is None:
+		angle_x = get("camera_angle_x")
+		if angle_x is None:
+			raise ValueError("Frames need focal lengths (fl_x) or fields of view (camera_angle_x)")
+		if w is None:
+			w, h = 1.0, 1.0
+		fl_x = 0.5 * w / np.tan(0.5 * angle_x)
+		angle_y = get("camera_angle_y")
+		if fl_y is None and angle_y is not None:
+			fl_y = 0.5 * h / np.tan(0.5 * angle_y)
+	if w is None or h is None:
+		raise ValueError("Frames need their resolution (w and h)")
+	return float(fl_x), float(fl_y if fl_y is not None else fl_x), float(w), float(h)
+
+def frustum_samples(c2ws, intrinsics, depth, grid_size=4, n_depths=4):
+	# World space points (N, S, 3) regularly spread in the view frustums of the cameras, up to `depth`
+	c2ws = np.asarray(c2ws, dtype=np.float64)
+	intrinsics = np.asarray(intrinsics, dtype=np.float64)
+	uv = (np.arange(grid_size) + 0.5) / grid_size
+	u, v, d = np.meshgrid(uv, uv, np.arange(1, n_depths + 1) / n_depths * depth, indexing="ij")
+	u, v, d = u.ravel(), v.ravel(), d.ravel()
+	fl_x, fl_y, w, h = (intrinsics[:, i:i+1] for i in range(4))
+	# NeRF camera convention: x right, y up, looking along -z
+	x = (u * w - 0.5 * w) / fl_x * d
+	y = -(v * h - 0.5 * h) / fl_y * d
+	points_cam = np.stack([x, y, np.broadcast_to(-d, x.shape)], axis=-1)
+	return np.einsum("nij,nsj->nsi", c2ws[:, 0:3, 0:3], points_cam) + c2ws[:, np.newaxis, 0:3, 3]
+
+def visible_fraction(points, c2ws, intrinsics):
+	# Fraction of the points (P, S, 3) seen by the cameras (P, 4, 4), pinhole model
+	R = c2ws[:, 0:3, 0:3]
+	points_cam = np.einsum("pji,psj->psi", R, points - c2ws[:, np.newaxis, 0:3, 3])
+	fl_x, fl_y, w, h = (intrinsics[:, i:i+1] for i in range(4))
+	z = -points_cam[..., 2]
+	with np.errstate(divide="ignore", invalid="ignore"):
+		u = points_cam[..., 0] / z * fl_x + 0.5 * w
+		v = -points_cam[..., 1] / z * fl_y + 0.5 * h
+	visible = (z > 0) & (u >= 0) & (u < w) & (v >= 0) & (v < h)
+	return visible.mean(axis=-1)
+
+def pose_pairs(c2ws, intrinsics, num_neighbors=20, min_overlap=0.1, frustum_depth=0.0):
+	# Pairs (i, j), i < j, of nearby cameras with overlapping frustums, as an (M, 2) array
+	c2ws = np.asarray(c2ws, dtype=np.float64)
+	intrinsics = np.asarray(intrinsics, dtype=np.float64)
+	n = len(c2ws)
+	if n < 2:
+		return np.zeros((0, 2), dtype=np.int64)
+	positions = c2ws[:, 0:3, 3]
+	if frustum_depth <= 0:
+		frustum_depth = np.linalg.norm(positions - positions.mean(axis=0), axis=-1).mean() or 1.0
+
+	k = min(num_neighbors + 1, n)
+	_, neighbors = cKDTree(positions).query(positions, k=k)
+	candidates = np.stack([np.repeat(np.arange(n), k), neighbors.reshape(-1)], axis=-1)
+	candidates = np.sort(candidates[candidates[:, 0] != candidates[:, 1]], axis=-1)
+	candidates = np.unique(candidates, axis=0)
+
+	samples = frustum_samples(c2ws, intrinsics, frustum_depth)
+	overlap = np.empty(len(candidates))
+	for start in range(0, len(candidates), OVERLAP_CHUNK_SIZE):
+		i, j = candidates[start:start + OVERLAP_CHUNK_SIZE].T
+		overlap[start:start + len(i)] = 0.5 * (visible_fraction(samples[i], c2ws[j], intrinsics[j]) + visible_fraction(samples[j], c2ws[i], intrinsics[i]))
+	return candidates[overlap >= min_overlap]
+
+def write_pair_list(path, names, pairs):
+	# COLMAP matches_importer format: "name1 name2" per line
+	with open(path, "w") as f:
+		for i, j in pairs:
+			f.write(f"{names[i]} {names[j]}\n")
+
+def transforms_pairs(transforms_path, image_folder="", num_neighbors=20, min_overlap=0.1, frustum_depth=0.0):
+	# (image names relative to image_folder, pairs) of the frames of a transforms file
+	columns = load_columns(transforms_path)
+	base_dir = os.path.dirname(os.path.abspath(transforms_path))
+	paths = [resolve_image_path(base_dir, str(path)) for path in columns.column("file_path")]
+	if not image_folder:
+		image_folder = os.path.commonpath([os.path.dirname(path) for path in paths])
+	names = [os.path.relpath(path, image_folder).replace("\\", "/") for path in paths]
+	return names, pose_pairs(columns.c2ws(), columns.intrinsics(from_images=True), num_neighbors, min_overlap, frustum_depth)
+
+if __name__ == "__main__":
+	args = parse_args()
+	names, pairs = transforms_pairs(args.transforms, args.images, args.num_neighbors, args.min_overlap, args.frustum_depth)
+	print(f"{len(pairs)} pairs for {len(names)} images ({len(names) * (len(names) - 1) // 2} exhaustive pairs)")
+	write_pair_list(args.out, names, pairs)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# Selection of the frames streamed to a fixed number of training slots (live NeRFCapture streaming).
+#
+# Instead of overwriting the slots round-robin, a frame is only accepted if it adds view coverage or is sharper
+# than the frame it is redundant with:
+# - no slot within min_pose_distance: the frame goes to a free slot, or, once all slots are used, replaces the most
+#   redundant slot (the one closest to another slot), if the frame is farther from the slots than that one is,
+# - otherwise, it replaces its nearest slot if it is sharper by sharpness_margin, and is dropped if not.
+# The pose distance is the one of select_keyframes (camera position and rotation_weight * viewing direction, here
+# in the units of the stream), and slots are found with a uniform grid over the camera positions.
+#
+# Accepted frames are converted to linear RGBA float in preallocated buffers, through a uint8 -> linear lookup table.
+
+import math
+from collections import defaultdict
+
+import cv2
+import numpy as np
+
+from common import srgb_to_linear
+from sharpness import variance_of_laplacian
+
+SHARPNESS_REDUCTION = 4
+
+# uint8 sRGB to linear float
+SRGB_TO_LINEAR_LUT = srgb_to_linear(np.arange(256, dtype=np.float32) / 255.0).astype(np.float32)
+
+class LinearConverter:
+	# Converts uint8 sRGB images to linear float RGBA (alpha 0) and resizes depth maps, into reused buffers.
+	# The returned arrays are overwritten by the next call.
+	def __init__(self, width, height):
+		self.size = (width, height)
+		self.staging = np.zeros((height, width, 4), dtype=np.uint8)
+		self.rgba = np.empty((height, width, 4), dtype=np.float32)
+		self.depth = np.empty((height, width), dtype=np.float32)
+
+	def image(self, rgb):
+		self.staging[..., 0:3] = rgb
+		return cv2.LUT(self.staging, SRGB_TO_LINEAR_LUT, dst=self.rgba)
+
+	def depth_image(self, depth):
+		return cv2.resize(depth, dsize=self.size, dst=self.depth, interpolation=cv2.INTER_NEAREST)
+
+def frame_sharpness(rgb):
+	gray = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+	h, w = gray.shape
+	gray = cv2.resize(gray, (max(1, w // SHARPNESS_REDUCTION), max(1, h // SHARPNESS_REDUCTION)), interpolation=cv2.INTER_AREA)
+	return float(variance_of_laplacian(gray))
+
+class PoseSlots:
+	# Poses and sharpness of the frames in the training slots, with a grid over the camera positions
+	def __init__(self, max_slots, min_pose_distance=0.1, rotation_weight=0.5, sharpness_margin=0.1):
+		self.max_slots = max_slots
+		self.min_pose_distance = min_pose_distance
+		self.rotation_weight = rotation_weight
+		self.sharpness_margin = sharpness_margin
+		self.features = np.zeros((max_slots, 6))
+		self.sharpness = np.zeros(max_slots)
+		self.n_used = 0
+		self.grid = defaultdict(set)
+		self.cells = [None] * max_slots
+
+	def feature(self, c2w):
+		# Unlike select_keyframes, positions are not normalised: the stream's scale is known
+		c2w = np.asarray(c2w, dtype=np.float64)
+		direction = c2w[0:3, 2] / np.linalg.norm(c2w[0:3, 2])
+		return np.concatenate([c2w[0:3, 3], self.rotation_weight * direction])
+
+	def _cell(self, feature):
+		return tuple(math.floor(x / self.min_pose_distance) for x in feature[0:3])
+
+	def _set(self, slot, feature, sharpness):
+		if self.cells[slot] is not None:
+			self.grid[self.cells[slot]].discard(slot)
+		self.features[slot] = feature
+		self.sharpness[slot] = sharpness
+		self.cells[slot] = self._cell(feature)
+		self.grid[self.cells[slot]].add(slot)
+
+	def nearest(self, feature):
+		# (slot, distance) of the nearest slot within min_pose_distance, (None, inf) if there is none
+		cx, cy, cz = self._cell(feature)
+		candidates = [slot for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1) for slot in self.grid.get((cx + dx, cy + dy, cz + dz), ())]
+		if not candidates:
+			return None, math.inf
+		distances = np.linalg.norm(self.features[candidates] - feature, axis=-1)
+		i = int(np.argmin(distances))
+		if distances[i] > self.min_pose_distance:
+			return None, math.inf
+		return candidates[i], float(distances[i])
+
+	def most_redundant(self):
+		# (slot, distance to its nearest other slot) of the slot closest to another one
+		features = self.features[:self.n_used]
+		distances = np.linalg.norm(features[:, np.newaxis] - features[np.newaxis], axis=-1)
+		np.fill_diagonal(distances, np.inf)
+		nearest = distances.min(axis=-1)
+		slot = int(np.argmin(nearest))
+		return slot, float(nearest[slot])
+
+	def offer(self, c2w, sharpness):
+		# Slot the frame should be written to, or None if it should be dropped
+		feature = self.feature(c2w)
+		slot, _ = self.nearest(feature)
+		if slot is not None:
+			if sharpness > self.sharpness[slot] * (1.0 + self.sharpness_margin):
+				self._set(slot, feature, sharpness)
+				return slot
+			return None
+
+		if self.n_used < self.max_slots:
+			slot = self.n_used
+			self.n_used += 1
+			self._set(slot, feature, sharpness)
+			return slot
+
+		# All slots are used and the frame is novel: it replaces the most redundant slot, if it is less redundant
+		slot, redundancy = self.most_redundant()
+		novelty = np.linalg.norm(self.features[:self.n_used] - feature, axis=-1).min()
+		if novelty > redundancy:
+			self._set(slot, feature, sharpness)
+			return slot
+		return None
+
+class LiveIngestion:
+	# Decides which training slot each streamed frame goes to, and converts the accepted ones
+	def __init__(self, max_slots, min_pose_distance=0.1, rotation_weight=0.5, sharpness_margin=0.1):
+		self.slots = PoseSlots(max_slots, min_pose_distance, rotation_weight, sharpness_margin)
+		self.converter = None
+		self.received = 0
+		self.accepted = 0
+
+	@property
+	def n_used(self):
+		return self.slots.n_used
+
+	def offer(self, rgb, c2w, depth=None):
+		# Returns (slot, linear RGBA image, depth resized to the image or None) or None if the frame is dropped
+		self.received += 1
+		slot = self.slots.offer(c2w, frame_sharpness(rgb))
+		if slot is None:
+			return None
+		self.accepted += 1
+		h, w = rgb.shape[:2]
+		if self.converter is None or self.converter.size != (w, h):
+			self.converter = LinearConverter(w, h)
+		return slot, self.converter.image(rgb), None if depth is None else self.converter.depth_image(depth)
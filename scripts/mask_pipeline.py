@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# Generation of the `dynamic_mask_<image>.png` masks the loader excludes from training, with an instance
+# segmentation model.
+#
+# Images are decoded by a thread pool a few batches ahead of the predictor, the predictor is called on whole
+# batches, and masks are encoded and written by the same pool while the next batch is predicted. Images whose
+# mask is newer than the image are skipped.
+#
+# A predictor is any object with a `predict(images)` method taking a list of BGR uint8 images and returning, for
+# each image, (classes (K,) int array, masks (K, H, W) bool array) of its K detected instances. This allows running
+# without detectron2, e.g. with a fake model in tests, or any other model.
+
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+SCRIPTS_FOLDER = os.path.dirname(os.path.realpath(__file__))
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".exr", ".bmp"}
+DETECTRON2_CONFIG = "COCO-InstanceSegmentation/mask_rcnn_R_50_FPN_3x.yaml"
+
+def category_ids(categories):
+	with open(os.path.join(SCRIPTS_FOLDER, "category2id.json"), "r") as f:
+		category2id = json.load(f)
+	return [category2id[c] for c in categories]
+
+def mask_path(image_path):
+	# Same name as the loader looks for
+	folder, filename = os.path.split(image_path)
+	return os.path.join(folder, f"dynamic_mask_{os.path.splitext(filename)[0]}.png")
+
+def list_images(folder):
+	return sorted(
+		os.path.join(folder, f) for f in os.listdir(folder)
+		if os.path.splitext(f)[1].lower() in IMAGE_EXTENSIONS and not f.startswith("dynamic_mask_")
+	)
+
+def is_up_to_date(image_path):
+	path = mask_path(image_path)
+	return os.path.isfile(path) and os.path.getmtime(path) >= os.path.getmtime(image_path)
+
+def import_detectron2():
+	# Check if detectron2 is installed. If not, install it.
+	try:
+		import detectron2
+	except ModuleNotFoundError:
+		try:
+			import torch
+		except ModuleNotFoundError:
+			print("PyTorch is not installed. For automatic masking, install PyTorch from https://pytorch.org/")
+			sys.exit(1)
+
+		input("Detectron2 is not installed. Press enter to install it.")
+		import subprocess
+		package = 'git+https://github.com/facebookresearch/detectron2.git'
+		subprocess.check_call([sys.executable, "-m", "pip", "install", package])
+		import detectron2
+	return detectron2
+
+class Detectron2Predictor:
+	# Batched Mask R-CNN from detectron2's model zoo, on the GPU if there is one. Only the instances of class_ids
+	# (all if None) are moved to the CPU.
+	def __init__(self, class_ids=None, score_threshold=0.5, config=DETECTRON2_CONFIG, device=None):
+		import_detectron2()
+		import torch
+		from detectron2 import model_zoo
+		from detectron2.checkpoint import DetectionCheckpointer
+		from detectron2.config import get_cfg
+		from detectron2.data import transforms as T
+		from detectron2.modeling import build_model
+
+		cfg = get_cfg()
+		cfg.merge_from_file(model_zoo.get_config_file(config))
+		cfg.MODEL.ROI_HEADS.SCORE_THRESH_TEST = score_threshold
+		cfg.MODEL.WEIGHTS = model_zoo.get_checkpoint_url(config)
+		cfg.MODEL.DEVICE = device or ("cuda" if torch.cuda.is_available() else "cpu")
+
+		self.torch = torch
+		self.model = build_model(cfg)
+		self.model.eval()
+		DetectionCheckpointer(self.model).load(cfg.MODEL.WEIGHTS)
+		self.resize = T.ResizeShortestEdge([cfg.INPUT.MIN_SIZE_TEST, cfg.INPUT.MIN_SIZE_TEST], cfg.INPUT.MAX_SIZE_TEST)
+		self.input_format = cfg.INPUT.FORMAT
+		self.class_ids = None if class_ids is None else torch.as_tensor(list(class_ids), device=cfg.MODEL.DEVICE)
+
+	def predict(self, images):
+		inputs = []
+		for image in images:
+			height, width = image.shape[:2]
+			if self.input_format == "RGB":
+				image = image[:, :, ::-1]
+			resized = self.resize.get_transform(image).apply_image(image)
+			inputs.append({"image": self.torch.as_tensor(resized.astype("float32").transpose(2, 0, 1)), "height": height, "width": width})
+
+		with self.torch.no_grad():
+			outputs = self.model(inputs)
+
+		results = []
+		for output in outputs:
+			instances = output["instances"]
+			classes, masks = instances.pred_classes, instances.pred_masks
+			if self.class_ids is not None:
+				selected = self.torch.isin(classes, self.class_ids)
+				classes, masks = classes[selected], masks[selected]
+			results.append((classes.cpu().numpy(), masks.cpu().numpy()))
+		return results
+
+def union_mask(classes, masks, class_ids, shape):
+	# Union of the masks of the instances of class_ids, as a uint8 0/255 image
+	selected = np.isin(np.asarray(classes), list(class_ids))
+	if not selected.any():
+		return np.zeros(shape, dtype=np.uint8)
+	return np.any(np.asarray(masks)[selected], axis=0).astype(np.uint8) * 255
+
+def _read(path):
+	image = cv2.imread(path)
+	if image is None:
+		raise IOError(f"Could not read {path}")
+	return image
+
+def _write(path, mask):
+	if not cv2.imwrite(path, mask):
+		raise IOError(f"Could not write {path}")
+
+def generate_masks(image_paths, predictor, class_ids, batch_size=4, n_workers=4, prefetch_batches=2, overwrite=False, progress=None):
+	# Writes the mask of each image (see mask_path) and returns the paths of the written masks.
+	# progress, if given, is called with the number of images processed by each batch.
+	image_paths = [str(path) for path in image_paths]
+	todo = image_paths if overwrite else [path for path in image_paths if not is_up_to_date(path)]
+	if progress is not None and len(todo) < len(image_paths):
+		progress(len(image_paths) - len(todo))
+	batches = [todo[start:start + batch_size] for start in range(0, len(todo), batch_size)]
+	written = []
+
+	with ThreadPoolExecutor(max_workers=n_workers) as pool:
+		decoding = [[pool.submit(_read, path) for path in batch] for batch in batches[:prefetch_batches + 1]]
+		writes = []
+		for b, batch in enumerate(batches):
+			images = [future.result() for future in decoding[b]]
+			decoding[b] = None
+			next_batch = b + prefetch_batches + 1
+			if next_batch < len(batches):
+				decoding.append([pool.submit(_read, path) for path in batches[next_batch]])
+
+			for path, image, (classes, masks) in zip(batch, images, predictor.predict(images)):
+				out_path = mask_path(path)
+				writes.append(pool.submit(_write, out_path, union_mask(classes, masks, class_ids, image.shape[:2])))
+				written.append(out_path)
+			if progress is not None:
+				progress(len(batch))
+		for future in writes:
+			future.result()
+	return written
@@ -2,9 +2,7 @@
 # Streaming/Dataset capture script for the NeRFCapture iOS App
 
 import argparse
-import cv2
 from pathlib import Path
-import json
 import shutil
 
 import cyclonedds.idl as idl
@@ -17,16 +15,22 @@ from cyclonedds.sub import DataReader
 from cyclonedds.topic import Topic
 from cyclonedds.util import duration
 
+from capture_writer import CaptureWriter, capture_dataset
 from common import *
+from live_ingestion import LiveIngestion
 import pyngp as ngp  # noqa
 
 def parse_args():
 	parser = argparse.ArgumentParser()
 	parser.add_argument("--stream", action="store_true", help="Stream images directly to InstantNGP.")
 	parser.add_argument("--n_frames", default=10, type=int, help="Number of frames before saving the dataset. Also used as the number of cameras to remember when streaming.")
+	parser.add_argument("--min_pose_distance", default=0.1, type=float, help="When streaming, frames closer than this to a remembered camera (in meters, plus rotation_weight per radian) only replace it if they are sharper.")
+	parser.add_argument("--rotation_weight", default=0.5, type=float, help="Weight of the viewing direction in the pose distance, in meters per radian.")
 	parser.add_argument("--save_path", required='--stream' not in sys.argv, type=str, help="Path to save the dataset.")
 	parser.add_argument("--depth_scale", default=10.0, type=float, help="Depth scale used when saving depth. Only used when saving dataset.")
 	parser.add_argument("--overwrite", action="store_true", help="Rewrite over dataset if it exists.")
+	parser.add_argument("--writer_threads", default=4, type=int, help="Number of threads writing the frames of the dataset.")
+	parser.add_argument("--max_pending_frames", default=32, type=int, help="Frames received while this many frames are waiting to be written are dropped.")
 	return parser.parse_args()
 
 
@@ -75,7 +79,7 @@ def set_frame(testbed, frame_idx: int, rgb: np.ndarray, depth: np.ndarray, depth
 	testbed.nerf.training.set_camera_intrinsics(frame_idx=frame_idx, fx=fx, fy=fy, cx=cx, cy=cy)
 
 
-def live_streaming_loop(reader: DataReader, max_cameras: int):
+def live_streaming_loop(reader: DataReader, max_cameras: int, min_pose_distance: float, rotation_weight: float):
 	# Start InstantNGP
 	testbed = ngp.Testbed(ngp.TestbedMode.Nerf)
 	testbed.init_window(1920, 1080)
@@ -83,8 +87,8 @@ def live_streaming_loop(reader: DataReader, max_cameras: int):
 	testbed.visualize_unit_cube = True
 	testbed.nerf.visualize_cameras = True
 
-	camera_index = 0  # Current camera index we are replacing in InstantNGP
-	total_frames = 0 # Total frames received
+	# Only the frames adding view coverage, or sharper than the remembered frame at the same pose, are kept
+	ingestion = LiveIngestion(max_cameras, min_pose_distance, rotation_weight)
 
 	# Create Empty Dataset
 	testbed.create_empty_nerf_dataset(max_cameras, aabb_scale=1)
@@ -95,30 +99,27 @@ def live_streaming_loop(reader: DataReader, max_cameras: int):
 	while testbed.frame():
 		sample = reader.read_next() # Get frame from NeRFCapture
 		if sample:
-			print(f"Frame {total_frames + 1} received")
-
-			# RGB
-			image = np.asarray(sample.image, dtype=np.uint8).reshape(
-				(sample.height, sample.width, 3)).astype(np.float32)/255.0
-			image = np.concatenate(
-				[image, np.zeros((sample.height, sample.width, 1), dtype=np.float32)], axis=-1)
+			# Transform
+			X_WV = np.asarray(sample.transform_matrix,
+							dtype=np.float32).reshape((4, 4)).T[:3, :].copy()
 
-			# Depth if available
+			# RGB and depth if available
+			image = np.frombuffer(bytes(sample.image), dtype=np.uint8).reshape((sample.height, sample.width, 3))
 			depth = None
 			if sample.has_depth:
-				depth = np.asarray(sample.depth_image, dtype=np.uint8).view(
-					dtype=np.float32).reshape((sample.depth_height, sample.depth_width))
-				depth = cv2.resize(depth, dsize=(
-					sample.width, sample.height), interpolation=cv2.INTER_NEAREST)
+				depth = np.frombuffer(bytes(sample.depth_image), dtype=np.float32).reshape((sample.depth_height, sample.depth_width))
 
-			# Transform
-			X_WV = np.asarray(sample.transform_matrix,
-							dtype=np.float32).reshape((4, 4)).T[:3, :].copy()
+			ingested = ingestion.offer(image, X_WV, depth)
+			if ingested is None:
+				print(f"Frame {ingestion.received} received, redundant")
+				continue
+			camera_index, rgba, depth = ingested
+			print(f"Frame {ingestion.received} received, stored in slot {camera_index}")
 
 			# Add frame to InstantNGP
 			set_frame(testbed,
 					frame_idx=camera_index,
-					rgb=srgb_to_linear(image),
+					rgb=rgba,
 					depth=depth,
 					depth_scale=1,
 					X_WV=X_WV,
@@ -127,16 +128,13 @@ def live_streaming_loop(reader: DataReader, max_cameras: int):
 					cx=sample.cx,
 					cy=sample.cy)
 
-			# Update index
-			total_frames += 1
-			testbed.nerf.training.n_images_for_training = min(total_frames, max_cameras)
-			camera_index = (camera_index + 1) % max_cameras
+			testbed.nerf.training.n_images_for_training = ingestion.n_used
 
-			if total_frames == 1:
+			if ingestion.accepted == 1:
 				testbed.first_training_view()
 				testbed.render_groundtruth = True
 
-def dataset_capture_loop(reader: DataReader, save_path: Path, overwrite: bool, n_frames: int):
+def dataset_capture_loop(reader: DataReader, save_path: Path, overwrite: bool, n_frames: int, depth_scale: float, writer_threads: int, max_pending_frames: int):
 	if save_path.exists():
 		if overwrite:
 			# Prompt user to confirm deletion
@@ -148,82 +146,12 @@ def dataset_capture_loop(reader: DataReader, save_path: Path, overwrite: bool, n
 			sys.exit(1)
 
 	print("Waiting for frames...")
-	# Make directory
-	images_dir = save_path.joinpath("images")
-
-	manifest = {
-		"fl_x":  0.0,
-		"fl_y":  0.0,
-		"cx": 0.0,
-		"cy": 0.0,
-		"w": 0.0,
-		"h": 0.0,
-		"frames": []
-	}
-
-	total_frames = 0 # Total frames received
-
-	# Start DDS Loop
-	while True:
-		sample = reader.read_next() # Get frame from NeRFCapture
-		if sample:
-			print(f"{total_frames + 1}/{n_frames} frames received")
-
-			if total_frames == 0:
-				save_path.mkdir(parents=True)
-				images_dir.mkdir()
-				manifest["w"] = sample.width
-				manifest["h"] = sample.height
-				manifest["cx"] = sample.cx
-				manifest["cy"] = sample.cy
-				manifest["fl_x"] = sample.fl_x
-				manifest["fl_y"] = sample.fl_y
-				manifest["integer_depth_scale"] = float(args.depth_scale)/65535.0
-
-			# RGB
-			image = np.asarray(sample.image, dtype=np.uint8).reshape((sample.height, sample.width, 3))
-			cv2.imwrite(str(images_dir.joinpath(f"{total_frames}.png")), cv2.cvtColor(image, cv2.COLOR_RGB2BGR))
-
-			# Depth if avaiable
-			depth = None
-			if sample.has_depth:
-				depth = np.asarray(sample.depth_image, dtype=np.uint8).view(
-					dtype=np.float32).reshape((sample.depth_height, sample.depth_width))
-				depth = (depth*65535/float(args.depth_scale)).astype(np.uint16)
-				depth = cv2.resize(depth, dsize=(
-					sample.width, sample.height), interpolation=cv2.INTER_NEAREST)
-				cv2.imwrite(str(images_dir.joinpath(f"{total_frames}.depth.png")), depth)
-
-			# Transform
-			X_WV = np.asarray(sample.transform_matrix,
-							  dtype=np.float32).reshape((4, 4)).T
-
-			frame = {
-				"transform_matrix": X_WV.tolist(),
-				"file_path": f"images/{total_frames}",
-				"fl_x": sample.fl_x,
-				"fl_y": sample.fl_y,
-				"cx": sample.cx,
-				"cy": sample.cy,
-				"w": sample.width,
-				"h": sample.height
-			}
-
-			if depth is not None:
-				frame["depth_path"] = f"images/{total_frames}.depth.png"
-
-			manifest["frames"].append(frame)
-
-			# Update index
-			if total_frames == n_frames - 1:
-				print("Saving manifest...")
-				# Write manifest as json
-				manifest_json = json.dumps(manifest, indent=4)
-				with open(save_path.joinpath("transforms.json"), "w") as f:
-					f.write(manifest_json)
-				print("Done")
-				sys.exit(0)
-			total_frames += 1
+	# Frames are written in the background, the manifest is saved as they are
+	with CaptureWriter(save_path, depth_scale, writer_threads, max_pending_frames) as writer:
+		capture_dataset(reader, writer, n_frames, on_frame=lambda stats: print(f"{stats['received'] - stats['dropped']}/{n_frames} frames received, {stats['dropped']} dropped"))
+		print("Saving manifest...")
+	stats = writer.stats()
+	print(f"Done: {stats['written']} frames written, {stats['dropped']} dropped, {stats['failed']} failed")
 
 
 if __name__ == "__main__":
@@ -238,6 +166,6 @@ if __name__ == "__main__":
 	reader = DataReader(participant, topic)
 
 	if args.stream:
-		live_streaming_loop(reader, args.n_frames)
+		live_streaming_loop(reader, args.n_frames, args.min_pose_distance, args.rotation_weight)
 	else:
-		dataset_capture_loop(reader, Path(args.save_path), args.overwrite, args.n_frames)
+		dataset_capture_loop(reader, Path(args.save_path), args.overwrite, args.n_frames, args.depth_scale, args.writer_threads, args.max_pending_frames)
@@ -18,6 +18,9 @@ import math
 import cv2
 import glob
 
+from pose_normalization import bbox_center_and_scale, translate_and_scale
+from sharpness import compute_sharpness
+
 def parse_args():
 	parser = argparse.ArgumentParser(description="convert a dataset from the nsvf paper format to nerf format transforms.json")
 
@@ -27,15 +30,6 @@ def parse_args():
 	args = parser.parse_args()
 	return args
 
-def variance_of_laplacian(image):
-	return cv2.Laplacian(image, cv2.CV_64F).var()
-
-def sharpness(imagePath):
-	image = cv2.imread(imagePath)
-	gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-	fm = variance_of_laplacian(gray)
-	return fm
-
 if __name__ == "__main__":
 	args = parse_args()
 	AABB_SCALE = int(args.aabb_scale)
@@ -100,12 +94,10 @@ if __name__ == "__main__":
 	p2 = 0
 
 	print(f"camera:\n\tres={w,h}\n\tcenter={cx,cy}\n\tfocal={fl_x,fl_y}\n\tfov={fovx,fovy}\n\tk={k1,k2} p={p1,p2}")
-	centroid = [(bbox[0]+bbox[3])*0.5,(bbox[1]+bbox[4])*0.5,(bbox[2]+bbox[5])*0.5]
+	centroid, scale = bbox_center_and_scale(bbox)
 	print("bbox is ", bbox)
 	print("centroid is ", centroid)
-	radius = [(bbox[3]-bbox[0])*0.5,(bbox[4]-bbox[1])*0.5,(bbox[5]-bbox[2])*0.5]
-	scale = 0.5/np.max(radius)
-	print("radius is ", np.max(radius))
+	print("radius is ", 0.5/scale)
 
 	for itype in [0,1,2]:
 		if (img_files[2]):
@@ -132,22 +124,21 @@ if __name__ == "__main__":
 			"black_transparent": args.black_transparent,
 			"aabb_scale": AABB_SCALE,"frames":[]
 		}
+		poses = []
 		for img_f in img_files[itype]:
 			pose_f = os.path.join(IMAGE_FOLDER,"pose",os.path.splitext(os.path.basename(img_f))[0]+".txt")
 			elems = tuple(map(float," ".join(open(pose_f).readlines()).split(" ")))
-			name = img_f
-			m = np.array(elems).reshape(4,4)
-			b = sharpness(name)
-			#print(name, "sharpness=",b)
-			c2w = m # np.linalg.inv(m)
-			c2w[0:3,3] -= centroid
-			c2w[0:3,3] *= scale
-			#print(name,c2w)
-			c2w[0:3,2] *= -1 # flip the y and z axis
-			c2w[0:3,1] *= -1
-			c2w = c2w[[0,2,1,3],:] # swap y and z 012 201 102
-			c2w[2,:] *= -1 # flip whole world upside down
+			poses.append(np.array(elems).reshape(4,4))
+
+		c2ws = translate_and_scale(np.reshape(poses, (-1,4,4)), centroid, scale)
+		c2ws[:,0:3,2] *= -1 # flip the y and z axis
+		c2ws[:,0:3,1] *= -1
+		c2ws = c2ws[:,[0,2,1,3],:] # swap y and z 012 201 102
+		c2ws[:,2,:] *= -1 # flip whole world upside down
 
+		sharpnesses = compute_sharpness(img_files[itype])
+		for name, c2w, b in zip(img_files[itype], c2ws, sharpnesses):
+			#print(name, "sharpness=",b)
 			frame = {"file_path": name, "sharpness": b, "transform_matrix": c2w}
 			out["frames"].append(frame)
 
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# Pose normalization shared by the dataset converters (colmap2nerf, record3d2nerf, nsvf2nerf).
+#
+# All functions work on stacked camera-to-world matrices of shape (N,4,4) (or (N,3,4)) rather than on
+# per-frame dicts, so that they stay cheap for datasets of tens of thousands of frames.
+
+import numpy as np
+
+# Max number of camera pairs processed at once by `center_of_attention`, bounds its memory to ~100MB per array
+PAIR_CHUNK_SIZE = 1 << 22
+
+def rotmat(a, b):
+	# Rotation matrix taking direction `a` to direction `b`
+	a, b = a / np.linalg.norm(a), b / np.linalg.norm(b)
+	v = np.cross(a, b)
+	c = np.dot(a, b)
+	# handle exception for the opposite direction input
+	if c < -1 + 1e-10:
+		return rotmat(a + np.random.uniform(-1e-2, 1e-2, 3), b)
+	s = np.linalg.norm(v)
+	kmat = np.array([[0, -v[2], v[1]], [v[2], 0, -v[0]], [-v[1], v[0], 0]])
+	return np.eye(3) + kmat + kmat.dot(kmat) * ((1 - c) / (s ** 2 + 1e-10))
+
+def closest_points_2_lines(oa, da, ob, db):
+	# Batched version of the pairwise solve: for rays o+t*d (arrays of shape (...,3)), returns the point closest
+	# to both rays (looking backwards along the rays only) and a weight that goes to 0 if the lines are parallel
+	da = da / np.linalg.norm(da, axis=-1, keepdims=True)
+	db = db / np.linalg.norm(db, axis=-1, keepdims=True)
+	c = np.cross(da, db)
+	denom = np.sum(c * c, axis=-1)
+	t = ob - oa
+	# det([t, d, c]) = t . (d x c)
+	ta = np.minimum(np.sum(t * np.cross(db, c), axis=-1) / (denom + 1e-10), 0)
+	tb = np.minimum(np.sum(t * np.cross(da, c), axis=-1) / (denom + 1e-10), 0)
+	return (oa + ta[..., np.newaxis] * da + ob + tb[..., np.newaxis] * db) * 0.5, denom
+
+def center_of_attention(c2ws, min_weight=0.00001, chunk_size=PAIR_CHUNK_SIZE):
+	# Weighted average of the closest points between the optical axes of all pairs of cameras,
+	# i.e. the point all the cameras are looking at
+	origins = c2ws[:, 0:3, 3]
+	directions = c2ws[:, 0:3, 2]
+	n = len(origins)
+	rows = max(1, chunk_size // max(n, 1))
+	totp = np.zeros(3)
+	totw = 0.0
+	for start in range(0, n, rows):
+		oa = origins[start:start + rows, np.newaxis]
+		da = directions[start:start + rows, np.newaxis]
+		p, w = closest_points_2_lines(oa, da, origins[np.newaxis], directions[np.newaxis])
+		w = np.where(w > min_weight, w, 0.0)
+		totp += np.einsum("ij,ijk->k", w, p)
+		totw += w.sum()
+	if totw > 0.0:
+		totp /= totw
+	return totp
+
+def min_line_dist(rays_o, rays_d):
+	# Closed-form least-squares point minimizing its distances to all rays of shape (N,3)
+	rays_o = rays_o.reshape(-1, 3, 1)
+	rays_d = rays_d.reshape(-1, 3, 1)
+	A_i = np.eye(3) - rays_d * np.transpose(rays_d, [0,2,1])
+	b_i = -A_i @ rays_o
+	return np.squeeze(-np.linalg.inv((np.transpose(A_i, [0,2,1]) @ A_i).mean(0)) @ (b_i).mean(0))
+
+def up_vector(c2ws):
+	# Average up direction (y axis) of the cameras
+	up = c2ws[:, 0:3, 1].sum(axis=0)
+	return up / np.linalg.norm(up)
+
+def up_rotation(up, target=(0, 0, 1)):
+	# 4x4 rotation of the whole scene taking `up` to `target`
+	R = np.eye(4)
+	R[0:3, 0:3] = rotmat(up, np.asarray(target, dtype=np.float64))
+	return R
+
+def align_up(c2ws, up, target=(0, 0, 1)):
+	# Rotates the whole scene so that `up` becomes `target`
+	return up_rotation(up, target) @ c2ws
+
+def average_distance(c2ws, center=0.0):
+	return float(np.mean(np.linalg.norm(c2ws[:, 0:3, 3] - center, axis=-1)))
+
+def nerf_scale(c2ws, center=0.0, target_distance=4.0):
+	# Scale bringing the average camera distance to `center` to `target_distance`, i.e. "nerf sized"
+	return target_distance / average_distance(c2ws, center)
+
+def bbox_center_and_scale(bbox, target_radius=0.5):
+	# Center and scale mapping an axis aligned box (xmin, ymin, zmin, xmax, ymax, zmax) into [-target_radius, target_radius]^3
+	bbox = np.asarray(bbox[0:6], dtype=np.float64)
+	center = (bbox[0:3] + bbox[3:6]) * 0.5
+	radius = (bbox[3:6] - bbox[0:3]) * 0.5
+	return center, target_radius / np.max(radius)
+
+def translate_and_scale(c2ws, translation, scale):
+	# Returns a copy of the cameras with positions (p - translation) * scale
+	c2ws = np.array(c2ws, dtype=np.float64)
+	c2ws[:, 0:3, 3] -= translation
+	c2ws[:, 0:3, 3] *= scale
+	return c2ws
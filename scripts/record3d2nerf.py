@@ -8,21 +8,40 @@
 # distribution of this software and related documentation without an express
 # license agreement from NVIDIA CORPORATION is strictly prohibited.
 
+# Converts a Record3D capture (.r3d export, unzipped) to transforms files.
+#
+# Poses are converted and normalised as stacked (N,4,4) arrays. With --rotate, images are rotated into `rotated/`,
+# leaving the capture untouched, by a process pool. With --depth, the LiDAR depth maps of `rgbd/<i>.depth`
+# (LZFSE compressed float32 metres, at the depth resolution of the metadata) are resized to the image resolution,
+# rotated like the images, and written as uint16 `depth/<i>.png` images, in units of max_depth / 65535 metres;
+# pixels of lower confidence than --min_depth_confidence (from `rgbd/<i>.conf`) or farther than max_depth are
+# written as 0 ("no depth"). Both transforms files get the matching `integer_depth_scale`, for depth supervision.
+
 import argparse
 import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+import cv2
 import numpy as np
 import json
-import copy
 from pyquaternion import Quaternion
 from tqdm import tqdm
-from PIL import Image
 
-def rotate_img(img_path, degree=90):
-	img = Image.open(img_path)
-	img = img.rotate(degree, expand=1)
-	img.save(img_path, quality=100, subsampling=0)
+from colmap_model import qvecs_to_rotmats
+from pose_normalization import average_distance, min_line_dist, nerf_scale, translate_and_scale
+
+UINT16_MAX = 65535
+
+def rotate_img(img_path, out_path, degree=90):
+	# Counter-clockwise rotation by a multiple of 90 degrees, re-encoded at full quality
+	img = cv2.imread(str(img_path), cv2.IMREAD_UNCHANGED)
+	if img is None:
+		raise IOError(f"Could not read {img_path}")
+	img = np.rot90(img, k=degree // 90)
+	params = [cv2.IMWRITE_JPEG_QUALITY, 100, cv2.IMWRITE_JPEG_SAMPLING_FACTOR, cv2.IMWRITE_JPEG_SAMPLING_FACTOR_444]
+	if not cv2.imwrite(str(out_path), np.ascontiguousarray(img), params):
+		raise IOError(f"Could not write {out_path}")
 
 def rotate_camera(c2w, degree=90):
 	rad = np.deg2rad(degree)
@@ -36,52 +55,94 @@ def swap_axes(c2w):
 	T = R.transformation_matrix
 	return T @ c2w
 
+def record3d_c2ws(poses, rotate=False):
+	""" Each `pose` is a 7-element tuple which contains quaternion + world position.
+		[qx, qy, qz, qw, tx, ty, tz]
+	"""
+	poses = np.asarray(poses, dtype=np.float64).reshape(-1, 7)
+	c2ws = np.tile(np.eye(4), (len(poses), 1, 1))
+	c2ws[:, :3, :3] = qvecs_to_rotmats(poses[:, [3, 0, 1, 2]])
+	c2ws[:, :3, 3] = poses[:, 4:7]
+	if rotate:
+		c2ws = swap_axes(rotate_camera(c2ws))
+	return c2ws
+
+def decompress_lzfse(buffer):
+	try:
+		import liblzfse
+	except ModuleNotFoundError:
+		raise ModuleNotFoundError("Reading Record3D depth maps needs liblzfse: pip install pyliblzfse")
+	return liblzfse.decompress(buffer)
+
+def read_depth(path, depth_size, dtype=np.float32, decompress=decompress_lzfse):
+	dw, dh = depth_size
+	with open(path, "rb") as f:
+		return np.frombuffer(decompress(f.read()), dtype=dtype).reshape(dh, dw)
+
+def convert_depth(depth_path, out_path, depth_size, image_size, depth_unit, max_depth, conf_path=None, min_confidence=0, rotate=False, decompress=decompress_lzfse):
+	# Writes the depth map as a uint16 image of the (unrotated) image size, in units of depth_unit metres
+	depth = read_depth(depth_path, depth_size, np.float32, decompress)
+	valid = np.isfinite(depth) & (depth > 0) & (depth <= max_depth)
+	if conf_path is not None and min_confidence > 0:
+		valid &= read_depth(conf_path, depth_size, np.uint8, decompress) >= min_confidence
+	image = np.where(valid, np.clip(np.rint(np.where(valid, depth, 0) / depth_unit), 1, UINT16_MAX), 0).astype(np.uint16)
+	# 0 is "no depth", never interpolated with valid depths
+	image = cv2.resize(image, dsize=tuple(image_size), interpolation=cv2.INTER_NEAREST)
+	if rotate:
+		image = np.ascontiguousarray(np.rot90(image))
+	if not cv2.imwrite(str(out_path), image):
+		raise IOError(f"Could not write {out_path}")
+
+def _convert_frame(task):
+	# Frame conversion run by a worker process
+	idx, dataset_dir, rotate, depth_args = task
+	if rotate:
+		rotate_img(dataset_dir / "rgbd" / f"{idx}.jpg", dataset_dir / "rotated" / f"{idx}.jpg")
+	if depth_args is not None:
+		conf_path = dataset_dir / "rgbd" / f"{idx}.conf"
+		convert_depth(dataset_dir / "rgbd" / f"{idx}.depth", dataset_dir / "depth" / f"{idx}.png",
+			conf_path=conf_path if conf_path.is_file() else None, rotate=rotate, **depth_args)
+	return idx
+
+def convert_frames(dataset_dir, n_images, rotate=False, depth_args=None, n_workers=None):
+	# Rotates the images and / or converts the depth maps of all frames in a process pool
+	dataset_dir = Path(dataset_dir)
+	if rotate:
+		os.makedirs(dataset_dir / "rotated", exist_ok=True)
+	if depth_args is not None:
+		os.makedirs(dataset_dir / "depth", exist_ok=True)
+	if not rotate and depth_args is None:
+		return
+	tasks = [(idx, dataset_dir, rotate, depth_args) for idx in range(n_images)]
+	if n_workers is not None and n_workers <= 1:
+		for task in tqdm(tasks):
+			_convert_frame(task)
+		return
+	with ProcessPoolExecutor(max_workers=n_workers) as pool:
+		chunksize = max(1, n_images // (4 * (n_workers or os.cpu_count() or 1)))
+		list(tqdm(pool.map(_convert_frame, tasks, chunksize=chunksize), total=n_images))
+
 # Automatic rescale & offset the poses.
 def find_transforms_center_and_scale(raw_transforms):
 	print("computing center of attention...")
-	frames = raw_transforms['frames']
-	for frame in frames:
-		frame['transform_matrix'] = np.array(frame['transform_matrix'])
-
-	rays_o = []
-	rays_d = []
-	for f in tqdm(frames):
-		mf = f["transform_matrix"][0:3,:]
-		rays_o.append(mf[:3,3:])
-		rays_d.append(mf[:3,2:3])
-	rays_o = np.asarray(rays_o)
-	rays_d = np.asarray(rays_d)
+	c2ws = np.array([frame['transform_matrix'] for frame in raw_transforms['frames']])
 
 	# Find the point that minimizes its distances to all rays.
-	def min_line_dist(rays_o, rays_d):
-		A_i = np.eye(3) - rays_d * np.transpose(rays_d, [0,2,1])
-		b_i = -A_i @ rays_o
-		pt_mindist = np.squeeze(-np.linalg.inv((np.transpose(A_i, [0,2,1]) @ A_i).mean(0)) @ (b_i).mean(0))
-		return pt_mindist
-
-	translation = min_line_dist(rays_o, rays_d)
-	normalized_transforms = copy.deepcopy(raw_transforms)
-	for f in normalized_transforms["frames"]:
-		f["transform_matrix"][0:3,3] -= translation
+	translation = min_line_dist(c2ws[:, 0:3, 3], c2ws[:, 0:3, 2])
 
 	# Find the scale.
-	avglen = 0.
-	for f in normalized_transforms["frames"]:
-		avglen += np.linalg.norm(f["transform_matrix"][0:3,3])
-	nframes = len(normalized_transforms["frames"])
-	avglen /= nframes
-	print("avg camera distance from origin", avglen)
-	scale = 4.0 / avglen # scale to "nerf sized"
+	print("avg camera distance from origin", average_distance(c2ws, translation))
+	scale = nerf_scale(c2ws, translation) # scale to "nerf sized"
 
 	return translation, scale
 
 def normalize_transforms(transforms, translation, scale):
-	normalized_transforms = copy.deepcopy(transforms)
-	for f in normalized_transforms["frames"]:
-		f["transform_matrix"] = np.asarray(f["transform_matrix"])
-		f["transform_matrix"][0:3,3] -= translation
-		f["transform_matrix"][0:3,3] *= scale
-		f["transform_matrix"] = f["transform_matrix"].tolist()
+	c2ws = translate_and_scale([f["transform_matrix"] for f in transforms["frames"]], translation, scale)
+	normalized_transforms = dict(transforms)
+	normalized_transforms["frames"] = [dict(f, transform_matrix=c2w.tolist()) for f, c2w in zip(transforms["frames"], c2ws)]
+	if "integer_depth_scale" in transforms:
+		# Depths are scaled like the camera positions
+		normalized_transforms["integer_depth_scale"] = transforms["integer_depth_scale"] * scale
 	return normalized_transforms
 
 def parse_args():
@@ -89,6 +150,10 @@ def parse_args():
 	parser.add_argument("--scene", default="", help="path to the Record3D capture")
 	parser.add_argument("--rotate", action="store_true", help="rotate the dataset")
 	parser.add_argument("--subsample", default=1, type=int, help="step size of subsampling")
+	parser.add_argument("--depth", action="store_true", help="convert the LiDAR depth maps to `depth/<i>.png` images, for depth supervision (needs pyliblzfse)")
+	parser.add_argument("--max_depth", default=10.0, type=float, help="farthest depth, in metres, stored in the depth images")
+	parser.add_argument("--min_depth_confidence", default=1, type=int, choices=[0, 1, 2], help="minimum ARKit confidence (0: low, 1: medium, 2: high) of the converted depths")
+	parser.add_argument("--n_workers", default=None, type=int, help="number of processes converting the frames (one per CPU by default)")
 	args = parser.parse_args()
 	return args
 
@@ -98,38 +163,23 @@ if __name__ == "__main__":
 	with open(dataset_dir / 'metadata') as f:
 		metadata = json.load(f)
 
-	frames = []
 	n_images = len(list((dataset_dir / 'rgbd').glob('*.jpg')))
-	poses = np.array(metadata['poses'])
-	for idx in tqdm(range(n_images)):
-		# Link the image.
-		img_name = f'{idx}.jpg'
-		img_path = dataset_dir / 'rgbd' / img_name
-
-		# Rotate the image.
-		if args.rotate:
-			# TODO: parallelize this step with joblib.
-			rotate_img(img_path)
-
-		# Extract c2w.
-		""" Each `pose` is a 7-element tuple which contains quaternion + world position.
-			[qx, qy, qz, qw, tx, ty, tz]
-		"""
-		pose = poses[idx]
-		q = Quaternion(x=pose[0], y=pose[1], z=pose[2], w=pose[3])
-		c2w = np.eye(4)
-		c2w[:3, :3] = q.rotation_matrix
-		c2w[:3, -1] = [pose[4], pose[5], pose[6]]
-		if args.rotate:
-			c2w = rotate_camera(c2w)
-			c2w = swap_axes(c2w)
-
-		frames.append(
-			{
-				"file_path": f"./rgbd/{img_name}",
-				"transform_matrix": c2w.tolist(),
-			}
-		)
+	c2ws = record3d_c2ws(metadata['poses'][:n_images], args.rotate)
+	image_folder = "rotated" if args.rotate else "rgbd"
+	frames = [{"file_path": f"./{image_folder}/{idx}.jpg", "transform_matrix": c2w.tolist()} for idx, c2w in enumerate(c2ws)]
+
+	depth_args = None
+	if args.depth:
+		depth_args = {
+			"depth_size": (metadata['dw'], metadata['dh']),
+			"image_size": (metadata['w'], metadata['h']),
+			"depth_unit": args.max_depth / UINT16_MAX,
+			"max_depth": args.max_depth,
+			"min_confidence": args.min_depth_confidence,
+		}
+		for idx, frame in enumerate(frames):
+			frame["depth_path"] = f"./depth/{idx}.png"
+	convert_frames(dataset_dir, n_images, args.rotate, depth_args, args.n_workers)
 
 	# Write intrinsics to `cameras.txt`.
 	if not args.rotate:
@@ -160,6 +210,8 @@ if __name__ == "__main__":
 	transforms['scale'] = 1.0
 	transforms['camera_angle_x'] = 2 * np.arctan(transforms['w'] / (2 * transforms['fl_x']))
 	transforms['camera_angle_y'] = 2 * np.arctan(transforms['h'] / (2 * transforms['fl_y']))
+	if depth_args is not None:
+		transforms['integer_depth_scale'] = depth_args['depth_unit']
 	transforms['frames'] = frames
 
 	os.makedirs(dataset_dir / 'arkit_transforms', exist_ok=True)
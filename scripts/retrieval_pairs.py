@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# Image pair lists for COLMAP's matches_importer, from image retrieval, for unordered photo collections.
+#
+# Each image gets a compact global descriptor, computed from a thumbnail: a colour histogram, a histogram of
+# gradient orientations over a 2x2 grid and a tiny grayscale image, square rooted (Hellinger kernel). Descriptors
+# are computed in a process pool, reduced by PCA and L2 normalised, and each image is paired with its num_neighbors
+# most similar images (KD-tree search), so that matching is linear in the number of images, without the
+# vocabulary tree that COLMAP's vocab_tree matcher needs.
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+from scipy.spatial import cKDTree
+
+from image_pairs import write_pair_list
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff"}
+THUMBNAIL_SIZE = 64
+COLOR_BINS = (8, 4, 4)
+ORIENTATION_BINS = 8
+TINY_SIZE = 8
+
+def parse_args():
+	parser = argparse.ArgumentParser(description="Write a COLMAP pair list (for matches_importer) of visually similar images.")
+	parser.add_argument("images", help="COLMAP image folder.")
+	parser.add_argument("--out", default="pairs.txt", help="Output pair list.")
+	parser.add_argument("--num_neighbors", default=20, type=int, help="Number of most similar images each image is matched with.")
+	parser.add_argument("--pca_dims", default=64, type=int, help="Dimension of the descriptors after PCA.")
+	parser.add_argument("--n_workers", default=None, type=int, help="Number of processes computing the descriptors (one per CPU by default).")
+	return parser.parse_args()
+
+def list_images(folder):
+	# Image paths under folder, recursively and sorted, as COLMAP's feature extractor sees them
+	paths = []
+	for root, _, files in os.walk(folder):
+		paths += [os.path.join(root, f) for f in files if os.path.splitext(f)[1].lower() in IMAGE_EXTENSIONS]
+	return sorted(paths)
+
+def thumbnail_descriptor(path):
+	# Hellinger-normalised concatenation of colour, gradient orientation and tiny image descriptors
+	image = cv2.imread(path, cv2.IMREAD_REDUCED_COLOR_4)
+	if image is None:
+		raise IOError(f"Could not read {path}")
+	image = cv2.resize(image, (THUMBNAIL_SIZE, THUMBNAIL_SIZE), interpolation=cv2.INTER_AREA)
+
+	hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+	color = cv2.calcHist([hsv], [0, 1, 2], None, list(COLOR_BINS), [0, 180, 0, 256, 0, 256]).ravel()
+
+	gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY).astype(np.float32)
+	magnitude, angle = cv2.cartToPolar(cv2.Sobel(gray, cv2.CV_32F, 1, 0), cv2.Sobel(gray, cv2.CV_32F, 0, 1))
+	bins = np.minimum((angle % np.pi) / np.pi * ORIENTATION_BINS, ORIENTATION_BINS - 1).astype(np.int64)
+	half = THUMBNAIL_SIZE // 2
+	cell = (np.arange(THUMBNAIL_SIZE)[:, np.newaxis] // half) * 2 + np.arange(THUMBNAIL_SIZE)[np.newaxis] // half
+	gradients = np.bincount((cell * ORIENTATION_BINS + bins).ravel(), weights=magnitude.ravel(), minlength=4 * ORIENTATION_BINS)
+
+	tiny = cv2.resize(gray, (TINY_SIZE, TINY_SIZE), interpolation=cv2.INTER_AREA).ravel()
+	tiny = tiny - tiny.mean()
+
+	parts = [color / max(color.sum(), 1e-12), gradients / max(gradients.sum(), 1e-12)]
+	descriptor = np.concatenate([np.sqrt(p) for p in parts] + [tiny / max(np.linalg.norm(tiny), 1e-12)])
+	return descriptor.astype(np.float32)
+
+def compute_descriptors(paths, n_workers=None):
+	if n_workers is not None and n_workers <= 1:
+		return np.stack([thumbnail_descriptor(path) for path in paths])
+	with ProcessPoolExecutor(max_workers=n_workers) as pool:
+		chunksize = max(1, len(paths) // (4 * (n_workers or os.cpu_count() or 1)))
+		return np.stack(list(pool.map(thumbnail_descriptor, paths, chunksize=chunksize)))
+
+def pca_reduce(descriptors, dims=64):
+	# Projection on the `dims` principal components, L2 normalised
+	centered = descriptors - descriptors.mean(axis=0)
+	dims = min(dims, *centered.shape)
+	_, _, vt = np.linalg.svd(centered, full_matrices=False)
+	reduced = centered @ vt[:dims].T
+	return reduced / np.maximum(np.linalg.norm(reduced, axis=-1, keepdims=True), 1e-12)
+
+def retrieval_pairs(descriptors, num_neighbors=20):
+	# Pairs (i, j), i < j, of each descriptor with its num_neighbors nearest ones, as an (M, 2) array
+	n = len(descriptors)
+	if n < 2:
+		return np.zeros((0, 2), dtype=np.int64)
+	k = min(num_neighbors + 1, n)
+	_, neighbors = cKDTree(descriptors).query(descriptors, k=k)
+	pairs = np.stack([np.repeat(np.arange(n), k), neighbors.reshape(-1)], axis=-1)
+	pairs = np.sort(pairs[pairs[:, 0] != pairs[:, 1]], axis=-1)
+	return np.unique(pairs, axis=0)
+
+def folder_pairs(image_folder, num_neighbors=20, pca_dims=64, n_workers=None, names=None):
+	# (image names relative to image_folder, pairs) of the images of a folder, or only of the given image names
+	if names is None:
+		paths = list_images(image_folder)
+		names = [os.path.relpath(path, image_folder).replace("\\", "/") for path in paths]
+	else:
+		paths = [os.path.join(image_folder, name) for name in names]
+	if len(paths) < 2:
+		return names, np.zeros((0, 2), dtype=np.int64)
+	descriptors = pca_reduce(compute_descriptors(paths, n_workers), pca_dims)
+	return names, retrieval_pairs(descriptors, num_neighbors)
+
+if __name__ == "__main__":
+	args = parse_args()
+	names, pairs = folder_pairs(args.images, args.num_neighbors, args.pca_dims, args.n_workers)
+	print(f"{len(pairs)} pairs for {len(names)} images ({len(names) * (len(names) - 1) // 2} exhaustive pairs)")
+	write_pair_list(args.out, names, pairs)
@@ -10,15 +10,19 @@
 
 import argparse
 import os
-import commentjson as json
+import sys
 
 import numpy as np
 
-import shutil
 import time
 
+from camera_path import CameraPath, smoothed_camera
 from common import *
+from image_metrics import frame_metrics
+from video_encoder import open_video_encoder
 from scenes import *
+from transforms_columns import load_columns
+from validate_dataset import format_report, validate_dataset
 
 from tqdm import tqdm
 
@@ -31,6 +35,7 @@ def parse_args():
 
 	parser.add_argument("--scene", "--training_data", default="", help="The scene to load. Can be the scene's name or a full path to the training data. Can be NeRF dataset, a *.obj/*.stl mesh for training a SDF, an image, or a *.nvdb volume.")
 	parser.add_argument("--mode", default="", type=str, help=argparse.SUPPRESS) # deprecated
+	parser.add_argument("--skip_dataset_check", action="store_true", help="Do not check the images, masks and depths of a NeRF dataset (headers only) before loading it.")
 	parser.add_argument("--network", default="", help="Path to the network config. Uses the scene's default if unspecified.")
 
 	parser.add_argument("--load_snapshot", "--snapshot", default="", help="Load this snapshot before training. recommended extension: .ingp/.msgpack")
@@ -53,6 +58,7 @@ def parse_args():
 	parser.add_argument("--video_render_range", type=int, nargs=2, default=(-1, -1), metavar=("START_FRAME", "END_FRAME"), help="Limit output to frames between START_FRAME and END_FRAME (inclusive)")
 	parser.add_argument("--video_spp", type=int, default=8, help="Number of samples per pixel. A larger number means less noise, but slower rendering.")
 	parser.add_argument("--video_output", type=str, default="video.mp4", help="Filename of the output video (video.mp4) or video frames (video_%%04d.png).")
+	parser.add_argument("--video_bit_depth", type=int, default=8, choices=[8, 16], help="Bit depth of the frames sent to the encoder. 16 bits avoids banding in PNG frames and high bit depth codecs.")
 
 	parser.add_argument("--save_mesh", default="", help="Output a marching-cubes based mesh from the NeRF or SDF model. Supports OBJ and PLY format.")
 	parser.add_argument("--marching_cubes_res", default=256, type=int, help="Sets the resolution for the marching cubes grid.")
@@ -86,6 +92,20 @@ if __name__ == "__main__":
 	if args.mode:
 		print("Warning: the '--mode' argument is no longer in use. It has no effect. The mode is automatically chosen based on the scene.")
 
+	if args.scene:
+		scene_info = get_scene(args.scene)
+		if scene_info is not None:
+			args.scene = os.path.join(scene_info["data_dir"], scene_info["dataset"])
+			if not args.network and "network" in scene_info:
+				args.network = scene_info["network"]
+
+		# Catch broken NeRF datasets before initializing the GPU
+		if not args.skip_dataset_check and (args.scene.lower().endswith(".json") or os.path.isdir(args.scene)):
+			report = validate_dataset(args.scene)
+			print(format_report(report))
+			if report["errors"]:
+				sys.exit(1)
+
 	testbed = ngp.Testbed()
 	testbed.root_dir = ROOT_DIR
 
@@ -96,12 +116,6 @@ if __name__ == "__main__":
 		testbed.load_file(file)
 
 	if args.scene:
-		scene_info = get_scene(args.scene)
-		if scene_info is not None:
-			args.scene = os.path.join(scene_info["data_dir"], scene_info["dataset"])
-			if not args.network and "network" in scene_info:
-				args.network = scene_info["network"]
-
 		testbed.load_training_data(args.scene)
 
 	if args.gui:
@@ -124,11 +138,10 @@ if __name__ == "__main__":
 	elif args.network:
 		testbed.reload_network_from_file(args.network)
 
-	ref_transforms = {}
+	ref_transforms = None
 	if args.screenshot_transforms: # try to load the given file straight away
 		print("Screenshot transforms from ", args.screenshot_transforms)
-		with open(args.screenshot_transforms) as f:
-			ref_transforms = json.load(f)
+		ref_transforms = load_columns(args.screenshot_transforms)
 
 	if testbed.mode == ngp.TestbedMode.Sdf:
 		testbed.tonemap_curve = ngp.TonemapCurve.ACES
@@ -209,8 +222,8 @@ if __name__ == "__main__":
 
 	if args.test_transforms:
 		print("Evaluating test transforms from ", args.test_transforms)
-		with open(args.test_transforms) as f:
-			test_transforms = json.load(f)
+		# Validates the file before it is loaded
+		load_columns(args.test_transforms)
 		data_dir=os.path.dirname(args.test_transforms)
 		totmse = 0
 		totpsnr = 0
@@ -249,10 +262,9 @@ if __name__ == "__main__":
 					diffimg[...,3:4] = 1.0
 					write_image("diff.png", diffimg)
 
-				A = np.clip(linear_to_srgb(image[...,:3]), 0.0, 1.0)
-				R = np.clip(linear_to_srgb(ref_image[...,:3]), 0.0, 1.0)
-				mse = float(compute_error("MSE", A, R))
-				ssim = float(compute_error("SSIM", A, R))
+				metrics = frame_metrics(image, ref_image, ("MSE", "SSIM"))
+				mse = metrics["MSE"]
+				ssim = metrics["SSIM"]
 				totssim += ssim
 				totmse += mse
 				psnr = mse2psnr(mse)
@@ -273,14 +285,14 @@ if __name__ == "__main__":
 		print(f"Generating mesh via marching cubes and saving to {args.save_mesh}. Resolution=[{res},{res},{res}], Density Threshold={thresh}")
 		testbed.compute_and_save_marching_cubes_mesh(args.save_mesh, [res, res, res], thresh=thresh)
 
-	if ref_transforms:
+	if ref_transforms is not None:
 		testbed.fov_axis = 0
-		testbed.fov = ref_transforms["camera_angle_x"] * 180 / np.pi
+		testbed.fov = ref_transforms.header["camera_angle_x"] * 180 / np.pi
 		if not args.screenshot_frames:
-			args.screenshot_frames = range(len(ref_transforms["frames"]))
+			args.screenshot_frames = range(len(ref_transforms))
 		print(args.screenshot_frames)
-		for idx in args.screenshot_frames:
-			f = ref_transforms["frames"][int(idx)]
+		# Only the requested frames are rebuilt from the columns
+		for f in ref_transforms.frames([int(idx) for idx in args.screenshot_frames]):
 			cam_matrix = f.get("transform_matrix", f["transform_matrix_start"])
 			testbed.set_nerf_camera_matrix(np.matrix(cam_matrix)[:-1,:])
 			outname = os.path.join(args.screenshot_dir, os.path.basename(f["file_path"]))
@@ -290,7 +302,7 @@ if __name__ == "__main__":
 				outname = outname + ".png"
 
 			print(f"rendering {outname}")
-			image = testbed.render(args.width or int(ref_transforms["w"]), args.height or int(ref_transforms["h"]), args.screenshot_spp, True)
+			image = testbed.render(args.width or int(ref_transforms.header["w"]), args.height or int(ref_transforms.header["h"]), args.screenshot_spp, True)
 			os.makedirs(os.path.dirname(outname), exist_ok=True)
 			write_image(outname, image)
 	elif args.screenshot_dir:
@@ -306,33 +318,17 @@ if __name__ == "__main__":
 
 		resolution = [args.width or 1920, args.height or 1080]
 		n_frames = args.video_n_seconds * args.video_fps
-		save_frames = "%" in args.video_output
 		start_frame, end_frame = args.video_render_range
 
-		if "tmp" in os.listdir():
-			shutil.rmtree("tmp")
-		os.makedirs("tmp")
-
-		for i in tqdm(list(range(min(n_frames, n_frames+1))), unit="frames", desc=f"Rendering video"):
+		# Frames are streamed to the encoder (ffmpeg stdin or a PNG sequence) while the next ones render
+		with open_video_encoder(args.video_output, args.video_fps, resolution, start_index=max(start_frame, 0), bit_depth=args.video_bit_depth) as encoder:
 			testbed.camera_smoothing = args.video_camera_smoothing
-
-			if start_frame >= 0 and i < start_frame:
-				# For camera smoothing and motion blur to work, we cannot just start rendering
-				# from middle of the sequence. Instead we render a very small image and discard it
-				# for these initial frames.
-				# TODO Replace this with a no-op render method once it's available
-				frame = testbed.render(32, 32, 1, True, float(i)/n_frames, float(i + 1)/n_frames, args.video_fps, shutter_fraction=0.5)
-				continue
-			elif end_frame >= 0 and i > end_frame:
-				continue
-
-			frame = testbed.render(resolution[0], resolution[1], args.video_spp, True, float(i)/n_frames, float(i + 1)/n_frames, args.video_fps, shutter_fraction=0.5)
-			if save_frames:
-				write_image(args.video_output % i, np.clip(frame * 2**args.exposure, 0.0, 1.0), quality=100)
-			else:
-				write_image(f"tmp/{i:04d}.jpg", np.clip(frame * 2**args.exposure, 0.0, 1.0), quality=100)
-
-		if not save_frames:
-			os.system(f"ffmpeg -y -framerate {args.video_fps} -i tmp/%04d.jpg -c:v libx264 -pix_fmt yuv420p {args.video_output}")
-
-		shutil.rmtree("tmp")
+			if start_frame > 0:
+				# For camera smoothing and motion blur to work, the first rendered frame must start
+				# from the camera where the previous frames would have left it: compute it from the path.
+				camera_path = CameraPath.load(args.video_camera_path)
+				testbed.smoothed_camera = smoothed_camera(camera_path, start_frame, n_frames, args.video_fps, args.video_camera_smoothing)
+
+			for i in tqdm(list(range(max(start_frame, 0), n_frames if end_frame < 0 else min(n_frames, end_frame + 1))), unit="frames", desc=f"Rendering video"):
+				frame = testbed.render(resolution[0], resolution[1], args.video_spp, True, float(i)/n_frames, float(i + 1)/n_frames, args.video_fps, shutter_fraction=0.5)
+				encoder.write(np.clip(frame * 2**args.exposure, 0.0, 1.0))
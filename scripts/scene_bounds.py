@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# Tight `aabb_scale` and `render_aabb` of a NeRF dataset, from its cameras and its sparse geometry.
+#
+# The scene content is bounded by points: COLMAP points3D (from colmap2nerf) or the pixels of the depth maps of the
+# frames (`depth_path`, unprojected every depth_stride pixels), or, without either, points regularly spread in the
+# camera frusta up to the average distance of the cameras to their centroid. Points farther from their median than
+# mad_threshold (scaled) median absolute deviations are rejected, then the box is taken between the `percentile` and
+# 100 - `percentile` percentiles of each axis, grown by `margin` of its size on each side, and united with the camera
+# positions. In the testbed's coordinates (position * scale + offset, axes cycled), `aabb_scale` is the smallest
+# power of two whose box around (0.5, 0.5, 0.5) contains it, and `render_aabb` is the box itself.
+#
+# The number of ray marching steps the testbed takes through each box, before its occupancy grid prunes empty
+# space, is estimated for rays through a grid of pixels of every camera, to compare the bounds.
+
+import argparse
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from image_pairs import frustum_samples
+from transforms_columns import load_columns, read_transforms
+
+NERF_SCALE = 0.33
+NERF_OFFSET = 0.5
+MAX_AABB_SCALE = 128
+# Ray marching constants of the testbed (nerf_device.cuh)
+NERF_GRIDSIZE = 128
+NERF_STEPS = 1024
+NERF_CASCADES = 8
+MIN_CONE_STEPSIZE = np.sqrt(3) / NERF_STEPS
+MAX_CONE_STEPSIZE = MIN_CONE_STEPSIZE * (1 << (NERF_CASCADES - 1)) * NERF_STEPS / NERF_GRIDSIZE
+
+def parse_args():
+	parser = argparse.ArgumentParser(description="Write a tight aabb_scale and render_aabb into a transforms file.")
+	parser.add_argument("transforms", help="Input transforms file.")
+	parser.add_argument("--out", default="", help="Output transforms file. Defaults to the input file.")
+	parser.add_argument("--percentile", default=1.0, type=float, help="Percentile of the points, on each axis and side, bounding the scene.")
+	parser.add_argument("--mad_threshold", default=5.0, type=float, help="Reject the points farther from the median point than this many median absolute deviations.")
+	parser.add_argument("--margin", default=0.1, type=float, help="Margin added on each side of the box, relative to its size.")
+	parser.add_argument("--depth_stride", default=8, type=int, help="Unproject one depth pixel every depth_stride pixels along each axis.")
+	parser.add_argument("--no_depth", action="store_true", help="Ignore the depth maps of the frames, only use the camera frusta.")
+	return parser.parse_args()
+
+def robust_box(points, percentile=1.0, mad_threshold=5.0):
+	# (min, max) corners of the inliers of an (N, 3) point cloud
+	points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+	distances = np.linalg.norm(points - np.median(points, axis=0), axis=-1)
+	median = np.median(distances)
+	mad = 1.4826 * np.median(np.abs(distances - median))
+	inliers = points[distances <= median + mad_threshold * mad] if mad > 0 else points
+	return np.percentile(inliers, percentile, axis=0), np.percentile(inliers, 100 - percentile, axis=0)
+
+def frustum_points(c2ws, intrinsics):
+	# Points spread in the camera frusta, up to the average distance of the cameras to their centroid
+	positions = c2ws[:, 0:3, 3]
+	depth = np.mean(np.linalg.norm(positions - positions.mean(axis=0), axis=-1))
+	return frustum_samples(c2ws, intrinsics, depth if depth > 0 else 1.0).reshape(-1, 3)
+
+def unproject_depth(c2w, depth, fl_x, fl_y, cx, cy, stride=8):
+	# World points of the valid pixels of a depth map (camera z, 0 for no depth), every stride pixels
+	v, u = np.mgrid[0:depth.shape[0]:stride, 0:depth.shape[1]:stride]
+	z = depth[v, u]
+	valid = z > 0
+	u, v, z = u[valid] + 0.5, v[valid] + 0.5, z[valid]
+	# NeRF camera convention: x right, y up, looking along -z
+	points_cam = np.stack([(u - cx) / fl_x * z, -(v - cy) / fl_y * z, -z], axis=-1)
+	return points_cam @ c2w[0:3, 0:3].T + c2w[0:3, 3]
+
+def principal_points(columns, intrinsics):
+	# (cx, cy) of the frames, the image center where not set
+	cx = np.where(np.isnan(columns.values("cx")), intrinsics[:, 2] / 2, columns.values("cx"))
+	cy = np.where(np.isnan(columns.values("cy")), intrinsics[:, 3] / 2, columns.values("cy"))
+	return cx, cy
+
+def depth_points(columns, base_dir, stride=8, n_workers=None):
+	# World points of the depth maps of the frames of a transforms file, None if there are none
+	depth_unit = columns.header.get("integer_depth_scale")
+	depth_paths = columns.column("depth_path").tolist()
+	frames = [i for i, path in enumerate(depth_paths) if path]
+	if not depth_unit or not frames:
+		return None
+	c2ws = columns.c2ws()
+	intrinsics = columns.intrinsics(from_images=True)
+	cx, cy = principal_points(columns, intrinsics)
+
+	def points(i):
+		depth = cv2.imread(os.path.join(base_dir, depth_paths[i]), cv2.IMREAD_UNCHANGED)
+		if depth is None:
+			return np.zeros((0, 3))
+		return unproject_depth(c2ws[i], depth.astype(np.float64) * depth_unit, intrinsics[i, 0], intrinsics[i, 1], cx[i], cy[i], stride)
+
+	with ThreadPoolExecutor(max_workers=n_workers) as pool:
+		points = np.concatenate(list(pool.map(points, frames)))
+	return points if len(points) > 0 else None
+
+def scene_box(c2ws, intrinsics, points=None, percentile=1.0, mad_threshold=5.0, margin=0.1):
+	# (min, max) corners, in the transforms' coordinates, of the scene content and the cameras
+	if points is None or len(points) == 0:
+		points = frustum_points(c2ws, intrinsics)
+	lo, hi = robust_box(points, percentile, mad_threshold)
+	size = hi - lo
+	lo, hi = lo - margin * size, hi + margin * size
+	positions = c2ws[:, 0:3, 3]
+	return np.minimum(lo, positions.min(axis=0)), np.maximum(hi, positions.max(axis=0))
+
+def testbed_transform(header):
+	# (scale, offset) the testbed applies to the positions of the transforms
+	scale = float(header.get("scale", NERF_SCALE))
+	offset = np.broadcast_to(np.asarray(header.get("offset", NERF_OFFSET), dtype=np.float64), (3,))
+	return scale, offset
+
+def to_testbed(points, scale, offset):
+	# Positions in the testbed's coordinates (Testbed::nerf_position_to_ngp)
+	return (np.asarray(points) * scale + offset)[..., [1, 2, 0]]
+
+def from_testbed(points, scale, offset):
+	# Positions in the transforms' coordinates (Testbed::ngp_position_to_nerf)
+	return (np.asarray(points)[..., [2, 0, 1]] - offset) / scale
+
+def fit_aabb_scale(lo, hi):
+	# Smallest power of two aabb_scale whose box, centered on 0.5, contains the box (lo, hi), up to MAX_AABB_SCALE
+	extent = 2 * max(np.max(0.5 - np.asarray(lo)), np.max(np.asarray(hi) - 0.5))
+	aabb_scale = 1
+	while aabb_scale < extent and aabb_scale < MAX_AABB_SCALE:
+		aabb_scale *= 2
+	return aabb_scale
+
+def aabb_of_scale(aabb_scale):
+	return np.full(3, 0.5 - 0.5 * aabb_scale), np.full(3, 0.5 + 0.5 * aabb_scale)
+
+def marching_steps(t0, t1, cone_angle):
+	# Number of steps from t0 to t1 with the testbed's step size, clamp(t * cone_angle, MIN, MAX)
+	t0, t1 = np.asarray(t0, dtype=np.float64), np.asarray(t1, dtype=np.float64)
+	if cone_angle <= 0:
+		return np.maximum(t1 - t0, 0) / MIN_CONE_STEPSIZE
+	t_min, t_max = MIN_CONE_STEPSIZE / cone_angle, MAX_CONE_STEPSIZE / cone_angle
+	def clipped(a, b):
+		return np.clip(t0, a, b), np.clip(t1, a, b)
+	a, b = clipped(0, t_min)
+	steps = (b - a) / MIN_CONE_STEPSIZE
+	a, b = clipped(t_min, t_max)
+	steps += np.log(b / a) / np.log1p(cone_angle)
+	a, b = clipped(t_max, np.inf)
+	return steps + (b - a) / MAX_CONE_STEPSIZE
+
+def ray_box(origins, directions, lo, hi):
+	# (t_near, t_far) of rays through a box, t_near >= 0, t_far < t_near if they miss it
+	with np.errstate(divide="ignore", invalid="ignore"):
+		inverse = 1.0 / directions
+		t_lo, t_hi = (lo - origins) * inverse, (hi - origins) * inverse
+	t_near = np.maximum(np.nanmax(np.minimum(t_lo, t_hi), axis=-1), 0)
+	t_far = np.nanmin(np.maximum(t_lo, t_hi), axis=-1)
+	return t_near, t_far
+
+def steps_per_ray(c2ws, intrinsics, scale, offset, aabb_scale, box=None, grid_size=8):
+	# Mean number of ray marching steps through `box` (default: the aabb_scale box), in the testbed's
+	# coordinates, of rays through a grid of pixels of every camera, before occupancy grid pruning
+	lo, hi = aabb_of_scale(aabb_scale) if box is None else box
+	uv = (np.arange(grid_size) + 0.5) / grid_size
+	u, v = (x.ravel() for x in np.meshgrid(uv, uv))
+	fl_x, fl_y, w, h = (intrinsics[:, i:i+1] for i in range(4))
+	directions_cam = np.stack([(u * w - 0.5 * w) / fl_x, -(v * h - 0.5 * h) / fl_y, -np.ones_like(u * w)], axis=-1)
+	directions = np.einsum("nij,nkj->nki", c2ws[:, 0:3, 0:3], directions_cam)[..., [1, 2, 0]]
+	directions /= np.linalg.norm(directions, axis=-1, keepdims=True)
+	origins = np.broadcast_to(to_testbed(c2ws[:, 0:3, 3], scale, offset)[:, np.newaxis], directions.shape)
+	t_near, t_far = ray_box(origins.reshape(-1, 3), directions.reshape(-1, 3), lo, hi)
+	cone_angle = 1.0 / 256 if aabb_scale > 1 else 0.0
+	return float(np.mean(np.where(t_far > t_near, marching_steps(t_near, t_far, cone_angle), 0)))
+
+def fit_bounds(c2ws, intrinsics, header, points=None, percentile=1.0, mad_threshold=5.0, margin=0.1):
+	# (aabb_scale, render_aabb as [[min], [max]] in the testbed's coordinates)
+	lo, hi = scene_box(c2ws, intrinsics, points, percentile, mad_threshold, margin)
+	scale, offset = testbed_transform(header)
+	corners = to_testbed(np.stack([lo, hi]), scale, offset)
+	lo, hi = corners.min(axis=0), corners.max(axis=0)
+	aabb_scale = fit_aabb_scale(lo, hi)
+	aabb_lo, aabb_hi = aabb_of_scale(aabb_scale)
+	return aabb_scale, [np.maximum(lo, aabb_lo).tolist(), np.minimum(hi, aabb_hi).tolist()]
+
+def report_gain(c2ws, intrinsics, header, aabb_scale, render_aabb):
+	# Estimated ray marching steps and density grid cells, before (the transforms' aabb_scale) and after
+	scale, offset = testbed_transform(header)
+	old_scale = int(header.get("aabb_scale", 1))
+	def cells(aabb_scale):
+		return NERF_GRIDSIZE**3 * (int(np.log2(aabb_scale)) + 1)
+	return {
+		"aabb_scale": (old_scale, aabb_scale),
+		"density_grid_cells": (cells(old_scale), cells(aabb_scale)),
+		"training_steps_per_ray": (steps_per_ray(c2ws, intrinsics, scale, offset, old_scale), steps_per_ray(c2ws, intrinsics, scale, offset, aabb_scale)),
+		"rendering_steps_per_ray": (steps_per_ray(c2ws, intrinsics, scale, offset, old_scale), steps_per_ray(c2ws, intrinsics, scale, offset, aabb_scale, np.array(render_aabb))),
+	}
+
+def print_gain(gain):
+	for key, (before, after) in gain.items():
+		print(f"{key}: {before:.6g} -> {after:.6g}")
+
+def update_transforms(transforms_path, out_path="", points=None, use_depth=True, depth_stride=8, percentile=1.0, mad_threshold=5.0, margin=0.1):
+	# Writes aabb_scale and render_aabb, returns the estimated gain (see report_gain)
+	columns = load_columns(transforms_path)
+	c2ws, intrinsics = columns.c2ws(), columns.intrinsics(from_images=True)
+	if points is None and use_depth:
+		points = depth_points(columns, os.path.dirname(os.path.abspath(transforms_path)), depth_stride)
+	aabb_scale, render_aabb = fit_bounds(c2ws, intrinsics, columns.header, points, percentile, mad_threshold, margin)
+	gain = report_gain(c2ws, intrinsics, columns.header, aabb_scale, render_aabb)
+
+	transforms = read_transforms(transforms_path)
+	transforms["aabb_scale"] = aabb_scale
+	transforms["render_aabb"] = render_aabb
+	with open(out_path or transforms_path, "w") as f:
+		json.dump(transforms, f, indent=2)
+	return gain
+
+if __name__ == "__main__":
+	args = parse_args()
+	gain = update_transforms(args.transforms, args.out, use_depth=not args.no_depth, depth_stride=args.depth_stride, percentile=args.percentile, mad_threshold=args.mad_threshold, margin=args.margin)
+	print_gain(gain)
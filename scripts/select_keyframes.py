@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# Keeps a subset of the frames of a transforms file: the sharpest frame of each temporal window, and among those,
+# only the frames whose pose is not redundant with a frame already kept.
+#
+# Candidates are visited from the sharpest, and each kept frame suppresses the candidates within max_pose_distance
+# of it (non-maximum suppression with a KD-tree over the poses). The pose distance is the euclidean distance
+# between [camera position / trajectory radius, rotation_weight * viewing direction], that is the translation in
+# units of the average distance of the cameras to their centroid, plus about rotation_weight per radian of
+# viewing angle. Every dropped frame has a kept frame within max_pose_distance: this is the coverage guarantee.
+# With --target_frames, the smallest max_pose_distance keeping at most that many frames is searched instead.
+
+import argparse
+import json
+import os
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from sharpness import compute_sharpness
+
+IMAGE_EXTENSIONS = ["", ".png", ".jpg", ".jpeg", ".exr"]
+PATH_KEYS = ["file_path", "depth_path"]
+
+def parse_args():
+	parser = argparse.ArgumentParser(description="Write a reduced transforms file with the sharpest and most diverse frames.")
+	parser.add_argument("transforms", help="Input transforms file.")
+	parser.add_argument("--out", required=True, help="Output transforms file.")
+	parser.add_argument("--window", default=3, type=int, help="Only keep the sharpest frame of each window of this many consecutive frames (1 to disable).")
+	group = parser.add_mutually_exclusive_group()
+	group.add_argument("--max_pose_distance", default=0.05, type=float, help="Drop the frames within this pose distance of a sharper kept frame.")
+	group.add_argument("--target_frames", type=int, help="Keep at most this many frames, as spread out as possible.")
+	parser.add_argument("--rotation_weight", default=1.0, type=float, help="Weight of the viewing direction in the pose distance, relative to the camera position.")
+	parser.add_argument("--sharpness_reduction", default=2, type=int, choices=[1, 2, 4, 8], help="Downscaling factor of the images when computing the sharpness of frames that have none.")
+	return parser.parse_args()
+
+def resolve_image_path(base_dir, path):
+	# The loader accepts paths without extension
+	path = os.path.join(base_dir, path)
+	for ext in IMAGE_EXTENSIONS:
+		if os.path.isfile(path + ext):
+			return path + ext
+	raise FileNotFoundError(f"Could not find image {path}")
+
+def frame_sharpness(frames, base_dir, reduction=2):
+	# Sharpness of each frame, computed only for the frames that do not store it
+	scores = [f.get("sharpness") for f in frames]
+	missing = [i for i, score in enumerate(scores) if score is None]
+	if missing:
+		print(f"computing the sharpness of {len(missing)} frames...")
+		computed = compute_sharpness([resolve_image_path(base_dir, frames[i]["file_path"]) for i in missing], reduction=reduction)
+		for i, score in zip(missing, computed):
+			scores[i] = score
+	return np.array(scores, dtype=np.float64)
+
+def pose_features(c2ws, rotation_weight=1.0):
+	# Points whose euclidean distances are the pose distances of the cameras c2ws (N, 4, 4) or (N, 3, 4)
+	c2ws = np.asarray(c2ws, dtype=np.float64)
+	positions = c2ws[:, 0:3, 3]
+	radius = np.linalg.norm(positions - positions.mean(axis=0), axis=-1).mean()
+	if radius <= 0:
+		radius = 1.0
+	# Cameras look along -z in the NeRF convention, the sign does not matter for distances
+	directions = c2ws[:, 0:3, 2] / np.linalg.norm(c2ws[:, 0:3, 2], axis=-1, keepdims=True)
+	return np.concatenate([positions / radius, rotation_weight * directions], axis=-1)
+
+def window_maxima(scores, window):
+	# Index of the highest score of each window of `window` consecutive scores
+	if window <= 1:
+		return np.arange(len(scores))
+	starts = np.arange(0, len(scores), window)
+	return np.array([start + int(np.argmax(scores[start:start + window])) for start in starts], dtype=np.int64)
+
+def suppress_redundant(features, scores, max_pose_distance, tree=None):
+	# Indices of the kept points, from the highest score, each suppressing the other points within max_pose_distance
+	if tree is None:
+		tree = cKDTree(features)
+	suppressed = np.zeros(len(features), dtype=bool)
+	kept = []
+	for i in np.argsort(-scores, kind="stable"):
+		if suppressed[i]:
+			continue
+		kept.append(i)
+		suppressed[tree.query_ball_point(features[i], max_pose_distance)] = True
+	return np.sort(np.array(kept, dtype=np.int64))
+
+def select_keyframes(c2ws, scores, window=3, max_pose_distance=0.05, target_frames=None, rotation_weight=1.0, n_iterations=30):
+	# Indices of the kept frames, in order. If target_frames is set, max_pose_distance is ignored and searched for.
+	scores = np.asarray(scores, dtype=np.float64)
+	candidates = window_maxima(scores, window)
+	features = pose_features(c2ws, rotation_weight)[candidates]
+	tree = cKDTree(features)
+	if target_frames is None:
+		return candidates[suppress_redundant(features, scores[candidates], max_pose_distance, tree)]
+
+	if target_frames >= len(candidates):
+		return candidates
+	low, high = 0.0, 2.0 * np.linalg.norm(features.max(axis=0) - features.min(axis=0)) + 1e-9
+	best = candidates[suppress_redundant(features, scores[candidates], high, tree)]
+	for _ in range(n_iterations):
+		mid = 0.5 * (low + high)
+		kept = suppress_redundant(features, scores[candidates], mid, tree)
+		if len(kept) <= target_frames:
+			high = mid
+			best = candidates[kept]
+		else:
+			low = mid
+	return best
+
+def rebase_paths(frame, in_dir, out_dir):
+	# Relative paths of the frame, from out_dir instead of in_dir
+	frame = dict(frame)
+	for key in PATH_KEYS:
+		if key in frame and not os.path.isabs(frame[key]):
+			frame[key] = os.path.relpath(os.path.join(in_dir, frame[key]), out_dir).replace("\\", "/")
+	return frame
+
+if __name__ == "__main__":
+	args = parse_args()
+	with open(args.transforms) as f:
+		transforms = json.load(f)
+	frames = transforms["frames"]
+	in_dir = os.path.dirname(os.path.abspath(args.transforms))
+	out_dir = os.path.dirname(os.path.abspath(args.out))
+
+	scores = frame_sharpness(frames, in_dir, args.sharpness_reduction)
+	c2ws = [f["transform_matrix"] for f in frames]
+	kept = select_keyframes(c2ws, scores, args.window, args.max_pose_distance, args.target_frames, args.rotation_weight)
+	print(f"keeping {len(kept)} of {len(frames)} frames")
+
+	reduced = dict(transforms)
+	reduced["frames"] = [rebase_paths(dict(frames[i], sharpness=float(scores[i])), in_dir, out_dir) for i in kept]
+	print(f"writing {args.out}")
+	with open(args.out, "w") as f:
+		json.dump(reduced, f, indent=2)
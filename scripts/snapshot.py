@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+# Reading and writing of testbed snapshots without pyngp (i.e. without a GPU).
+#
+# A snapshot is the network config of the testbed, with the trained model under its "snapshot" key, serialized by
+# nlohmann::json as msgpack: zlib (gzip) compressed for .ingp files, plain for .msgpack files. Compressed files are
+# decompressed chunk by chunk into a single buffer, plain ones are memory-mapped. The msgpack parser returns the
+# binaries (weights, density grid) as memoryviews of that buffer, so `params_binary` and `density_grid_binary` are
+# NumPy views, not copies, and maps as LazyMaps: reading a map only decodes its keys and skips over its values,
+# which are decoded on first access (e.g. the per-frame lists of `nerf.dataset` are only built if they are read). The writer streams the objects through the compressor, binaries without copies, into
+# files the testbed loads: gzip container as written by zstr, binaries as msgpack bin (ext with a subtype).
+
+import argparse
+import json
+import mmap
+import os
+import struct
+import zlib
+from collections.abc import Mapping
+
+import numpy as np
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZLIB_MAGIC = {b"\x78\x01", b"\x78\x5e", b"\x78\x9c", b"\x78\xda"}
+# Window bits of zstr: gzip container when writing, gzip or zlib header detected when reading
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+AUTO_WBITS = 32 + zlib.MAX_WBITS
+CHUNK_SIZE = 1 << 20
+PARAMS_TYPES = {"__half": np.float16, "float": np.float32}
+NERF_GRIDSIZE = 128
+
+# msgpack type bytes with a fixed size payload, and bytes followed by the length of a payload
+_FIXED = {0xca: ">f", 0xcb: ">d", 0xcc: ">B", 0xcd: ">H", 0xce: ">I", 0xcf: ">Q", 0xd0: ">b", 0xd1: ">h", 0xd2: ">i", 0xd3: ">q"}
+_SIZED = {0xc4: (">B", "bin"), 0xc5: (">H", "bin"), 0xc6: (">I", "bin"), 0xc7: (">B", "ext"), 0xc8: (">H", "ext"), 0xc9: (">I", "ext"), 0xd9: (">B", "str"), 0xda: (">H", "str"), 0xdb: (">I", "str"), 0xdc: (">H", "array"), 0xdd: (">I", "array"), 0xde: (">H", "map"), 0xdf: (">I", "map")}
+_FIXEXT_SIZES = {0xd4: 1, 0xd5: 2, 0xd6: 4, 0xd7: 8, 0xd8: 16}
+
+def parse_args():
+	parser = argparse.ArgumentParser(description="Print the content of a snapshot (.ingp/.msgpack), without loading it in the testbed.")
+	parser.add_argument("snapshot", help="Snapshot file.")
+	return parser.parse_args()
+
+class Ext:
+	# msgpack extension: a binary with a subtype, for nlohmann::json
+	def __init__(self, subtype, data):
+		self.subtype = subtype
+		self.data = data
+
+class LazyMap(Mapping):
+	# Read-only msgpack map, its values decoded on first access from their offsets in the buffer
+	def __init__(self, view, offsets):
+		self._view = view
+		self._offsets = offsets
+		self._values = {}
+
+	def __getitem__(self, key):
+		if key not in self._values:
+			unpacker = _Unpacker(self._view)
+			unpacker.pos = self._offsets[key]
+			self._values[key] = unpacker.read()
+		return self._values[key]
+
+	def __iter__(self):
+		return iter(self._offsets)
+
+	def __len__(self):
+		return len(self._offsets)
+
+	def __repr__(self):
+		return repr(dict(self))
+
+class _Unpacker:
+	def __init__(self, buffer):
+		self.view = memoryview(buffer)
+		self.pos = 0
+
+	def _take(self, n):
+		if self.pos + n > len(self.view):
+			raise ValueError("truncated msgpack data")
+		data = self.view[self.pos:self.pos + n]
+		self.pos += n
+		return data
+
+	def _unpack(self, fmt):
+		value, = struct.unpack_from(fmt, self.view, self.pos)
+		self.pos += struct.calcsize(fmt)
+		return value
+
+	def _map(self, n):
+		offsets = {}
+		for _ in range(n):
+			key = self.read()
+			offsets[key] = self.pos
+			self.skip()
+		return LazyMap(self.view, offsets)
+
+	def _object(self, kind, n):
+		if kind == "map":
+			return self._map(n)
+		if kind == "array":
+			return [self.read() for _ in range(n)]
+		if kind == "str":
+			return str(self._take(n), "utf-8")
+		if kind == "bin":
+			return self._take(n)
+		subtype = self._unpack(">b")
+		return Ext(subtype, self._take(n))
+
+	def read(self):
+		if self.pos >= len(self.view):
+			raise ValueError("truncated msgpack data")
+		b = self.view[self.pos]
+		self.pos += 1
+		if b <= 0x7f:
+			return b
+		if b >= 0xe0:
+			return b - 0x100
+		if b <= 0x8f:
+			return self._object("map", b & 0x0f)
+		if b <= 0x9f:
+			return self._object("array", b & 0x0f)
+		if b <= 0xbf:
+			return self._object("str", b & 0x1f)
+		if b == 0xc0:
+			return None
+		if b in (0xc2, 0xc3):
+			return b == 0xc3
+		if b in _FIXED:
+			return self._unpack(_FIXED[b])
+		if b in _SIZED:
+			fmt, kind = _SIZED[b]
+			return self._object(kind, self._unpack(fmt))
+		if b in _FIXEXT_SIZES:
+			return self._object("ext", _FIXEXT_SIZES[b])
+		raise ValueError(f"invalid msgpack type byte 0x{b:02x} at offset {self.pos - 1}")
+
+	def skip(self):
+		# Moves past the next object without decoding it
+		n_objects = 1
+		while n_objects > 0:
+			n_objects -= 1
+			if self.pos >= len(self.view):
+				raise ValueError("truncated msgpack data")
+			b = self.view[self.pos]
+			self.pos += 1
+			if b <= 0x7f or b >= 0xe0 or b in (0xc0, 0xc2, 0xc3):
+				continue
+			if b <= 0x8f:
+				n_objects += 2 * (b & 0x0f)
+			elif b <= 0x9f:
+				n_objects += b & 0x0f
+			elif b <= 0xbf:
+				self._take(b & 0x1f)
+			elif b in _FIXED:
+				self._take(struct.calcsize(_FIXED[b]))
+			elif b in _SIZED:
+				fmt, kind = _SIZED[b]
+				n = self._unpack(fmt)
+				if kind == "map":
+					n_objects += 2 * n
+				elif kind == "array":
+					n_objects += n
+				else:
+					self._take(n + (kind == "ext"))
+			elif b in _FIXEXT_SIZES:
+				self._take(_FIXEXT_SIZES[b] + 1)
+			else:
+				raise ValueError(f"invalid msgpack type byte 0x{b:02x} at offset {self.pos - 1}")
+
+def unpackb(buffer):
+	# Object of msgpack data, binaries as memoryviews of the buffer and maps as LazyMaps
+	unpacker = _Unpacker(buffer)
+	obj = unpacker.read()
+	if unpacker.pos != len(unpacker.view):
+		raise ValueError(f"{len(unpacker.view) - unpacker.pos} trailing bytes after msgpack data")
+	return obj
+
+class _Packer:
+	# Writes msgpack to a file-like object through an optional compressor; small objects are buffered,
+	# binaries are passed on as they are
+	def __init__(self, f, compressor=None):
+		self.f = f
+		self.compressor = compressor
+		self.pending = bytearray()
+
+	def _write(self, data):
+		self.f.write(self.compressor.compress(data) if self.compressor else data)
+
+	def _flush(self):
+		if self.pending:
+			self._write(bytes(self.pending))
+			self.pending.clear()
+
+	def _header(self, n, fix, fix_max, codes):
+		# Type byte(s) of a map, array, str or bin of size n
+		if fix is not None and n <= fix_max:
+			self.pending.append(fix | n)
+		elif n <= 0xff and codes[0] is not None:
+			self.pending += struct.pack(">BB", codes[0], n)
+		elif n <= 0xffff:
+			self.pending += struct.pack(">BH", codes[1], n)
+		else:
+			self.pending += struct.pack(">BI", codes[2], n)
+
+	def _binary(self, data):
+		data = memoryview(data).cast("B")
+		if len(data) < CHUNK_SIZE:
+			self.pending += data
+		else:
+			self._flush()
+			self._write(data)
+
+	def pack(self, obj):
+		if obj is None:
+			self.pending.append(0xc0)
+		elif isinstance(obj, (bool, np.bool_)):
+			self.pending.append(0xc3 if obj else 0xc2)
+		elif isinstance(obj, (int, np.integer)):
+			self._int(int(obj))
+		elif isinstance(obj, (float, np.floating)):
+			self.pending += struct.pack(">Bd", 0xcb, float(obj))
+		elif isinstance(obj, str):
+			data = obj.encode("utf-8")
+			self._header(len(data), 0xa0, 0x1f, (0xd9, 0xda, 0xdb))
+			self.pending += data
+		elif isinstance(obj, np.ndarray):
+			data = np.ascontiguousarray(obj)
+			self._header(data.nbytes, None, 0, (0xc4, 0xc5, 0xc6))
+			self._binary(data.reshape(-1).view(np.uint8))
+		elif isinstance(obj, (bytes, bytearray, memoryview)):
+			self._header(memoryview(obj).nbytes, None, 0, (0xc4, 0xc5, 0xc6))
+			self._binary(obj)
+		elif isinstance(obj, Ext):
+			n = memoryview(obj.data).nbytes
+			fixext = {size: code for code, size in _FIXEXT_SIZES.items()}
+			if n in fixext:
+				self.pending.append(fixext[n])
+			else:
+				self._header(n, None, 0, (0xc7, 0xc8, 0xc9))
+			self.pending += struct.pack(">b", obj.subtype)
+			self._binary(obj.data)
+		elif isinstance(obj, Mapping):
+			self._header(len(obj), 0x80, 0x0f, (None, 0xde, 0xdf))
+			for key, value in obj.items():
+				self.pack(key)
+				self.pack(value)
+		elif isinstance(obj, (list, tuple)):
+			self._header(len(obj), 0x90, 0x0f, (None, 0xdc, 0xdd))
+			for value in obj:
+				self.pack(value)
+		else:
+			raise TypeError(f"cannot serialize {type(obj).__name__} to msgpack")
+		if len(self.pending) >= CHUNK_SIZE:
+			self._flush()
+
+	def _int(self, value):
+		if 0 <= value <= 0x7f or -32 <= value < 0:
+			self.pending += struct.pack(">b" if value < 0 else ">B", value)
+		elif value >= 0:
+			for code, fmt, limit in ((0xcc, ">B", 0xff), (0xcd, ">H", 0xffff), (0xce, ">I", 0xffffffff), (0xcf, ">Q", 0xffffffffffffffff)):
+				if value <= limit:
+					self.pending += struct.pack(">B" + fmt[1:], code, value)
+					return
+			raise OverflowError(f"{value} does not fit in msgpack")
+		else:
+			for code, fmt, limit in ((0xd0, ">b", 1 << 7), (0xd1, ">h", 1 << 15), (0xd2, ">i", 1 << 31), (0xd3, ">q", 1 << 63)):
+				if value >= -limit:
+					self.pending += struct.pack(">B" + fmt[1:], code, value)
+					return
+			raise OverflowError(f"{value} does not fit in msgpack")
+
+	def close(self):
+		self._flush()
+		if self.compressor:
+			self.f.write(self.compressor.flush())
+
+def packb(obj):
+	class _Bytes(bytearray):
+		write = bytearray.extend
+	out = _Bytes()
+	packer = _Packer(out)
+	packer.pack(obj)
+	packer.close()
+	return bytes(out)
+
+def _read_buffer(path):
+	# Decompressed content of a snapshot file, memory-mapped if it is not compressed (zstr detects the header)
+	with open(path, "rb") as f:
+		magic = f.read(2)
+		f.seek(0)
+		if magic != GZIP_MAGIC and magic not in ZLIB_MAGIC:
+			if os.fstat(f.fileno()).st_size == 0:
+				raise ValueError(f"{path} is empty")
+			return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		decompressor = zlib.decompressobj(AUTO_WBITS)
+		buffer = bytearray()
+		for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+			buffer += decompressor.decompress(chunk)
+		buffer += decompressor.flush()
+		return buffer
+
+class Snapshot:
+	# Network config of a testbed with its trained model, under the "snapshot" key
+	def __init__(self, config):
+		self.config = config
+
+	@property
+	def snapshot(self):
+		return self.config["snapshot"]
+
+	@property
+	def network_config(self):
+		# Config without the trained model (encoding, network, optimizer, ...)
+		return {key: value for key, value in self.config.items() if key != "snapshot"}
+
+	@property
+	def params_binary(self):
+		# Weights of the model, a view of the file
+		return np.frombuffer(self.snapshot["params_binary"], dtype=PARAMS_TYPES[self.snapshot.get("params_type", "__half")])
+
+	@property
+	def density_grid_binary(self):
+		# Density grid of the model, as fp16 cells in Morton order, one cascade after the other, a view of the file
+		return np.frombuffer(self.snapshot["density_grid_binary"], dtype=np.float16)
+
+	@property
+	def nerf(self):
+		return self.snapshot.get("nerf", {})
+
+	@property
+	def dataset(self):
+		return self.nerf.get("dataset")
+
+	@property
+	def camera(self):
+		return self.snapshot.get("camera")
+
+	def density_grid(self):
+		# (cascades, x, y, z) array of the density grid
+		grid_size = self.snapshot.get("density_grid_size", NERF_GRIDSIZE)
+		cells = self.density_grid_binary.reshape(-1, grid_size**3)
+		index = np.arange(grid_size**3, dtype=np.uint32)
+		x, y, z = (morton3D_invert(index >> i) for i in range(3))
+		grid = np.empty((len(cells), grid_size, grid_size, grid_size), dtype=cells.dtype)
+		grid[:, x, y, z] = cells
+		return grid
+
+def morton3D_invert(x):
+	# Every third bit of x, from the first one (as in the testbed)
+	x = x & 0x49249249
+	x = (x | (x >> 2)) & 0xc30c30c3
+	x = (x | (x >> 4)) & 0x0f00f00f
+	x = (x | (x >> 8)) & 0xff0000ff
+	x = (x | (x >> 16)) & 0x0000ffff
+	return x
+
+def read_snapshot(path):
+	return Snapshot(unpackb(_read_buffer(path)))
+
+def write_snapshot(path, snapshot, compress=True):
+	# Writes a Snapshot (or a config dict) as Testbed::save_snapshot does: gzip compressed for .ingp files
+	config = snapshot.config if isinstance(snapshot, Snapshot) else snapshot
+	compressor = None
+	if os.path.splitext(path)[1].lower() == ".ingp":
+		compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION if compress else zlib.Z_NO_COMPRESSION, zlib.DEFLATED, GZIP_WBITS)
+	with open(path + ".tmp", "wb") as f:
+		packer = _Packer(f, compressor)
+		packer.pack(config)
+		packer.close()
+	os.replace(path + ".tmp", path)
+
+def summary(snapshot):
+	# JSON-serializable description of a snapshot, binaries replaced by their size
+	def describe(obj):
+		if isinstance(obj, Mapping):
+			return {key: describe(value) for key, value in obj.items()}
+		if isinstance(obj, list):
+			return [describe(value) for value in obj] if len(obj) <= 16 else f"<{len(obj)} items>"
+		if isinstance(obj, (memoryview, Ext)):
+			return f"<{memoryview(obj.data if isinstance(obj, Ext) else obj).nbytes} bytes>"
+		return obj
+	config = describe(snapshot.config)
+	if isinstance(config.get("snapshot", {}).get("nerf", {}).get("dataset"), Mapping):
+		config["snapshot"]["nerf"]["dataset"] = f"<{len(snapshot.dataset)} keys>"
+	return config
+
+if __name__ == "__main__":
+	args = parse_args()
+	print(json.dumps(summary(read_snapshot(args.snapshot)), indent=2))
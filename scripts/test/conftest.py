@@ -0,0 +1,5 @@
+# The scripts are not a package: make them importable the same way they import each other.
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
@@ -0,0 +1,88 @@
+"""Test the analytic camera path evaluation and smoothing warm-up."""
+import json
+
+import numpy as np
+import pytest
+from scipy.linalg import expm, logm
+from scipy.spatial.transform import Rotation
+
+from camera_path import CameraPath, camera_log_lerp, smoothed_camera, smoothing_decay
+
+def _random_path(rng, n=5, loop=False):
+	rotations = Rotation.random(n, random_state=rng.integers(1 << 31)).as_quat()
+	# Flip some signs: the path must not depend on the quaternion representation
+	rotations *= rng.choice([-1.0, 1.0], size=(n, 1))
+	attributes = np.concatenate((rng.uniform(-1.0, 1.0, size=(n, 3)), rng.uniform(0.5, 1.0, size=(n, 5))), axis=1)
+	return CameraPath(rotations, attributes, [0] * n, loop=loop)
+
+def _to_4x4(m):
+	return np.concatenate((m, [[0.0, 0.0, 0.0, 1.0]]), axis=0)
+
+def _sequential_smoothed_cameras(camera_path, n_frames, fps, smoothing):
+	# Camera state of `Testbed::render_to_cpu` when rendering all frames in order
+	alpha = 1.0 - smoothing_decay(fps) if smoothing else 1.0
+	cameras = [camera_path.camera_matrix(0.0)]
+	for i in range(1, n_frames):
+		cameras.append(camera_log_lerp(cameras[-1], camera_path.camera_matrix(i / n_frames), alpha))
+	return cameras
+
+def test_camera_log_lerp_matches_matrix_log():
+	"""Test the closed form SE(3) interpolation against the matrix logarithm and exponential."""
+	# GIVEN
+	rng = np.random.default_rng(3)
+	for _ in range(10):
+		a = _random_path(rng, n=1).camera_matrix(0.0)
+		b = _random_path(rng, n=1).camera_matrix(0.0)
+		t = rng.uniform(0.0, 1.0)
+
+		# WHEN
+		result = camera_log_lerp(a, b, t)
+
+		# THEN
+		A = _to_4x4(a)
+		expected = expm(np.real(logm(_to_4x4(b) @ np.linalg.inv(A))) * t) @ A
+		np.testing.assert_allclose(result, expected[:3], atol=1e-9)
+
+def test_keyframe_spline():
+	"""Test the B-spline on a path whose keyframes are identical up to quaternion sign, and its endpoints."""
+	# GIVEN
+	q = Rotation.from_euler("xyz", [0.1, 0.2, 0.3]).as_quat()
+	attributes = np.arange(8, dtype=np.float64)
+	camera_path = CameraPath([q, -q, q], [attributes] * 3, [1, 0, 0])
+
+	# WHEN / THEN
+	for t in (0.0, 0.3, 0.5, 1.0):
+		R, values, _ = camera_path.keyframe(t)
+		np.testing.assert_allclose(R * np.sign(np.dot(R, q)), q, atol=1e-12)
+		np.testing.assert_allclose(values, attributes, atol=1e-12)
+	assert camera_path.keyframe(0.0)[2] == 1
+
+def test_load(tmp_path):
+	"""Test reading a camera path saved by the testbed."""
+	# GIVEN
+	path = tmp_path / "base_cam.json"
+	keyframe = {"R": [0.0, 0.0, 0.0, 1.0], "T": [1.0, 2.0, 3.0], "slice": 0.0, "scale": 1.0, "fov": 50.0, "dof": 0.1, "glow_mode": 0, "glow_y_cutoff": 0.0}
+	path.write_text(json.dumps({"loop": True, "time": 0.0, "path": [keyframe, keyframe]}))
+
+	# WHEN
+	camera_path = CameraPath.load(str(path))
+
+	# THEN
+	assert len(camera_path) == 2 and camera_path.loop
+	np.testing.assert_allclose(camera_path.camera_matrix(0.5), [[1, 0, 0, 1], [0, 1, 0, 2], [0, 0, 1, 3]], atol=1e-12)
+	np.testing.assert_allclose(camera_path.keyframe(0.5)[1][3:7], [0.0, 1.0, 50.0, 0.1])
+
+@pytest.mark.parametrize("smoothing", [False, True])
+@pytest.mark.parametrize("loop", [False, True])
+def test_smoothed_camera_matches_sequential_render(smoothing, loop):
+	"""Test that starting at any frame gives the camera state of a sequential render."""
+	# GIVEN
+	rng = np.random.default_rng(7)
+	camera_path = _random_path(rng, loop=loop)
+	fps = 30
+	n_frames = 6 * fps
+	expected = _sequential_smoothed_cameras(camera_path, n_frames, fps, smoothing)
+
+	# WHEN / THEN
+	for frame in (0, 1, 17, 90, 150, n_frames - 1):
+		np.testing.assert_allclose(smoothed_camera(camera_path, frame, n_frames, fps, smoothing), expected[frame], atol=1e-6)
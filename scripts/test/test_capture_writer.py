@@ -0,0 +1,97 @@
+"""Test the non-blocking NeRFCapture dataset writer with a fake DataReader."""
+import json
+import threading
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+
+import capture_writer
+from capture_writer import CaptureWriter, capture_dataset, load_jsonl_manifest
+
+W, H = 8, 6
+
+def _sample(i, has_depth=True):
+	return SimpleNamespace(
+		id=i, timestamp=float(i), fl_x=10.0, fl_y=11.0, cx=4.0, cy=3.0, width=W, height=H,
+		transform_matrix=np.eye(4, dtype=np.float32).ravel().tolist(),
+		image=np.full((H, W, 3), i, dtype=np.uint8).tobytes(),
+		has_depth=has_depth, depth_width=W // 2, depth_height=H // 2, depth_scale=1.0,
+		depth_image=np.full((H // 2, W // 2), 0.5, dtype=np.float32).tobytes(),
+	)
+
+class FakeReader:
+	# Like a DDS DataReader: read_next returns None when no sample is available
+	def __init__(self, samples, gap=1):
+		self.samples = list(samples)
+		self.calls = 0
+		self.gap = gap
+
+	def read_next(self):
+		self.calls += 1
+		if self.calls % (self.gap + 1) != 0 or not self.samples:
+			return None
+		return self.samples.pop(0)
+
+def test_capture_dataset(tmp_path):
+	"""Test that frames, depth maps and the manifests are written."""
+	# GIVEN
+	reader = FakeReader([_sample(i, has_depth=i != 1) for i in range(5)])
+
+	# WHEN
+	with CaptureWriter(tmp_path / "dataset", depth_scale=2.0, n_workers=2, flush_every=2) as writer:
+		queued = capture_dataset(reader, writer, n_frames=4, idle_sleep=0)
+
+	# THEN
+	assert queued == 4 and len(reader.samples) == 1
+	assert writer.stats() == {"received": 4, "written": 4, "dropped": 0, "failed": 0}
+	with open(tmp_path / "dataset" / "transforms.json") as f:
+		manifest = json.load(f)
+	assert manifest["w"] == W and manifest["integer_depth_scale"] == 2.0 / 65535.0
+	assert [frame["file_path"] for frame in manifest["frames"]] == [f"images/{i}" for i in range(4)]
+	assert ["depth_path" in frame for frame in manifest["frames"]] == [True, False, True, True]
+	assert manifest == load_jsonl_manifest(tmp_path / "dataset" / "transforms.jsonl")
+
+	image = cv2.imread(str(tmp_path / "dataset" / "images" / "2.png"))
+	assert image.shape == (H, W, 3) and (image == 2).all()
+	depth = cv2.imread(str(tmp_path / "dataset" / "images" / "0.depth.png"), cv2.IMREAD_UNCHANGED)
+	assert depth.shape == (H, W) and (depth == int(0.5 * 65535 / 2.0)).all()
+
+def test_slow_disk_drops_frames_instead_of_blocking(tmp_path, monkeypatch):
+	"""Test that frames received while the writer is saturated are dropped and counted, and that the manifest is flushed periodically."""
+	# GIVEN a disk that blocks until released
+	release = threading.Event()
+	original_imwrite = cv2.imwrite
+	monkeypatch.setattr(capture_writer.cv2, "imwrite", lambda *a, **k: release.wait(10) and original_imwrite(*a, **k))
+	writer = CaptureWriter(tmp_path / "dataset", n_workers=1, max_pending=2, flush_every=1)
+
+	# WHEN more frames arrive than can be pending
+	accepted = [writer.submit(_sample(i, has_depth=False)) for i in range(5)]
+
+	# THEN receiving did not block, and the extra frames are dropped
+	assert accepted == [True, True, False, False, False]
+	assert writer.stats() == {"received": 5, "written": 0, "dropped": 3, "failed": 0}
+
+	# WHEN the disk catches up
+	release.set()
+	writer.close()
+
+	# THEN
+	assert writer.stats()["written"] == 2
+	assert len(load_jsonl_manifest(tmp_path / "dataset" / "transforms.jsonl")["frames"]) == 2
+
+def test_interrupted_capture_leaves_usable_manifest(tmp_path):
+	"""Test that the manifests are usable before the capture is closed."""
+	# GIVEN
+	writer = CaptureWriter(tmp_path / "dataset", n_workers=1, flush_every=2)
+
+	# WHEN the capture stops without closing the writer
+	for i in range(3):
+		writer.submit(_sample(i))
+	writer._pool.shutdown(wait=True)
+
+	# THEN
+	with open(tmp_path / "dataset" / "transforms.json") as f:
+		assert len(json.load(f)["frames"]) == 2
+	assert len(load_jsonl_manifest(tmp_path / "dataset" / "transforms.jsonl")["frames"]) == 3
+	writer.close()
@@ -0,0 +1,81 @@
+"""Test colmap2nerf end to end on a synthetic COLMAP model."""
+import json
+import os
+import subprocess
+import sys
+
+import cv2
+import numpy as np
+import pytest
+from scipy.spatial.transform import Rotation
+
+from colmap_model import Camera, Images, Points3D, write_cameras_binary, write_images_binary, write_points3D_binary
+from image_pairs import frame_intrinsics
+from scene_bounds import fit_bounds
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "colmap2nerf.py")
+W, H = 64, 48
+
+def _write_model(folder, rng, n_cameras=8, n_points=500, n_outliers=20):
+	# Cameras on a ring looking at the origin, reliable points on a ground wider than the ring, and points far on
+	# one side with a large reprojection error
+	folder.mkdir()
+	write_cameras_binary(str(folder / "cameras.bin"), {1: Camera(1, "PINHOLE", W, H, np.array([50.0, 50.0, W / 2, H / 2]))})
+	centers, qvecs, tvecs = [], [], []
+	for i in range(n_cameras):
+		angle = 2 * np.pi * i / n_cameras
+		center = np.array([3 * np.cos(angle), 0.5 * (-1)**i, 3 * np.sin(angle)])
+		# COLMAP cameras: x right, y down, z forward
+		forward = -center / np.linalg.norm(center)
+		right = np.cross([0.0, -1.0, 0.0], forward)
+		right /= np.linalg.norm(right)
+		R_wc = np.stack([right, np.cross(forward, right), forward])
+		x, y, z, w = Rotation.from_matrix(R_wc).as_quat()
+		centers.append(center)
+		qvecs.append([w, x, y, z])
+		tvecs.append(-R_wc @ center)
+	names = [f"{i}.png" for i in range(n_cameras)]
+	write_images_binary(str(folder / "images.bin"), Images(np.arange(1, n_cameras + 1), np.array(qvecs), np.array(tvecs), np.ones(n_cameras, dtype=np.int32), names, None, None, None))
+
+	points = rng.uniform([-6, -0.3, -6], [6, 0.3, 6], (n_points, 3))
+	outliers = rng.uniform([6, -0.3, -1], [10, 0.3, 1], (n_outliers, 3))
+	n = n_points + n_outliers
+	errors = np.concatenate([np.full(n_points, 0.5), np.full(n_outliers, 10.0)])
+	track_offsets = np.arange(n + 1) * 3
+	write_points3D_binary(str(folder / "points3D.bin"), Points3D(np.arange(1, n + 1), np.concatenate([points, outliers]), np.zeros((n, 3), dtype=np.uint8), errors, track_offsets, np.tile([1, 2, 3], n), np.zeros(3 * n, dtype=np.int32)))
+	return np.array(centers), names, points
+
+def _similarity(src, dst):
+	# (s, R, t) with dst = s * R @ src + t, from matching point sets (Umeyama)
+	src_mean, dst_mean = src.mean(axis=0), dst.mean(axis=0)
+	U, S, Vt = np.linalg.svd((dst - dst_mean).T @ (src - src_mean))
+	D = np.diag([1.0, 1.0, np.sign(np.linalg.det(U @ Vt))])
+	R = U @ D @ Vt
+	s = np.trace(np.diag(S) @ D) / np.sum((src - src_mean)**2)
+	return s, R, dst_mean - s * R @ src_mean
+
+@pytest.mark.parametrize("keep_colmap_coords", [False, True])
+def test_auto_aabb(tmp_path, keep_colmap_coords):
+	"""Test that --auto_aabb fits the bounds to the reliable points, moved like the cameras."""
+	# GIVEN
+	rng = np.random.default_rng(0)
+	centers, names, points = _write_model(tmp_path / "sparse", rng)
+	(tmp_path / "images").mkdir()
+	for name in names:
+		cv2.imwrite(str(tmp_path / "images" / name), rng.integers(0, 255, (H, W, 3), dtype=np.uint8))
+
+	# WHEN
+	command = [sys.executable, SCRIPT, "--images", "images", "--text", "sparse", "--out", "transforms.json", "--aabb_scale", "1", "--auto_aabb"]
+	subprocess.run(command + (["--keep_colmap_coords"] if keep_colmap_coords else []), cwd=str(tmp_path), check=True)
+
+	# THEN
+	with open(tmp_path / "transforms.json") as f:
+		out = json.load(f)
+	c2ws = np.array([frame["transform_matrix"] for frame in out["frames"]])
+	# Frames are in the order of the model, the points follow the transform of the camera centers
+	s, R, t = _similarity(centers, c2ws[:, 0:3, 3])
+	np.testing.assert_allclose(s * centers @ R.T + t, c2ws[:, 0:3, 3], atol=1e-6)
+	intrinsics = np.array([frame_intrinsics(out, frame) for frame in out["frames"]])
+	aabb_scale, render_aabb = fit_bounds(c2ws, intrinsics, out, s * points @ R.T + t)
+	assert out["aabb_scale"] == aabb_scale > 1
+	np.testing.assert_allclose(out["render_aabb"], render_aabb, atol=1e-6)
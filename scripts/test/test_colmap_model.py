@@ -0,0 +1,136 @@
+"""Test the COLMAP binary and text model readers on synthetic models."""
+import struct
+
+import numpy as np
+import pytest
+
+from colmap_model import CAMERA_MODELS, read_cameras_binary, read_images_binary, read_model, read_points3D_binary, write_cameras_binary, write_images_binary, write_points3D_binary
+
+def _synthetic_model(rng):
+	# Cameras of every model, images with names with spaces and empty point lists, points with empty tracks
+	cameras = [(i + 1, model_id, 640 + i, 480 + i, rng.normal(size=num_params)) for i, (model_id, (_, num_params)) in enumerate(CAMERA_MODELS.items())]
+	images = []
+	for i in range(7):
+		n_points = [0, 3, 1, 5, 0, 2, 4][i]
+		points = [(rng.normal(), rng.normal(), int(rng.integers(-1, 100))) for _ in range(n_points)]
+		images.append((10 + i, rng.normal(size=4), rng.normal(size=3), cameras[i % len(cameras)][0], f"folder/image {i}.jpg", points))
+	points3D = []
+	for i in range(9):
+		track = [(int(rng.integers(0, 20)), int(rng.integers(0, 50))) for _ in range(i % 4)]
+		points3D.append((100 + i, rng.normal(size=3), rng.integers(0, 256, size=3), rng.uniform(), track))
+	return cameras, images, points3D
+
+def _write_binary(folder, cameras, images, points3D):
+	# Independent writer following https://colmap.github.io/format.html
+	with open(folder / "cameras.bin", "wb") as f:
+		f.write(struct.pack("<Q", len(cameras)))
+		for camera_id, model_id, width, height, params in cameras:
+			f.write(struct.pack("<iiQQ", camera_id, model_id, width, height) + struct.pack(f"<{len(params)}d", *params))
+	with open(folder / "images.bin", "wb") as f:
+		f.write(struct.pack("<Q", len(images)))
+		for image_id, qvec, tvec, camera_id, name, points in images:
+			f.write(struct.pack("<i4d3di", image_id, *qvec, *tvec, camera_id) + name.encode() + b"\0")
+			f.write(struct.pack("<Q", len(points)))
+			for x, y, point3D_id in points:
+				f.write(struct.pack("<ddq", x, y, point3D_id))
+	with open(folder / "points3D.bin", "wb") as f:
+		f.write(struct.pack("<Q", len(points3D)))
+		for point_id, xyz, rgb, error, track in points3D:
+			f.write(struct.pack("<Q3d3BdQ", point_id, *xyz, *rgb, error, len(track)))
+			for image_id, point2D_idx in track:
+				f.write(struct.pack("<ii", image_id, point2D_idx))
+
+def _fmt(value):
+	return repr(float(value))
+
+def _write_text(folder, cameras, images, points3D):
+	with open(folder / "cameras.txt", "w") as f:
+		f.write("# Camera list with one line of data per camera:\n")
+		for camera_id, model_id, width, height, params in cameras:
+			f.write(" ".join([str(camera_id), CAMERA_MODELS[model_id][0], str(width), str(height)] + [_fmt(p) for p in params]) + "\n")
+	with open(folder / "images.txt", "w") as f:
+		f.write("# Image list with two lines of data per image:\n")
+		for image_id, qvec, tvec, camera_id, name, points in images:
+			f.write(" ".join([str(image_id)] + [_fmt(v) for v in (*qvec, *tvec)] + [str(camera_id), name]) + "\n")
+			f.write(" ".join(f"{_fmt(x)} {_fmt(y)} {point3D_id}" for x, y, point3D_id in points) + "\n")
+	with open(folder / "points3D.txt", "w") as f:
+		f.write("# 3D point list with one line of data per point:\n")
+		for point_id, xyz, rgb, error, track in points3D:
+			f.write(" ".join([str(point_id)] + [_fmt(v) for v in xyz] + [str(v) for v in rgb] + [_fmt(error)] + [f"{a} {b}" for a, b in track]) + "\n")
+
+def _check_model(model, cameras, images, points3D):
+	colmap_cameras, colmap_images, colmap_points3D = model
+	assert sorted(colmap_cameras) == [camera[0] for camera in cameras]
+	for camera_id, model_id, width, height, params in cameras:
+		camera = colmap_cameras[camera_id]
+		assert (camera.model, camera.width, camera.height) == (CAMERA_MODELS[model_id][0], width, height)
+		np.testing.assert_array_equal(camera.params, params)
+
+	np.testing.assert_array_equal(colmap_images.ids, [image[0] for image in images])
+	np.testing.assert_array_equal(colmap_images.qvecs, [image[1] for image in images])
+	np.testing.assert_array_equal(colmap_images.tvecs, [image[2] for image in images])
+	np.testing.assert_array_equal(colmap_images.camera_ids, [image[3] for image in images])
+	assert colmap_images.names == [image[4] for image in images]
+	for i, image in enumerate(images):
+		start, end = colmap_images.points2D_offsets[i:i+2]
+		np.testing.assert_array_equal(colmap_images.points2D_xy[start:end], np.reshape([p[0:2] for p in image[5]], (-1, 2)))
+		np.testing.assert_array_equal(colmap_images.points2D_point3D_ids[start:end], [p[2] for p in image[5]])
+
+	np.testing.assert_array_equal(colmap_points3D.ids, [point[0] for point in points3D])
+	np.testing.assert_array_equal(colmap_points3D.xyz, [point[1] for point in points3D])
+	np.testing.assert_array_equal(colmap_points3D.rgb, [point[2] for point in points3D])
+	np.testing.assert_array_equal(colmap_points3D.errors, [point[3] for point in points3D])
+	for i, point in enumerate(points3D):
+		start, end = colmap_points3D.track_offsets[i:i+2]
+		np.testing.assert_array_equal(colmap_points3D.track_image_ids[start:end], [t[0] for t in point[4]])
+		np.testing.assert_array_equal(colmap_points3D.track_point2D_idxs[start:end], [t[1] for t in point[4]])
+
+@pytest.mark.parametrize("write", [_write_binary, _write_text])
+def test_read_model(tmp_path, write):
+	"""Test reading binary and text models."""
+	# GIVEN
+	cameras, images, points3D = _synthetic_model(np.random.default_rng(0))
+	write(tmp_path, cameras, images, points3D)
+
+	# WHEN
+	model = read_model(str(tmp_path), load_points2D=True, load_points3D=True)
+
+	# THEN
+	_check_model(model, cameras, images, points3D)
+
+def test_binary_round_trip(tmp_path):
+	"""Test that the writers produce the files COLMAP would."""
+	# GIVEN
+	cameras, images, points3D = _synthetic_model(np.random.default_rng(1))
+	_write_binary(tmp_path, cameras, images, points3D)
+	out = tmp_path / "out"
+	out.mkdir()
+
+	# WHEN
+	write_cameras_binary(out / "cameras.bin", read_cameras_binary(tmp_path / "cameras.bin"))
+	write_images_binary(out / "images.bin", read_images_binary(tmp_path / "images.bin", load_points2D=True))
+	write_points3D_binary(out / "points3D.bin", read_points3D_binary(tmp_path / "points3D.bin"))
+
+	# THEN
+	for name in ("cameras.bin", "images.bin", "points3D.bin"):
+		assert (out / name).read_bytes() == (tmp_path / name).read_bytes()
+
+def test_read_large_points3D(tmp_path):
+	"""Test a point cloud spanning several decoding chunks."""
+	# GIVEN
+	rng = np.random.default_rng(2)
+	n = 200000
+	track_lengths = rng.integers(0, 5, size=n)
+	with open(tmp_path / "points3D.bin", "wb") as f:
+		f.write(struct.pack("<Q", n))
+		for i in range(n):
+			f.write(struct.pack("<Q3d3BdQ", i, i, 2 * i, 3 * i, i % 256, 0, 0, 0.5, track_lengths[i]))
+			f.write(np.full(2 * track_lengths[i], i, dtype="<i4").tobytes())
+
+	# WHEN
+	points3D = read_points3D_binary(tmp_path / "points3D.bin")
+
+	# THEN
+	np.testing.assert_array_equal(points3D.xyz, np.arange(n)[:, np.newaxis] * [1, 2, 3])
+	np.testing.assert_array_equal(points3D.rgb[:, 0], np.arange(n) % 256)
+	np.testing.assert_array_equal(points3D.track_image_ids, np.repeat(np.arange(n), track_lengths))
@@ -0,0 +1,155 @@
+"""Test the compaction of snapshots, on synthetic snapshots."""
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from compact_snapshot import CODECS, COMPACT_MAGIC, compact, compact_snapshot, default_codec, expand, expand_snapshot, grid_layout, is_compact, read_compact, write_compact
+from snapshot import read_snapshot, write_snapshot
+
+N_MLP_PARAMS = 10240
+ENCODING = {"otype": "HashGrid", "n_levels": 4, "n_features_per_level": 2, "log2_hashmap_size": 14, "base_resolution": 4, "per_level_scale": 2.0}
+# Entries of the levels: 4^3, 8^3, 16^3, then 32^3 capped to 2^14
+LEVEL_ENTRIES = [64, 512, 4096, 16384]
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "compact_snapshot.py")
+
+def _synthetic_config(untouched=0.5):
+	# Trained weights in the MLPs and the grid, and grid entries left at their initialization
+	rng = np.random.default_rng(0)
+	n_grid = sum(LEVEL_ENTRIES) * 2
+	grid = rng.normal(scale=0.1, size=(n_grid // 2, 2))
+	untouched_entries = rng.uniform(size=len(grid)) < untouched
+	grid[untouched_entries] = rng.uniform(-1e-4, 1e-4, size=(np.count_nonzero(untouched_entries), 2))
+	params = np.concatenate([rng.normal(scale=0.5, size=N_MLP_PARAMS), grid.ravel()]).astype(np.float16)
+	return {
+		"encoding": dict(ENCODING),
+		"network": {"otype": "FullyFusedMLP", "n_neurons": 64, "n_hidden_layers": 1},
+		"dir_encoding": {"otype": "Composite", "nested": [{"otype": "SphericalHarmonics", "degree": 4}, {"otype": "Identity"}]},
+		"snapshot": {
+			"version": 1,
+			"mode": "Nerf",
+			"n_params": len(params),
+			"params_type": "__half",
+			"params_binary": params,
+			"optimizer": {"first_moments_binary": np.zeros(len(params), dtype=np.float32)},
+			"density_grid_size": 8,
+			"density_grid_binary": rng.uniform(size=8**3).astype(np.float16),
+			"nerf": {"aabb_scale": 1},
+		},
+	}
+
+def test_grid_layout():
+	"""Test the offsets of the hash grid levels in the params."""
+	# GIVEN
+	config = _synthetic_config()
+
+	# WHEN
+	offset, levels, n_features = grid_layout(config)
+
+	# THEN
+	assert offset == N_MLP_PARAMS
+	assert [n for _, n in levels] == LEVEL_ENTRIES
+	assert [start for start, _ in levels] == [0, 64, 576, 4672]
+	assert n_features == 2
+
+def test_grid_layout_default_scale():
+	"""Test the per level scale the testbed derives from the aabb_scale, with the default NeRF config."""
+	# GIVEN
+	encoding = {"otype": "HashGrid", "n_levels": 8, "n_features_per_level": 4, "log2_hashmap_size": 19, "base_resolution": 16}
+	n_grid = (16**3 + 32**3 + 64**3 + 5 * 2**19) * 4
+	config = {"encoding": encoding, "snapshot": {"n_params": N_MLP_PARAMS + n_grid, "nerf": {"aabb_scale": 1}}}
+
+	# WHEN
+	offset, levels, _ = grid_layout(config)
+
+	# THEN
+	assert offset == N_MLP_PARAMS
+	assert [n for _, n in levels] == [16**3, 32**3, 64**3] + [2**19] * 5
+
+def test_grid_layout_unknown():
+	"""Test that models whose grid cannot be located are not quantized."""
+	# GIVEN
+	config = _synthetic_config()
+	config["encoding"]["otype"] = "Frequency"
+
+	# WHEN
+	compacted = compact(config)
+
+	# THEN
+	assert grid_layout(config) is None
+	assert np.array_equal(expand(compacted)["snapshot"]["params_binary"], config["snapshot"]["params_binary"])
+
+@pytest.mark.parametrize("sparsify_threshold", [0.0, 2e-4])
+def test_compact_expand(sparsify_threshold):
+	"""Test that the MLPs are kept as they are and the grid is close to the original."""
+	# GIVEN
+	config = _synthetic_config()
+	params = config["snapshot"]["params_binary"]
+
+	# WHEN
+	compacted = compact(config, sparsify_threshold=sparsify_threshold)
+	restored = expand(compacted)["snapshot"]["params_binary"]
+
+	# THEN
+	assert "optimizer" not in compacted["snapshot"]
+	assert restored.dtype == np.float16 and restored.shape == params.shape
+	assert np.array_equal(restored[:N_MLP_PARAMS], params[:N_MLP_PARAMS])
+	grid, restored_grid = params[N_MLP_PARAMS:].astype(np.float32), restored[N_MLP_PARAMS:].astype(np.float32)
+	assert np.abs(grid - restored_grid).max() < np.abs(grid).max() / 127
+	if sparsify_threshold > 0:
+		assert sum(len(level["quantized"]) for level in compacted["snapshot"]["params_binary"]["levels"]) < sum(LEVEL_ENTRIES) * 0.6
+		untouched = np.abs(grid.reshape(-1, 2)).max(axis=1) <= sparsify_threshold
+		assert np.all(restored_grid.reshape(-1, 2)[untouched] == 0)
+
+@pytest.mark.parametrize("codec", ["zlib", "lzma", "zstd"])
+def test_compact_snapshot(tmp_path, codec):
+	"""Test that a compacted snapshot is smaller and expands to a snapshot with the same layout."""
+	# GIVEN
+	if codec == "zstd":
+		pytest.importorskip("zstandard")
+	config = _synthetic_config()
+	write_snapshot(str(tmp_path / "model.ingp"), config)
+
+	# WHEN
+	report = compact_snapshot(str(tmp_path / "model.ingp"), str(tmp_path / "model.ingpc"), codec, sparsify_threshold=2e-4)
+	expand_snapshot(str(tmp_path / "model.ingpc"), str(tmp_path / "expanded.ingp"))
+
+	# THEN
+	assert is_compact(str(tmp_path / "model.ingpc")) and not is_compact(str(tmp_path / "model.ingp"))
+	assert report["ratio"] > 1.8
+	assert report["params_psnr"] > 40
+	assert report["dropped_entries"] > 0.4
+	expanded = read_snapshot(str(tmp_path / "expanded.ingp"))
+	assert expanded.params_binary.shape == (config["snapshot"]["n_params"],)
+	assert np.array_equal(expanded.density_grid_binary, config["snapshot"]["density_grid_binary"])
+	assert expanded.network_config["encoding"] == ENCODING
+
+def test_unknown_codec(tmp_path):
+	"""Test that compacted snapshots are read back with their codec, and that unknown codecs are errors."""
+	# GIVEN
+	write_compact(str(tmp_path / "model.ingpc"), compact(_synthetic_config()), "lzma")
+
+	# WHEN
+	compacted = read_compact(str(tmp_path / "model.ingpc"))
+
+	# THEN
+	assert compacted["snapshot"]["n_params"] == _synthetic_config()["snapshot"]["n_params"]
+	with pytest.raises(ValueError):
+		write_compact(str(tmp_path / "other.ingpc"), compacted, "brotli")
+
+@pytest.mark.parametrize("n_workers", ["1", "2"])
+def test_default_codec(tmp_path, n_workers):
+	"""Test that the command line works without options, whether zstandard is installed or not."""
+	# GIVEN
+	write_snapshot(str(tmp_path / "model.ingp"), _synthetic_config())
+
+	# WHEN
+	subprocess.run([sys.executable, SCRIPT, str(tmp_path / "model.ingp"), "--n_workers", n_workers], check=True)
+	subprocess.run([sys.executable, SCRIPT, str(tmp_path / "model.ingpc"), "--out_dir", str(tmp_path / "expanded"), "--n_workers", n_workers], check=True)
+
+	# THEN
+	with open(tmp_path / "model.ingpc", "rb") as f:
+		assert f.read(len(COMPACT_MAGIC) + 1) == COMPACT_MAGIC + bytes([CODECS[default_codec()]])
+	assert read_snapshot(str(tmp_path / "expanded" / "model.ingp")).params_binary.shape == (_synthetic_config()["snapshot"]["n_params"],)
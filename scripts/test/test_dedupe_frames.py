@@ -0,0 +1,81 @@
+"""Test the perceptual-hash removal of near-duplicate frames."""
+import json
+
+import cv2
+import numpy as np
+
+from dedupe_frames import BKTree, dedupe_transforms, hamming_distance, perceptual_hash, select_unique
+
+def _scene(seed, size=(128, 160)):
+	# Smooth random image, different for each seed
+	rng = np.random.default_rng(seed)
+	image = cv2.resize(rng.integers(0, 256, (8, 10, 3), dtype=np.uint8), size[::-1], interpolation=cv2.INTER_CUBIC)
+	return cv2.add(image, rng.integers(0, 40, size + (3,), dtype=np.uint8))
+
+def test_bk_tree_query():
+	"""Test the BK-tree queries against a brute force search."""
+	# GIVEN
+	rng = np.random.default_rng(0)
+	hashes = [int(h) for h in rng.integers(0, 1 << 16, 500)] + [7, 7]
+	tree = BKTree()
+	for i, value in enumerate(hashes):
+		tree.add(value, i)
+
+	for query in hashes[:20] + [7]:
+		# WHEN
+		found = tree.query(query, 3)
+
+		# THEN
+		assert sorted(found) == [i for i, value in enumerate(hashes) if hamming_distance(value, query) <= 3]
+
+def test_perceptual_hash(tmp_path):
+	"""Test that the hashes of slightly different images are close, and far from other scenes'."""
+	# GIVEN
+	image = _scene(0)
+	cv2.imwrite(str(tmp_path / "a.png"), image)
+	cv2.imwrite(str(tmp_path / "b.jpg"), cv2.GaussianBlur(image, (0, 0), 1.0), [cv2.IMWRITE_JPEG_QUALITY, 80])
+	cv2.imwrite(str(tmp_path / "c.png"), _scene(1))
+
+	# WHEN
+	a, b, c = (perceptual_hash(str(tmp_path / name)) for name in ("a.png", "b.jpg", "c.png"))
+
+	# THEN
+	assert hamming_distance(a, b) <= 4
+	assert hamming_distance(a, c) > 16
+
+def test_select_unique():
+	"""Test that the highest scoring frame of a group of duplicates is kept, and every dropped frame has a kept one nearby."""
+	# GIVEN
+	hashes = [0b0000, 0b0001, 0b0011, 0b1111_0000, 0b1111_0001]
+	scores = [1.0, 3.0, 2.0, 1.0, 0.5]
+
+	# WHEN
+	kept = select_unique(hashes, scores, max_distance=1)
+
+	# THEN
+	assert kept == [1, 3]
+
+def test_dedupe_transforms(tmp_path):
+	"""Test that a stationary run is reduced to its sharpest frame, and distinct frames are kept."""
+	# GIVEN frames 0-4 from a stationary device, 2 being the sharpest, and 3 other views
+	(tmp_path / "images").mkdir()
+	still = _scene(0)
+	for i in range(5):
+		image = still if i == 2 else cv2.GaussianBlur(still, (0, 0), 0.5 + 0.3 * i)
+		cv2.imwrite(str(tmp_path / "images" / f"{i}.png"), image)
+	for i in range(5, 8):
+		cv2.imwrite(str(tmp_path / "images" / f"{i}.png"), _scene(i))
+	frames = [{"file_path": f"images/{i}", "transform_matrix": np.eye(4).tolist()} for i in range(8)]
+	with open(tmp_path / "transforms.json", "w") as f:
+		json.dump({"aabb_scale": 16, "frames": frames}, f)
+	(tmp_path / "out").mkdir()
+
+	# WHEN
+	n_kept, n_frames = dedupe_transforms(str(tmp_path / "transforms.json"), str(tmp_path / "out" / "transforms.json"), n_workers=2)
+
+	# THEN
+	with open(tmp_path / "out" / "transforms.json") as f:
+		out = json.load(f)
+	assert (n_kept, n_frames) == (4, 8)
+	assert [frame["file_path"] for frame in out["frames"]] == ["../images/2", "../images/5", "../images/6", "../images/7"]
+	assert out["aabb_scale"] == 16
@@ -0,0 +1,120 @@
+"""Test the sparse depth priors of COLMAP points."""
+import cv2
+import numpy as np
+import pytest
+
+from colmap_model import Camera, Images, Points3D, qvecs_to_rotmats
+from depth_priors import UINT16_MAX, compute_depth_maps, integer_depth_scale, points_per_image, project_points, sparse_depth_map, write_depth_maps
+
+def _points_in_front(rng, n):
+	return np.concatenate([rng.uniform(-1, 1, (n, 2)), rng.uniform(1, 3, (n, 1))], axis=-1)
+
+@pytest.mark.parametrize("model, params", [
+	("PINHOLE", [50, 52, 32, 24]),
+	("OPENCV", [50, 52, 32, 24, 0.1, -0.05, 0.002, -0.003]),
+	("FULL_OPENCV", [50, 52, 32, 24, 0.1, -0.05, 0.002, -0.003, 0.01, 0.02, -0.01, 0.005]),
+])
+def test_project_points_matches_opencv(model, params):
+	"""Test the perspective models against cv2.projectPoints."""
+	# GIVEN
+	points = _points_in_front(np.random.default_rng(0), 100)
+	K = np.array([[params[0], 0, params[2]], [0, params[1], params[3]], [0, 0, 1]])
+	# k1 k2 p1 p2 (k3 k4 k5 k6), same order as OpenCV
+	dist = np.array(params[4:], dtype=np.float64)
+	expected = cv2.projectPoints(points, np.zeros(3), np.zeros(3), K, dist if len(dist) else None)[0][:, 0]
+
+	# WHEN
+	uv = project_points(points, model, params)
+
+	# THEN
+	np.testing.assert_allclose(uv, expected, atol=1e-9)
+
+def test_project_points_fisheye_matches_opencv():
+	"""Test the fisheye model against cv2.fisheye.projectPoints."""
+	# GIVEN
+	params = [50.0, 52.0, 32.0, 24.0, 0.05, -0.01, 0.003, -0.001]
+	points = _points_in_front(np.random.default_rng(1), 100)
+	K = np.array([[params[0], 0, params[2]], [0, params[1], params[3]], [0, 0, 1]])
+
+	# WHEN
+	uv = project_points(points, "OPENCV_FISHEYE", params)
+
+	# THEN
+	expected = cv2.fisheye.projectPoints(points[np.newaxis], np.zeros(3), np.zeros(3), K, np.array(params[4:]))[0][0]
+	np.testing.assert_allclose(uv, expected, atol=1e-9)
+
+def test_sparse_depth_map_keeps_nearest_point():
+	"""Test that each pixel gets the depth of the nearest point, and that points behind or outside are dropped."""
+	# GIVEN a camera 2 units behind the origin, looking along +z
+	camera = Camera(1, "SIMPLE_PINHOLE", 8, 6, np.array([4.0, 4.0, 3.0]))
+	qvec = np.array([1.0, 0.0, 0.0, 0.0])
+	tvec = np.array([0.0, 0.0, 2.0])
+	xyz = np.array([
+		[0.0, 0.0, 1.0],   # depth 3, pixel (4, 3)
+		[0.0, 0.0, 0.0],   # depth 2, same pixel: wins
+		[0.5, 0.0, 0.0],   # depth 2, pixel (5, 3)
+		[0.0, 0.0, -3.0],  # behind the camera
+		[50.0, 0.0, 0.0],  # outside the image
+	])
+
+	# WHEN
+	indices, depths = sparse_depth_map(camera, qvec, tvec, xyz)
+
+	# THEN
+	assert dict(zip(indices.tolist(), depths.tolist())) == {3 * 8 + 4: 2.0, 3 * 8 + 5: 2.0}
+
+	# WHEN splatting the points
+	indices, depths = sparse_depth_map(camera, qvec, tvec, xyz[:1], splat_radius=1)
+
+	# THEN they cover a disc
+	assert sorted(indices.tolist()) == [2 * 8 + 4, 3 * 8 + 3, 3 * 8 + 4, 3 * 8 + 5, 4 * 8 + 4]
+	assert (depths == 3.0).all()
+
+def test_points_per_image_filters_unreliable_points():
+	"""Test that points with short tracks or large reprojection errors are not used."""
+	# GIVEN tracks [10, 11], [11], [10, 11, 10] and [10, 12]
+	points3D = Points3D(
+		ids=np.arange(4), xyz=np.zeros((4, 3)), rgb=np.zeros((4, 3), dtype=np.uint8), errors=np.array([0.5, 0.5, 0.5, 5.0]),
+		track_offsets=np.array([0, 2, 3, 6, 8]), track_image_ids=np.array([10, 11, 11, 10, 11, 10, 10, 12]), track_point2D_idxs=np.zeros(8, dtype=np.int64),
+	)
+
+	# WHEN
+	visible = points_per_image(points3D, np.array([10, 11, 12]), min_track_length=2, max_reprojection_error=1.0)
+
+	# THEN
+	assert [v.tolist() for v in visible] == [[0, 2], [0, 2], []]
+
+def test_depth_maps_round_trip(tmp_path):
+	"""Test that the written uint16 depth maps, times integer_depth_scale, are the scaled camera space depths."""
+	# GIVEN a few cameras looking at a random point cloud, every point seen by every camera
+	rng = np.random.default_rng(2)
+	n_images, n_points = 3, 50
+	cameras = {1: Camera(1, "OPENCV", 64, 48, np.array([40.0, 41.0, 32.0, 24.0, 0.05, -0.02, 0.001, 0.001]))}
+	qvecs = rng.normal(0, 0.05, (n_images, 4)) + [1, 0, 0, 0]
+	qvecs /= np.linalg.norm(qvecs, axis=-1, keepdims=True)
+	tvecs = rng.normal(0, 0.1, (n_images, 3)) + [0, 0, 4]
+	images = Images(np.arange(1, n_images + 1), qvecs, tvecs, np.ones(n_images, dtype=np.int64), [f"{i}.jpg" for i in range(n_images)], None, None, None)
+	xyz = rng.uniform(-1, 1, (n_points, 3))
+	points3D = Points3D(
+		np.arange(n_points), xyz, np.zeros((n_points, 3), dtype=np.uint8), np.zeros(n_points),
+		np.arange(0, n_images * n_points + 1, n_images), np.tile(images.ids, n_points), np.zeros(n_images * n_points, dtype=np.int64),
+	)
+	scale = 0.5
+
+	# WHEN
+	depth_maps = compute_depth_maps(cameras, images, points3D, image_indices=[1, 2], n_workers=2)
+	depth_unit = integer_depth_scale(depth_maps, scale)
+	paths = [str(tmp_path / "depth" / f"{i}.png") for i in (1, 2)]
+	write_depth_maps(paths, [(64, 48)] * 2, depth_maps, depth_unit, scale)
+
+	# THEN
+	for i, path in zip((1, 2), paths):
+		depth = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+		assert depth.dtype == np.uint16 and depth.shape == (48, 64)
+		z = (xyz @ qvecs_to_rotmats(qvecs[i]).T + tvecs[i])[:, 2]
+		ys, xs = np.nonzero(depth)
+		assert len(ys) > 0
+		# Every stored depth is the depth of one of the points, up to the quantisation
+		stored = depth[ys, xs] * depth_unit
+		assert np.abs(stored[:, np.newaxis] - z * scale).min(axis=-1).max() <= depth_unit
+	assert max(cv2.imread(path, cv2.IMREAD_UNCHANGED).max() for path in paths) == UINT16_MAX
@@ -0,0 +1,44 @@
+"""Test the fast FLIP implementation against the reference one."""
+import numpy as np
+import pytest
+
+import flip
+import flip.fast
+
+PIXELS_PER_DEGREE = 0.7 * (3840 / 0.7) * (np.pi / 180)
+
+@pytest.mark.parametrize("noise", [0.0, 0.05, 0.3])
+def test_fast_flip_matches_reference(noise):
+	"""Test FLIP maps on noisy images."""
+	# GIVEN
+	rng = np.random.default_rng(42)
+	reference = rng.uniform(0.0, 1.0, size=(3, 64, 96))
+	test = np.clip(reference + rng.normal(0.0, noise, size=reference.shape), 0.0, 1.0)
+
+	# WHEN
+	expected = flip.compute_flip(reference, test, PIXELS_PER_DEGREE)
+	result = flip.fast.compute_flip(reference, test, PIXELS_PER_DEGREE)
+
+	# THEN
+	assert result.shape == expected.shape
+	assert result.dtype == np.float32
+	np.testing.assert_allclose(result, expected, atol=5e-4)
+	np.testing.assert_allclose(result.mean(), expected.mean(), atol=1e-5)
+
+def test_fast_flip_batch():
+	"""Test that a batch gives the same maps as the images processed one by one."""
+	# GIVEN
+	rng = np.random.default_rng(0)
+	reference = np.zeros((2, 3, 64, 64))
+	reference[1] = 0.5
+	test = reference.copy()
+	test[:, :, 20:40, 20:40] = rng.uniform(size=(2, 3, 1, 1))
+
+	# WHEN
+	result = flip.fast.compute_flip(reference, test, PIXELS_PER_DEGREE)
+
+	# THEN
+	assert result.shape == (2, 1, 64, 64)
+	for i in range(2):
+		np.testing.assert_array_equal(result[i], flip.fast.compute_flip(reference[i], test[i], PIXELS_PER_DEGREE))
+		np.testing.assert_allclose(result[i], flip.compute_flip(reference[i], test[i], PIXELS_PER_DEGREE), atol=5e-4)
@@ -0,0 +1,54 @@
+"""Test the batched image metrics against `common.compute_error`."""
+import numpy as np
+
+from common import compute_error, linear_to_srgb, mse2psnr, trim
+from image_metrics import compute_metrics, frame_metrics
+
+def _random_pair(rng, h=48, w=64):
+	ref = rng.uniform(0.0, 1.2, size=(h, w, 4))
+	img = np.clip(ref + rng.normal(0.0, 0.05, size=ref.shape), -0.1, None)
+	return img, ref
+
+def test_frame_metrics_match_compute_error():
+	"""Test that all metrics match the per-metric reference implementation."""
+	# GIVEN
+	rng = np.random.default_rng(42)
+	img, ref = _random_pair(rng)
+
+	# WHEN
+	metrics = frame_metrics(img, ref, ("MSE", "PSNR", "SSIM", "FLIP"))
+
+	# THEN the values match `compute_error` as used by run.py
+	A = np.clip(linear_to_srgb(img[...,:3]), 0.0, 1.0)
+	R = np.clip(linear_to_srgb(ref[...,:3]), 0.0, 1.0)
+	mse = compute_error("MSE", A.copy(), R)
+	np.testing.assert_allclose(metrics["MSE"], mse, rtol=1e-5)
+	np.testing.assert_allclose(metrics["PSNR"], mse2psnr(mse), rtol=1e-5)
+	np.testing.assert_allclose(metrics["SSIM"], compute_error("SSIM", A.copy(), R), rtol=1e-5)
+	np.testing.assert_allclose(metrics["FLIP"], compute_error("FLIP", img[...,:3].copy(), ref[...,:3]), rtol=1e-5)
+
+def test_compute_metrics_batch():
+	"""Test the per-frame table and aggregates of a batch, serial and in a process pool."""
+	# GIVEN
+	rng = np.random.default_rng(0)
+	pairs = [_random_pair(rng) for _ in range(4)]
+
+	# WHEN
+	serial = compute_metrics(pairs, ("PSNR", "SSIM"), n_workers=1)
+	parallel = compute_metrics(pairs, ("PSNR", "SSIM"), n_workers=2)
+
+	# THEN
+	assert serial == parallel
+	assert len(serial["frames"]) == 4
+	psnrs = [frame["PSNR"] for frame in serial["frames"]]
+	np.testing.assert_allclose(serial["aggregate"]["PSNR"]["mean"], np.mean(psnrs))
+	assert serial["aggregate"]["PSNR"]["min"] == min(psnrs)
+	assert serial["aggregate"]["PSNR"]["max"] == max(psnrs)
+
+def test_trim_matches_full_sort():
+	"""Test the partition-based trimmed mean against a full sort."""
+	rng = np.random.default_rng(1)
+	error = rng.exponential(size=(1000, 1000))
+	skip = int(0.000001 * error.size)
+	expected = np.sort(error.flatten())[skip:error.size-skip].mean()
+	np.testing.assert_allclose(trim(error), expected, rtol=1e-12)
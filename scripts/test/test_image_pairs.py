@@ -0,0 +1,67 @@
+"""Test the pose prior image pairs."""
+import json
+
+import numpy as np
+
+from image_pairs import frame_intrinsics, pose_pairs, transforms_pairs, write_pair_list
+
+def _look_at(position, target):
+	# NeRF convention camera to world matrix, looking along -z
+	forward = np.asarray(target, dtype=np.float64) - position
+	forward /= np.linalg.norm(forward)
+	right = np.cross(forward, [0, 0, 1])
+	right /= np.linalg.norm(right)
+	up = np.cross(right, forward)
+	c2w = np.eye(4)
+	c2w[0:3, 0:3] = np.stack([right, up, -forward], axis=-1)
+	c2w[0:3, 3] = position
+	return c2w
+
+def test_frame_intrinsics():
+	"""Test that the frames' intrinsics override the global ones, and that fields of view are supported."""
+	# GIVEN
+	transforms = {"fl_x": 100, "w": 200, "h": 100}
+
+	# WHEN / THEN
+	assert frame_intrinsics(transforms, {}) == (100, 100, 200, 100)
+	assert frame_intrinsics(transforms, {"fl_x": 50, "fl_y": 60}) == (50, 60, 200, 100)
+	assert np.allclose(frame_intrinsics({"camera_angle_x": np.pi / 2}, {}), (0.5, 0.5, 1, 1))
+
+def test_pose_pairs_follow_view_overlap():
+	"""Test that nearby cameras looking at the same place are paired, but not cameras looking away from each other."""
+	# GIVEN cameras on a circle looking at its center, and two cameras looking outwards
+	angles = np.linspace(0, 2 * np.pi, 24, endpoint=False)
+	c2ws = [_look_at([4 * np.cos(a), 4 * np.sin(a), 0], [0, 0, 0]) for a in angles]
+	c2ws += [_look_at([0, 0, 0.1], [10, 0, 0.1]), _look_at([0, 0, -0.1], [-10, 0, -0.1])]
+	intrinsics = [(50, 50, 64, 48)] * len(c2ws)
+
+	# WHEN
+	pairs = pose_pairs(c2ws, intrinsics, num_neighbors=4, min_overlap=0.1, frustum_depth=4)
+
+	# THEN each camera of the circle is paired with its neighbours
+	pair_set = {tuple(p) for p in pairs.tolist()}
+	for i in range(24):
+		assert tuple(sorted((i, (i + 1) % 24))) in pair_set
+	# the opposite outward cameras are not paired together
+	assert (24, 25) not in pair_set
+	# matching is sparse: at most num_neighbors pairs per camera
+	assert len(pairs) <= 4 * len(c2ws)
+	assert (pairs[:, 0] < pairs[:, 1]).all()
+
+def test_transforms_pairs(tmp_path):
+	"""Test the pair list of a transforms file, with image names relative to the image folder."""
+	# GIVEN
+	(tmp_path / "images").mkdir()
+	frames = []
+	for i, x in enumerate([0.0, 0.1, 0.2, 50.0]):
+		(tmp_path / "images" / f"{i}.png").write_bytes(b"")
+		frames.append({"file_path": f"images/{i}", "transform_matrix": _look_at([x, -5, 0], [x, 0, 0]).tolist()})
+	with open(tmp_path / "transforms.json", "w") as f:
+		json.dump({"fl_x": 50, "w": 64, "h": 48, "frames": frames}, f)
+
+	# WHEN
+	names, pairs = transforms_pairs(str(tmp_path / "transforms.json"), num_neighbors=2, frustum_depth=5)
+	write_pair_list(tmp_path / "pairs.txt", names, pairs)
+
+	# THEN the far away camera is not paired
+	assert (tmp_path / "pairs.txt").read_text().splitlines() == ["0.png 1.png", "0.png 2.png", "1.png 2.png"]
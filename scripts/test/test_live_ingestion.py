@@ -0,0 +1,76 @@
+"""Test the novelty-gated selection of streamed frames."""
+import cv2
+import numpy as np
+
+from common import srgb_to_linear
+from live_ingestion import LinearConverter, LiveIngestion, PoseSlots
+
+def _c2w(x, yaw=0.0):
+	c2w = np.eye(4)[:3]
+	c2w[0:3, 0:3] = [[np.cos(yaw), 0, np.sin(yaw)], [0, 1, 0], [-np.sin(yaw), 0, np.cos(yaw)]]
+	c2w[0, 3] = x
+	return c2w
+
+def test_linear_converter_matches_srgb_to_linear():
+	"""Test the lookup table conversion, reusing its buffers."""
+	# GIVEN
+	rgb = np.random.default_rng(0).integers(0, 256, (6, 8, 3), dtype=np.uint8)
+	converter = LinearConverter(8, 6)
+
+	# WHEN
+	rgba = converter.image(rgb)
+
+	# THEN
+	np.testing.assert_allclose(rgba[..., 0:3], srgb_to_linear(rgb.astype(np.float32) / 255.0), rtol=1e-6, atol=1e-7)
+	assert (rgba[..., 3] == 0).all() and rgba.dtype == np.float32
+	assert converter.image(rgb) is rgba
+	depth = converter.depth_image(np.arange(12, dtype=np.float32).reshape(3, 4))
+	assert depth.shape == (6, 8) and depth[5, 7] == 11
+
+def test_redundant_frames_only_replace_blurrier_ones():
+	"""Test that a frame at a known pose replaces it only if it is sharper."""
+	# GIVEN
+	slots = PoseSlots(4, min_pose_distance=0.1)
+	assert slots.offer(_c2w(0.0), sharpness=10.0) == 0
+	assert slots.offer(_c2w(1.0), sharpness=10.0) == 1
+
+	# WHEN / THEN a blurrier frame at the same pose is dropped, a sharper one replaces it
+	assert slots.offer(_c2w(0.02), sharpness=5.0) is None
+	assert slots.offer(_c2w(0.02), sharpness=20.0) == 0
+	# a frame at the same position looking elsewhere adds coverage
+	assert slots.offer(_c2w(0.0, yaw=np.pi / 2), sharpness=1.0) == 2
+	assert slots.n_used == 3
+
+def test_full_slots_keep_the_most_informative_views():
+	"""Test that once all slots are used, novel frames replace the most redundant slot."""
+	# GIVEN two close cameras and a far one in 3 slots
+	slots = PoseSlots(3, min_pose_distance=0.1)
+	for x in (0.0, 0.15, 1.0):
+		slots.offer(_c2w(x), sharpness=1.0)
+
+	# WHEN a frame far from every slot arrives
+	slot = slots.offer(_c2w(2.0), sharpness=1.0)
+
+	# THEN it replaces one of the two close cameras
+	assert slot in (0, 1)
+	assert sorted(slots.features[:, 0].tolist()) in ([0.0, 1.0, 2.0], [0.15, 1.0, 2.0])
+
+	# WHEN a frame adding less coverage than the most redundant slot arrives
+	# THEN it is dropped
+	assert slots.offer(_c2w(1.12), sharpness=1.0) is None
+
+def test_live_ingestion_stream():
+	"""Test a stream of frames from a camera going back and forth: the slots hold distinct views."""
+	# GIVEN
+	rng = np.random.default_rng(1)
+	image = cv2.GaussianBlur(rng.integers(0, 256, (48, 64, 3), dtype=np.uint8), (0, 0), 1)
+	ingestion = LiveIngestion(5, min_pose_distance=0.1)
+
+	# WHEN
+	slots = [ingestion.offer(image, _c2w(x)) for x in np.concatenate([np.linspace(0, 1, 50), np.linspace(1, 0, 50)])]
+
+	# THEN
+	assert ingestion.received == 100 and ingestion.n_used == 5
+	assert ingestion.accepted == sum(s is not None for s in slots) < 100
+	positions = np.sort(ingestion.slots.features[:, 0])
+	assert np.diff(positions).min() > 0.1
@@ -0,0 +1,79 @@
+"""Test the batched mask generation with a fake segmentation model."""
+import os
+
+import cv2
+import numpy as np
+
+from mask_pipeline import generate_masks, list_images, mask_path, union_mask
+
+class FakePredictor:
+	# Detects a "person" (class 0) in the left half of the images and a "car" (class 2) in their top half
+	def __init__(self):
+		self.batches = []
+
+	def predict(self, images):
+		self.batches.append(len(images))
+		results = []
+		for image in images:
+			h, w = image.shape[:2]
+			masks = np.zeros((2, h, w), dtype=bool)
+			masks[0, :, :w // 2] = True
+			masks[1, :h // 2] = True
+			results.append((np.array([0, 2]), masks))
+		return results
+
+def _write_images(folder, n):
+	for i in range(n):
+		cv2.imwrite(str(folder / f"{i:02d}.jpg"), np.full((8, 6, 3), 10 * i, dtype=np.uint8))
+	return list_images(str(folder))
+
+def test_union_mask():
+	"""Test the union of the masks of the selected classes."""
+	# GIVEN
+	masks = np.zeros((3, 2, 2), dtype=bool)
+	masks[0, 0, 0] = masks[1, 1, 1] = masks[2, 0, 1] = True
+
+	# WHEN / THEN
+	np.testing.assert_array_equal(union_mask([0, 1, 0], masks, [0], (2, 2)), [[255, 255], [0, 0]])
+	np.testing.assert_array_equal(union_mask([], np.zeros((0, 2, 2), dtype=bool), [0], (2, 2)), [[0, 0], [0, 0]])
+
+def test_generate_masks(tmp_path):
+	"""Test that masks are written in batches, next to the images, with the names the loader expects."""
+	# GIVEN
+	paths = _write_images(tmp_path, 7)
+	predictor = FakePredictor()
+	progress = []
+
+	# WHEN
+	written = generate_masks(paths, predictor, [2], batch_size=3, n_workers=2, prefetch_batches=1, progress=progress.append)
+
+	# THEN
+	assert predictor.batches == [3, 3, 1]
+	assert sum(progress) == 7
+	assert written == [str(tmp_path / f"dynamic_mask_{i:02d}.png") for i in range(7)]
+	expected = np.zeros((8, 6), dtype=np.uint8)
+	expected[:4] = 255
+	for path in written:
+		np.testing.assert_array_equal(cv2.imread(path, cv2.IMREAD_UNCHANGED), expected)
+	assert list_images(str(tmp_path)) == paths
+
+def test_up_to_date_masks_are_skipped(tmp_path):
+	"""Test that only the images newer than their mask are segmented again."""
+	# GIVEN masks for all images, and an image modified since
+	paths = _write_images(tmp_path, 3)
+	generate_masks(paths, FakePredictor(), [0])
+	os.utime(paths[1], ns=(os.stat(mask_path(paths[1])).st_mtime_ns + 10**9,) * 2)
+	predictor = FakePredictor()
+
+	# WHEN
+	written = generate_masks(paths, predictor, [0])
+
+	# THEN
+	assert predictor.batches == [1]
+	assert written == [mask_path(paths[1])]
+
+	# WHEN overwriting
+	written = generate_masks(paths, predictor, [0], overwrite=True)
+
+	# THEN
+	assert len(written) == 3
@@ -0,0 +1,88 @@
+"""Test the vectorised pose normalization against the former per-frame implementations."""
+import numpy as np
+from scipy.spatial.transform import Rotation
+
+from pose_normalization import align_up, average_distance, bbox_center_and_scale, center_of_attention, min_line_dist, nerf_scale, rotmat, translate_and_scale, up_vector
+
+def _closest_point_2_lines(oa, da, ob, db):
+	# Former colmap2nerf implementation
+	da = da / np.linalg.norm(da)
+	db = db / np.linalg.norm(db)
+	c = np.cross(da, db)
+	denom = np.linalg.norm(c)**2
+	t = ob - oa
+	ta = np.linalg.det([t, db, c]) / (denom + 1e-10)
+	tb = np.linalg.det([t, da, c]) / (denom + 1e-10)
+	if ta > 0:
+		ta = 0
+	if tb > 0:
+		tb = 0
+	return (oa+ta*da+ob+tb*db) * 0.5, denom
+
+def _random_cameras(rng, n):
+	# Cameras on a sphere, looking roughly at a point (with their -z axis, like in colmap2nerf)
+	c2ws = np.tile(np.eye(4), (n, 1, 1))
+	c2ws[:, 0:3, 0:3] = Rotation.random(n, random_state=rng.integers(1 << 31)).as_matrix()
+	c2ws[:, 0:3, 3] = rng.normal(size=(n, 3)) * 3.0 + c2ws[:, 0:3, 2] * 2.0
+	return c2ws
+
+def test_center_of_attention():
+	"""Test the chunked pairwise solve against the former double loop."""
+	# GIVEN
+	rng = np.random.default_rng(0)
+	c2ws = _random_cameras(rng, 40)
+
+	# WHEN
+	center = center_of_attention(c2ws)
+	center_chunked = center_of_attention(c2ws, chunk_size=100)
+
+	# THEN
+	totw = 0.0
+	totp = np.zeros(3)
+	for mf in c2ws:
+		for mg in c2ws:
+			p, w = _closest_point_2_lines(mf[0:3,3], mf[0:3,2], mg[0:3,3], mg[0:3,2])
+			if w > 0.00001:
+				totp += p*w
+				totw += w
+	np.testing.assert_allclose(center, totp / totw, rtol=1e-10, atol=1e-12)
+	np.testing.assert_allclose(center_chunked, center, rtol=1e-10, atol=1e-12)
+
+def test_min_line_dist():
+	"""Test that the least-squares point is the intersection of rays crossing at one point."""
+	# GIVEN
+	rng = np.random.default_rng(1)
+	target = np.array([0.5, -1.0, 2.0])
+	origins = rng.normal(size=(10, 3))
+	directions = target - origins
+	directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+
+	# WHEN / THEN
+	np.testing.assert_allclose(min_line_dist(origins, directions), target, atol=1e-10)
+
+def test_up_alignment_and_scale():
+	"""Test the up vector alignment and the scale normalization of colmap2nerf."""
+	# GIVEN
+	rng = np.random.default_rng(2)
+	c2ws = _random_cameras(rng, 10)
+
+	# WHEN
+	up = up_vector(c2ws)
+	aligned = align_up(c2ws, up)
+	center = np.array([1.0, 2.0, 3.0])
+	scale = nerf_scale(aligned, center)
+	normalized = translate_and_scale(aligned, center, scale)
+
+	# THEN
+	np.testing.assert_allclose(up, c2ws[:, 0:3, 1].sum(axis=0) / np.linalg.norm(c2ws[:, 0:3, 1].sum(axis=0)))
+	np.testing.assert_allclose(up_vector(aligned), [0, 0, 1], atol=1e-8)
+	assert scale == 4.0 / average_distance(aligned, center)
+	np.testing.assert_allclose(aligned[0, 0:3, 0:3], rotmat(up, np.array([0, 0, 1])) @ c2ws[0, 0:3, 0:3])
+	np.testing.assert_allclose(np.mean(np.linalg.norm(normalized[:, 0:3, 3], axis=1)), 4.0)
+	np.testing.assert_array_equal(normalized[:, 0:3, 0:3], aligned[:, 0:3, 0:3])
+
+def test_bbox_center_and_scale():
+	"""Test the nsvf2nerf bounding box normalization."""
+	center, scale = bbox_center_and_scale((-1.0, 0.0, 2.0, 3.0, 1.0, 3.0, 0.01))
+	np.testing.assert_allclose(center, [1.0, 0.5, 2.5])
+	assert scale == 0.5 / 2.0
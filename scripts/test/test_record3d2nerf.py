@@ -0,0 +1,102 @@
+"""Test the Record3D conversion of poses, images and depth maps."""
+import cv2
+import numpy as np
+from PIL import Image
+from pyquaternion import Quaternion
+
+from record3d2nerf import UINT16_MAX, convert_depth, convert_frames, normalize_transforms, record3d_c2ws, rotate_camera, rotate_img, swap_axes
+
+def _c2w(pose, rotate):
+	# Former per-frame conversion
+	q = Quaternion(x=pose[0], y=pose[1], z=pose[2], w=pose[3])
+	c2w = np.eye(4)
+	c2w[:3, :3] = q.rotation_matrix
+	c2w[:3, -1] = [pose[4], pose[5], pose[6]]
+	if rotate:
+		c2w = rotate_camera(c2w)
+		c2w = swap_axes(c2w)
+	return c2w
+
+def _write_raw(path, array):
+	with open(path, "wb") as f:
+		f.write(np.ascontiguousarray(array).tobytes())
+
+def test_record3d_c2ws():
+	"""Test the vectorised pose conversion against the former per-frame one."""
+	# GIVEN
+	rng = np.random.default_rng(0)
+	quaternions = rng.normal(size=(20, 4))
+	poses = np.concatenate([quaternions / np.linalg.norm(quaternions, axis=-1, keepdims=True), rng.normal(size=(20, 3))], axis=-1)
+
+	for rotate in (False, True):
+		# WHEN
+		c2ws = record3d_c2ws(poses.tolist(), rotate)
+
+		# THEN
+		np.testing.assert_allclose(c2ws, [_c2w(pose, rotate) for pose in poses], atol=1e-12)
+
+def test_rotate_img(tmp_path):
+	"""Test the image rotation against PIL's."""
+	# GIVEN
+	image = np.random.default_rng(1).integers(0, 256, (6, 10, 3), dtype=np.uint8)
+	cv2.imwrite(str(tmp_path / "0.png"), image)
+
+	# WHEN
+	rotate_img(tmp_path / "0.png", tmp_path / "rotated.png")
+
+	# THEN
+	expected = np.asarray(Image.open(tmp_path / "0.png").rotate(90, expand=1))
+	np.testing.assert_array_equal(cv2.imread(str(tmp_path / "rotated.png"))[..., ::-1], expected)
+
+def test_convert_depth(tmp_path):
+	"""Test the conversion of depth maps to uint16 images of the image resolution, without low confidence or far depths."""
+	# GIVEN a 2x3 depth map of an 4x6 image
+	depth = np.array([[1.0, 2.0, 20.0], [0.0, 3.0, 4.0]], dtype=np.float32)
+	confidence = np.array([[2, 1, 2], [2, 2, 0]], dtype=np.uint8)
+	_write_raw(tmp_path / "0.depth", depth)
+	_write_raw(tmp_path / "0.conf", confidence)
+	depth_unit = 10.0 / UINT16_MAX
+
+	# WHEN
+	convert_depth(tmp_path / "0.depth", tmp_path / "0.png", (3, 2), (6, 4), depth_unit, 10.0, conf_path=tmp_path / "0.conf", min_confidence=1, decompress=bytes)
+	convert_depth(tmp_path / "0.depth", tmp_path / "rotated.png", (3, 2), (6, 4), depth_unit, 10.0, rotate=True, decompress=bytes)
+
+	# THEN
+	image = cv2.imread(str(tmp_path / "0.png"), cv2.IMREAD_UNCHANGED)
+	assert image.dtype == np.uint16 and image.shape == (4, 6)
+	expected = np.array([[1.0, 2.0, 0.0], [0.0, 3.0, 0.0]])
+	np.testing.assert_allclose(image[::2, ::2] * depth_unit, expected, atol=depth_unit)
+	rotated = cv2.imread(str(tmp_path / "rotated.png"), cv2.IMREAD_UNCHANGED)
+	assert rotated.shape == (6, 4)
+	np.testing.assert_allclose(rotated[::2, ::2] * depth_unit, np.rot90([[1.0, 2.0, 0.0], [0.0, 3.0, 4.0]]), atol=depth_unit)
+
+def test_convert_frames(tmp_path):
+	"""Test the conversion of all frames in a process pool."""
+	# GIVEN
+	(tmp_path / "rgbd").mkdir()
+	for idx in range(3):
+		cv2.imwrite(str(tmp_path / "rgbd" / f"{idx}.jpg"), np.full((4, 6, 3), 50 * idx, dtype=np.uint8))
+		_write_raw(tmp_path / "rgbd" / f"{idx}.depth", np.full((2, 3), idx + 1.0, dtype=np.float32))
+	depth_args = {"depth_size": (3, 2), "image_size": (6, 4), "depth_unit": 10.0 / UINT16_MAX, "max_depth": 10.0, "decompress": bytes}
+
+	# WHEN
+	convert_frames(tmp_path, 3, rotate=True, depth_args=depth_args, n_workers=2)
+
+	# THEN
+	for idx in range(3):
+		assert cv2.imread(str(tmp_path / "rotated" / f"{idx}.jpg")).shape == (6, 4, 3)
+		depth = cv2.imread(str(tmp_path / "depth" / f"{idx}.png"), cv2.IMREAD_UNCHANGED)
+		assert depth.shape == (6, 4)
+		np.testing.assert_allclose(depth * depth_args["depth_unit"], idx + 1.0, atol=depth_args["depth_unit"])
+
+def test_normalize_transforms_scales_depth():
+	"""Test that the depth unit is scaled like the camera positions."""
+	# GIVEN
+	transforms = {"integer_depth_scale": 1e-4, "frames": [{"transform_matrix": np.eye(4).tolist()}]}
+
+	# WHEN
+	normalized = normalize_transforms(transforms, np.array([1.0, 0.0, 0.0]), 2.0)
+
+	# THEN
+	assert normalized["integer_depth_scale"] == 2e-4 and transforms["integer_depth_scale"] == 1e-4
+	assert normalized["frames"][0]["transform_matrix"][0][3] == -2.0
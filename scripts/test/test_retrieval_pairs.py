@@ -0,0 +1,61 @@
+"""Test the image retrieval pairs."""
+import cv2
+import numpy as np
+
+from retrieval_pairs import compute_descriptors, folder_pairs, list_images, pca_reduce, retrieval_pairs
+
+def _write_scenes(folder, rng, n_scenes=3, n_views=5):
+	# Several views (random crops) of a few random scenes, returns the scene of each image in name order
+	scenes = []
+	for s in range(n_scenes):
+		# Distinct dominant colours and textures
+		tint = rng.uniform(0, 255, 3)
+		scene = np.clip(0.5 * tint + 0.5 * cv2.GaussianBlur(rng.uniform(0, 255, (80, 80, 3)), (0, 0), 1 + s), 0, 255).astype(np.uint8)
+		scene = cv2.resize(scene, (320, 320), interpolation=cv2.INTER_CUBIC)
+		for v in range(n_views):
+			x, y = rng.integers(0, 64, size=2)
+			cv2.imwrite(str(folder / f"scene{s} view{v}.jpg"), scene[y:y + 256, x:x + 256])
+			scenes.append(s)
+	return scenes
+
+def test_similar_images_are_paired(tmp_path):
+	"""Test that views of the same scene are paired together, and that names are relative to the image folder."""
+	# GIVEN
+	(tmp_path / "images" / "sub").mkdir(parents=True)
+	scenes = _write_scenes(tmp_path / "images" / "sub", np.random.default_rng(0))
+
+	# WHEN
+	names, pairs = folder_pairs(str(tmp_path / "images"), num_neighbors=4, pca_dims=8, n_workers=2)
+
+	# THEN
+	assert names[0] == "sub/scene0 view0.jpg"
+	assert len(pairs) > 0
+	assert all(scenes[i] == scenes[j] for i, j in pairs)
+
+def test_descriptors_are_deterministic(tmp_path):
+	"""Test that process pool and serial descriptors agree."""
+	# GIVEN
+	_write_scenes(tmp_path, np.random.default_rng(1), n_scenes=1, n_views=3)
+	paths = list_images(str(tmp_path))
+
+	# WHEN
+	descriptors = compute_descriptors(paths, n_workers=2)
+
+	# THEN
+	np.testing.assert_array_equal(descriptors, compute_descriptors(paths, n_workers=1))
+	assert np.isfinite(descriptors).all()
+
+def test_retrieval_pairs():
+	"""Test the k nearest neighbour pairs of PCA reduced descriptors."""
+	# GIVEN two clusters of descriptors
+	rng = np.random.default_rng(2)
+	descriptors = np.concatenate([rng.normal(0, 0.01, (4, 16)) + 1, rng.normal(0, 0.01, (4, 16)) - 1])
+	descriptors[:, 1] += np.arange(8)
+
+	# WHEN
+	pairs = retrieval_pairs(pca_reduce(descriptors, 4), num_neighbors=1)
+
+	# THEN
+	assert (pairs[:, 0] < pairs[:, 1]).all()
+	assert all((i < 4) == (j < 4) for i, j in pairs)
+	assert set(np.unique(pairs)) == set(range(8))
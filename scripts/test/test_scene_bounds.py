@@ -0,0 +1,116 @@
+"""Test the fitting of aabb_scale and render_aabb."""
+import json
+
+import cv2
+import numpy as np
+import pytest
+
+from scene_bounds import MAX_CONE_STEPSIZE, MIN_CONE_STEPSIZE, fit_aabb_scale, fit_bounds, marching_steps, robust_box, to_testbed, unproject_depth, update_transforms
+
+def _look_at(position, target):
+	# NeRF camera (looking along -z, y up) at position looking at target
+	back = position - target
+	back /= np.linalg.norm(back)
+	right = np.cross([0.0, 0.0, 1.0], back)
+	right /= np.linalg.norm(right)
+	c2w = np.eye(4)
+	c2w[0:3, 0:3] = np.stack([right, np.cross(back, right), back], axis=-1)
+	c2w[0:3, 3] = position
+	return c2w
+
+def _ring_cameras(n=8, radius=1.0):
+	angles = np.arange(n) / n * 2 * np.pi
+	return np.stack([_look_at(np.array([radius * np.cos(a), radius * np.sin(a), 0.2]), np.zeros(3)) for a in angles])
+
+def test_robust_box():
+	"""Test that outliers are left out of the box."""
+	# GIVEN
+	rng = np.random.default_rng(0)
+	points = np.concatenate([rng.uniform(-1, 1, (1000, 3)), [[100.0, 0.0, 0.0], [0.0, -50.0, 0.0]]])
+
+	# WHEN
+	lo, hi = robust_box(points, percentile=0)
+
+	# THEN
+	assert np.all(lo > -1.01) and np.all(hi < 1.01)
+	assert np.all(lo < -0.98) and np.all(hi > 0.98)
+
+@pytest.mark.parametrize("lo, hi, aabb_scale", [([0.1] * 3, [0.9] * 3, 1), ([0.5] * 3, [1.2, 0.6, 0.6], 2), ([-3.0, 0.5, 0.5], [0.6] * 3, 8), ([-1000.0] * 3, [0.6] * 3, 128)])
+def test_fit_aabb_scale(lo, hi, aabb_scale):
+	"""Test the smallest power of two box around (0.5, 0.5, 0.5) containing a box."""
+	assert fit_aabb_scale(np.array(lo), np.array(hi)) == aabb_scale
+
+def test_to_testbed():
+	"""Test the scale, offset and axis cycle of Testbed::nerf_position_to_ngp."""
+	assert np.allclose(to_testbed(np.array([1.0, 2.0, 3.0]), 0.5, np.array([0.5, 0.5, 0.5])), [1.5, 2.0, 1.0])
+
+@pytest.mark.parametrize("cone_angle", [0.0, 1.0 / 256])
+def test_marching_steps(cone_angle):
+	"""Test the closed form number of steps against the testbed's marching loop."""
+	# GIVEN
+	t0, t1 = 0.05, 3000.0 if cone_angle > 0 else 3.0
+
+	# WHEN
+	steps = marching_steps(t0, t1, cone_angle)
+
+	# THEN
+	t, n = t0, 0
+	while t < t1:
+		t += np.clip(t * cone_angle, MIN_CONE_STEPSIZE, MAX_CONE_STEPSIZE)
+		n += 1
+	assert steps == pytest.approx(n, rel=0.01)
+
+def test_unproject_depth():
+	"""Test that the depth pixels land at their depth along the camera axis."""
+	# GIVEN
+	c2w = _look_at(np.array([2.0, 0.0, 0.0]), np.zeros(3))
+	depth = np.full((16, 16), 2.0)
+
+	# WHEN
+	points = unproject_depth(c2w, depth, 16.0, 16.0, 8.0, 8.0, stride=4)
+
+	# THEN
+	assert points.shape == (16, 3)
+	assert np.allclose(points[:, 0], 0.0)
+	assert np.all(np.abs(points[:, 1:]) < 1.0)
+
+def test_fit_bounds():
+	"""Test that the render box contains the points and cameras, in a tighter aabb_scale."""
+	# GIVEN
+	c2ws = _ring_cameras(radius=1.0)
+	intrinsics = np.tile([50.0, 50.0, 100.0, 100.0], (len(c2ws), 1))
+	points = np.random.default_rng(0).uniform(-0.3, 0.3, (500, 3))
+
+	# WHEN
+	aabb_scale, render_aabb = fit_bounds(c2ws, intrinsics, {"scale": 0.33, "offset": [0.5, 0.5, 0.5]}, points, percentile=0)
+
+	# THEN
+	lo, hi = np.array(render_aabb)
+	inside = to_testbed(np.concatenate([points, c2ws[:, 0:3, 3]]), 0.33, 0.5)
+	assert np.all(inside >= lo) and np.all(inside <= hi)
+	assert aabb_scale == 1
+
+def test_update_transforms(tmp_path):
+	"""Test that the depth maps bound the scene of a transforms file."""
+	# GIVEN
+	c2ws = _ring_cameras(radius=3.0)
+	(tmp_path / "depth").mkdir()
+	frames = []
+	for i, c2w in enumerate(c2ws):
+		cv2.imwrite(str(tmp_path / "depth" / f"{i}.png"), np.full((20, 20), 2000, dtype=np.uint16))
+		frames.append({"file_path": f"images/{i}.jpg", "depth_path": f"depth/{i}.png", "transform_matrix": c2w.tolist()})
+	with open(tmp_path / "transforms.json", "w") as f:
+		json.dump({"w": 20, "h": 20, "fl_x": 20.0, "aabb_scale": 32, "integer_depth_scale": 0.001, "frames": frames}, f)
+
+	# WHEN
+	gain = update_transforms(str(tmp_path / "transforms.json"), str(tmp_path / "out.json"))
+
+	# THEN
+	with open(tmp_path / "out.json") as f:
+		transforms = json.load(f)
+	assert transforms["aabb_scale"] == 2
+	assert len(transforms["frames"]) == len(frames)
+	assert np.all(np.array(transforms["render_aabb"][0]) >= -1.5) and np.all(np.array(transforms["render_aabb"][1]) <= 2.5)
+	assert gain["aabb_scale"] == (32, 2)
+	assert gain["training_steps_per_ray"][1] < gain["training_steps_per_ray"][0]
+	assert gain["rendering_steps_per_ray"][1] <= gain["training_steps_per_ray"][1]
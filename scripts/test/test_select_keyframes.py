@@ -0,0 +1,89 @@
+"""Test the keyframe selection."""
+import json
+import os
+import subprocess
+import sys
+
+import cv2
+import numpy as np
+
+from select_keyframes import pose_features, select_keyframes, window_maxima
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "select_keyframes.py")
+
+def _c2w(position, yaw=0.0):
+	c2w = np.eye(4)
+	c2w[0:3, 0:3] = [[np.cos(yaw), 0, np.sin(yaw)], [0, 1, 0], [-np.sin(yaw), 0, np.cos(yaw)]]
+	c2w[0:3, 3] = position
+	return c2w
+
+def test_window_maxima():
+	"""Test that the sharpest frame of each window is kept, including the last, shorter, window."""
+	# GIVEN
+	scores = np.array([1, 3, 2, 5, 4, 0, 7])
+
+	# WHEN
+	maxima = window_maxima(scores, 3)
+
+	# THEN
+	assert maxima.tolist() == [1, 3, 6]
+	assert window_maxima(scores, 1).tolist() == list(range(7))
+
+def test_redundant_poses_are_dropped():
+	"""Test that frames at the same pose as a sharper frame are dropped, but not frames looking elsewhere."""
+	# GIVEN two clusters of frames on a circle, and a frame at the first cluster's position looking sideways
+	c2ws = [_c2w([1, 0, 0]), _c2w([1, 0, 0.001]), _c2w([-1, 0, 0]), _c2w([-1, 0, 0.001]), _c2w([1, 0, 0], yaw=np.pi / 2)]
+	scores = [1.0, 2.0, 3.0, 1.0, 0.5]
+
+	# WHEN
+	kept = select_keyframes(c2ws, scores, window=1, max_pose_distance=0.05)
+
+	# THEN the sharpest frame of each cluster is kept
+	assert kept.tolist() == [1, 2, 4]
+
+	# WHEN the viewing direction does not matter
+	kept = select_keyframes(c2ws, scores, window=1, max_pose_distance=0.05, rotation_weight=0.0)
+
+	# THEN
+	assert kept.tolist() == [1, 2]
+
+def test_target_frames_spreads_frames():
+	"""Test that at most target_frames are kept, and that every dropped frame is close to a kept frame."""
+	# GIVEN a camera moving along a line
+	rng = np.random.default_rng(0)
+	c2ws = [_c2w([x, 0, 0]) for x in np.linspace(0, 10, 200)]
+	scores = rng.uniform(size=200)
+
+	# WHEN
+	kept = select_keyframes(c2ws, scores, window=2, target_frames=20)
+
+	# THEN
+	assert 15 <= len(kept) <= 20
+	features = pose_features(c2ws)
+	gaps = np.linalg.norm(features[:, np.newaxis] - features[kept], axis=-1).min(axis=-1)
+	assert gaps.max() < 3 * np.linalg.norm(features[0] - features[-1]) / 20
+
+def test_cli_writes_reduced_transforms(tmp_path):
+	"""Test the script on frames without sharpness, with the output in another folder."""
+	# GIVEN
+	rng = np.random.default_rng(1)
+	(tmp_path / "images").mkdir()
+	frames = []
+	for i in range(6):
+		image = cv2.GaussianBlur(rng.uniform(0, 255, (32, 32, 3)).astype(np.uint8), (0, 0), 0.5 + (i % 2))
+		cv2.imwrite(str(tmp_path / "images" / f"{i}.png"), image)
+		frames.append({"file_path": f"images/{i}", "transform_matrix": _c2w([i, 0, 0]).tolist()})
+	with open(tmp_path / "transforms.json", "w") as f:
+		json.dump({"aabb_scale": 4, "frames": frames}, f)
+	out = tmp_path / "reduced" / "transforms.json"
+	out.parent.mkdir()
+
+	# WHEN
+	subprocess.run([sys.executable, SCRIPT, str(tmp_path / "transforms.json"), "--out", str(out), "--window", "2"], check=True)
+
+	# THEN the sharper frame of each pair is kept
+	with open(out) as f:
+		reduced = json.load(f)
+	assert reduced["aabb_scale"] == 4
+	assert [f["file_path"] for f in reduced["frames"]] == ["../images/0", "../images/2", "../images/4"]
+	assert all(f["sharpness"] > 0 for f in reduced["frames"])
@@ -0,0 +1,74 @@
+"""Test the parallel cached sharpness scoring."""
+import os
+
+import cv2
+import numpy as np
+
+import sharpness
+from sharpness import CACHE_FILENAME, compute_sharpness
+
+def _write_images(folder, n, rng):
+	paths = []
+	for i in range(n):
+		path = str(folder / f"{i:04d}.jpg")
+		image = cv2.GaussianBlur(rng.uniform(0, 255, (96, 128, 3)).astype(np.uint8), (0, 0), 0.5 + i)
+		cv2.imwrite(path, image)
+		paths.append(path)
+	return paths
+
+def test_full_resolution_matches_former_sharpness(tmp_path):
+	"""Test that full resolution scores are the ones the converters used to compute."""
+	# GIVEN
+	paths = _write_images(tmp_path, 3, np.random.default_rng(0))
+
+	# WHEN
+	scores = compute_sharpness(paths, reduction=1, n_workers=1, use_cache=False)
+
+	# THEN
+	for path, score in zip(paths, scores):
+		gray = cv2.cvtColor(cv2.imread(path), cv2.COLOR_BGR2GRAY)
+		assert score == cv2.Laplacian(gray, cv2.CV_64F).var()
+
+def test_reduced_scores_rank_blur(tmp_path):
+	"""Test that reduced resolution scores, computed in a process pool, still rank blurrier images lower."""
+	# GIVEN images blurrier and blurrier
+	paths = _write_images(tmp_path, 4, np.random.default_rng(1))
+
+	# WHEN
+	scores = compute_sharpness(paths, reduction=2, n_workers=2, use_cache=False)
+
+	# THEN
+	assert scores == compute_sharpness(paths, reduction=2, n_workers=1, use_cache=False)
+	assert all(a > b for a, b in zip(scores[:-1], scores[1:]))
+
+def test_cache(tmp_path, monkeypatch):
+	"""Test that cached scores are reused, and recomputed for modified images or another reduction."""
+	# GIVEN
+	paths = _write_images(tmp_path, 3, np.random.default_rng(2))
+	expected = compute_sharpness(paths, n_workers=1)
+	assert os.path.isfile(tmp_path / CACHE_FILENAME)
+
+	scored = []
+	original_sharpness = sharpness.sharpness
+	monkeypatch.setattr(sharpness, "sharpness", lambda path, reduction: scored.append(path) or original_sharpness(path, reduction))
+
+	# WHEN nothing changed
+	# THEN nothing is decoded
+	assert compute_sharpness(paths, n_workers=1) == expected
+	assert scored == []
+
+	# WHEN an image is modified
+	cv2.imwrite(paths[1], np.zeros((96, 128, 3), dtype=np.uint8))
+	os.utime(paths[1], ns=(0, 0))
+	scores = compute_sharpness(paths, n_workers=1)
+
+	# THEN only that image is scored again
+	assert scored == [paths[1]]
+	assert scores[0] == expected[0] and scores[2] == expected[2] and scores[1] == 0.0
+
+	# WHEN the reduction changes
+	scored.clear()
+	compute_sharpness(paths, reduction=4, n_workers=1)
+
+	# THEN all images are scored again
+	assert scored == paths
@@ -0,0 +1,140 @@
+"""Test the pyngp-free snapshot reader and writer on synthetic snapshots."""
+import gzip
+import struct
+
+import numpy as np
+import pytest
+
+from snapshot import Ext, Snapshot, packb, read_snapshot, unpackb, write_snapshot
+
+def _synthetic_config(n_params=1000, n_cascades=2, grid_size=8):
+	rng = np.random.default_rng(0)
+	return {
+		"encoding": {"otype": "HashGrid", "n_levels": 16, "n_features_per_level": 2, "log2_hashmap_size": 19},
+		"network": {"otype": "FullyFusedMLP", "n_neurons": 64},
+		"snapshot": {
+			"version": 1,
+			"mode": "Nerf",
+			"n_params": n_params,
+			"params_type": "__half",
+			"params_binary": rng.normal(size=n_params).astype(np.float16),
+			"density_grid_size": grid_size,
+			"density_grid_binary": rng.uniform(size=n_cascades * grid_size**3).astype(np.float16),
+			"training_step": 3500,
+			"loss": 0.0123,
+			"nerf": {"aabb_scale": 4, "dataset": {"aabb_scale": 4, "scale": 0.33, "offset": [0.5, 0.5, 0.5], "metadata": [{"resolution": [800, 600]}] * 3}},
+			"camera": {"matrix": [[1.0, 0.0, 0.0, 0.5], [0.0, -1.0, 0.0, 0.5], [0.0, 0.0, -1.0, 0.5]], "fov_axis": 1, "zoom": 1.0},
+		},
+	}
+
+@pytest.mark.parametrize("obj", [None, True, False, 0, 127, 128, -32, -33, 255, 256, 65536, 1 << 40, -(1 << 40), 1.5, -0.25, "", "a" * 31, "b" * 32, "é" * 300, [], list(range(20)), {"k": {"nested": [1, "2", None]}}, {str(i): i for i in range(70000)}])
+def test_packb_roundtrip(obj):
+	"""Test that every msgpack type the testbed writes is read back."""
+	assert unpackb(packb(obj)) == obj
+
+def test_binaries():
+	"""Test binaries and extensions, read as memoryviews."""
+	# GIVEN
+	data = {"bin": bytes(range(200)), "big": b"x" * 70000, "ext": Ext(3, b"abcd"), "ext_long": Ext(-1, b"12345")}
+
+	# WHEN
+	obj = unpackb(packb(data))
+
+	# THEN
+	assert bytes(obj["bin"]) == data["bin"] and bytes(obj["big"]) == data["big"]
+	assert (obj["ext"].subtype, bytes(obj["ext"].data)) == (3, b"abcd")
+	assert (obj["ext_long"].subtype, bytes(obj["ext_long"].data)) == (-1, b"12345")
+
+def test_float32():
+	"""Test the float32 values nlohmann::json writes when they are exact."""
+	assert unpackb(b"\x92\xca" + struct.pack(">f", 1.5) + b"\xcb" + struct.pack(">d", 0.1)) == [1.5, 0.1]
+
+def test_lazy_map():
+	"""Test that the values of maps are only decoded when they are accessed."""
+	# GIVEN
+	buffer = bytearray(packb({"dataset": {"metadata": [1, 2, 3]}, "scale": 1}))
+
+	# WHEN
+	obj = unpackb(buffer)
+	buffer[buffer.index(b"\x93") + 1] = 7
+
+	# THEN
+	assert obj["dataset"]["metadata"] == [7, 2, 3]
+	assert obj == {"dataset": {"metadata": [7, 2, 3]}, "scale": 1}
+
+def test_truncated():
+	"""Test that truncated data is an error."""
+	with pytest.raises(ValueError):
+		unpackb(packb({"params_binary": b"x" * 100})[:-10])
+
+@pytest.mark.parametrize("ext, compress", [(".ingp", True), (".ingp", False), (".msgpack", False)])
+def test_snapshot_roundtrip(tmp_path, ext, compress):
+	"""Test that a written snapshot is read back, with its weights and density grid."""
+	# GIVEN
+	config = _synthetic_config()
+	path = str(tmp_path / f"snapshot{ext}")
+
+	# WHEN
+	write_snapshot(path, config, compress)
+	snapshot = read_snapshot(path)
+
+	# THEN
+	assert snapshot.params_binary.dtype == np.float16
+	assert np.array_equal(snapshot.params_binary, config["snapshot"]["params_binary"])
+	assert np.array_equal(snapshot.density_grid_binary, config["snapshot"]["density_grid_binary"])
+	assert snapshot.network_config == {key: config[key] for key in ("encoding", "network")}
+	assert snapshot.dataset == config["snapshot"]["nerf"]["dataset"]
+	assert snapshot.camera == config["snapshot"]["camera"]
+	assert snapshot.snapshot["training_step"] == 3500
+
+	# GIVEN a copy of the snapshot, WHEN it is written and read, THEN it is unchanged
+	write_snapshot(str(tmp_path / f"copy{ext}"), snapshot, compress)
+	copy = read_snapshot(str(tmp_path / f"copy{ext}"))
+	assert np.array_equal(copy.params_binary, snapshot.params_binary)
+	assert copy.config.keys() == snapshot.config.keys()
+
+def test_ingp_is_gzip(tmp_path):
+	"""Test that .ingp files are gzip streams of msgpack, like zstr writes them."""
+	# GIVEN
+	config = _synthetic_config()
+	write_snapshot(str(tmp_path / "snapshot.ingp"), config)
+
+	# WHEN
+	with open(tmp_path / "snapshot.ingp", "rb") as f:
+		data = gzip.decompress(f.read())
+
+	# THEN
+	assert data == packb(config)
+	msgpack = pytest.importorskip("msgpack")
+	reference = msgpack.unpackb(data, raw=False, strict_map_key=False)
+	assert reference["snapshot"]["params_binary"] == config["snapshot"]["params_binary"].tobytes()
+	assert msgpack.packb(reference["encoding"]) == packb(config["encoding"])
+
+def test_zero_copy(tmp_path):
+	"""Test that the weights are views of the decompressed file."""
+	# GIVEN
+	write_snapshot(str(tmp_path / "snapshot.ingp"), _synthetic_config())
+	snapshot = read_snapshot(str(tmp_path / "snapshot.ingp"))
+
+	# WHEN
+	snapshot.params_binary[0] = 42
+
+	# THEN
+	assert snapshot.params_binary[0] == 42
+	assert not snapshot.params_binary.flags.owndata
+
+def test_density_grid():
+	"""Test the Morton order of the density grid cells."""
+	# GIVEN
+	grid_size = 8
+	cells = np.zeros(2 * grid_size**3, dtype=np.float16)
+	cells[1], cells[2], cells[4], cells[9], cells[grid_size**3 + 7] = 1, 2, 3, 4, 5
+	snapshot = Snapshot({"snapshot": {"density_grid_size": grid_size, "density_grid_binary": cells.tobytes()}})
+
+	# WHEN
+	grid = snapshot.density_grid()
+
+	# THEN
+	assert grid.shape == (2, grid_size, grid_size, grid_size)
+	assert (grid[0, 1, 0, 0], grid[0, 0, 1, 0], grid[0, 0, 0, 1], grid[0, 3, 0, 0], grid[1, 1, 1, 1]) == (1, 2, 3, 4, 5)
+	assert np.count_nonzero(grid) == 5
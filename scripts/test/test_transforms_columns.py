@@ -0,0 +1,141 @@
+"""Test the columnar sidecar of transforms files."""
+import json
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from image_pairs import frame_intrinsics, transforms_pairs
+from transforms_columns import load_columns, load_transforms, sidecar_path
+
+def _transforms(n=5):
+	rng = np.random.default_rng(0)
+	frames = []
+	for i in range(n):
+		c2w = np.eye(4)
+		c2w[0:3, 3] = rng.normal(size=3)
+		frames.append({"file_path": f"images/{i:04d}.jpg", "transform_matrix": c2w.tolist(), "sharpness": float(i)})
+	# Per-frame intrinsics, depth and extra keys on some frames only
+	frames[1].update({"fl_x": 500.0, "w": 640, "h": 480, "k1": 0.1, "is_fisheye": True, "depth_path": "depth/0001.png"})
+	frames[2] = {key: value for key, value in frames[2].items() if key != "transform_matrix"}
+	frames[2]["transform_matrix_start"] = np.eye(4).tolist()
+	return {"camera_angle_x": 1.2, "camera_angle_y": 0.9, "w": 800, "h": 600, "aabb_scale": 16, "frames": frames}
+
+def _write(path, transforms):
+	with open(path, "w") as f:
+		json.dump(transforms, f)
+
+def test_round_trip(tmp_path):
+	"""Test that the transforms rebuilt from the sidecar are the transforms file, and only a subset can be rebuilt."""
+	# GIVEN
+	transforms = _transforms()
+	_write(tmp_path / "transforms.json", transforms)
+
+	# WHEN
+	columns = load_columns(str(tmp_path / "transforms.json"))
+
+	# THEN
+	assert os.path.isfile(sidecar_path(str(tmp_path / "transforms.json")))
+	assert columns.to_transforms() == transforms
+	assert columns.frames([3, 1]) == [transforms["frames"][3], transforms["frames"][1]]
+	np.testing.assert_allclose(columns.intrinsics(), [frame_intrinsics(transforms, frame) for frame in transforms["frames"]])
+
+	# WHEN written back next to another folder
+	(tmp_path / "subset").mkdir()
+	columns.write_json(str(tmp_path / "subset" / "transforms.json"), [0])
+
+	# THEN
+	with open(tmp_path / "subset" / "transforms.json") as f:
+		assert json.load(f)["frames"][0]["file_path"] == "../images/0000.jpg"
+
+def test_sidecar_invalidation(tmp_path):
+	"""Test that the sidecar is reused while the transforms file is unchanged, and rebuilt when it changes."""
+	# GIVEN
+	path = str(tmp_path / "transforms.json")
+	transforms = _transforms()
+	_write(path, transforms)
+	load_columns(path)
+	mtime = os.path.getmtime(sidecar_path(path))
+
+	# WHEN the file is touched without change
+	os.utime(path, ns=(0, 0))
+
+	# THEN the sidecar is still valid
+	assert load_transforms(path) == transforms
+	assert os.path.getmtime(sidecar_path(path)) == mtime
+
+	# WHEN the file changes
+	transforms["frames"] = transforms["frames"][:2]
+	_write(path, transforms)
+
+	# THEN
+	assert load_transforms(path) == transforms
+
+def test_validation(tmp_path):
+	"""Test that frames the loader could not use are reported."""
+	# GIVEN
+	transforms = _transforms()
+	transforms["frames"][3]["transform_matrix"] = [[1, 0, 0]]
+	_write(tmp_path / "transforms.json", transforms)
+
+	# WHEN / THEN
+	with pytest.raises(ValueError, match="frame 3"):
+		load_columns(str(tmp_path / "transforms.json"))
+
+def test_blender_transforms(tmp_path):
+	"""Test NeRF synthetic transforms files, without resolution: it is read from the images, like the loader does."""
+	# GIVEN
+	(tmp_path / "test").mkdir()
+	transforms = {"camera_angle_x": 0.69, "frames": []}
+	for i in range(3):
+		Image.new("RGBA", (40, 30)).save(tmp_path / "test" / f"r_{i}.png")
+		c2w = np.eye(4)
+		c2w[0, 3] = 0.1 * i
+		transforms["frames"].append({"file_path": f"./test/r_{i}", "rotation": 0.03, "transform_matrix": c2w.tolist()})
+	_write(tmp_path / "transforms_test.json", transforms)
+
+	# WHEN
+	columns = load_columns(str(tmp_path / "transforms_test.json"))
+
+	# THEN
+	assert columns.to_transforms() == transforms
+	assert np.isnan(columns.intrinsics()).all()
+	expected_focal = 0.5 * 40 / np.tan(0.5 * 0.69)
+	np.testing.assert_allclose(columns.intrinsics(from_images=True), [[expected_focal, expected_focal, 40, 30]] * 3)
+	names, pairs = transforms_pairs(str(tmp_path / "transforms_test.json"), num_neighbors=2, frustum_depth=2.0)
+	assert names == [f"r_{i}.png" for i in range(3)] and len(pairs) > 0
+
+	# GIVEN an invalid resolution, WHEN / THEN it is still an error
+	transforms["w"] = 0
+	_write(tmp_path / "transforms_test.json", transforms)
+	with pytest.raises(ValueError, match="frame 0: invalid resolution"):
+		load_columns(str(tmp_path / "transforms_test.json"))
+
+@pytest.mark.parametrize("header, frame, expected", [
+	({"camera_angle_y": 0.5}, {}, [0.5 * 30 / np.tan(0.25)] * 2),
+	({"fl_y": 70.0}, {}, [70.0, 70.0]),
+	({"x_fov": 60.0, "camera_angle_y": 0.5}, {}, [0.5 * 40 / np.tan(np.radians(30)), 0.5 * 30 / np.tan(0.25)]),
+	({"fl_x": 50.0, "camera_angle_x": 1.0}, {}, [50.0, 50.0]),
+	({"fl_x": 50.0, "fl_y": 60.0}, {"fl_y": 70.0}, [70.0, 70.0]),
+])
+def test_focal_keys(tmp_path, header, frame, expected):
+	"""Test the focal lengths of every key the loader accepts, frame keys replacing the transforms' ones as a whole."""
+	# GIVEN
+	transforms = dict(header, w=40, h=30, frames=[dict(frame, file_path="0.png", transform_matrix=np.eye(4).tolist())])
+	_write(tmp_path / "transforms.json", transforms)
+
+	# WHEN
+	columns = load_columns(str(tmp_path / "transforms.json"))
+
+	# THEN
+	np.testing.assert_allclose(columns.intrinsics(), [expected + [40, 30]])
+
+def test_no_focal_length(tmp_path):
+	"""Test that frames without any focal length key are reported."""
+	# GIVEN
+	_write(tmp_path / "transforms.json", {"w": 40, "h": 30, "frames": [{"file_path": "0.png", "transform_matrix": np.eye(4).tolist()}]})
+
+	# WHEN / THEN
+	with pytest.raises(ValueError, match="frame 0: no focal length"):
+		load_columns(str(tmp_path / "transforms.json"))
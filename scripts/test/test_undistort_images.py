@@ -0,0 +1,148 @@
+"""Test the undistortion of the images of transforms files."""
+import json
+
+import cv2
+import numpy as np
+import pytest
+
+from undistort_images import UndistortionCache, frame_camera, undistort_transforms
+
+W, H = 160, 120
+
+def _camera(is_fisheye):
+	camera = {"w": W, "h": H, "fl_x": 100.0, "fl_y": 98.0, "cx": 81.0, "cy": 59.0, "is_fisheye": is_fisheye}
+	if is_fisheye:
+		camera.update({"k1": 0.1, "k2": -0.05, "k3": 0.01, "k4": -0.002})
+	else:
+		camera.update({"k1": -0.2, "k2": 0.05, "p1": 0.002, "p2": -0.001})
+	return camera
+
+def _distorted_dots(camera, points):
+	# Image of a few white dots at the distorted projections of points
+	K = np.array([[camera["fl_x"], 0, camera["cx"]], [0, camera["fl_y"], camera["cy"]], [0, 0, 1]])
+	if camera["is_fisheye"]:
+		uv = cv2.fisheye.projectPoints(points[np.newaxis], np.zeros(3), np.zeros(3), K, np.array([camera[k] for k in ("k1", "k2", "k3", "k4")]))[0][0]
+	else:
+		uv = cv2.projectPoints(points, np.zeros(3), np.zeros(3), K, np.array([camera[k] for k in ("k1", "k2", "p1", "p2")]))[0][:, 0]
+	image = np.zeros((H, W), dtype=np.uint8)
+	for u, v in uv:
+		cv2.circle(image, (int(round(u * 16)), int(round(v * 16))), 2 * 16, 255, -1, shift=4)
+	return image
+
+@pytest.mark.parametrize("is_fisheye", [False, True])
+def test_undistorted_points_follow_pinhole_model(is_fisheye):
+	"""Test that after undistortion, points are where the new pinhole camera projects them."""
+	# GIVEN
+	camera = frame_camera(_camera(is_fisheye), {})
+	points = np.array([[-0.5, -0.3, 1.0], [0.4, 0.25, 1.0], [0.0, 0.0, 1.0]])
+	image = _distorted_dots(camera, points)
+
+	# WHEN
+	map1, map2, new_K = UndistortionCache(balance=0.0).get(camera)
+	undistorted = cv2.remap(image, map1, map2, cv2.INTER_LINEAR)
+
+	# THEN
+	n, labels = cv2.connectedComponents((undistorted > 0).astype(np.uint8))
+	assert n == len(points) + 1
+	ys, xs = np.mgrid[0:H, 0:W]
+	weights = [(undistorted * (labels == label)).astype(np.float64) for label in range(1, n)]
+	centroids = np.array([[(w * xs).sum() / w.sum(), (w * ys).sum() / w.sum()] for w in weights])
+	expected = (points / points[:, 2:]) @ new_K.T
+	for u, v, _ in expected:
+		# Up to the fixed point maps and the magnification of the dots by the undistortion
+		assert np.linalg.norm(centroids - [u, v], axis=-1).min() < 1.0
+
+def test_maps_are_cached_per_camera():
+	"""Test that the maps of a camera are computed once."""
+	# GIVEN
+	cache = UndistortionCache()
+	camera = frame_camera(_camera(False), {})
+
+	# WHEN
+	first = cache.get(camera)
+	second = cache.get(dict(camera))
+	cache.get(frame_camera(_camera(True), {}))
+
+	# THEN
+	assert first is second
+	assert len(cache.maps) == 2
+
+def test_undistort_transforms(tmp_path):
+	"""Test that images, masks and depth maps are undistorted, and that the output transforms are pinhole."""
+	# GIVEN two frames of one camera, one with a mask and a depth map, and a frame of another camera
+	(tmp_path / "images").mkdir()
+	rng = np.random.default_rng(0)
+	transforms = dict(_camera(False), aabb_scale=16, integer_depth_scale=0.001, frames=[])
+	for i in range(3):
+		cv2.imwrite(str(tmp_path / "images" / f"{i}.png"), rng.integers(0, 255, (H, W, 3), dtype=np.uint8))
+		transforms["frames"].append({"file_path": f"images/{i}", "transform_matrix": np.eye(4).tolist()})
+	cv2.imwrite(str(tmp_path / "images" / "dynamic_mask_0.png"), np.full((H, W), 255, dtype=np.uint8))
+	cv2.imwrite(str(tmp_path / "images" / "0.depth.png"), np.full((H, W), 1000, dtype=np.uint16))
+	transforms["frames"][0]["depth_path"] = "images/0.depth.png"
+	transforms["frames"][2].update(_camera(True))
+	with open(tmp_path / "transforms.json", "w") as f:
+		json.dump(transforms, f)
+
+	# WHEN
+	n_cameras = undistort_transforms(str(tmp_path / "transforms.json"), str(tmp_path / "out.json"), balance=1.0, n_workers=2)
+
+	# THEN
+	assert n_cameras == 2
+	with open(tmp_path / "out.json") as f:
+		out = json.load(f)
+	assert out["aabb_scale"] == 16 and out["integer_depth_scale"] == 0.001
+	assert not any(key in out for key in ("k1", "p1", "is_fisheye", "fl_x"))
+	for frame in out["frames"]:
+		assert not any(key in frame for key in ("k1", "k2", "k3", "k4", "p1", "p2", "is_fisheye"))
+		assert frame["w"] == W and frame["h"] == H and "fl_x" in frame
+	assert [frame["file_path"] for frame in out["frames"]] == [f"undistorted/{i}.png" for i in range(3)]
+	assert out["frames"][0]["depth_path"] == "undistorted/0.depth.png"
+
+	depth = cv2.imread(str(tmp_path / "undistorted" / "0.depth.png"), cv2.IMREAD_UNCHANGED)
+	assert depth.dtype == np.uint16 and set(np.unique(depth)) <= {0, 1000}
+	# The whole image stays masked, and the black borders of the other frames are masked
+	assert (cv2.imread(str(tmp_path / "undistorted" / "dynamic_mask_0.png"), cv2.IMREAD_GRAYSCALE) == 255).all()
+	border_mask = cv2.imread(str(tmp_path / "undistorted" / "dynamic_mask_1.png"), cv2.IMREAD_GRAYSCALE)
+	assert 0 < (border_mask == 255).mean() < 0.5
+	assert border_mask[H // 2, W // 2] == 0
+
+def test_pinhole_frames_are_copied(tmp_path):
+	"""Test that frames without distortion are copied as they are, with their mask and intrinsics."""
+	# GIVEN
+	(tmp_path / "images").mkdir()
+	camera = {"w": W, "h": H, "fl_x": 100.0, "fl_y": 98.0, "cx": 81.0, "cy": 59.0, "k1": 0.0, "p1": 0.0}
+	image = np.random.default_rng(0).integers(0, 255, (H, W, 3), dtype=np.uint8)
+	cv2.imwrite(str(tmp_path / "images" / "0.jpg"), image)
+	cv2.imwrite(str(tmp_path / "images" / "dynamic_mask_0.png"), np.full((H, W), 255, dtype=np.uint8))
+	with open(tmp_path / "transforms.json", "w") as f:
+		json.dump(dict(camera, frames=[{"file_path": "images/0.jpg", "transform_matrix": np.eye(4).tolist()}]), f)
+
+	# WHEN
+	undistort_transforms(str(tmp_path / "transforms.json"), str(tmp_path / "out.json"))
+
+	# THEN
+	with open(tmp_path / "out.json") as f:
+		out = json.load(f)
+	assert (tmp_path / "undistorted" / "0.jpg").read_bytes() == (tmp_path / "images" / "0.jpg").read_bytes()
+	assert (tmp_path / "undistorted" / "dynamic_mask_0.png").is_file()
+	assert [out[key] for key in ("fl_x", "fl_y", "cx", "cy")] == [100.0, 98.0, 81.0, 59.0]
+
+@pytest.mark.parametrize("header", [{"camera_angle_x": 0.69}, {"w": W, "h": H, "x_fov": 60.0}])
+def test_blender_transforms(tmp_path, header):
+	"""Test transforms without focal length or resolution: read like the loader does, then copied as pinhole frames."""
+	# GIVEN
+	(tmp_path / "train").mkdir()
+	cv2.imwrite(str(tmp_path / "train" / "r_0.png"), np.zeros((H, W, 4), dtype=np.uint8))
+	with open(tmp_path / "transforms.json", "w") as f:
+		json.dump(dict(header, frames=[{"file_path": "./train/r_0", "transform_matrix": np.eye(4).tolist()}]), f)
+
+	# WHEN
+	undistort_transforms(str(tmp_path / "transforms.json"), str(tmp_path / "out.json"))
+
+	# THEN
+	with open(tmp_path / "out.json") as f:
+		out = json.load(f)
+	fl = 0.5 * W / np.tan(0.5 * 0.69) if "camera_angle_x" in header else 0.5 * W / np.tan(np.radians(30))
+	assert (out["w"], out["h"]) == (W, H) and "x_fov" not in out
+	np.testing.assert_allclose([out["fl_x"], out["fl_y"], out["cx"], out["cy"]], [fl, fl, W / 2, H / 2])
+	assert (tmp_path / "undistorted" / "r_0.png").read_bytes() == (tmp_path / "train" / "r_0.png").read_bytes()
@@ -0,0 +1,127 @@
+"""Test the header-only dataset validation."""
+import json
+import struct
+
+import cv2
+import numpy as np
+import pytest
+
+from validate_dataset import format_report, read_image_header, validate_dataset
+
+def _write_exr_header(path, width, height):
+	# Header of a scanline EXR file with one half channel, without pixels
+	def attribute(name, attribute_type, value):
+		return name.encode() + b"\0" + attribute_type.encode() + b"\0" + struct.pack("<i", len(value)) + value
+	header = b"\x76\x2f\x31\x01" + struct.pack("<i", 2)
+	header += attribute("channels", "chlist", b"R\0" + struct.pack("<iBBBBii", 1, 0, 0, 0, 0, 1, 1) + b"\0")
+	header += attribute("compression", "compression", b"\0")
+	header += attribute("dataWindow", "box2i", struct.pack("<iiii", 2, 3, width + 1, height + 2))
+	with open(path, "wb") as f:
+		f.write(header + b"\0")
+
+@pytest.mark.parametrize("ext, dtype, bit_depth", [(".png", np.uint8, 8), (".png", np.uint16, 16), (".jpg", np.uint8, 8), (".bmp", np.uint8, 8)])
+def test_read_image_header(tmp_path, ext, dtype, bit_depth):
+	"""Test the image size read from the headers."""
+	# GIVEN
+	path = str(tmp_path / f"image{ext}")
+	cv2.imwrite(path, np.zeros((7, 13), dtype=dtype))
+
+	# WHEN
+	header = read_image_header(path)
+
+	# THEN
+	assert (header.width, header.height, header.bit_depth, header.is_hdr) == (13, 7, bit_depth, False)
+
+def test_read_exr_header(tmp_path):
+	"""Test the image size read from the dataWindow of an EXR header."""
+	# GIVEN
+	_write_exr_header(tmp_path / "image.exr", 13, 7)
+
+	# WHEN
+	header = read_image_header(str(tmp_path / "image.exr"))
+
+	# THEN
+	assert (header.width, header.height, header.is_hdr) == (13, 7, True)
+
+def test_validate_dataset(tmp_path):
+	"""Test the errors, warnings and statistics of a dataset with broken frames."""
+	# GIVEN
+	(tmp_path / "images").mkdir()
+	for i in range(6):
+		cv2.imwrite(str(tmp_path / "images" / f"{i}.jpg"), np.zeros((6, 8, 3), dtype=np.uint8))
+		cv2.imwrite(str(tmp_path / "images" / f"{i}.depth.png"), np.ones((6, 8), dtype=np.uint16))
+	cv2.imwrite(str(tmp_path / "images" / "1.jpg"), np.zeros((8, 6, 3), dtype=np.uint8))
+	cv2.imwrite(str(tmp_path / "images" / "dynamic_mask_2.png"), np.zeros((3, 4), dtype=np.uint8))
+	cv2.imwrite(str(tmp_path / "images" / "3.depth.png"), np.ones((6, 8), dtype=np.uint8))
+	cv2.imwrite(str(tmp_path / "images" / "4.depth.png"), np.ones((3, 4), dtype=np.uint16))
+	frames = [{"file_path": f"images/{i}", "depth_path": f"images/{i}.depth.png", "transform_matrix": np.eye(4).tolist()} for i in range(7)]
+	frames[5]["depth_path"] = "images/missing.png"
+	with open(tmp_path / "transforms.json", "w") as f:
+		json.dump({"w": 8, "h": 6, "fl_x": 10.0, "integer_depth_scale": 0.001, "frames": frames}, f)
+
+	# WHEN
+	report = validate_dataset(str(tmp_path), n_workers=4)
+
+	# THEN
+	assert report["n_frames"] == 7
+	assert report["resolutions"] == {(8, 6): 5, (6, 8): 1}
+	assert report["n_pixels"] == 6 * 48
+	assert report["gpu_bytes"] == 6 * 48 * (4 + 16)
+	errors = "\n".join(report["errors"])
+	assert len(report["errors"]) == 5
+	assert "images/6 does not exist" in errors
+	assert "1.jpg is 6x8, the transforms declare 8x6" in errors and "1.depth.png is 8x6, its image is 6x8" in errors
+	assert "dynamic_mask_2.png is 4x3" in errors
+	assert "4.depth.png is 4x3" in errors
+	warnings = "\n".join(report["warnings"])
+	assert "3.depth.png has 8 bits" in warnings and "missing.png does not exist" in warnings
+	assert "5 errors" in format_report(report)
+
+def test_depth_without_scale(tmp_path):
+	"""Test that depth images are reported as ignored without integer_depth_scale."""
+	# GIVEN
+	cv2.imwrite(str(tmp_path / "0.png"), np.zeros((6, 8, 3), dtype=np.uint8))
+	with open(tmp_path / "transforms.json", "w") as f:
+		json.dump({"camera_angle_x": 1.0, "w": 8, "h": 6, "frames": [{"file_path": "0.png", "depth_path": "0.depth.png", "transform_matrix": np.eye(4).tolist()}]}, f)
+
+	# WHEN
+	report = validate_dataset(str(tmp_path / "transforms.json"))
+
+	# THEN
+	assert not report["errors"] and report["gpu_bytes"] == 48 * 4
+	assert "ignored" in report["warnings"][0]
+
+	# GIVEN a depth scale of 0, WHEN / THEN the depths are not loaded either
+	with open(tmp_path / "transforms.json", "w") as f:
+		json.dump({"camera_angle_x": 1.0, "w": 8, "h": 6, "integer_depth_scale": 0.0, "frames": [{"file_path": "0.png", "depth_path": "0.depth.png", "transform_matrix": np.eye(4).tolist()}]}, f)
+	report = validate_dataset(str(tmp_path / "transforms.json"))
+	assert report["gpu_bytes"] == 48 * 4 and "ignored" in report["warnings"][0]
+
+def test_blender_scene(tmp_path):
+	"""Test that NeRF synthetic scenes, whose transforms have no resolution, are checked from the images only."""
+	# GIVEN
+	(tmp_path / "train").mkdir()
+	cv2.imwrite(str(tmp_path / "train" / "r_0.png"), np.zeros((6, 8, 4), dtype=np.uint8))
+	with open(tmp_path / "transforms_train.json", "w") as f:
+		json.dump({"camera_angle_x": 0.69, "frames": [{"file_path": "./train/r_0", "rotation": 0.03, "transform_matrix": np.eye(4).tolist()}]}, f)
+
+	# WHEN
+	report = validate_dataset(str(tmp_path))
+
+	# THEN
+	assert not report["errors"] and not report["warnings"]
+	assert report["resolutions"] == {(8, 6): 1}
+
+def test_read_only_check(tmp_path):
+	"""Test that the check accepts the focal lengths the loader accepts and writes nothing into the dataset."""
+	# GIVEN
+	cv2.imwrite(str(tmp_path / "0.png"), np.zeros((6, 8, 3), dtype=np.uint8))
+	with open(tmp_path / "transforms.json", "w") as f:
+		json.dump({"camera_angle_y": 0.5, "frames": [{"file_path": "0.png", "transform_matrix": np.eye(4).tolist()}]}, f)
+
+	# WHEN
+	report = validate_dataset(str(tmp_path))
+
+	# THEN
+	assert not report["errors"]
+	assert sorted(path.name for path in tmp_path.iterdir()) == ["0.png", "transforms.json"]
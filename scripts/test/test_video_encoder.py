@@ -0,0 +1,170 @@
+"""Test the streamed video encoders."""
+import os
+import shutil
+import stat
+import subprocess
+import threading
+
+import cv2
+import numpy as np
+import pytest
+
+from video_encoder import FfmpegPipeEncoder, MemoryEncoder, QueuedEncoder, open_video_encoder, quantize_frame
+
+def _frames(n, h=16, w=24):
+	rng = np.random.default_rng(1)
+	return [rng.uniform(0.0, 1.0, size=(h, w, 4)).astype(np.float32) for _ in range(n)]
+
+def _fake_ffmpeg(tmp_path, script):
+	path = tmp_path / "ffmpeg"
+	path.write_text("#!/bin/sh\n" + script)
+	path.chmod(path.stat().st_mode | stat.S_IEXEC)
+	return str(path)
+
+class _FailingEncoder(MemoryEncoder):
+	def __init__(self, fail_at):
+		super().__init__()
+		self.fail_at = fail_at
+
+	def write(self, frame):
+		if len(self.frames) == self.fail_at:
+			raise RuntimeError("encoder failure")
+		super().write(frame)
+
+class _BlockingEncoder(MemoryEncoder):
+	def __init__(self):
+		super().__init__()
+		self.release = threading.Event()
+
+	def write(self, frame):
+		self.release.wait()
+		super().write(frame)
+
+def test_queued_encoder_keeps_order():
+	"""Test that frames reach the encoder in order, quantized like `write_image`."""
+	# GIVEN
+	frames = _frames(10)
+	memory = MemoryEncoder()
+
+	# WHEN
+	with QueuedEncoder(memory, max_queued_frames=2) as encoder:
+		for frame in frames:
+			encoder.write(frame)
+
+	# THEN
+	assert memory.closed
+	assert len(memory.frames) == len(frames)
+	for frame, encoded in zip(frames, memory.frames):
+		np.testing.assert_array_equal(encoded, quantize_frame(frame))
+		assert encoded.dtype == np.uint8 and encoded.shape == (16, 24, 3)
+
+def test_queued_encoder_is_bounded():
+	"""Test that the producer blocks once the queue is full."""
+	# GIVEN an encoder stuck on its first frame
+	memory = _BlockingEncoder()
+	encoder = QueuedEncoder(memory, max_queued_frames=2)
+	frames = _frames(4)
+
+	# WHEN
+	producer = threading.Thread(target=lambda: [encoder.write(frame) for frame in frames])
+	producer.start()
+	producer.join(timeout=0.5)
+
+	# THEN 1 frame in the encoder + 2 queued frames, the last one is waiting
+	assert producer.is_alive()
+	memory.release.set()
+	producer.join()
+	encoder.close()
+	assert len(memory.frames) == 4
+
+def test_queued_encoder_propagates_errors():
+	"""Test that an encoder failure is raised to the producer."""
+	# GIVEN
+	frames = _frames(6)
+
+	# WHEN / THEN
+	with pytest.raises(RuntimeError, match="encoder failure"):
+		with QueuedEncoder(_FailingEncoder(fail_at=2), max_queued_frames=1) as encoder:
+			for frame in frames:
+				encoder.write(frame)
+
+def test_png_sequence(tmp_path):
+	"""Test PNG sequences in 8 and 16 bits, numbered from the start index, with their alpha channel."""
+	frames = _frames(3)
+	for bit_depth, dtype in ((8, np.uint8), (16, np.uint16)):
+		# GIVEN
+		pattern = str(tmp_path / f"{bit_depth}" / "video_%04d.png")
+
+		# WHEN
+		with open_video_encoder(pattern, 30, (24, 16), start_index=5, bit_depth=bit_depth) as encoder:
+			for frame in frames:
+				encoder.write(frame)
+
+		# THEN
+		for i, frame in enumerate(frames):
+			image = cv2.cvtColor(cv2.imread(pattern % (5 + i), cv2.IMREAD_UNCHANGED), cv2.COLOR_BGRA2RGBA)
+			assert image.dtype == dtype and image.shape == (16, 24, 4)
+			np.testing.assert_array_equal(image, quantize_frame(frame, bit_depth, keep_alpha=True))
+			np.testing.assert_array_equal(image[...,0:3], quantize_frame(frame, bit_depth))
+
+def test_png_sequence_rgb(tmp_path):
+	"""Test that RGB frames are written as RGB PNGs."""
+	# GIVEN
+	frame = _frames(1)[0][...,0:3]
+	pattern = str(tmp_path / "video_%04d.png")
+
+	# WHEN
+	with open_video_encoder(pattern, 30, (24, 16)) as encoder:
+		encoder.write(frame)
+
+	# THEN
+	image = cv2.imread(pattern % 0, cv2.IMREAD_UNCHANGED)
+	assert image.shape == (16, 24, 3)
+	np.testing.assert_array_equal(cv2.cvtColor(image, cv2.COLOR_BGR2RGB), quantize_frame(frame))
+
+@pytest.mark.skipif(os.name == "nt", reason="Uses a shell script as ffmpeg")
+def test_ffmpeg_pipe_raw_frames(tmp_path):
+	"""Test that raw RGB24/RGB48 frames are piped to ffmpeg's stdin."""
+	frames = _frames(3)
+	for bit_depth, dtype in ((8, np.uint8), (16, "<u2")):
+		# GIVEN a fake ffmpeg copying its stdin to a file
+		raw = tmp_path / f"frames_{bit_depth}.raw"
+		ffmpeg = _fake_ffmpeg(tmp_path, f"cat > {raw}\n")
+
+		# WHEN
+		with QueuedEncoder(FfmpegPipeEncoder("out.mp4", 30, (24, 16), bit_depth=bit_depth, ffmpeg_binary=ffmpeg)) as encoder:
+			for frame in frames:
+				encoder.write(frame)
+
+		# THEN
+		data = np.fromfile(raw, dtype=dtype).reshape(len(frames), 16, 24, 3)
+		for frame, encoded in zip(frames, data):
+			np.testing.assert_array_equal(encoded, quantize_frame(frame, bit_depth))
+
+@pytest.mark.skipif(os.name == "nt", reason="Uses a shell script as ffmpeg")
+def test_ffmpeg_pipe_exit_status(tmp_path):
+	"""Test that a failing ffmpeg raises with its exit status, whether it fails at the end or early."""
+	for script in ("cat > /dev/null\nexit 3\n", "exit 3\n"):
+		# GIVEN
+		ffmpeg = _fake_ffmpeg(tmp_path, script)
+
+		# WHEN / THEN
+		with pytest.raises(subprocess.CalledProcessError) as error:
+			with QueuedEncoder(FfmpegPipeEncoder("out.mp4", 30, (512, 512), ffmpeg_binary=ffmpeg)) as encoder:
+				for frame in _frames(8, h=512, w=512):
+					encoder.write(frame)
+		assert error.value.returncode == 3
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+def test_ffmpeg_video(tmp_path):
+	"""Test encoding an actual video."""
+	# GIVEN
+	output = str(tmp_path / "video.mp4")
+
+	# WHEN
+	with open_video_encoder(output, 30, (24, 16)) as encoder:
+		for frame in _frames(5):
+			encoder.write(frame)
+
+	# THEN
+	assert os.path.getsize(output) > 0
@@ -0,0 +1,56 @@
+"""Test the streaming frame extraction from videos."""
+import cv2
+import numpy as np
+import pytest
+
+from video_frames import extract_frames, iter_frames, select_frames
+
+def _write_video(path, frames, fps):
+	writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), fps, (frames[0].shape[1], frames[0].shape[0]))
+	if not writer.isOpened():
+		pytest.skip("No MJPG video writer in this OpenCV build")
+	for frame in frames:
+		writer.write(frame)
+	writer.release()
+
+def _textured_frame(rng, blur):
+	return cv2.GaussianBlur(rng.uniform(0, 255, (64, 96, 3)).astype(np.uint8), (0, 0), blur)
+
+def test_select_frames_keeps_sharpest_per_window():
+	"""Test that the sharpest frame of each window is selected."""
+	# GIVEN 10 frames per second, the third frame of each half second is the sharpest
+	rng = np.random.default_rng(0)
+	frames = [(i / 10, _textured_frame(rng, 0.5 if i % 5 == 2 else 3.0)) for i in range(20)]
+
+	# WHEN
+	selected = list(select_frames(frames, fps=2, reduction=2))
+
+	# THEN
+	assert [t for t, _, _ in selected] == [0.2, 0.7, 1.2, 1.7]
+
+def test_select_frames_skips_static_frames():
+	"""Test that frames too similar to the previous selected frame are dropped."""
+	# GIVEN a still camera for the first half of the video
+	rng = np.random.default_rng(1)
+	still = _textured_frame(rng, 1.0)
+	frames = [(i / 10, still if i < 10 else _textured_frame(rng, 1.0)) for i in range(20)]
+
+	# WHEN
+	selected = list(select_frames(frames, fps=5, reduction=2, min_motion=5.0))
+
+	# THEN one frame of the still part is kept, and all the moving ones
+	assert [int(t * 5 + 1e-9) for t, _, _ in selected] == [0, 5, 6, 7, 8, 9]
+
+def test_extract_frames(tmp_path):
+	"""Test extracting a time slice of a video."""
+	# GIVEN a 2 seconds video at 10 frames per second
+	rng = np.random.default_rng(2)
+	_write_video(tmp_path / "video.avi", [_textured_frame(rng, 1.0) for _ in range(20)], 10)
+
+	# WHEN
+	paths = extract_frames(str(tmp_path / "video.avi"), str(tmp_path / "images"), fps=2, time_slice=(0.5, 1.45), n_workers=2, max_pending_writes=1)
+
+	# THEN
+	assert [p.replace("\\", "/").split("/")[-1] for p in paths] == ["0001.jpg", "0002.jpg"]
+	assert all(cv2.imread(p).shape == (64, 96, 3) for p in paths)
+	assert [t for t, _ in iter_frames(str(tmp_path / "video.avi"), (0.5, 1.45))] == pytest.approx([0.5 + i / 10 for i in range(10)])
@@ -0,0 +1,170 @@
+"""Test the visual hull carving from silhouettes."""
+import json
+
+import cv2
+import numpy as np
+import pytest
+
+from scene_bounds import to_testbed
+from visual_hull import carve, crop_box, silhouette, visual_hull
+
+RADIUS = 0.5
+
+def _look_at(position, target):
+	# NeRF camera (looking along -z, y up) at position looking at target
+	back = position - target
+	back /= np.linalg.norm(back)
+	right = np.cross([0.0, 0.0, 1.0], back)
+	right /= np.linalg.norm(right)
+	c2w = np.eye(4)
+	c2w[0:3, 0:3] = np.stack([right, np.cross(back, right), back], axis=-1)
+	c2w[0:3, 3] = position
+	return c2w
+
+def _cameras(n=12, distance=3.0):
+	angles = np.arange(n) / n * 2 * np.pi
+	heights = np.where(np.arange(n) % 2 == 0, 1.0, -1.0)
+	return np.stack([_look_at(np.array([distance * np.cos(a), distance * np.sin(a), h]), np.zeros(3)) for a, h in zip(angles, heights)])
+
+def _sphere_silhouette(c2w, fl, size):
+	# Exact silhouette of the sphere of radius RADIUS at the origin, by ray casting the pixel centers
+	v, u = np.mgrid[0:size, 0:size] + 0.5
+	directions = np.stack([(u - size / 2) / fl, -(v - size / 2) / fl, -np.ones_like(u)], axis=-1) @ c2w[0:3, 0:3].T
+	directions /= np.linalg.norm(directions, axis=-1, keepdims=True)
+	origin = c2w[0:3, 3]
+	closest = np.linalg.norm(origin - (directions @ origin)[..., np.newaxis] * directions, axis=-1)
+	return closest <= RADIUS
+
+def test_carve():
+	"""Test that the carved grid keeps the whole sphere and little else."""
+	# GIVEN
+	c2ws = _cameras()
+	fl, size = 40.0, 64
+	masks = [_sphere_silhouette(c2w, fl, size) for c2w in c2ws]
+	intrinsics = np.tile([fl, fl, size / 2, size / 2], (len(c2ws), 1))
+	lo, hi = np.full(3, -1.5), np.full(3, 1.5)
+
+	# WHEN
+	occupancy = carve(c2ws, intrinsics, lambda i: masks[i], lo, hi, resolution=30, dilation=0.0, n_workers=4)
+
+	# THEN
+	centers = (np.stack(np.meshgrid(*[np.arange(30)] * 3, indexing="ij"), axis=-1) + 0.5) * 0.1 - 1.5
+	distances = np.linalg.norm(centers, axis=-1)
+	assert occupancy[distances <= RADIUS + 0.05 * np.sqrt(3)].all()
+	assert not occupancy[distances > 2 * RADIUS].any()
+
+def test_carve_unseen():
+	"""Test that voxels out of every frame are only carved by min_views."""
+	# GIVEN
+	c2ws = _cameras(n=2)
+	masks = [np.zeros((16, 16), dtype=bool)] * 2
+	intrinsics = np.tile([8.0, 8.0, 8.0, 8.0], (2, 1))
+	lo, hi = np.full(3, -10.0), np.full(3, 10.0)
+
+	# WHEN
+	kept = carve(c2ws, intrinsics, lambda i: masks[i], lo, hi, resolution=32, min_views=0)
+	carved = carve(c2ws, intrinsics, lambda i: masks[i], lo, hi, resolution=32, min_views=1)
+
+	# THEN
+	assert kept.any() and not kept.all()
+	assert np.count_nonzero(carved) < np.count_nonzero(kept)
+
+def test_carve_border():
+	"""Test that min_views keeps the voxels whose footprint overlaps object pixels at the border of the image."""
+	# GIVEN
+	c2ws = _cameras(n=1)
+	fl, size, resolution = 24.0, 16, 12
+	mask = np.ones((size, size), dtype=bool)
+	intrinsics = np.array([[fl, fl, size / 2, size / 2]])
+	lo, hi = np.full(3, -1.5), np.full(3, 1.5)
+
+	# WHEN
+	occupancy = carve(c2ws, intrinsics, lambda i: mask, lo, hi, resolution=resolution, min_views=1, dilation=0.0)
+
+	# THEN
+	voxel = (hi - lo) / resolution
+	indices = np.stack(np.meshgrid(*[np.arange(resolution)] * 3, indexing="ij"), axis=-1)
+	offsets = np.stack(np.meshgrid(*[[0, 1]] * 3, indexing="ij"), axis=-1).reshape(-1, 3)
+	points = (lo + (indices[..., np.newaxis, :] + offsets) * voxel - c2ws[0, 0:3, 3]) @ c2ws[0, 0:3, 0:3]
+	u = fl * points[..., 0] / -points[..., 2] + size / 2
+	v = -fl * points[..., 1] / -points[..., 2] + size / 2
+	centers = (lo + (indices + 0.5) * voxel - c2ws[0, 0:3, 3]) @ c2ws[0, 0:3, 0:3]
+	u_center = fl * centers[..., 0] / -centers[..., 2] + size / 2
+	# Voxels with a corner in the image, but not their center
+	border = np.any((u > 0) & (u < size) & (v > 0) & (v < size), axis=-1) & ((u_center < 0) | (u_center > size))
+	assert border.any()
+	assert occupancy[border].all()
+
+def test_carve_no_silhouettes():
+	"""Test that carving without any silhouette raises an error."""
+	# GIVEN
+	c2ws = _cameras(n=2)
+	intrinsics = np.tile([8.0, 8.0, 8.0, 8.0], (2, 1))
+
+	# WHEN / THEN
+	with pytest.raises(ValueError, match="No silhouettes found"):
+		carve(c2ws, intrinsics, lambda i: None, np.full(3, -1.0), np.full(3, 1.0), resolution=4)
+
+def test_crop_box():
+	"""Test the crop box matrix against NerfDataset::nerf_matrix_to_ngp, as used by Testbed::set_crop_box."""
+	# GIVEN
+	lo, hi = np.array([0.1, 0.2, 0.3]), np.array([0.5, 0.9, 0.6])
+	scale, offset = 0.33, np.array([0.5, 0.5, 0.5])
+
+	# WHEN
+	m = crop_box(lo, hi, scale, offset)
+
+	# THEN
+	m[:, 0] *= scale
+	m[:, 1:3] *= -scale
+	m[:, 3] = m[:, 3] * scale + offset
+	m = m[[1, 2, 0]]
+	radius = np.linalg.norm(m[:, 0:3], axis=0)
+	assert np.allclose(m[:, 3] - radius, lo) and np.allclose(m[:, 3] + radius, hi)
+
+@pytest.mark.parametrize("kind", ["rgba", "alpha_image", "white_transparent", "none"])
+def test_silhouette(tmp_path, kind):
+	"""Test the silhouettes read from alpha channels, alpha images and transparent colors."""
+	# GIVEN
+	image = np.full((8, 8, 3), 255, dtype=np.uint8)
+	image[2:4, 3:6] = 100
+	foreground = np.all(image != 255, axis=-1)
+	if kind == "rgba":
+		cv2.imwrite(str(tmp_path / "0.png"), np.dstack([image, foreground * 255]).astype(np.uint8))
+	else:
+		cv2.imwrite(str(tmp_path / "0.png"), image)
+	if kind == "alpha_image":
+		cv2.imwrite(str(tmp_path / "0.png.alpha.png"), np.dstack([np.zeros((8, 8, 2)), foreground * 255]).astype(np.uint8))
+	cv2.imwrite(str(tmp_path / "dynamic_mask_0.png"), np.pad(np.full((1, 1), 255, dtype=np.uint8), ((0, 7), (0, 7))))
+
+	# WHEN
+	mask = silhouette(str(tmp_path), "0.png", white_transparent=kind == "white_transparent")
+
+	# THEN
+	if kind == "none":
+		assert mask is None
+	else:
+		foreground[0, 0] = True
+		assert np.array_equal(mask, foreground)
+
+def test_visual_hull(tmp_path):
+	"""Test the hull box of a transforms file with RGBA images of a sphere."""
+	# GIVEN
+	c2ws = _cameras()
+	fl, size = 40.0, 64
+	frames = []
+	for i, c2w in enumerate(c2ws):
+		alpha = _sphere_silhouette(c2w, fl, size).astype(np.uint8) * 255
+		cv2.imwrite(str(tmp_path / f"{i}.png"), np.dstack([np.full((size, size, 3), 128, dtype=np.uint8), alpha]))
+		frames.append({"file_path": f"{i}.png", "transform_matrix": c2w.tolist()})
+	with open(tmp_path / "transforms.json", "w") as f:
+		json.dump({"w": size, "h": size, "fl_x": fl, "aabb_scale": 2, "frames": frames}, f)
+
+	# WHEN
+	hull = visual_hull(str(tmp_path / "transforms.json"), resolution=32, dilation=0.0)
+
+	# THEN
+	assert np.all(hull["hull_min"] <= -RADIUS) and np.all(hull["hull_max"] >= RADIUS)
+	assert np.all(hull["hull_min"] > -2 * RADIUS) and np.all(hull["hull_max"] < 2 * RADIUS)
+	corners = to_testbed(np.stack([hull["hull_min"], hull["hull_max"]]), 0.33, 0.5)
+	assert np.allclose(hull["render_aabb"], [corners.min(axis=0), corners.max(axis=0)])
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# Columnar sidecar of a transforms file, so that huge datasets are parsed and validated once.
+#
+# `transforms.json` gets a `transforms.columns.npz` next to it: the poses as one (N,4,4) array, one column per
+# intrinsics / distortion / resolution key (NaN where a frame does not set it, the transforms-level value applies),
+# the image and depth paths, and any other per-frame keys as JSON strings. The sidecar stores the size, mtime and
+# BLAKE2 hash of the transforms file it was built from: it is rebuilt when the hash changes, and the hash is only
+# recomputed when the size or mtime changed. Columns are read from the (uncompressed) archive on first access only,
+# and frames can be rebuilt for a subset of indices, or written back to a JSON file for the C++ loader. As for the
+# loader, the resolution is optional (e.g. NeRF synthetic datasets): callers that need it read it from the image headers.
+
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from select_keyframes import rebase_paths, resolve_image_path
+
+SIDECAR_VERSION = 2
+FLOAT_KEYS = ["fl_x", "fl_y", "cx", "cy", "w", "h", "k1", "k2", "k3", "k4", "p1", "p2", "camera_angle_x", "camera_angle_y", "x_fov", "y_fov", "is_fisheye"]
+INT_KEYS = ["w", "h"]
+# Keys the loader reads a focal length from (read_focal_length in nerf_loader.cu)
+FOCAL_KEYS = ["x_fov", "y_fov", "fl_x", "fl_y", "camera_angle_x", "camera_angle_y"]
+PATH_KEYS = ["file_path", "depth_path"]
+COLUMN_KEYS = ["transform_matrix"] + FLOAT_KEYS + PATH_KEYS
+
+def parse_args():
+	parser = argparse.ArgumentParser(description="Build (or check) the columnar sidecar of transforms files.")
+	parser.add_argument("transforms", nargs="+", help="Transforms files.")
+	parser.add_argument("--force", action="store_true", help="Rebuild the sidecars even if they are up to date.")
+	return parser.parse_args()
+
+def sidecar_path(transforms_path):
+	return os.path.splitext(transforms_path)[0] + ".columns.npz"
+
+def file_hash(path):
+	h = hashlib.blake2b(digest_size=20)
+	with open(path, "rb") as f:
+		for chunk in iter(lambda: f.read(1 << 20), b""):
+			h.update(chunk)
+	return h.hexdigest()
+
+def read_transforms(path):
+	with open(path) as f:
+		text = f.read()
+	try:
+		return json.loads(text)
+	except json.JSONDecodeError:
+		# Transforms files written by hand may have comments
+		import commentjson
+		return commentjson.loads(text)
+
+def validate_transforms(transforms):
+	# Raises ValueError on the first frame the loader could not use
+	frames = transforms.get("frames")
+	if not isinstance(frames, list):
+		raise ValueError("transforms have no frames list")
+	for i, frame in enumerate(frames):
+		def get(key):
+			return frame.get(key, transforms.get(key))
+		if not isinstance(frame.get("file_path"), str):
+			raise ValueError(f"frame {i}: no file_path")
+		matrix = frame.get("transform_matrix", frame.get("transform_matrix_start"))
+		if matrix is None or np.shape(matrix) != (4, 4) or not np.isfinite(np.asarray(matrix, dtype=np.float64)).all():
+			raise ValueError(f"frame {i}: transform_matrix is not a finite 4x4 matrix")
+		# Like the loader, the resolution is read from the image when the transforms do not set it
+		if any(get(key) is not None and get(key) <= 0 for key in ("w", "h")):
+			raise ValueError(f"frame {i}: invalid resolution (w, h)")
+		if all(get(key) is None for key in FOCAL_KEYS):
+			raise ValueError(f"frame {i}: no focal length ({', '.join(FOCAL_KEYS)})")
+
+def transforms_to_columns(transforms):
+	# Dict of numpy arrays of a validated transforms dict
+	frames = transforms["frames"]
+	columns = {"header": np.array(json.dumps({key: value for key, value in transforms.items() if key != "frames"}))}
+	missing = np.full((4, 4), np.nan).tolist()
+	columns["transform_matrix"] = np.array([frame.get("transform_matrix", missing) for frame in frames], dtype=np.float64).reshape(-1, 4, 4)
+	for key in FLOAT_KEYS:
+		columns[key] = np.array([float(frame.get(key, np.nan)) for frame in frames], dtype=np.float64)
+	for key in PATH_KEYS:
+		columns[key] = np.array([frame.get(key, "") for frame in frames], dtype=str)
+	columns["extra"] = np.array([json.dumps(extra) if extra else "" for extra in ({key: value for key, value in frame.items() if key not in COLUMN_KEYS} for frame in frames)], dtype=str)
+	return columns
+
+def build_columns(transforms_path, transforms=None):
+	# Validated columns of a transforms file, with the identity of the file they are built from
+	stat = os.stat(transforms_path)
+	digest = file_hash(transforms_path)
+	if transforms is None:
+		transforms = read_transforms(transforms_path)
+	validate_transforms(transforms)
+	columns = transforms_to_columns(transforms)
+	columns.update(version=np.array(SIDECAR_VERSION), source_size=np.array(stat.st_size), source_mtime_ns=np.array(stat.st_mtime_ns), source_hash=np.array(digest))
+	return columns
+
+def write_sidecar(transforms_path, columns):
+	path = sidecar_path(transforms_path)
+	# The file object keeps np.savez from appending .npz to the temporary name
+	with open(path + ".tmp", "wb") as f:
+		np.savez(f, **columns)
+	os.replace(path + ".tmp", path)
+
+def is_up_to_date(transforms_path, npz):
+	# Whether an opened sidecar was built from the current transforms file
+	if "version" not in npz.files or int(npz["version"]) != SIDECAR_VERSION:
+		return False
+	stat = os.stat(transforms_path)
+	if int(npz["source_size"]) == stat.st_size and int(npz["source_mtime_ns"]) == stat.st_mtime_ns:
+		return True
+	return int(npz["source_size"]) == stat.st_size and str(npz["source_hash"]) == file_hash(transforms_path)
+
+def _focal_lengths(get, w, h):
+	# (fl_x, fl_y) arrays from the FOCAL_KEYS columns of `get`, NaN where none is set. As in read_focal_length, each
+	# axis takes its fov in degrees, else its focal length, else its angle in radians, and a missing axis takes the
+	# focal length of the other one.
+	def axis(resolution, fov, fl, angle):
+		with np.errstate(invalid="ignore"):
+			focal = np.where(np.isnan(angle), np.nan, 0.5 * resolution / np.tan(0.5 * angle))
+			focal = np.where(np.isnan(fl), focal, fl)
+			return np.where(np.isnan(fov), focal, 0.5 * resolution / np.tan(0.5 * np.radians(fov)))
+	fl_x = axis(w, get("x_fov"), get("fl_x"), get("camera_angle_x"))
+	fl_y = axis(h, get("y_fov"), get("fl_y"), get("camera_angle_y"))
+	return np.where(np.isnan(fl_x), fl_y, fl_x), np.where(np.isnan(fl_y), fl_x, fl_y)
+
+class TransformsColumns:
+	# Lazily loaded columns of a transforms file
+	def __init__(self, transforms_path, npz):
+		self.transforms_path = transforms_path
+		self.npz = npz
+		self.header = json.loads(str(npz["header"]))
+		self._columns = {}
+
+	def __len__(self):
+		return len(self.column("file_path"))
+
+	def column(self, key):
+		if key not in self._columns:
+			self._columns[key] = self.npz[key]
+		return self._columns[key]
+
+	def _select(self, key, indices):
+		column = self.column(key)
+		return column if indices is None else column[np.asarray(indices, dtype=np.int64)]
+
+	def c2ws(self, indices=None):
+		return self._select("transform_matrix", indices)
+
+	def values(self, key, indices=None):
+		# Per-frame values of an intrinsics key, the transforms-level value where a frame does not set it
+		values = self._select(key, indices)
+		return np.where(np.isnan(values), float(self.header.get(key, np.nan)), values)
+
+	def resolutions(self, indices=None, from_images=False, n_workers=16):
+		# (w, h) arrays of the frames, NaN where the transforms do not set them unless read from the image headers
+		w, h = self.values("w", indices), self.values("h", indices)
+		missing = np.flatnonzero(np.isnan(w) | np.isnan(h))
+		if from_images and len(missing) > 0:
+			from validate_dataset import read_image_header
+			base_dir = os.path.dirname(os.path.abspath(self.transforms_path))
+			file_paths = self._select("file_path", indices)[missing].tolist()
+			with ThreadPoolExecutor(max_workers=n_workers) as pool:
+				headers = list(pool.map(lambda path: read_image_header(resolve_image_path(base_dir, path)), file_paths))
+			w[missing] = [header.width for header in headers]
+			h[missing] = [header.height for header in headers]
+		return w, h
+
+	def intrinsics(self, indices=None, from_images=False):
+		# (N, 4) array of the (fl_x, fl_y, w, h) of the frames, with the focal lengths the loader reads.
+		# Without from_images, frames without resolution have NaN values.
+		w, h = self.resolutions(indices, from_images)
+		n = len(w)
+		header_fl = _focal_lengths(lambda key: np.full(n, float(self.header.get(key, np.nan))), w, h)
+		frame_fl = _focal_lengths(lambda key: self._select(key, indices), w, h)
+		# The focal lengths of a frame replace the transforms' ones as a whole
+		from_frame = ~np.isnan(frame_fl[0])
+		fl_x, fl_y = (np.where(from_frame, f, t) for f, t in zip(frame_fl, header_fl))
+		return np.stack([fl_x, fl_y, w, h], axis=-1)
+
+	def frames(self, indices=None):
+		# Frame dicts, as in the transforms file. Columns are converted to lists at once, NaN is the only x != x.
+		indices = np.arange(len(self)) if indices is None else np.asarray(indices, dtype=np.int64)
+		c2ws = self.c2ws(indices)
+		has_c2w = ~np.isnan(c2ws[:, 0, 0])
+		c2ws = c2ws.tolist()
+		floats = [(key, self._select(key, indices).tolist()) for key in FLOAT_KEYS if not np.isnan(self._select(key, indices)).all()]
+		file_paths, depth_paths, extras = (self._select(key, indices).tolist() for key in ("file_path", "depth_path", "extra"))
+		frames = []
+		for j in range(len(indices)):
+			frame = {"file_path": file_paths[j]} if file_paths[j] else {}
+			if has_c2w[j]:
+				frame["transform_matrix"] = c2ws[j]
+			for key, values in floats:
+				value = values[j]
+				if value == value:
+					frame[key] = bool(value) if key == "is_fisheye" else int(value) if key in INT_KEYS and value.is_integer() else value
+			if depth_paths[j]:
+				frame["depth_path"] = depth_paths[j]
+			if extras[j]:
+				frame.update(json.loads(extras[j]))
+			frames.append(frame)
+		return frames
+
+	def to_transforms(self, indices=None):
+		return dict(self.header, frames=self.frames(indices))
+
+	def write_json(self, path, indices=None):
+		# Transforms file of the frames (all or a subset) for the C++ loader, with paths relative to its folder
+		transforms = self.to_transforms(indices)
+		in_dir = os.path.dirname(os.path.abspath(self.transforms_path))
+		out_dir = os.path.dirname(os.path.abspath(path))
+		if in_dir != out_dir:
+			transforms["frames"] = [rebase_paths(frame, in_dir, out_dir) for frame in transforms["frames"]]
+		with open(path, "w") as f:
+			json.dump(transforms, f, indent=2)
+
+def load_columns(transforms_path, rebuild=False):
+	# Columns of a transforms file, from its sidecar, (re)built if missing or stale
+	path = sidecar_path(transforms_path)
+	if not rebuild and os.path.isfile(path):
+		npz = np.load(path)
+		if is_up_to_date(transforms_path, npz):
+			return TransformsColumns(transforms_path, npz)
+		npz.close()
+	columns = build_columns(transforms_path)
+	try:
+		write_sidecar(transforms_path, columns)
+	except OSError as e:
+		# e.g. read-only datasets: the columns are only kept in memory
+		print(f"Could not write {path}: {e}")
+		return TransformsColumns(transforms_path, columns)
+	return TransformsColumns(transforms_path, np.load(path))
+
+def load_transforms(transforms_path):
+	# Validated transforms dict, from the sidecar when it is up to date
+	return load_columns(transforms_path).to_transforms()
+
+if __name__ == "__main__":
+	args = parse_args()
+	for transforms_path in args.transforms:
+		columns = load_columns(transforms_path, rebuild=args.force)
+		print(f"{sidecar_path(transforms_path)}: {len(columns)} frames")
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# Undistorts the images of a transforms file to pinhole cameras, so that training and rendering use the
+# perspective lens model instead of the OpenCV / OpenCV fisheye distortion of each ray.
+#
+# The remap tables are computed once per distinct camera (intrinsics and distortion) and cached in memory, in
+# OpenCV's fixed point format. Images, their dynamic masks and their depth maps are remapped in a thread pool
+# (cv2.remap releases the GIL) with the same tables, masks and depths with nearest neighbour interpolation.
+# With balance > 0, pixels outside the source image are black: they are added to the dynamic masks so that they
+# are not trained on. Frames of cameras without distortion are copied as they are, rather than resampled.
+
+import argparse
+import json
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from mask_pipeline import mask_path
+from select_keyframes import resolve_image_path
+from transforms_columns import TransformsColumns, build_columns
+
+DISTORTION_KEYS = ["k1", "k2", "k3", "k4", "p1", "p2"]
+CAMERA_KEYS = ["w", "h", "fl_x", "fl_y", "cx", "cy", "is_fisheye"] + DISTORTION_KEYS
+# Replaced by the focal lengths of the pinhole cameras (x_fov and y_fov would take precedence over them in the loader)
+FOV_KEYS = ["camera_angle_x", "camera_angle_y", "x_fov", "y_fov", "fovx", "fovy"]
+
+def parse_args():
+	parser = argparse.ArgumentParser(description="Undistort the images of a transforms file and write a transforms file with pinhole cameras.")
+	parser.add_argument("transforms", help="Input transforms file.")
+	parser.add_argument("--out", required=True, help="Output transforms file.")
+	parser.add_argument("--out_images", default="", help="Output folder of the undistorted images, masks and depth maps. Defaults to `undistorted` next to the output transforms file.")
+	parser.add_argument("--balance", default=0.0, type=float, help="0 keeps only valid pixels (the image is cropped), 1 keeps all the source pixels (with black, masked, borders).")
+	parser.add_argument("--n_workers", default=None, type=int, help="Number of threads remapping images.")
+	return parser.parse_args()
+
+def frame_camera(transforms, frame, intrinsics=None):
+	# Intrinsics and distortion of a frame, whose own values override the transforms' ones. intrinsics, the
+	# (fl_x, fl_y, w, h) the loader reads for the frame, replace its focal lengths and resolution.
+	camera = {key: frame.get(key, transforms.get(key)) for key in CAMERA_KEYS}
+	if intrinsics is not None:
+		camera["fl_x"], camera["fl_y"] = float(intrinsics[0]), float(intrinsics[1])
+		camera["w"], camera["h"] = int(intrinsics[2]), int(intrinsics[3])
+	camera["fl_y"] = camera["fl_y"] if camera["fl_y"] is not None else camera["fl_x"]
+	camera["cx"] = camera["cx"] if camera["cx"] is not None else camera["w"] / 2
+	camera["cy"] = camera["cy"] if camera["cy"] is not None else camera["h"] / 2
+	camera["is_fisheye"] = bool(camera["is_fisheye"])
+	for key in DISTORTION_KEYS:
+		camera[key] = float(camera[key] or 0.0)
+	return camera
+
+def camera_key(camera):
+	return tuple(camera[key] for key in CAMERA_KEYS)
+
+def is_distorted(camera):
+	return any(camera[key] != 0.0 for key in DISTORTION_KEYS)
+
+def undistortion_maps(camera, balance=0.0):
+	# (map1, map2, pinhole K) to remap images of the camera with cv2.remap, maps are None if the camera is already pinhole
+	size = (int(camera["w"]), int(camera["h"]))
+	K = np.array([[camera["fl_x"], 0, camera["cx"]], [0, camera["fl_y"], camera["cy"]], [0, 0, 1]], dtype=np.float64)
+	if not is_distorted(camera):
+		return None, None, K
+	if camera["is_fisheye"]:
+		D = np.array([camera["k1"], camera["k2"], camera["k3"], camera["k4"]], dtype=np.float64)
+		new_K = cv2.fisheye.estimateNewCameraMatrixForUndistortRectify(K, D, size, np.eye(3), balance=balance)
+		map1, map2 = cv2.fisheye.initUndistortRectifyMap(K, D, np.eye(3), new_K, size, cv2.CV_16SC2)
+	else:
+		# The loader's OpenCV model only has k1, k2, p1, p2
+		D = np.array([camera["k1"], camera["k2"], camera["p1"], camera["p2"]], dtype=np.float64)
+		new_K, _ = cv2.getOptimalNewCameraMatrix(K, D, size, balance, size)
+		map1, map2 = cv2.initUndistortRectifyMap(K, D, np.eye(3), new_K, size, cv2.CV_16SC2)
+	return map1, map2, new_K
+
+class UndistortionCache:
+	# Undistortion maps of each distinct camera, computed on first use
+	def __init__(self, balance=0.0):
+		self.balance = balance
+		self.maps = {}
+
+	def get(self, camera):
+		key = camera_key(camera)
+		if key not in self.maps:
+			self.maps[key] = undistortion_maps(camera, self.balance)
+		return self.maps[key]
+
+def pinhole_camera(camera, new_K):
+	w, h = camera["w"], camera["h"]
+	fl_x, fl_y, cx, cy = float(new_K[0, 0]), float(new_K[1, 1]), float(new_K[0, 2]), float(new_K[1, 2])
+	angle_x = 2 * np.arctan(w / (2 * fl_x))
+	angle_y = 2 * np.arctan(h / (2 * fl_y))
+	return {"fl_x": fl_x, "fl_y": fl_y, "cx": cx, "cy": cy, "w": w, "h": h,
+		"camera_angle_x": angle_x, "camera_angle_y": angle_y, "fovx": np.degrees(angle_x), "fovy": np.degrees(angle_y)}
+
+def _read(path, flags):
+	image = cv2.imread(path, flags)
+	if image is None:
+		raise IOError(f"Could not read {path}")
+	return image
+
+def _write(path, image):
+	os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+	params = [cv2.IMWRITE_JPEG_QUALITY, 100] if os.path.splitext(path)[1].lower() in (".jpg", ".jpeg") else []
+	if not cv2.imwrite(path, image, params):
+		raise IOError(f"Could not write {path}")
+
+def _copy(path, out_path):
+	os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+	shutil.copyfile(path, out_path)
+
+def undistort_files(maps, image_path, out_image_path, depth_path=None, out_depth_path=None):
+	# Undistorts an image, its dynamic mask if any, and its depth map if any
+	map1, map2, _ = maps
+	if map1 is None:
+		_copy(image_path, out_image_path)
+		if os.path.isfile(mask_path(image_path)):
+			_copy(mask_path(image_path), mask_path(out_image_path))
+		if depth_path is not None:
+			_copy(depth_path, out_depth_path)
+		return
+	image = _read(image_path, cv2.IMREAD_UNCHANGED)
+	_write(out_image_path, cv2.remap(image, map1, map2, cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT))
+
+	invalid = cv2.remap(np.full(image.shape[:2], 255, dtype=np.uint8), map1, map2, cv2.INTER_NEAREST, borderMode=cv2.BORDER_CONSTANT) == 0
+	mask = None
+	if os.path.isfile(mask_path(image_path)):
+		mask = cv2.remap(_read(mask_path(image_path), cv2.IMREAD_GRAYSCALE), map1, map2, cv2.INTER_NEAREST, borderMode=cv2.BORDER_CONSTANT)
+	if invalid.any():
+		mask = np.zeros(image.shape[:2], dtype=np.uint8) if mask is None else mask
+		mask[invalid] = 255
+	if mask is not None:
+		_write(mask_path(out_image_path), mask)
+
+	if depth_path is not None:
+		depth = _read(depth_path, cv2.IMREAD_UNCHANGED)
+		# 0 is "no depth", never interpolated with valid depths
+		_write(out_depth_path, cv2.remap(depth, map1, map2, cv2.INTER_NEAREST, borderMode=cv2.BORDER_CONSTANT))
+
+def undistort_transforms(transforms_path, out_path, out_images="", balance=0.0, n_workers=None):
+	# Writes the undistorted images and the pinhole transforms file, returns the number of distinct cameras
+	with open(transforms_path) as f:
+		transforms = json.load(f)
+	in_dir = os.path.dirname(os.path.abspath(transforms_path))
+	out_dir = os.path.dirname(os.path.abspath(out_path))
+	out_images = os.path.abspath(out_images or os.path.join(out_dir, "undistorted"))
+
+	frames = transforms["frames"]
+	image_paths = [resolve_image_path(in_dir, frame["file_path"]) for frame in frames]
+	depth_paths = [os.path.join(in_dir, frame["depth_path"]) if "depth_path" in frame else None for frame in frames]
+	root = os.path.commonpath([os.path.dirname(path) for path in image_paths + [p for p in depth_paths if p is not None]])
+
+	def out_file(path):
+		return None if path is None else os.path.join(out_images, os.path.relpath(path, root))
+
+	cache = UndistortionCache(balance)
+	# Focal lengths from any of the keys the loader accepts, resolutions from the images where not set
+	intrinsics = TransformsColumns(transforms_path, build_columns(transforms_path, transforms)).intrinsics(from_images=True)
+	cameras = [frame_camera(transforms, frame, frame_intrinsics) for frame, frame_intrinsics in zip(frames, intrinsics)]
+	# Maps are computed up front, once per distinct camera
+	maps = [cache.get(camera) for camera in cameras]
+
+	with ThreadPoolExecutor(max_workers=n_workers) as pool:
+		list(pool.map(undistort_files, maps, image_paths, [out_file(p) for p in image_paths], depth_paths, [out_file(p) for p in depth_paths]))
+
+	undistorted = {key: value for key, value in transforms.items() if key not in CAMERA_KEYS + FOV_KEYS + ["frames"]}
+	single_camera = len(cache.maps) == 1
+	if single_camera:
+		undistorted.update(pinhole_camera(cameras[0], maps[0][2]))
+	undistorted["frames"] = []
+	for frame, camera, frame_maps, image_path, depth_path in zip(frames, cameras, maps, image_paths, depth_paths):
+		frame = {key: value for key, value in frame.items() if key not in CAMERA_KEYS + FOV_KEYS}
+		if not single_camera:
+			frame.update(pinhole_camera(camera, frame_maps[2]))
+		frame["file_path"] = os.path.relpath(out_file(image_path), out_dir).replace("\\", "/")
+		if depth_path is not None:
+			frame["depth_path"] = os.path.relpath(out_file(depth_path), out_dir).replace("\\", "/")
+		undistorted["frames"].append(frame)
+
+	with open(out_path, "w") as f:
+		json.dump(undistorted, f, indent=2)
+	return len(cache.maps)
+
+if __name__ == "__main__":
+	args = parse_args()
+	n_cameras = undistort_transforms(args.transforms, args.out, args.out_images, args.balance, args.n_workers)
+	print(f"undistorted the images of {n_cameras} distinct cameras, wrote {args.out}")
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# Checks a NeRF dataset before it is loaded by the testbed, whose loader only reports errors after the GPU is
+# initialised and part of the images are uploaded.
+#
+# Only the headers of the images are read (PNG IHDR chunk, JPEG SOF segment, EXR dataWindow attribute, PIL for
+# the other formats), by a thread pool, to check that each image exists and has the resolution declared in the
+# transforms if they declare one, and that its dynamic mask, alpha image and depth image, if any, have the same
+# resolution. The report also gives the histogram of the resolutions, the number of training pixels and an estimate
+# of the GPU memory taken by the training images (RGBA8, or RGBA16F for EXR, plus a float4 per pixel once depths
+# are enabled).
+
+import argparse
+import glob
+import os
+import struct
+import sys
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from mask_pipeline import mask_path
+from select_keyframes import resolve_image_path
+from transforms_columns import TransformsColumns, build_columns
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+EXR_MAGIC = b"\x76\x2f\x31\x01"
+# Start of frame markers, which hold the image size (all 0xC0-0xCF but DHT, JPG and DAC)
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+def parse_args():
+	parser = argparse.ArgumentParser(description="Check the images, masks and depths of a NeRF dataset, without loading them.")
+	parser.add_argument("scene", help="Transforms file, or folder of transforms files.")
+	parser.add_argument("--n_workers", default=16, type=int, help="Number of threads reading image headers.")
+	parser.add_argument("--max_messages", default=20, type=int, help="Maximum number of errors and warnings printed.")
+	return parser.parse_args()
+
+class ImageHeader:
+	def __init__(self, width, height, bit_depth=8, is_hdr=False):
+		self.width = width
+		self.height = height
+		self.bit_depth = bit_depth
+		self.is_hdr = is_hdr
+
+def _png_header(f):
+	data = f.read(26)
+	if len(data) < 26 or data[:8] != PNG_SIGNATURE or data[12:16] != b"IHDR":
+		raise ValueError("not a PNG file")
+	width, height, bit_depth = struct.unpack(">IIB", data[16:25])
+	return ImageHeader(width, height, bit_depth)
+
+def _jpeg_header(f):
+	if f.read(2) != b"\xff\xd8":
+		raise ValueError("not a JPEG file")
+	while True:
+		byte = f.read(1)
+		if not byte:
+			raise ValueError("no start of frame in JPEG file")
+		if byte != b"\xff":
+			continue
+		marker = f.read(1)
+		while marker == b"\xff":
+			marker = f.read(1)
+		if not marker:
+			raise ValueError("no start of frame in JPEG file")
+		marker = marker[0]
+		# Markers without a segment
+		if marker in (0x01, 0x00) or 0xD0 <= marker <= 0xD9:
+			continue
+		length = struct.unpack(">H", f.read(2))[0]
+		if marker in JPEG_SOF_MARKERS:
+			bit_depth, height, width = struct.unpack(">BHH", f.read(5))
+			return ImageHeader(width, height, bit_depth)
+		f.seek(length - 2, os.SEEK_CUR)
+
+def _read_until_null(f):
+	chars = bytearray()
+	while True:
+		c = f.read(1)
+		if not c:
+			raise ValueError("truncated EXR header")
+		if c == b"\0":
+			return chars.decode("latin-1")
+		chars += c
+
+def _exr_header(f):
+	if f.read(4) != EXR_MAGIC:
+		raise ValueError("not an EXR file")
+	f.read(4) # version and flags
+	while True:
+		name = _read_until_null(f)
+		if not name:
+			raise ValueError("no dataWindow in EXR header")
+		attribute_type = _read_until_null(f)
+		size = struct.unpack("<i", f.read(4))[0]
+		if name == "dataWindow" and attribute_type == "box2i":
+			xmin, ymin, xmax, ymax = struct.unpack("<iiii", f.read(16))
+			return ImageHeader(xmax - xmin + 1, ymax - ymin + 1, 16, is_hdr=True)
+		f.seek(size, os.SEEK_CUR)
+
+def read_image_header(path):
+	# ImageHeader of an image file, reading as few bytes as possible
+	ext = os.path.splitext(path)[1].lower()
+	with open(path, "rb") as f:
+		if ext == ".png":
+			return _png_header(f)
+		if ext in (".jpg", ".jpeg"):
+			return _jpeg_header(f)
+		if ext == ".exr":
+			return _exr_header(f)
+	# Other formats the loader reads through stb_image, PIL only parses their header until pixels are accessed
+	with Image.open(path) as image:
+		return ImageHeader(image.width, image.height)
+
+def _header_or_error(path, kind, errors):
+	try:
+		return read_image_header(path)
+	except (OSError, ValueError, struct.error) as e:
+		errors.append(f"{kind} {path} could not be read: {e}")
+		return None
+
+def check_frame(base_dir, file_path, depth_path, declared_size, load_depth):
+	# (errors, warnings, image header or None) of a frame
+	errors, warnings = [], []
+	try:
+		image_path = resolve_image_path(base_dir, file_path)
+	except FileNotFoundError:
+		return [f"image {os.path.join(base_dir, file_path)} does not exist"], warnings, None
+	header = _header_or_error(image_path, "image", errors)
+	if header is None:
+		return errors, warnings, None
+
+	size = (header.width, header.height)
+	w, h = declared_size
+	if w == w and h == h and (int(w), int(h)) != size:
+		errors.append(f"image {image_path} is {size[0]}x{size[1]}, the transforms declare {int(w)}x{int(h)}")
+
+	companions = []
+	if not header.is_hdr:
+		ext = os.path.splitext(image_path)[1]
+		companions = [("dynamic mask", mask_path(image_path)), ("alpha image", os.path.join(base_dir, f"{file_path}.alpha{ext}"))]
+	if depth_path:
+		depth_file = os.path.join(base_dir, depth_path)
+		if not load_depth:
+			warnings.append(f"depth image {depth_file} is ignored: the transforms have no integer_depth_scale")
+		elif not os.path.isfile(depth_file):
+			warnings.append(f"depth image {depth_file} does not exist, the frame has no depth")
+		else:
+			companions.append(("depth image", depth_file))
+
+	for kind, path in companions:
+		if kind != "depth image" and not os.path.isfile(path):
+			continue
+		companion = _header_or_error(path, kind, errors)
+		if companion is None:
+			continue
+		if (companion.width, companion.height) != size:
+			errors.append(f"{kind} {path} is {companion.width}x{companion.height}, its image is {size[0]}x{size[1]}")
+		if kind == "depth image" and companion.bit_depth != 16:
+			warnings.append(f"depth image {path} has {companion.bit_depth} bits per channel instead of 16")
+	return errors, warnings, header
+
+def transforms_paths(scene):
+	# Transforms files the testbed loads for a scene, as in Testbed::load_nerf
+	if os.path.isdir(scene):
+		return sorted(glob.glob(os.path.join(scene, "*.json")))
+	return [scene]
+
+def validate_dataset(scene, n_workers=16):
+	# Report dict: errors and warnings (lists of messages) and dataset statistics
+	report = {"errors": [], "warnings": [], "n_frames": 0, "resolutions": Counter(), "n_pixels": 0, "gpu_bytes": 0}
+	with ThreadPoolExecutor(max_workers=n_workers) as pool:
+		for path in transforms_paths(scene):
+			try:
+				# Validated in memory: the check does not write sidecars into the dataset
+				columns = TransformsColumns(path, build_columns(path))
+			except (OSError, ValueError) as e:
+				report["errors"].append(f"{path}: {e}")
+				continue
+			base_dir = os.path.dirname(os.path.abspath(path))
+			depth_scale = columns.header.get("integer_depth_scale")
+			load_depth = depth_scale is not None and depth_scale > 0
+			sizes = zip(columns.values("w").tolist(), columns.values("h").tolist())
+			checks = pool.map(check_frame, [base_dir] * len(columns), columns.column("file_path").tolist(), columns.column("depth_path").tolist(), sizes, [load_depth] * len(columns))
+			for errors, warnings, header in checks:
+				report["errors"] += errors
+				report["warnings"] += warnings
+				report["n_frames"] += 1
+				if header is None:
+					continue
+				n_pixels = header.width * header.height
+				report["resolutions"][(header.width, header.height)] += 1
+				report["n_pixels"] += n_pixels
+				# RGBA of bytes or halfs, and a float4 depth buffer per image when the depths are loaded
+				report["gpu_bytes"] += n_pixels * (8 if header.is_hdr else 4) + (16 * n_pixels if load_depth else 0)
+	return report
+
+def format_report(report, max_messages=20):
+	lines = [f"{report['n_frames']} frames, {report['n_pixels'] / 1e6:.1f} Mpixels, ~{report['gpu_bytes'] / 2**30:.2f} GiB of GPU memory for the training images"]
+	for (w, h), count in report["resolutions"].most_common():
+		lines.append(f"  {w}x{h}: {count} frames")
+	for kind in ("errors", "warnings"):
+		messages = report[kind]
+		if messages:
+			lines.append(f"{len(messages)} {kind}:")
+			lines += [f"  {message}" for message in messages[:max_messages]]
+			if len(messages) > max_messages:
+				lines.append(f"  ... and {len(messages) - max_messages} more")
+	return "\n".join(lines)
+
+if __name__ == "__main__":
+	args = parse_args()
+	report = validate_dataset(args.scene, args.n_workers)
+	print(format_report(report, args.max_messages))
+	sys.exit(1 if report["errors"] else 0)
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# Video encoders for rendered frames.
+#
+# Frames are linear RGB(A) float images as returned by `testbed.render`. They are converted to sRGB
+# and quantized by the encoder, which runs on its own thread behind a bounded queue (see `QueuedEncoder`),
+# so that the render loop only waits on the encoder when it falls behind by more than the queue size.
+
+import os
+import queue
+import subprocess
+import threading
+
+import cv2
+import numpy as np
+
+from common import linear_to_srgb
+
+def quantize_frame(frame, bit_depth=8, keep_alpha=False):
+	# Same conversion as `common.write_image`: un-multiply alpha, linear -> sRGB, alpha stays linear.
+	# Alpha is dropped unless `keep_alpha`, raw video pipes only take RGB.
+	frame = np.asarray(frame, dtype=np.float32)
+	alpha = None
+	if frame.shape[2] == 4:
+		alpha = frame[...,3:4]
+		frame = np.divide(frame[...,0:3], alpha, out=np.zeros_like(frame[...,0:3]), where=alpha != 0)
+	frame = linear_to_srgb(frame[...,0:3])
+	if keep_alpha and alpha is not None:
+		frame = np.concatenate([frame, alpha], axis=-1)
+	frame = np.clip(frame, 0.0, 1.0)
+	if bit_depth == 8:
+		return (frame * 255.0 + 0.5).astype(np.uint8)
+	elif bit_depth == 16:
+		return (frame * 65535.0 + 0.5).astype(np.uint16)
+	raise ValueError(f"Unsupported bit depth: {bit_depth}. Should be 8 or 16.")
+
+class FfmpegPipeEncoder:
+	# Pipes raw RGB24/RGB48 frames into the stdin of an ffmpeg process
+	def __init__(self, path, fps, resolution, bit_depth=8, ffmpeg_binary="ffmpeg", output_args=("-c:v", "libx264", "-pix_fmt", "yuv420p")):
+		self.bit_depth = bit_depth
+		self.resolution = tuple(resolution)
+		pix_fmt = "rgb24" if bit_depth == 8 else "rgb48le"
+		self.cmd = [
+			ffmpeg_binary, "-y", "-loglevel", "error",
+			"-f", "rawvideo", "-pix_fmt", pix_fmt, "-s", f"{self.resolution[0]}x{self.resolution[1]}", "-framerate", str(fps), "-i", "-",
+			*output_args, str(path),
+		]
+		self.process = subprocess.Popen(self.cmd, stdin=subprocess.PIPE)
+
+	def write(self, frame):
+		frame = quantize_frame(frame, self.bit_depth)
+		if (frame.shape[1], frame.shape[0]) != self.resolution:
+			raise ValueError(f"Frame resolution {frame.shape[1]}x{frame.shape[0]} does not match the video resolution {self.resolution[0]}x{self.resolution[1]}")
+		try:
+			self.process.stdin.write(frame.astype(frame.dtype.newbyteorder("<"), copy=False).tobytes())
+		except BrokenPipeError:
+			# ffmpeg exited early: report its exit status rather than the broken pipe
+			self.process.wait()
+			self.check_returncode()
+			raise
+
+	def close(self):
+		try:
+			self.process.stdin.close()
+		except BrokenPipeError:
+			pass
+		self.process.wait()
+		self.check_returncode()
+
+	def check_returncode(self):
+		if self.process.returncode:
+			raise subprocess.CalledProcessError(self.process.returncode, self.cmd)
+
+class PngSequenceEncoder:
+	# Writes one PNG per frame to `pattern % frame_index`, e.g. video_%04d.png
+	def __init__(self, pattern, start_index=0, bit_depth=8):
+		self.pattern = pattern
+		self.index = start_index
+		self.bit_depth = bit_depth
+
+	def write(self, frame):
+		path = self.pattern % self.index
+		if os.path.dirname(path):
+			os.makedirs(os.path.dirname(path), exist_ok=True)
+		# OpenCV rather than imageio: Pillow cannot write 16 bit RGB PNGs. Alpha is kept, like `common.write_image` does.
+		frame = quantize_frame(frame, self.bit_depth, keep_alpha=True)
+		if not cv2.imwrite(path, cv2.cvtColor(frame, cv2.COLOR_RGBA2BGRA if frame.shape[2] == 4 else cv2.COLOR_RGB2BGR)):
+			raise IOError(f"Could not write {path}")
+		self.index += 1
+
+	def close(self):
+		pass
+
+class MemoryEncoder:
+	# Keeps the quantized frames in memory. Stand-in for tests.
+	def __init__(self, bit_depth=8):
+		self.bit_depth = bit_depth
+		self.frames = []
+		self.closed = False
+
+	def write(self, frame):
+		self.frames.append(quantize_frame(frame, self.bit_depth))
+
+	def close(self):
+		self.closed = True
+
+class QueuedEncoder:
+	# Runs `encoder` on a background thread, fed through a queue of at most `max_queued_frames` frames.
+	# Errors raised by the encoder are re-raised by the next `write` or by `close`.
+	def __init__(self, encoder, max_queued_frames=8):
+		self.encoder = encoder
+		self.queue = queue.Queue(maxsize=max_queued_frames)
+		self.error = None
+		self.thread = threading.Thread(target=self._run, daemon=True)
+		self.thread.start()
+
+	def _run(self):
+		while True:
+			frame = self.queue.get()
+			if frame is None:
+				return
+			if self.error is None:
+				try:
+					self.encoder.write(frame)
+				except BaseException as e:
+					# Keep draining the queue so that the producer never blocks
+					self.error = e
+
+	def write(self, frame):
+		if self.error is not None:
+			raise self.error
+		self.queue.put(frame)
+
+	def close(self):
+		self.queue.put(None)
+		self.thread.join()
+		try:
+			self.encoder.close()
+		finally:
+			if self.error is not None:
+				raise self.error
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		if exc_type is None:
+			self.close()
+		else:
+			# Already failing: clean up without masking the original exception
+			try:
+				self.close()
+			except Exception:
+				pass
+
+def open_video_encoder(output, fps, resolution, start_index=0, bit_depth=8, max_queued_frames=8):
+	# `output` containing a '%' is a PNG sequence pattern, anything else is a video file encoded by ffmpeg
+	if "%" in output:
+		encoder = PngSequenceEncoder(output, start_index=start_index, bit_depth=bit_depth)
+	else:
+		encoder = FfmpegPipeEncoder(output, fps, resolution, bit_depth=bit_depth)
+	return QueuedEncoder(encoder, max_queued_frames=max_queued_frames)
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# Streaming extraction of the frames of a video, keeping only the best ones.
+#
+# The video is decoded once, frame by frame, with cv2.VideoCapture. Each frame is scored on a downscaled grayscale
+# copy, and only the sharpest frame of each time window (1 / fps seconds) is kept in memory. A window's winner is
+# dropped if it barely differs from the last written frame (mean absolute difference of the downscaled copies
+# below min_motion, in 8-bit levels), e.g. when the camera stands still. Survivors are encoded and written by a
+# thread pool while decoding goes on, so only the selected frames ever reach the disk.
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from sharpness import variance_of_laplacian
+
+def small_gray(frame, reduction):
+	gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+	if reduction > 1:
+		gray = cv2.resize(gray, (max(1, gray.shape[1] // reduction), max(1, gray.shape[0] // reduction)), interpolation=cv2.INTER_AREA)
+	return gray
+
+def iter_frames(video_path, time_slice=None):
+	# Yields (timestamp in seconds, BGR frame) of the video, within the (start, end) time_slice if given
+	capture = cv2.VideoCapture(video_path)
+	if not capture.isOpened():
+		raise IOError(f"Could not open video {video_path}")
+	try:
+		video_fps = capture.get(cv2.CAP_PROP_FPS)
+		start, end = time_slice if time_slice else (0.0, np.inf)
+		if start > 0:
+			capture.set(cv2.CAP_PROP_POS_MSEC, start * 1000.0)
+		index = int(round(capture.get(cv2.CAP_PROP_POS_FRAMES)))
+		while True:
+			ok, frame = capture.read()
+			if not ok:
+				break
+			t = index / video_fps if video_fps > 0 else capture.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+			index += 1
+			if t < start:
+				continue
+			if t > end:
+				break
+			yield t, frame
+	finally:
+		capture.release()
+
+def select_frames(frames, fps, reduction=4, min_motion=0.0):
+	# Yields (timestamp, frame, sharpness) of the sharpest frame of each 1 / fps window of the (timestamp, frame)
+	# stream, skipping those within min_motion of the previously selected frame
+	best = None
+	window = None
+	last_gray = None
+
+	def flush():
+		nonlocal last_gray
+		t, frame, score, gray = best
+		if last_gray is not None and min_motion > 0 and cv2.absdiff(gray, last_gray).mean() < min_motion:
+			return None
+		last_gray = gray
+		return t, frame, score
+
+	for t, frame in frames:
+		# The epsilon keeps frames at window boundaries in the next window despite rounding
+		frame_window = int(np.floor(t * fps + 1e-9))
+		if window is not None and frame_window != window:
+			selected = flush()
+			if selected is not None:
+				yield selected
+			best = None
+		window = frame_window
+		gray = small_gray(frame, reduction)
+		score = float(variance_of_laplacian(gray))
+		if best is None or score > best[2]:
+			best = (t, frame, score, gray)
+
+	if best is not None:
+		selected = flush()
+		if selected is not None:
+			yield selected
+
+def extract_frames(video_path, out_folder, fps, time_slice=None, reduction=4, min_motion=0.0, jpeg_quality=100, n_workers=None, max_pending_writes=16):
+	# Writes the selected frames of the video to out_folder/0001.jpg, 0002.jpg, ... and returns their paths
+	os.makedirs(out_folder, exist_ok=True)
+	n_workers = n_workers or min(8, os.cpu_count() or 1)
+	paths = []
+	pending = []
+
+	def write(path, frame):
+		if not cv2.imwrite(path, frame, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]):
+			raise IOError(f"Could not write {path}")
+
+	with ThreadPoolExecutor(max_workers=n_workers) as pool:
+		for t, frame, score in select_frames(iter_frames(video_path, time_slice), fps, reduction, min_motion):
+			path = os.path.join(out_folder, f"{len(paths) + 1:04d}.jpg")
+			paths.append(path)
+			pending.append(pool.submit(write, path, frame))
+			# Bounds the number of decoded frames waiting to be written
+			if len(pending) >= max_pending_writes:
+				pending.pop(0).result()
+		for future in pending:
+			future.result()
+	return paths
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# Visual hull of an object-centric NeRF dataset, carved from the silhouettes of the object in its frames, to bound
+# the occupied volume much more tightly than the cameras do.
+#
+# Silhouettes are the alpha channel of the images (or their `.alpha` images), the pixels that are not pure white or
+# black with `white_transparent` / `black_transparent`, or, with --source dynamic_mask, the masks of the object
+# written by mask_images.py. In the first case, the pixels of the dynamic masks may see the object.
+#
+# A voxel grid spans the render_aabb of the transforms (or their aabb_scale box). Each frame projects the voxels
+# that are not carved yet, chunk by chunk (pinhole model, distortion left to the dilation margin), and carves the
+# ones whose whole projected footprint, a square bounding the projection of the voxel, is inside the image and
+# background; an integral image of the silhouette counts the object pixels of every footprint at once. Frames are
+# processed in parallel, by batches, so that later batches only test the voxels left. Voxels whose footprint misses
+# the images of all but fewer than min_views frames are carved too. The carving is conservative: a voxel that holds
+# any part of the object seen by the frames is never carved.
+#
+# The occupancy grid is written to an .npz file, with the box of the occupied voxels (one voxel larger) as
+# render_aabb and as the matrix of `testbed.set_crop_box`. The render_aabb can be written to the transforms too.
+
+import argparse
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from mask_pipeline import mask_path
+from scene_bounds import aabb_of_scale, fit_aabb_scale, from_testbed, principal_points, testbed_transform, to_testbed
+from select_keyframes import resolve_image_path
+from transforms_columns import load_columns, read_transforms
+
+# Max number of voxels projected at once by a frame
+VOXEL_CHUNK_SIZE = 1 << 18
+
+def parse_args():
+	parser = argparse.ArgumentParser(description="Carve the visual hull of an object from the silhouettes of a NeRF dataset, and bound it.")
+	parser.add_argument("transforms", help="Input transforms file.")
+	parser.add_argument("--out", default="", help="Output occupancy grid (.npz). Defaults to <transforms>.hull.npz.")
+	parser.add_argument("--source", default="alpha", choices=["alpha", "dynamic_mask"], help="Silhouettes: alpha channels and transparent colors, or the masks of mask_images.py.")
+	parser.add_argument("--resolution", default=128, type=int, help="Number of voxels along each axis.")
+	parser.add_argument("--min_views", default=1, type=int, help="Carve the voxels seen by fewer frames.")
+	parser.add_argument("--dilation", default=2.0, type=float, help="Margin, in pixels, added to the footprints of the voxels (e.g. for lens distortion).")
+	parser.add_argument("--n_workers", default=None, type=int, help="Number of threads carving frames.")
+	parser.add_argument("--write_transforms", action="store_true", help="Also write the box of the hull as render_aabb into the transforms file.")
+	parser.add_argument("--fit_aabb_scale", action="store_true", help="With --write_transforms, also shrink aabb_scale to the hull (only for transparent backgrounds).")
+	return parser.parse_args()
+
+def silhouette(base_dir, file_path, source="alpha", white_transparent=False, black_transparent=False):
+	# (H, W) bool mask of the pixels that may see the object, None if the frame has no silhouette
+	image_path = resolve_image_path(base_dir, file_path)
+	if source == "dynamic_mask":
+		mask = cv2.imread(mask_path(image_path), cv2.IMREAD_GRAYSCALE)
+		return None if mask is None else mask > 0
+
+	ext = os.path.splitext(image_path)[1]
+	alpha_path = os.path.join(base_dir, f"{file_path}.alpha{ext}")
+	foreground = None
+	if os.path.isfile(alpha_path):
+		alpha = cv2.imread(alpha_path, cv2.IMREAD_UNCHANGED)
+		if alpha is not None:
+			# The loader uses the red channel of alpha images
+			foreground = (alpha[..., 2] if alpha.ndim == 3 else alpha) > 0
+	if foreground is None and (white_transparent or black_transparent or ext.lower() == ".png"):
+		image = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
+		if image is not None and image.ndim == 3 and image.shape[2] == 4:
+			foreground = image[..., 3] > 0
+		elif image is not None and image.ndim == 3 and (white_transparent or black_transparent):
+			max_value = np.iinfo(image.dtype).max if image.dtype.kind in "ui" else 1.0
+			foreground = np.ones(image.shape[:2], dtype=bool)
+			if white_transparent:
+				foreground &= ~np.all(image[..., 0:3] == max_value, axis=-1)
+			if black_transparent:
+				foreground &= ~np.all(image[..., 0:3] == 0, axis=-1)
+	if foreground is None:
+		return None
+	# Pixels excluded from training may see the object
+	dynamic_mask = cv2.imread(mask_path(image_path), cv2.IMREAD_GRAYSCALE)
+	if dynamic_mask is not None and dynamic_mask.shape == foreground.shape:
+		foreground |= dynamic_mask > 0
+	return foreground
+
+def voxel_centers(lo, hi, resolution):
+	# (R^3, 3) centers of the voxels of the box (lo, hi), x major, and the size of a voxel
+	size = (np.asarray(hi) - np.asarray(lo)) / resolution
+	axes = [lo[i] + (np.arange(resolution) + 0.5) * size[i] for i in range(3)]
+	return np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(-1, 3), size
+
+def carve_frame(mask, c2w, fl_x, fl_y, cx, cy, centers, voxel_radius, dilation=2.0):
+	# (seen, background) bool arrays of the voxels: footprint overlapping the image (or voxel across the plane of the
+	# camera), and footprint inside the image and without object pixels
+	h, w = mask.shape
+	counts = cv2.integral(mask.astype(np.uint8))
+	seen = np.zeros(len(centers), dtype=bool)
+	background = np.zeros(len(centers), dtype=bool)
+	for start in range(0, len(centers), VOXEL_CHUNK_SIZE):
+		chunk = slice(start, start + VOXEL_CHUNK_SIZE)
+		# NeRF camera convention: x right, y up, looking along -z
+		points = (centers[chunk] - c2w[0:3, 3]) @ c2w[0:3, 0:3]
+		depth = -points[:, 2]
+		in_front = depth > voxel_radius
+		z = np.where(in_front, depth, 1.0)
+		u = fl_x * points[:, 0] / z + cx
+		v = -fl_y * points[:, 1] / z + cy
+		# Bound of the projection of the sphere around the voxel
+		near = np.maximum(z - voxel_radius, 1e-9)
+		radius_u = fl_x * voxel_radius * (1 + np.abs(points[:, 0]) / z) / near + dilation
+		radius_v = fl_y * voxel_radius * (1 + np.abs(points[:, 1]) / z) / near + dilation
+		u0, u1 = np.floor(u - radius_u), np.ceil(u + radius_u)
+		v0, v1 = np.floor(v - radius_v), np.ceil(v + radius_v)
+		seen[chunk] = (in_front & (u1 > 0) & (u0 < w) & (v1 > 0) & (v0 < h)) | (np.abs(depth) <= voxel_radius)
+		inside = in_front & (u0 >= 0) & (u1 <= w) & (v0 >= 0) & (v1 <= h)
+		u0, u1, v0, v1 = (np.where(inside, x, 0).astype(np.int64) for x in (u0, u1, v0, v1))
+		n_object = counts[v1, u1] - counts[v0, u1] - counts[v1, u0] + counts[v0, u0]
+		background[chunk] = inside & (n_object == 0)
+	return seen, background
+
+def carve(c2ws, intrinsics, load_mask, lo, hi, resolution=128, min_views=1, dilation=2.0, n_workers=None):
+	# (R, R, R) bool occupancy grid of the box (lo, hi). intrinsics are (N, 4) arrays (fl_x, fl_y, cx, cy), and
+	# load_mask(i) returns the silhouette of frame i, or None. Raises a ValueError when no frame has a silhouette.
+	centers, size = voxel_centers(lo, hi, resolution)
+	voxel_radius = 0.5 * np.linalg.norm(size)
+	occupied = np.ones(len(centers), dtype=bool)
+	n_views = np.zeros(len(centers), dtype=np.int32)
+	alive = np.arange(len(centers))
+	alive_centers = centers
+	n_silhouettes = 0
+
+	def carve_one(i):
+		mask = load_mask(i)
+		if mask is None:
+			return None
+		return carve_frame(mask, c2ws[i], *intrinsics[i], alive_centers, voxel_radius, dilation)
+
+	batch_size = 2 * (n_workers or os.cpu_count() or 1)
+	with ThreadPoolExecutor(max_workers=n_workers) as pool:
+		for start in range(0, len(c2ws), batch_size):
+			for result in pool.map(carve_one, range(start, min(start + batch_size, len(c2ws)))):
+				if result is None:
+					continue
+				n_silhouettes += 1
+				seen, background = result
+				n_views[alive] += seen
+				occupied[alive[background]] = False
+			alive = np.flatnonzero(occupied)
+			alive_centers = centers[alive]
+	if n_silhouettes == 0:
+		raise ValueError("No silhouettes found: the frames have no alpha channel, alpha image, transparent color or dynamic mask")
+	occupied &= n_views >= min_views
+	return occupied.reshape(resolution, resolution, resolution)
+
+def occupied_box(occupancy, lo, hi):
+	# (min, max) corners of the occupied voxels, one voxel larger on each side, within (lo, hi)
+	indices = np.argwhere(occupancy)
+	if len(indices) == 0:
+		raise ValueError("The silhouettes carve the whole volume")
+	size = (np.asarray(hi) - np.asarray(lo)) / np.array(occupancy.shape)
+	return np.maximum(lo + (indices.min(axis=0) - 1) * size, lo), np.minimum(lo + (indices.max(axis=0) + 2) * size, hi)
+
+def crop_box(lo, hi, scale, offset):
+	# 3x4 matrix of a box in the testbed's coordinates, for testbed.set_crop_box(nerf_space=True) (Testbed::crop_box)
+	m = np.zeros((3, 4))
+	m[:, 0:3] = np.diag(0.5 * (np.asarray(hi) - np.asarray(lo)))
+	m[:, 3] = 0.5 * (np.asarray(lo) + np.asarray(hi))
+	# NerfDataset::ngp_matrix_to_nerf: cycle the axes, then flip and scale the columns
+	m = m[[2, 0, 1]]
+	m[:, 0] /= scale
+	m[:, 1:3] /= -scale
+	m[:, 3] = (m[:, 3] - offset) / scale
+	return m
+
+def domain_box(header):
+	# (min, max) corners, in the transforms' coordinates, of the volume the testbed can reconstruct
+	scale, offset = testbed_transform(header)
+	box = np.array(header["render_aabb"], dtype=np.float64) if "render_aabb" in header else np.stack(aabb_of_scale(int(header.get("aabb_scale", 1))))
+	corners = from_testbed(box, scale, offset)
+	return corners.min(axis=0), corners.max(axis=0)
+
+def visual_hull(transforms_path, source="alpha", resolution=128, min_views=1, dilation=2.0, n_workers=None):
+	# Dict of the occupancy grid, its box and the box of the hull, in the transforms' and the testbed's coordinates
+	columns = load_columns(transforms_path)
+	header = columns.header
+	base_dir = os.path.dirname(os.path.abspath(transforms_path))
+	file_paths = columns.column("file_path").tolist()
+	c2ws = columns.c2ws()
+	intrinsics = columns.intrinsics(from_images=True)
+	cx, cy = principal_points(columns, intrinsics)
+	white_transparent, black_transparent = bool(header.get("white_transparent", False)), bool(header.get("black_transparent", False))
+
+	def load_mask(i):
+		mask = silhouette(base_dir, file_paths[i], source, white_transparent, black_transparent)
+		if mask is not None and mask.shape != (int(intrinsics[i, 3]), int(intrinsics[i, 2])):
+			# Silhouettes of another resolution than the declared one are scaled to it
+			mask = cv2.resize(mask.astype(np.uint8), (int(intrinsics[i, 2]), int(intrinsics[i, 3])), interpolation=cv2.INTER_NEAREST) > 0
+		return mask
+
+	lo, hi = domain_box(header)
+	occupancy = carve(c2ws, np.stack([intrinsics[:, 0], intrinsics[:, 1], cx, cy], axis=-1), load_mask, lo, hi, resolution, min_views, dilation, n_workers)
+	hull_lo, hull_hi = occupied_box(occupancy, lo, hi)
+	scale, offset = testbed_transform(header)
+	corners = to_testbed(np.stack([hull_lo, hull_hi]), scale, offset)
+	render_aabb = np.stack([corners.min(axis=0), corners.max(axis=0)])
+	return {
+		"occupancy": occupancy,
+		"box_min": lo,
+		"box_max": hi,
+		"hull_min": hull_lo,
+		"hull_max": hull_hi,
+		"render_aabb": render_aabb,
+		"crop_box": crop_box(render_aabb[0], render_aabb[1], scale, offset),
+	}
+
+def write_render_aabb(transforms_path, render_aabb, fit_scale=False):
+	transforms = read_transforms(transforms_path)
+	transforms["render_aabb"] = np.asarray(render_aabb).tolist()
+	if fit_scale:
+		transforms["aabb_scale"] = fit_aabb_scale(render_aabb[0], render_aabb[1])
+	with open(transforms_path, "w") as f:
+		json.dump(transforms, f, indent=2)
+
+if __name__ == "__main__":
+	args = parse_args()
+	hull = visual_hull(args.transforms, args.source, args.resolution, args.min_views, args.dilation, args.n_workers)
+	out_path = args.out or os.path.splitext(args.transforms)[0] + ".hull.npz"
+	np.savez_compressed(out_path, **hull)
+	occupancy = hull["occupancy"]
+	print(f"{np.count_nonzero(occupancy)} of {occupancy.size} voxels occupied ({100 * np.mean(occupancy):.1f}%), wrote {out_path}")
+	print(f"render_aabb: {hull['render_aabb'].tolist()}")
+	print(f"crop_box: {hull['crop_box'].tolist()}")
+	if args.write_transforms:
+		write_render_aabb(args.transforms, hull["render_aabb"], args.fit_aabb_scale)
@@ -521,6 +521,7 @@ PYBIND11_MODULE(pyngp, m) {
 			py::arg("quantize") = false
 		)
 		.def_readwrite("camera_matrix", &Testbed::m_camera)
+		.def_readwrite("smoothed_camera", &Testbed::m_smoothed_camera, "Camera at which the next camera path render starts. See scripts/camera_path.py")
 		.def_readwrite("up_dir", &Testbed::m_up_dir)
 		.def_readwrite("sun_dir", &Testbed::m_sun_dir)
 		.def_property("look_at", &Testbed::look_at, &Testbed::set_look_at)